@@ -1,6 +1,8 @@
 # import os
 # import sentry_sdk
 import time
+import asyncio
+from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse, HTMLResponse
@@ -13,8 +15,22 @@ from middleware.middleware import (
     LoggingMiddleware,
     ErrorHandlerMiddleware,
     RateLimitMiddleware,
+    ReadSessionMiddleware,
 )
-from db.redis_config import redis_client
+from db.redis_config import (
+    async_redis_client,
+    async_redis_pool,
+    async_pubsub_client,
+    async_replica_clients,
+    REDIS_CLUSTER,
+    REDIS_REPLICAS,
+    REDIS_CACHE_SIZE,
+    REDIS_ARCHIVE_AFTER_DAYS,
+)
+from db.cluster import close_node_clients
+from db.document_cache import listen_for_invalidations
+from db.replicas import monitor_replicas
+from db.async_redis_operations import run_archiver, resume_transfers
 from routes.auth import router as auth_router
 from routes.citizen import router as citizen_router
 from routes.vendor import router as vendor_router
@@ -31,11 +47,48 @@ from routes.chat import router as chat_router
 #     ],
 # )
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Finish transfers a worker was interrupted in (only recorded on Redis Cluster)
+    if REDIS_CLUSTER:
+        await resume_transfers()
+    # Keep the document cache coherent with writes from other workers
+    listener = None
+    if REDIS_CACHE_SIZE > 0:
+        listener = asyncio.create_task(listen_for_invalidations())
+    # Route reads to replicas while they keep up with the primary
+    monitor = None
+    if REDIS_REPLICAS:
+        monitor = asyncio.create_task(monitor_replicas())
+    # Move old transactions out of Redis to the archive
+    archiver = None
+    if REDIS_ARCHIVE_AFTER_DAYS > 0:
+        archiver = asyncio.create_task(run_archiver())
+    yield
+    if listener:
+        listener.cancel()
+    if archiver:
+        archiver.cancel()
+    if monitor:
+        monitor.cancel()
+    # Close pooled Redis connections on shutdown
+    if async_redis_pool is not None:
+        await async_redis_pool.disconnect()
+    else:
+        await async_redis_client.aclose()
+        await async_pubsub_client.aclose()
+        await close_node_clients()
+    for client in async_replica_clients:
+        await client.aclose()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Payzee API",
     description="A digital payment system",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Setup middleware (* for dev environment)
@@ -49,6 +102,8 @@ app.add_middleware(
 app.add_middleware(LoggingMiddleware)
 app.add_middleware(ErrorHandlerMiddleware)
 app.add_middleware(RateLimitMiddleware)
+if REDIS_REPLICAS:
+    app.add_middleware(ReadSessionMiddleware)
 
 # Add Prometheus middleware for metrics
 app.add_middleware(
@@ -75,7 +130,7 @@ def root() -> HTMLResponse:
 
 
 @app.get("/health")
-def health_check() -> JSONResponse:
+async def health_check() -> JSONResponse:
     api_start_time = time.time()
     api_status = {
         "name": "FastAPI",
@@ -97,7 +152,7 @@ def health_check() -> JSONResponse:
     }
 
     try:
-        redis_client.ping()
+        await async_redis_client.ping()
     except Exception as e:
         db_status["code"] = 503
         db_status["message"] = str(e)
@@ -1,6 +1,15 @@
-from .redis_config import redis_client
-from .redis_operations import array_union
-from utils.db_ops import (
+# The application uses the asyncio API, synchronous equivalents live in
+# db.redis_operations and utils.db_ops for scripts
+from .redis_config import redis_client, async_redis_client
+from .redis_operations import VersionConflictError, UniqueConstraintError
+from .async_redis_operations import (
+    array_union,
+    load_list_fields,
+    increment_field,
+    get_many_documents,
+    existing_field_values,
+)
+from utils.async_db_ops import (
     # Citizen operations
     get_citizen,
     save_citizen,
@@ -8,6 +17,8 @@ from utils.db_ops import (
     delete_citizen,
     query_citizens_by_field,
     get_all_citizens,
+    scan_citizens,
+    iter_citizen_batches,
     # Vendor operations
     get_vendor,
     save_vendor,
@@ -15,6 +26,7 @@ from utils.db_ops import (
     delete_vendor,
     query_vendors_by_field,
     get_all_vendors,
+    scan_vendors,
     # Government operations
     get_government,
     save_government,
@@ -26,32 +38,52 @@ from utils.db_ops import (
     get_scheme,
     save_scheme,
     update_scheme,
+    modify_scheme,
     query_schemes_by_field,
     get_all_schemes,
     add_beneficiary_to_scheme,
+    scan_scheme_beneficiaries,
     # Transaction operations
     get_transaction,
     save_transaction,
     update_transaction,
     query_transactions_by_field,
     get_all_transactions,
+    scan_transactions,
+    iter_transaction_batches,
+    get_account_transactions,
+    pay_vendor_from_wallet,
+    # Bulk operations
+    save_many,
+    update_many,
+    delete_many,
 )
 
 __all__ = [
     "redis_client",
+    "async_redis_client",
+    "VersionConflictError",
+    "UniqueConstraintError",
     "array_union",
+    "load_list_fields",
+    "increment_field",
+    "get_many_documents",
+    "existing_field_values",
     "get_citizen",
     "save_citizen",
     "update_citizen",
     "delete_citizen",
     "query_citizens_by_field",
     "get_all_citizens",
+    "scan_citizens",
+    "iter_citizen_batches",
     "get_vendor",
     "save_vendor",
     "update_vendor",
     "delete_vendor",
     "query_vendors_by_field",
     "get_all_vendors",
+    "scan_vendors",
     "get_government",
     "save_government",
     "update_government",
@@ -61,12 +93,21 @@ __all__ = [
     "get_scheme",
     "save_scheme",
     "update_scheme",
+    "modify_scheme",
     "query_schemes_by_field",
     "get_all_schemes",
     "add_beneficiary_to_scheme",
+    "scan_scheme_beneficiaries",
     "get_transaction",
     "save_transaction",
     "update_transaction",
     "query_transactions_by_field",
     "get_all_transactions",
+    "scan_transactions",
+    "iter_transaction_batches",
+    "get_account_transactions",
+    "pay_vendor_from_wallet",
+    "save_many",
+    "update_many",
+    "delete_many",
 ]
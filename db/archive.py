@@ -0,0 +1,225 @@
+import os
+import mmap
+import json
+import time
+import bisect
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from .redis_config import (
+    ARCHIVED_COLLECTIONS,
+    REDIS_ARCHIVE_DIR,
+    REDIS_ARCHIVE_COMPRESSION,
+)
+from utils.db_helpers import find_compressor, get_compressor
+
+# Segment files are written once and never modified:
+#   MAGIC, compressed blocks, JSON index, index offset and length, MAGIC
+# A block holds up to BLOCK_RECORDS records sorted by document ID, each record
+# being its timestamp score, ID and stored value (codec-encoded, uncompressed).
+# The index keeps the first and last ID, offset, length and timestamp score
+# range of every block, so a lookup decompresses at most one block.
+MAGIC = b"PZSEG\x01"
+BLOCK_RECORDS = 128
+SEGMENT_SUFFIX = ".seg"
+_RECORD = struct.Struct(">qHI")
+_FOOTER = struct.Struct(">QI")
+
+# (document ID, timestamp score, stored value)
+Record = Tuple[str, int, bytes]
+
+
+def _encode_block(records: List[Record], compressor) -> bytes:
+    payload = b"".join(
+        _RECORD.pack(score, len(doc_id.encode()), len(value)) + doc_id.encode() + value
+        for doc_id, score, value in records
+    )
+    return compressor.header + compressor.compress(payload)
+
+
+def _decode_block(block: bytes) -> Iterator[Record]:
+    payload = find_compressor(block).decompress(block[1:])
+    offset = 0
+    while offset < len(payload):
+        score, id_length, value_length = _RECORD.unpack_from(payload, offset)
+        offset += _RECORD.size
+        doc_id = payload[offset : offset + id_length].decode()
+        offset += id_length
+        yield doc_id, score, payload[offset : offset + value_length]
+        offset += value_length
+
+
+class Segment:
+    """A memory-mapped segment file and its block index"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        footer = len(self._map) - len(MAGIC) - _FOOTER.size
+        if self._map[: len(MAGIC)] != MAGIC or self._map[-len(MAGIC) :] != MAGIC:
+            raise ValueError(f"{path} is not a segment file")
+        offset, length = _FOOTER.unpack_from(self._map, footer)
+        self.blocks = json.loads(self._map[offset : offset + length])["blocks"]
+        self._first_ids = [block[0] for block in self.blocks]
+
+    def _read_block(self, block: List) -> Iterator[Record]:
+        _, _, offset, length, _, _ = block
+        return _decode_block(self._map[offset : offset + length])
+
+    def get(self, doc_id: str) -> Optional[bytes]:
+        """Get the stored value of a document, or None if not in this segment"""
+        position = bisect.bisect_right(self._first_ids, doc_id) - 1
+        if position < 0 or doc_id > self.blocks[position][1]:
+            return None
+        for record_id, _, value in self._read_block(self.blocks[position]):
+            if record_id == doc_id:
+                return value
+        return None
+
+    def records(
+        self, since: Optional[int] = None, until: Optional[int] = None
+    ) -> Iterator[Record]:
+        """Yield the records with a timestamp score from since to until"""
+        for block in self.blocks:
+            if (since is not None and block[5] < since) or (
+                until is not None and block[4] > until
+            ):
+                continue
+            for record in self._read_block(block):
+                if (since is None or record[1] >= since) and (
+                    until is None or record[1] <= until
+                ):
+                    yield record
+
+
+class SegmentArchive:
+    """The append-only segment files of a collection
+
+    Segments are named <partition>.<creation time in ms>.seg. A document archived
+    again, after being written while an older copy was archived, is served from
+    the newest segment. Segments written by other processes are picked up when
+    the directory changes.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._segments: Dict[str, Segment] = {}
+        # Newest first
+        self._order: List[Segment] = []
+        self._mtime: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """Open segments written since the last refresh"""
+        try:
+            mtime = self.directory.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            for path in self.directory.glob(f"*{SEGMENT_SUFFIX}"):
+                if path.name not in self._segments:
+                    self._segments[path.name] = Segment(path)
+            self._order = sorted(
+                self._segments.values(),
+                key=lambda segment: int(segment.path.name.split(".")[1]),
+                reverse=True,
+            )
+            self._mtime = mtime
+
+    def get_many(self, doc_ids: Iterable[str]) -> Dict[str, bytes]:
+        """Get the stored values of the archived documents among doc_ids"""
+        self.refresh()
+        found = {}
+        for doc_id in doc_ids:
+            for segment in self._order:
+                value = segment.get(doc_id)
+                if value is not None:
+                    found[doc_id] = value
+                    break
+        return found
+
+    def partitions(self) -> List[str]:
+        """Get the archived partitions, oldest first"""
+        self.refresh()
+        return sorted({name.split(".")[0] for name in self._segments})
+
+    def records(
+        self, partition: str, since: Optional[int] = None, until: Optional[int] = None
+    ) -> Iterator[Record]:
+        """Yield the records of a partition from since to until, newest copy only"""
+        self.refresh()
+        seen = set()
+        for segment in self._order:
+            if not segment.path.name.startswith(f"{partition}."):
+                continue
+            for record in segment.records(since, until):
+                if record[0] not in seen:
+                    seen.add(record[0])
+                    yield record
+
+    def write_segment(
+        self, partition: str, records: Iterable[Record]
+    ) -> Optional[Path]:
+        """Write records sorted by document ID to a new segment of a partition
+
+        The segment is written to a temporary file and renamed once complete,
+        so readers never see a partial segment. Nothing is written without
+        records.
+        """
+        compressor = get_compressor(REDIS_ARCHIVE_COMPRESSION)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"{partition}.{time.time_ns() // 1_000_000}{SEGMENT_SUFFIX}"
+        path = self.directory / name
+        temporary = path.with_suffix(".tmp")
+
+        blocks = []
+        with open(temporary, "wb") as f:
+            f.write(MAGIC)
+
+            def write_block(batch: List[Record]) -> None:
+                block = _encode_block(batch, compressor)
+                scores = [score for _, score, _ in batch]
+                blocks.append(
+                    [
+                        batch[0][0],
+                        batch[-1][0],
+                        f.tell(),
+                        len(block),
+                        min(scores),
+                        max(scores),
+                    ]
+                )
+                f.write(block)
+
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) >= BLOCK_RECORDS:
+                    write_block(batch)
+                    batch = []
+            if batch:
+                write_block(batch)
+
+            index = json.dumps({"blocks": blocks}).encode()
+            offset = f.tell()
+            f.write(index + _FOOTER.pack(offset, len(index)) + MAGIC)
+            f.flush()
+            os.fsync(f.fileno())
+        if not blocks:
+            temporary.unlink()
+            return None
+        os.replace(temporary, path)
+        return path
+
+
+# Per collection prefix
+archives = {
+    collection_prefix: SegmentArchive(
+        Path(REDIS_ARCHIVE_DIR) / collection_prefix.rstrip(":")
+    )
+    for collection_prefix in ARCHIVED_COLLECTIONS
+}
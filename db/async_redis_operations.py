@@ -0,0 +1,1134 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+from redis.exceptions import WatchError
+from .redis_config import (
+    async_redis_client,
+    SECONDARY_INDEXES,
+    REDIS_BATCH_SIZE,
+    REDIS_WRITE_BATCH_SIZE,
+    REDIS_MAX_RETRIES,
+    TRANSACTIONS_PREFIX,
+    TRANSACTIONS_SET,
+    PARTITIONED_INDEXES,
+    ARCHIVED_COLLECTIONS,
+    REDIS_ARCHIVE_AFTER_DAYS,
+    REDIS_ARCHIVE_INTERVAL,
+    REDIS_ARCHIVE_LOCK,
+    REDIS_CLUSTER,
+    PENDING_TRANSFER_PREFIX,
+    UNIQUE_FIELDS,
+    LIST_FIELDS,
+)
+from .redis_operations import (
+    UNSUPPORTED_CODEC,
+    VersionConflictError,
+    track_db_operation,
+    archive_documents,
+    _get_field,
+    _index_entries,
+    _index_set_shards,
+    _candidates_set,
+    _version_key,
+    _document_key,
+    _document_keys,
+    _pending_transfer_key,
+    _pending_transfer,
+    _read_document,
+    _read_documents,
+    _decompress,
+    _decode_document,
+    _update_fields_args,
+    _apply_operations,
+    _apply_transfer,
+    _apply_wallet_entry,
+    _cache_channel,
+    _check_version,
+    _queue_document_write,
+    _queue_document_delete,
+    _transfer_keys_and_args,
+    _timeline_entries,
+    _timeline_key,
+    _timeline_range,
+    _past_cursor,
+    _timeline_page,
+    _scriptable,
+    _named_cursors,
+    _parse_scan_cursor,
+    _scan_cursor,
+    _partitions_key,
+    _partition_range,
+    _within,
+    _read_archived,
+    _archived_records,
+    _update_operations,
+    _index_key,
+    _unique_key,
+    _unique_keys,
+    _queue_claims,
+    _check_claims,
+    _list_keys,
+    _transaction_list_keys,
+    _queue_list_append,
+    _merge_list_values,
+    _list_append_keys,
+    _parse_list_cursor,
+    _list_page,
+)
+from .archive import archives
+from .cluster import AsyncClusterPipeline
+from .document_cache import document_cache
+from .replicas import replica_router, current_replica, note_write
+from .redis_scripts import (
+    TRANSFER_FUNDS_LUA,
+    UPDATE_FIELDS_LUA,
+    WALLET_ENTRY_LUA,
+    RELEASE_CLAIM_LUA,
+    APPEND_LIST_LUA,
+    LINK_LISTS_LUA,
+)
+from utils.db_helpers import deserialize_from_db, deserialize_many_from_db
+from monitoring.metrics import increment_version_conflict, increment_optimistic_retry
+
+logger = logging.getLogger(__name__)
+
+transfer_funds_script = async_redis_client.register_script(TRANSFER_FUNDS_LUA)
+update_fields_script = async_redis_client.register_script(UPDATE_FIELDS_LUA)
+wallet_entry_script = async_redis_client.register_script(WALLET_ENTRY_LUA)
+release_claim_script = async_redis_client.register_script(RELEASE_CLAIM_LUA)
+append_list_script = async_redis_client.register_script(APPEND_LIST_LUA)
+link_lists_script = async_redis_client.register_script(LINK_LISTS_LUA)
+
+
+def _reader() -> Any:
+    """Get the client for reads, the replica of a routed read operation if any"""
+    return current_replica() or async_redis_client
+
+
+async def _read_cached_documents(collection_prefix: str, keys: List[str]) -> List[Any]:
+    """Read decompressed stored documents, through the cache when enabled"""
+    if not document_cache.caches(collection_prefix):
+        values = await _read_documents(_reader(), keys)
+        return [_decompress(collection_prefix, value) for value in values]
+
+    values = [document_cache.get(key) for key in keys]
+    missing = [i for i, value in enumerate(values) if value is None]
+    if missing:
+        # Misses are read from the primary, a lagging replica could otherwise
+        # cache a document older than its last invalidation
+        token = document_cache.token()
+        fetched = await _read_documents(async_redis_client, [keys[i] for i in missing])
+        for i, value in zip(missing, fetched):
+            values[i] = _decompress(collection_prefix, value)
+            document_cache.put(keys[i], values[i], token)
+    return values
+
+
+async def _read_archived_async(
+    collection_prefix: str, doc_ids: List[str], values: List[Any]
+) -> List[Any]:
+    """_read_archived off the event loop, segment files are mapped and
+    decompressed synchronously"""
+    if collection_prefix not in archives or all(values):
+        return values
+    return await asyncio.to_thread(_read_archived, collection_prefix, doc_ids, values)
+
+
+async def _iter_documents(
+    collection_prefix: str, doc_ids: Iterable[str], batch_size: int
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Yield (id, document) pairs, fetching one MGET batch at a time"""
+    doc_ids = list(doc_ids)
+    for start in range(0, len(doc_ids), batch_size):
+        batch = doc_ids[start : start + batch_size]
+        values = await _read_cached_documents(
+            collection_prefix,
+            [_document_key(collection_prefix, doc_id) for doc_id in batch],
+        )
+        values = await _read_archived_async(collection_prefix, batch, values)
+
+        # Skip IDs whose document no longer exists
+        found = [(doc_id, value) for doc_id, value in zip(batch, values) if value]
+        documents = deserialize_many_from_db([value for _, value in found])
+        for (doc_id, _), data in zip(found, documents):
+            yield doc_id, data
+
+
+async def _claim_unique_values(
+    collection_prefix: str, documents: Dict[str, Dict[str, Any]]
+) -> List[Tuple[str, str]]:
+    """Claim the unique values of documents about to be written, see
+    redis_operations._claim_unique_values"""
+    if collection_prefix not in UNIQUE_FIELDS:
+        return []
+    pipe = async_redis_client.pipeline(transaction=False)
+    claims = _queue_claims(pipe, collection_prefix, documents)
+    if not claims:
+        return []
+    claimed, conflict = _check_claims(claims, await pipe.execute())
+    if conflict is not None:
+        await _release_claims(claimed)
+        raise conflict
+    return claimed
+
+
+async def _release_claims(claimed: List[Tuple[str, str]]) -> None:
+    """Release unique values claimed for a write that failed"""
+    for key, doc_id in claimed:
+        await release_claim_script(keys=[key], args=[doc_id])
+
+
+def _pipeline(transaction: bool = True) -> Any:
+    """Start a pipeline, a MULTI/EXEC block unless transaction is False"""
+    note_write()
+    if REDIS_CLUSTER and transaction:
+        return AsyncClusterPipeline(async_redis_client)
+    return async_redis_client.pipeline(transaction=transaction)
+
+
+async def _write_document(
+    collection_prefix: str,
+    doc_id: str,
+    data: Dict[str, Any],
+    index_set: Optional[str],
+    previous_entries: Set[str],
+) -> None:
+    """Write a document and its index entries in a single round trip"""
+    pipe = _pipeline()
+    _queue_document_write(
+        pipe, collection_prefix, doc_id, data, index_set, previous_entries
+    )
+    await pipe.execute()
+
+
+async def _run_optimistic(
+    operation: str,
+    collection_prefix: str,
+    keys: List[str],
+    transaction: Callable[[Any], Awaitable[Any]],
+) -> Any:
+    """Run transaction(pipe) with the documents WATCHed, retrying on conflicts"""
+    watched = [*keys, *(_version_key(key) for key in keys)]
+    for attempt in range(REDIS_MAX_RETRIES):
+        async with _pipeline() as pipe:
+            try:
+                await pipe.watch(*watched)
+                return await transaction(pipe)
+            except WatchError:
+                increment_version_conflict(operation, collection_prefix)
+                if attempt + 1 < REDIS_MAX_RETRIES:
+                    increment_optimistic_retry(operation, collection_prefix)
+    raise VersionConflictError(
+        f"{', '.join(keys)} modified concurrently {REDIS_MAX_RETRIES} times "
+        f"during {operation}"
+    )
+
+
+@track_db_operation
+@replica_router.route
+async def get_document(collection_prefix: str, doc_id: str) -> Optional[Dict[str, Any]]:
+    """Get a document from Redis by ID, or from the archive once archived"""
+    key = _document_key(collection_prefix, doc_id)
+    if not document_cache.caches(collection_prefix):
+        data = await _read_document(_reader(), key)
+        data = (await _read_archived_async(collection_prefix, [doc_id], [data]))[0]
+        return _decode_document(collection_prefix, data)
+
+    data = document_cache.get(key)
+    if data is None:
+        token = document_cache.token()
+        data = _decompress(
+            collection_prefix, await _read_document(async_redis_client, key)
+        )
+        document_cache.put(key, data, token)
+    return deserialize_from_db(data)
+
+
+@track_db_operation
+async def get_document_with_version(
+    collection_prefix: str, doc_id: str
+) -> Tuple[Optional[Dict[str, Any]], int]:
+    """Get a document and the version it was read at"""
+    key = _document_key(collection_prefix, doc_id)
+    # Version first, see redis_operations.get_document_with_version
+    pipe = async_redis_client.pipeline(transaction=False)
+    pipe.get(_version_key(key))
+    _read_document(pipe, key)
+    version, data = await pipe.execute()
+    return _decode_document(collection_prefix, data), int(version or 0)
+
+
+@replica_router.route
+async def get_unique_owners(
+    unique_fields: List[Tuple[str, str]], value: Any
+) -> List[Optional[str]]:
+    """Get the IDs of the documents holding a value of unique fields, given as
+    (collection prefix, field path), in one round trip"""
+    pipe = _reader().pipeline(transaction=False)
+    for collection_prefix, field_path in unique_fields:
+        pipe.get(_unique_key(collection_prefix, field_path, value))
+    return await pipe.execute()
+
+
+@replica_router.route
+async def find_document(
+    collection_prefixes: List[str], doc_id: str
+) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """Get a document from the first of several collections holding its ID"""
+    if not collection_prefixes:
+        return None, None
+    keys = [_document_key(prefix, doc_id) for prefix in collection_prefixes]
+    values = await _read_documents(_reader(), keys)
+    for prefix, value in zip(collection_prefixes, values):
+        if value:
+            return prefix, _decode_document(prefix, value)
+    return None, None
+
+
+@track_db_operation
+async def set_document(
+    collection_prefix: str,
+    doc_id: str,
+    data: Dict[str, Any],
+    index_set: Optional[str] = None,
+) -> str:
+    """Save a document to Redis"""
+    # Without secondary indexes the write does not depend on the stored document
+    if collection_prefix not in SECONDARY_INDEXES:
+        await _write_document(collection_prefix, doc_id, data, index_set, set())
+        return doc_id
+
+    key = _document_key(collection_prefix, doc_id)
+
+    async def transaction(pipe):
+        # Drop index entries of the stored document that no longer apply
+        previous = _decode_document(collection_prefix, await _read_document(pipe, key))
+        pipe.multi()
+        _queue_document_write(
+            pipe,
+            collection_prefix,
+            doc_id,
+            data,
+            index_set,
+            _index_entries(collection_prefix, doc_id, previous),
+            _timeline_entries(collection_prefix, previous),
+            _unique_keys(collection_prefix, previous),
+        )
+        await pipe.execute()
+        return doc_id
+
+    claimed = await _claim_unique_values(collection_prefix, {doc_id: data})
+    try:
+        return await _run_optimistic(
+            "set_document", collection_prefix, [key], transaction
+        )
+    except BaseException:
+        await _release_claims(claimed)
+        raise
+
+
+@track_db_operation
+async def modify_document(
+    collection_prefix: str,
+    doc_id: str,
+    modifier: Callable[[Dict[str, Any]], None],
+    index_set: Optional[str] = None,
+    expected_version: Optional[int] = None,
+) -> Optional[Dict[str, Any]]:
+    """Apply modifier to a document in place and save it, retrying on conflicts
+
+    Returns the saved document, or None when it does not exist.
+    """
+    key = _document_key(collection_prefix, doc_id)
+
+    async def transaction(pipe):
+        data = _decode_document(collection_prefix, await _read_document(pipe, key))
+        if data is None:
+            return None
+        if expected_version is not None:
+            _check_version(
+                int(await pipe.get(_version_key(key)) or 0),
+                expected_version,
+                collection_prefix,
+                key,
+            )
+        previous_entries = _index_entries(collection_prefix, doc_id, data)
+        previous_timelines = _timeline_entries(collection_prefix, data)
+        previous_claims = _unique_keys(collection_prefix, data)
+        modifier(data)
+        claimed = await _claim_unique_values(collection_prefix, {doc_id: data})
+        try:
+            pipe.multi()
+            _queue_document_write(
+                pipe,
+                collection_prefix,
+                doc_id,
+                data,
+                index_set,
+                previous_entries,
+                previous_timelines,
+                previous_claims,
+            )
+            await pipe.execute()
+        except BaseException:
+            await _release_claims(claimed)
+            raise
+        return data
+
+    return await _run_optimistic(
+        "modify_document", collection_prefix, [key], transaction
+    )
+
+
+@track_db_operation
+async def delete_document(
+    collection_prefix: str, doc_id: str, index_set: Optional[str] = None
+) -> bool:
+    """Delete a document from Redis"""
+    key = _document_key(collection_prefix, doc_id)
+
+    async def transaction(pipe):
+        data = _decode_document(collection_prefix, await _read_document(pipe, key))
+        pipe.multi()
+        _queue_document_delete(
+            pipe,
+            collection_prefix,
+            doc_id,
+            index_set,
+            _index_entries(collection_prefix, doc_id, data),
+            _timeline_entries(collection_prefix, data),
+            _unique_keys(collection_prefix, data),
+        )
+        await pipe.execute()
+        return True
+
+    if collection_prefix in SECONDARY_INDEXES:
+        return await _run_optimistic(
+            "delete_document", collection_prefix, [key], transaction
+        )
+
+    pipe = _pipeline()
+    _queue_document_delete(pipe, collection_prefix, doc_id, index_set, set())
+    await pipe.execute()
+    return True
+
+
+@track_db_operation
+@replica_router.route
+async def get_many_documents(
+    collection_prefix: str,
+    doc_ids: Iterable[str],
+    batch_size: int = REDIS_BATCH_SIZE,
+) -> List[Dict[str, Any]]:
+    """Get multiple documents by ID using batched MGET calls"""
+    return [
+        data
+        async for _, data in _iter_documents(collection_prefix, doc_ids, batch_size)
+    ]
+
+
+async def _listing_sets(
+    collection_prefix: str,
+    index_set: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> List[str]:
+    """Get the sets listing the documents of a collection, oldest partition first"""
+    if collection_prefix not in PARTITIONED_INDEXES:
+        return _index_set_shards(index_set)
+    months = await _reader().zrangebyscore(
+        _partitions_key(index_set), *_partition_range(since, until)
+    )
+    return [
+        shard for month in months for shard in _index_set_shards(f"{index_set}:{month}")
+    ]
+
+
+@track_db_operation
+@replica_router.route
+async def get_all_documents(
+    collection_prefix: str, index_set: str
+) -> List[Dict[str, Any]]:
+    """Get all documents of a specific type"""
+    documents = []
+    for listing_set in await _listing_sets(collection_prefix, index_set):
+        all_ids = await _reader().smembers(listing_set)
+        documents.extend(await get_many_documents(collection_prefix, all_ids))
+    return documents
+
+
+async def _read_batch(
+    collection_prefix: str,
+    doc_ids: List[str],
+    since: Optional[datetime],
+    until: Optional[datetime],
+) -> List[Dict[str, Any]]:
+    """Read a batch of documents, keeping those from since to until"""
+    return [
+        data
+        async for _, data in _iter_documents(
+            collection_prefix, doc_ids, REDIS_BATCH_SIZE
+        )
+        if _within(collection_prefix, data, since, until)
+    ]
+
+
+@replica_router.route
+async def iter_document_batches(
+    collection_prefix: str,
+    index_set: str,
+    batch_size: int = REDIS_BATCH_SIZE,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Yield every document of a collection in batches, SSCANning its index set"""
+    for listing_set in await _listing_sets(collection_prefix, index_set, since, until):
+        doc_ids = []
+        async for doc_id in _reader().sscan_iter(listing_set, count=batch_size):
+            doc_ids.append(doc_id)
+            if len(doc_ids) >= batch_size:
+                yield await _read_batch(collection_prefix, doc_ids, since, until)
+                doc_ids = []
+        if doc_ids:
+            yield await _read_batch(collection_prefix, doc_ids, since, until)
+
+    # Archived batches are read off the event loop, see _read_archived_async
+    archived = _archived_records(collection_prefix, batch_size, since, until)
+    while records := await asyncio.to_thread(next, archived, None):
+        # Skip documents written again since they were archived, listed above
+        pipe = _reader().pipeline(transaction=False)
+        for doc_id, _, _ in records:
+            pipe.exists(_document_key(collection_prefix, doc_id))
+        hot = await pipe.execute()
+        yield deserialize_many_from_db(
+            [value for (_, _, value), exists in zip(records, hot) if not exists]
+        )
+
+
+@track_db_operation
+@replica_router.route
+async def scan_documents(
+    collection_prefix: str,
+    index_set: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Get a page of a collection by iterating its index set with SSCAN"""
+    listing_sets = await _listing_sets(collection_prefix, index_set, since, until)
+    named = _named_cursors(collection_prefix)
+    current, position, skip = _parse_scan_cursor(cursor, listing_sets, named)
+    doc_ids = []
+    while current < len(listing_sets) and len(doc_ids) < limit:
+        wanted = limit - len(doc_ids)
+        next_position, batch = await _reader().sscan(
+            listing_sets[current], position, count=skip + wanted
+        )
+        # IDs past the page are returned by the next one, see scan_documents
+        batch = batch[skip:]
+        if len(batch) > wanted:
+            doc_ids.extend(batch[:wanted])
+            skip += wanted
+            break
+        doc_ids.extend(batch)
+        position, skip = next_position, 0
+        if position == 0:
+            current += 1
+    documents = await _read_batch(collection_prefix, doc_ids, since, until)
+    return documents, _scan_cursor(listing_sets, current, position, skip, named)
+
+
+@track_db_operation
+@replica_router.route
+async def query_by_field(
+    collection_prefix: str, index_set: str, field_path: str, value: Any
+) -> List[Dict[str, Any]]:
+    """Query documents where a field equals a value"""
+    result = []
+
+    candidates = _candidates_set(collection_prefix, index_set, field_path, value)
+    if candidates == index_set:
+        candidate_ids = set()
+        for listing_set in await _listing_sets(collection_prefix, index_set):
+            candidate_ids |= await _reader().smembers(listing_set)
+    else:
+        candidate_ids = await _reader().smembers(candidates)
+    async for doc_id, data in _iter_documents(
+        collection_prefix, candidate_ids, REDIS_BATCH_SIZE
+    ):
+        # Re-check the value, index entries only narrow the candidates
+        found, current = _get_field(data, field_path)
+        if found and current == value:
+            data["id"] = doc_id
+            result.append(data)
+
+    return result
+
+
+@track_db_operation
+@replica_router.route
+async def get_timeline(
+    collection_prefix: str,
+    account_id: str,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Tuple[List[str], Optional[str]]:
+    """Get a page of document IDs from the timeline of an account, newest first"""
+    key = _timeline_key(collection_prefix, account_id)
+    cursor, newer, low, high = _timeline_range(before, after, since, until)
+
+    entries, offset = [], 0
+    while len(entries) <= limit:
+        if newer:
+            batch = await _reader().zrangebyscore(
+                key, low, high, start=offset, num=limit + 2, withscores=True
+            )
+        else:
+            batch = await _reader().zrevrangebyscore(
+                key, high, low, start=offset, num=limit + 2, withscores=True
+            )
+        entries.extend(_past_cursor(batch, cursor, newer))
+        offset += len(batch)
+        if len(batch) < limit + 2:
+            break
+    return _timeline_page(entries, limit, newer)
+
+
+async def _update_fields(
+    collection_prefix: str,
+    doc_id: str,
+    operations: List[Tuple[str, str, Any]],
+    expected_version: Optional[int] = None,
+) -> bool:
+    """Apply field operations with the update script"""
+    note_write()
+    keys = _document_keys(collection_prefix, doc_id)
+    result = UNSUPPORTED_CODEC
+    if _scriptable(collection_prefix, operations):
+        result = await update_fields_script(
+            keys=keys,
+            args=_update_fields_args(
+                collection_prefix, doc_id, operations, expected_version
+            ),
+        )
+    if result == UNSUPPORTED_CODEC:
+        # Lua cannot edit the document exactly or maintain its timelines (or
+        # indexes on Redis Cluster), update it client-side instead
+        return (
+            await modify_document(
+                collection_prefix,
+                doc_id,
+                lambda data: _apply_operations(data, operations),
+                expected_version=expected_version,
+            )
+            is not None
+        )
+    if result == -1:
+        increment_version_conflict("update_document", collection_prefix)
+        raise VersionConflictError(f"{keys[0]} is not at version {expected_version}")
+    document_cache.invalidate(keys[0])
+    return bool(result)
+
+
+@track_db_operation
+async def update_document(
+    collection_prefix: str,
+    doc_id: str,
+    update_data: Dict[str, Any],
+    expected_version: Optional[int] = None,
+) -> bool:
+    """Update fields of a document in Redis, applied server-side"""
+    return await _update_fields(
+        collection_prefix, doc_id, _update_operations(update_data), expected_version
+    )
+
+
+@track_db_operation
+async def increment_field(
+    collection_prefix: str, doc_id: str, field_path: str, amount: float
+) -> bool:
+    """Increment a numeric field of a document, applied server-side"""
+    return await _update_fields(
+        collection_prefix, doc_id, [("incr", field_path, amount)]
+    )
+
+
+@track_db_operation
+async def array_union(
+    collection_prefix: str, doc_id: str, field_path: str, values: List[Any]
+) -> bool:
+    """Adds values to an array field, avoiding duplicates"""
+    if field_path in LIST_FIELDS.get(collection_prefix, []):
+        note_write()
+        return bool(
+            await append_list_script(
+                keys=_list_append_keys(collection_prefix, doc_id, field_path),
+                args=values,
+            )
+        )
+    return await _update_fields(
+        collection_prefix, doc_id, [("union", field_path, values)]
+    )
+
+
+@track_db_operation
+async def link_list_fields(
+    collection_prefix: str,
+    doc_id: str,
+    field_path: str,
+    linked_prefix: str,
+    linked_id: str,
+    linked_field: str,
+) -> bool:
+    """Add two documents to the linked array fields of each other"""
+    note_write()
+    keys = _list_append_keys(collection_prefix, doc_id, field_path)
+    linked_keys = _list_append_keys(linked_prefix, linked_id, linked_field)
+    if REDIS_CLUSTER:
+        # The documents are on different slots, linking again completes a link
+        # interrupted between its sides
+        if not await async_redis_client.exists(keys[0]):
+            return False
+        return bool(
+            await append_list_script(keys=linked_keys, args=[doc_id])
+            and await append_list_script(keys=keys, args=[linked_id])
+        )
+    return bool(
+        await link_lists_script(keys=keys + linked_keys, args=[doc_id, linked_id])
+    )
+
+
+@track_db_operation
+@replica_router.route
+async def load_list_fields(
+    collection_prefix: str,
+    doc_id: str,
+    data: Dict[str, Any],
+    field_paths: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Fill in the array fields a document keeps out of it, in one round trip"""
+    fields = (
+        LIST_FIELDS.get(collection_prefix, []) if field_paths is None else field_paths
+    )
+    pipe = _reader().pipeline(transaction=False)
+    for field_path in fields:
+        pipe.lrange(_list_keys(collection_prefix, doc_id, field_path)[0], 0, -1)
+    for field_path, values in zip(fields, await pipe.execute()):
+        _merge_list_values(data, field_path, values)
+    return data
+
+
+@track_db_operation
+@replica_router.route
+async def scan_list_field(
+    collection_prefix: str,
+    doc_id: str,
+    field_path: str,
+    limit: int,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Any], int, Optional[str]]:
+    """Get a page of an array field kept out of its document"""
+    start = _parse_list_cursor(cursor)
+    list_key = _list_keys(collection_prefix, doc_id, field_path)[0]
+    pipe = _reader().pipeline(transaction=False)
+    pipe.lrange(list_key, start, start + limit - 1)
+    pipe.llen(list_key)
+    values, count = await pipe.execute()
+    return _list_page(start, values, count)
+
+
+@track_db_operation
+async def set_many_documents(
+    collection_prefix: str,
+    documents: Dict[str, Dict[str, Any]],
+    index_set: Optional[str] = None,
+    batch_size: int = REDIS_WRITE_BATCH_SIZE,
+) -> int:
+    """Save documents keyed by ID, one pipelined round trip per batch"""
+    items = list(documents.items())
+    if REDIS_CLUSTER and collection_prefix in SECONDARY_INDEXES:
+        # Cluster transactions are limited to the slot of one document
+        batch_size = 1
+    for start in range(0, len(items), batch_size):
+        batch = items[start : start + batch_size]
+        if collection_prefix not in SECONDARY_INDEXES:
+            pipe = _pipeline()
+            for doc_id, data in batch:
+                _queue_document_write(
+                    pipe, collection_prefix, doc_id, data, index_set, set()
+                )
+            await pipe.execute()
+            continue
+
+        keys = [_document_key(collection_prefix, doc_id) for doc_id, _ in batch]
+
+        async def transaction(pipe, batch=batch, keys=keys):
+            values = await _read_documents(pipe, keys)
+            pipe.multi()
+            for (doc_id, data), value in zip(batch, values):
+                previous = _decode_document(collection_prefix, value)
+                _queue_document_write(
+                    pipe,
+                    collection_prefix,
+                    doc_id,
+                    data,
+                    index_set,
+                    _index_entries(collection_prefix, doc_id, previous),
+                    _timeline_entries(collection_prefix, previous),
+                    _unique_keys(collection_prefix, previous),
+                )
+            await pipe.execute()
+
+        claimed = await _claim_unique_values(collection_prefix, dict(batch))
+        try:
+            await _run_optimistic(
+                "set_many_documents", collection_prefix, keys, transaction
+            )
+        except BaseException:
+            await _release_claims(claimed)
+            raise
+    return len(items)
+
+
+@track_db_operation
+async def update_many_documents(
+    collection_prefix: str,
+    updates: Dict[str, Dict[str, Any]],
+    batch_size: int = REDIS_WRITE_BATCH_SIZE,
+    missing: Optional[List[str]] = None,
+) -> int:
+    """Update fields of documents keyed by ID, pipelining the update script"""
+    note_write()
+    updated = 0
+    items = list(updates.items())
+    for start in range(0, len(items), batch_size):
+        queued, client_side, results = [], [], []
+        # Cluster pipelines cannot run scripts, run them one by one there
+        pipe = (
+            async_redis_client
+            if REDIS_CLUSTER
+            else async_redis_client.pipeline(transaction=False)
+        )
+        for doc_id, update_data in items[start : start + batch_size]:
+            operations = _update_operations(update_data)
+            if not _scriptable(collection_prefix, operations):
+                client_side.append((doc_id, operations))
+                continue
+            results.append(
+                await update_fields_script(
+                    keys=_document_keys(collection_prefix, doc_id),
+                    args=_update_fields_args(collection_prefix, doc_id, operations),
+                    client=pipe,
+                )
+            )
+            queued.append((doc_id, operations))
+        if not REDIS_CLUSTER:
+            results = await pipe.execute()
+
+        for (doc_id, operations), result in zip(queued, results):
+            if result == UNSUPPORTED_CODEC:
+                client_side.append((doc_id, operations))
+            elif result:
+                document_cache.invalidate(_document_key(collection_prefix, doc_id))
+                updated += 1
+            elif missing is not None:
+                missing.append(doc_id)
+
+        # Documents the script cannot handle are updated one at a time
+        for doc_id, operations in client_side:
+            data = await modify_document(
+                collection_prefix,
+                doc_id,
+                lambda data, operations=operations: _apply_operations(data, operations),
+            )
+            updated += data is not None
+            if data is None and missing is not None:
+                missing.append(doc_id)
+    return updated
+
+
+@track_db_operation
+async def delete_many_documents(
+    collection_prefix: str,
+    doc_ids: Iterable[str],
+    index_set: Optional[str] = None,
+    batch_size: int = REDIS_WRITE_BATCH_SIZE,
+) -> int:
+    """Delete documents and their index entries, one transaction per batch"""
+    deleted = 0
+    doc_ids = list(doc_ids)
+    if REDIS_CLUSTER:
+        # Cluster transactions are limited to the slot of one document
+        batch_size = 1
+    for start in range(0, len(doc_ids), batch_size):
+        batch = doc_ids[start : start + batch_size]
+        keys = [_document_key(collection_prefix, doc_id) for doc_id in batch]
+
+        async def transaction(pipe, batch=batch, keys=keys):
+            values = await _read_documents(pipe, keys)
+            pipe.multi()
+            for doc_id, value in zip(batch, values):
+                data = _decode_document(collection_prefix, value)
+                _queue_document_delete(
+                    pipe,
+                    collection_prefix,
+                    doc_id,
+                    index_set,
+                    _index_entries(collection_prefix, doc_id, data),
+                    _timeline_entries(collection_prefix, data),
+                    _unique_keys(collection_prefix, data),
+                )
+            await pipe.execute()
+            return sum(1 for value in values if value)
+
+        deleted += await _run_optimistic(
+            "delete_many_documents", collection_prefix, keys, transaction
+        )
+    return deleted
+
+
+@track_db_operation
+async def existing_field_values(
+    collection_prefix: str, field_path: str, values: Iterable[str]
+) -> Set[str]:
+    """Get the values of an indexed field that some document already has"""
+    values = list(values)
+    pipe = async_redis_client.pipeline(transaction=False)
+    for value in values:
+        pipe.exists(_index_key(collection_prefix, field_path, value))
+    return {value for value, exists in zip(values, await pipe.execute()) if exists}
+
+
+async def _record_wallet_entry(
+    account: Tuple[str, str, str],
+    amount: float,
+    transaction_id: str,
+    revert: bool = False,
+    pending_key: Optional[str] = None,
+    pending: str = "",
+) -> str:
+    """Apply one side of a cluster transfer with the wallet entry script"""
+    account_prefix, account_id, wallet = account
+    keys = _document_keys(account_prefix, account_id)
+    list_keys = _transaction_list_keys(account_prefix, account_id, wallet)
+    status = await wallet_entry_script(
+        keys=[*keys, *list_keys, pending_key] if pending_key else [*keys, *list_keys],
+        args=[
+            wallet,
+            amount,
+            transaction_id,
+            "revert" if revert else "apply",
+            _cache_channel(account_prefix),
+            pending,
+        ],
+    )
+    if status != "unsupported_codec":
+        document_cache.invalidate(keys[0])
+        return status
+
+    # Lua cannot decode the document, apply the entry client-side instead
+    async def transaction(pipe):
+        data = _decode_document(account_prefix, await _read_document(pipe, keys[0]))
+        entries = _index_entries(account_prefix, account_id, data)
+        listed = bool(await pipe.sismember(list_keys[1], transaction_id))
+        result, changes_list = _apply_wallet_entry(
+            data, wallet, amount, transaction_id, listed, revert
+        )
+        if result != "ok":
+            return result
+        pipe.multi()
+        _queue_document_write(pipe, account_prefix, account_id, data, None, entries)
+        if changes_list and revert:
+            pipe.srem(list_keys[1], transaction_id)
+            pipe.lrem(list_keys[0], 0, transaction_id)
+        elif changes_list:
+            _queue_list_append(pipe, list_keys, transaction_id)
+        if pending_key and revert:
+            pipe.delete(pending_key)
+        elif pending_key:
+            pipe.set(pending_key, pending)
+        await pipe.execute()
+        return result
+
+    return await _run_optimistic(
+        "transfer_funds", account_prefix, keys[:1], transaction
+    )
+
+
+async def _complete_transfer(pending_key: str, transfer: Dict[str, Any]) -> str:
+    """Credit the payee of a debited cluster transfer and save the transaction"""
+    amount, transaction_id = transfer["amount"], transfer["transaction_id"]
+    status = await _record_wallet_entry(transfer["payee"], amount, transaction_id)
+    if status != "ok":
+        await _record_wallet_entry(
+            transfer["payer"],
+            -amount,
+            transaction_id,
+            revert=True,
+            pending_key=pending_key,
+        )
+        return "payee_not_found" if status == "account_not_found" else status
+    await _write_document(
+        TRANSACTIONS_PREFIX,
+        transaction_id,
+        transfer["transaction"],
+        TRANSACTIONS_SET,
+        set(),
+    )
+    await async_redis_client.delete(pending_key)
+    return "ok"
+
+
+async def _transfer_across_slots(
+    payer: Tuple[str, str, str],
+    payee: Tuple[str, str, str],
+    amount: float,
+    transaction_id: str,
+    transaction_data: Dict[str, Any],
+) -> str:
+    """Transfer funds between accounts on different cluster slots"""
+    keys = [_document_key(payer[0], payer[1]), _document_key(payee[0], payee[1])]
+    documents = await _read_documents(async_redis_client, keys)
+    # Report missing accounts the way the transfer script does, before debiting
+    status = _apply_transfer(
+        _decode_document(payer[0], documents[0]),
+        _decode_document(payee[0], documents[1]),
+        payer[2],
+        payee[2],
+        amount,
+    )
+    if status != "ok":
+        return status
+
+    pending_key = _pending_transfer_key(payer[1], transaction_id)
+    pending = _pending_transfer(payer, payee, amount, transaction_id, transaction_data)
+    status = await _record_wallet_entry(
+        payer, -amount, transaction_id, pending_key=pending_key, pending=pending
+    )
+    if status != "ok":
+        return "payer_not_found" if status == "account_not_found" else status
+    return await _complete_transfer(pending_key, deserialize_from_db(pending))
+
+
+@track_db_operation
+async def transfer_funds(
+    payer_prefix: str,
+    payer_id: str,
+    payer_wallet: str,
+    payee_prefix: str,
+    payee_id: str,
+    payee_wallet: str,
+    amount: float,
+    transaction_id: str,
+    transaction_data: Dict[str, Any],
+) -> str:
+    """Atomically move funds between wallets and save the transaction"""
+    note_write()
+    if REDIS_CLUSTER:
+        return await _transfer_across_slots(
+            (payer_prefix, payer_id, payer_wallet),
+            (payee_prefix, payee_id, payee_wallet),
+            amount,
+            transaction_id,
+            transaction_data,
+        )
+
+    keys, args = _transfer_keys_and_args(
+        payer_prefix,
+        payer_id,
+        payer_wallet,
+        payee_prefix,
+        payee_id,
+        payee_wallet,
+        amount,
+        transaction_id,
+        transaction_data,
+    )
+    status = await transfer_funds_script(keys=keys, args=args)
+    if status != "unsupported_codec":
+        document_cache.invalidate(keys[0])
+        document_cache.invalidate(keys[1])
+        return status
+
+    # Lua cannot decode the documents, transfer client-side under WATCH instead
+    async def transaction(pipe):
+        payer = _decode_document(payer_prefix, await _read_document(pipe, keys[0]))
+        payee = _decode_document(payee_prefix, await _read_document(pipe, keys[1]))
+        result = _apply_transfer(payer, payee, payer_wallet, payee_wallet, amount)
+        if result != "ok":
+            return result
+        pipe.multi()
+        for prefix, doc_id, data, wallet in (
+            (payer_prefix, payer_id, payer, payer_wallet),
+            (payee_prefix, payee_id, payee, payee_wallet),
+        ):
+            entries = _index_entries(prefix, doc_id, data)
+            _queue_document_write(pipe, prefix, doc_id, data, None, entries)
+            _queue_list_append(
+                pipe, _transaction_list_keys(prefix, doc_id, wallet), transaction_id
+            )
+        _queue_document_write(
+            pipe,
+            TRANSACTIONS_PREFIX,
+            transaction_id,
+            transaction_data,
+            TRANSACTIONS_SET,
+            set(),
+        )
+        await pipe.execute()
+        return result
+
+    return await _run_optimistic("transfer_funds", payer_prefix, keys[:2], transaction)
+
+
+async def resume_transfers() -> int:
+    """Complete the cluster transfers interrupted after debiting the payer"""
+    count = 0
+    async for key in async_redis_client.scan_iter(
+        match=f"{PENDING_TRANSFER_PREFIX}*", count=REDIS_BATCH_SIZE
+    ):
+        pending = await async_redis_client.get(key)
+        if pending:
+            await _complete_transfer(key, deserialize_from_db(pending))
+            count += 1
+    return count
+
+
+async def run_archiver() -> None:
+    """Archive old partitions periodically, for as long as the app runs"""
+    while True:
+        try:
+            # The lock expires after an interval, so one worker archives per interval
+            if await async_redis_client.set(
+                REDIS_ARCHIVE_LOCK, "1", nx=True, ex=int(REDIS_ARCHIVE_INTERVAL)
+            ):
+                before = datetime.now(timezone.utc) - timedelta(
+                    days=REDIS_ARCHIVE_AFTER_DAYS
+                )
+                for collection_prefix in ARCHIVED_COLLECTIONS:
+                    index_set = PARTITIONED_INDEXES[collection_prefix][0]
+                    count = await asyncio.to_thread(
+                        archive_documents, collection_prefix, index_set, before
+                    )
+                    logger.info(f"Archived {count} documents of {collection_prefix}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Archiving failed: {e}")
+        await asyncio.sleep(REDIS_ARCHIVE_INTERVAL)
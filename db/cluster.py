@@ -0,0 +1,130 @@
+from typing import Any, Dict, List, Optional, Tuple
+import redis.asyncio as aioredis
+
+# Pipelines standing in for MULTI/EXEC pipelines on Redis Cluster, where a
+# transaction is limited to the slot of its keys and cannot PUBLISH. Once
+# watch() is called, commands on the slot of the first watched key (a document
+# hash-tagged with its version counter and timelines) are queued in a MULTI/EXEC
+# transaction on that slot, and the other commands (index sets, partitions) in
+# a pipeline sent after EXEC. Without watch() every command is pipelined.
+# Publications are sent once both executed. Index entries are therefore updated
+# after the document rather than atomically with it, and rebuild_indexes
+# repairs them should a worker die in between.
+
+
+def _command_key(name: str, args: Tuple[Any, ...]) -> Any:
+    """Get the first key of a pipeline method call"""
+    key = args[1] if name == "execute_command" else args[0]
+    return key[0] if isinstance(key, (list, tuple)) else key
+
+
+class _ClusterPipeline:
+    def __init__(self, client: Any):
+        self._client = client
+        self._transaction: Optional[Any] = None
+        self._slot: Optional[int] = None
+        self._pipeline = client.pipeline(transaction=False)
+        self._publications: List[Tuple[str, str]] = []
+
+    def _start_transaction(self, keys: Tuple[str, ...]) -> None:
+        self._transaction = self._client.pipeline(transaction=True)
+        self._slot = self._client.keyslot(keys[0])
+
+    def publish(self, channel: str, message: str) -> "_ClusterPipeline":
+        self._publications.append((channel, message))
+        return self
+
+    def multi(self) -> None:
+        self._transaction.multi()
+
+    def __getattr__(self, name: str) -> Any:
+        def command(*args, **kwargs):
+            target = self._pipeline
+            if (
+                self._transaction is not None
+                and self._client.keyslot(_command_key(name, args)) == self._slot
+            ):
+                target = self._transaction
+            return getattr(target, name)(*args, **kwargs)
+
+        return command
+
+
+class ClusterPipeline(_ClusterPipeline):
+    """Pipeline for the synchronous cluster client"""
+
+    def watch(self, *keys: str) -> None:
+        self._start_transaction(keys)
+        self._transaction.watch(*keys)
+
+    def execute(self) -> List[Any]:
+        results = self._transaction.execute() if self._transaction else []
+        results += self._pipeline.execute()
+        for channel, message in self._publications:
+            self._client.publish(channel, message)
+        self._publications = []
+        return results
+
+    def reset(self) -> None:
+        if self._transaction is not None:
+            self._transaction.reset()
+        self._pipeline.reset()
+
+    def __enter__(self) -> "ClusterPipeline":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.reset()
+
+
+# Clients of single nodes by node name, see AsyncClusterPipeline.watch()
+_node_clients: Dict[str, aioredis.Redis] = {}
+
+
+def _node_client(node: Any) -> aioredis.Redis:
+    if node.name not in _node_clients:
+        _node_clients[node.name] = aioredis.Redis(
+            host=node.host, port=node.port, decode_responses=True
+        )
+    return _node_clients[node.name]
+
+
+async def close_node_clients() -> None:
+    """Close the connections of the clients of single nodes"""
+    for client in _node_clients.values():
+        await client.aclose()
+    _node_clients.clear()
+
+
+class AsyncClusterPipeline(_ClusterPipeline):
+    """Pipeline for the asyncio cluster client"""
+
+    async def watch(self, *keys: str) -> None:
+        # redis-py sends WATCH and the reads of asyncio cluster transactions
+        # from another event loop, breaking pooled connections, so transactions
+        # go through a client of the node owning the slot instead
+        await self._client.initialize()
+        node = self._client.get_node_from_key(keys[0])
+        self._transaction = _node_client(node).pipeline(transaction=True)
+        self._slot = self._client.keyslot(keys[0])
+        await self._transaction.watch(*keys)
+
+    async def execute(self) -> List[Any]:
+        results = await self._transaction.execute() if self._transaction else []
+        results += await self._pipeline.execute()
+        for channel, message in self._publications:
+            # The asyncio cluster client has no publish()
+            await self._client.execute_command("PUBLISH", channel, message)
+        self._publications = []
+        return results
+
+    async def reset(self) -> None:
+        if self._transaction is not None:
+            await self._transaction.reset()
+        await self._pipeline.reset()
+
+    async def __aenter__(self) -> "AsyncClusterPipeline":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.reset()
@@ -0,0 +1,125 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+from .redis_config import (
+    async_pubsub_client,
+    CACHED_COLLECTIONS,
+    REDIS_CACHE_SIZE,
+    REDIS_CACHE_TTL,
+    REDIS_CACHE_CHANNEL,
+)
+from monitoring.metrics import increment_cache_request, increment_cache_eviction
+
+logger = logging.getLogger(__name__)
+
+
+def _collection(key: str) -> str:
+    """Get the collection prefix of a document key"""
+    return key[: key.index(":") + 1] if ":" in key else "unknown"
+
+
+class DocumentCache:
+    """Bounded LRU cache of stored document values with a TTL
+
+    Values are kept as stored in Redis and decoded on every hit, so callers
+    never share mutable documents. The cache only serves reads while active,
+    that is while this process receives invalidations of documents written by
+    other processes. Listeners get every invalidation, see add_listener().
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.active = False
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        # Incremented on every invalidation, see token() and put()
+        self._invalidations = 0
+        self._listeners: List[Callable[[Optional[str]], None]] = []
+
+    def add_listener(self, listener: Callable[[Optional[str]], None]) -> None:
+        """Call a listener with the key of every invalidated document, or None
+        when every document is"""
+        self._listeners.append(listener)
+
+    def caches(self, collection_prefix: str) -> bool:
+        """Check whether documents of a collection are served from the cache"""
+        return (
+            self.active
+            and self.max_size > 0
+            and collection_prefix in CACHED_COLLECTIONS
+        )
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get the stored value of a document, or None on a miss"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            self._evict(key, "expired")
+            entry = None
+        if entry is None:
+            increment_cache_request(_collection(key), "miss")
+            return None
+        self._entries.move_to_end(key)
+        increment_cache_request(_collection(key), "hit")
+        return entry[1]
+
+    def token(self) -> int:
+        """Take before reading a value from Redis, then pass it to put()"""
+        return self._invalidations
+
+    def put(self, key: str, value: Any, token: int) -> None:
+        """Cache a value read from Redis
+
+        Skipped when any invalidation arrived since the token was taken, as the
+        value may predate the write that caused it.
+        """
+        if token != self._invalidations or not value:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._evict(next(iter(self._entries)), "size")
+
+    def invalidate(self, key: str) -> None:
+        """Drop a document that was written or deleted"""
+        self._invalidations += 1
+        if key in self._entries:
+            self._evict(key, "invalidated")
+        for listener in self._listeners:
+            listener(key)
+
+    def clear(self) -> None:
+        """Drop every document"""
+        self._invalidations += 1
+        self._entries.clear()
+        for listener in self._listeners:
+            listener(None)
+
+    def _evict(self, key: str, reason: str) -> None:
+        del self._entries[key]
+        increment_cache_eviction(_collection(key), reason)
+
+
+document_cache = DocumentCache(REDIS_CACHE_SIZE, REDIS_CACHE_TTL)
+
+
+async def listen_for_invalidations() -> None:
+    """Evict documents written by any worker, for as long as the app runs"""
+    while True:
+        try:
+            async with async_pubsub_client.pubsub() as pubsub:
+                await pubsub.subscribe(REDIS_CACHE_CHANNEL)
+                document_cache.active = True
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        document_cache.invalidate(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Document cache invalidation listener failed: {e}")
+        finally:
+            # Invalidations are lost while disconnected
+            document_cache.active = False
+            document_cache.clear()
+        await asyncio.sleep(1)
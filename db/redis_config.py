@@ -1,14 +1,91 @@
 import redis
+import redis.asyncio as aioredis
 import os
+import importlib.util
+from redis.cluster import RedisCluster, ClusterNode
+from redis.asyncio.cluster import (
+    RedisCluster as AsyncRedisCluster,
+    ClusterNode as AsyncClusterNode,
+)
 
 redis_host = os.environ.get("REDIS_HOST", "localhost")
 redis_port = int(os.environ.get("REDIS_PORT", 6379))
 redis_db = int(os.environ.get("REDIS_DB", 0))
+redis_max_connections = int(os.environ.get("REDIS_MAX_CONNECTIONS", 100))
+
+# Redis Cluster startup nodes as comma-separated host:port pairs. When set, the
+# clients connect to the cluster instead of REDIS_HOST and REDIS_PORT.
+REDIS_CLUSTER_NODES = [
+    node.strip()
+    for node in os.environ.get("REDIS_CLUSTER_NODES", "").split(",")
+    if node.strip()
+]
+REDIS_CLUSTER = bool(REDIS_CLUSTER_NODES)
+
+if REDIS_CLUSTER:
+    cluster_nodes = [
+        (host, int(port))
+        for host, port in (node.rsplit(":", 1) for node in REDIS_CLUSTER_NODES)
+    ]
+    redis_client = RedisCluster(
+        startup_nodes=[ClusterNode(host, port) for host, port in cluster_nodes],
+        decode_responses=True,
+    )
+    # Cluster clients keep a connection pool per node
+    async_redis_pool = None
+    async_redis_client = AsyncRedisCluster(
+        startup_nodes=[AsyncClusterNode(host, port) for host, port in cluster_nodes],
+        decode_responses=True,
+        max_connections=redis_max_connections,
+    )
+    # Cluster clients have no pub/sub, and publications reach every node
+    async_pubsub_client = aioredis.Redis(
+        host=cluster_nodes[0][0], port=cluster_nodes[0][1], decode_responses=True
+    )
+else:
+    # Initialize Redis client (used by scripts and other synchronous callers)
+    redis_client = redis.Redis(
+        host=redis_host, port=redis_port, db=redis_db, decode_responses=True
+    )
+
+    # Initialize asyncio Redis client with a connection pool shared by all requests
+    async_redis_pool = aioredis.BlockingConnectionPool(
+        host=redis_host,
+        port=redis_port,
+        db=redis_db,
+        decode_responses=True,
+        max_connections=redis_max_connections,
+    )
+    async_redis_client = aioredis.Redis(connection_pool=async_redis_pool)
+    async_pubsub_client = async_redis_client
 
-# Initialize Redis client
-redis_client = redis.Redis(
-    host=redis_host, port=redis_port, db=redis_db, decode_responses=True
+# Read replicas of the primary as comma-separated host:port pairs. Read-only
+# operations go to a replica whose lag, measured every
+# REDIS_REPLICA_CHECK_INTERVAL seconds from a heartbeat the primary replicates,
+# is at most REDIS_REPLICA_MAX_LAG seconds, and to the primary otherwise. Not
+# used on Redis Cluster, which has replicas of its own.
+REDIS_REPLICAS = [
+    node.strip()
+    for node in os.environ.get("REDIS_REPLICAS", "").split(",")
+    if node.strip() and not REDIS_CLUSTER
+]
+REDIS_REPLICA_MAX_LAG = float(os.environ.get("REDIS_REPLICA_MAX_LAG", 1))
+REDIS_REPLICA_CHECK_INTERVAL = float(
+    os.environ.get("REDIS_REPLICA_CHECK_INTERVAL", 0.5)
 )
+REDIS_REPLICA_HEARTBEAT = "replicas:heartbeat"
+async_replica_clients = [
+    aioredis.Redis(
+        connection_pool=aioredis.BlockingConnectionPool(
+            host=host,
+            port=int(port),
+            db=redis_db,
+            decode_responses=True,
+            max_connections=redis_max_connections,
+        )
+    )
+    for host, port in (node.rsplit(":", 1) for node in REDIS_REPLICAS)
+]
 
 # Collection prefixes for different entity types
 CITIZENS_PREFIX = "citizen:"
@@ -17,9 +94,171 @@ GOVERNMENTS_PREFIX = "govt:"
 SCHEMES_PREFIX = "scheme:"
 TRANSACTIONS_PREFIX = "txn:"
 
-# Index sets to track all entities of each type
+# Index sets to track all entities of each type. Each is split into
+# REDIS_INDEX_SHARDS sets at {<index set>:<shard>} by a hash of the document ID,
+# so no cluster node holds a whole collection. 1 keeps the sets unsharded.
 CITIZENS_SET = "citizens"
 VENDORS_SET = "vendors"
 GOVERNMENTS_SET = "governments"
 SCHEMES_SET = "schemes"
 TRANSACTIONS_SET = "transactions"
+REDIS_INDEX_SHARDS = int(
+    os.environ.get("REDIS_INDEX_SHARDS", 16 if REDIS_CLUSTER else 1)
+)
+
+# Prefix for secondary index sets (field value -> set of document IDs)
+INDEX_PREFIX = "idx:"
+
+# Fields with a secondary index, per collection
+SECONDARY_INDEXES = {
+    CITIZENS_PREFIX: ["account_info.email", "personal_info.id_number"],
+    VENDORS_PREFIX: ["account_info.email", "business_info.business_id"],
+    GOVERNMENTS_PREFIX: ["account_info.email", "account_info.govt_id"],
+    SCHEMES_PREFIX: ["govt_id"],
+    TRANSACTIONS_PREFIX: ["from_id", "to_id"],
+}
+
+# Prefix for unique constraint keys, <prefix><collection prefix><field>:<value>
+# holding the ID of the document with that value. Writes claim them with SET NX
+# before the document is written, and the claims expire after UNIQUE_CLAIM_TTL
+# seconds unless the write persists them.
+UNIQUE_PREFIX = "uniq:"
+UNIQUE_CLAIM_TTL = 60
+
+# Fields whose value no two documents of a collection may share
+UNIQUE_FIELDS = {
+    CITIZENS_PREFIX: ["account_info.email", "personal_info.id_number"],
+    VENDORS_PREFIX: ["account_info.email", "business_info.business_id"],
+    GOVERNMENTS_PREFIX: ["account_info.email", "account_info.govt_id"],
+}
+
+# Prefix for timelines, sorted sets at <prefix><collection prefix><account ID>
+# holding the IDs of an account's documents scored by their timestamp
+TIMELINE_PREFIX = "timeline:"
+
+# On Redis Cluster, keys are hash-tagged with the ID of the account they belong
+# to: <collection prefix>{<ID>} for documents and their version counter,
+# <TIMELINE_PREFIX><collection prefix>{<ID>} for timelines and
+# <LIST_PREFIX><collection prefix>{<ID>}:<field> for array fields kept out of
+# documents. An account's keys then share a slot and can be updated by one
+# script or transaction.
+# Transfers, which span two accounts, record the debit at
+# <PENDING_TRANSFER_PREFIX>{<payer ID>}:<transaction ID> until they complete.
+PENDING_TRANSFER_PREFIX = "transfer:"
+
+# Fields holding the accounts whose timeline a document is added to, per collection
+TIMELINE_FIELDS = {
+    TRANSACTIONS_PREFIX: ["from_id", "to_id"],
+}
+
+# Prefix for array fields kept out of their document, each a list at
+# <prefix><collection prefix><ID>:<field> holding the values in the order they
+# were added, and a set at <list key><LIST_MEMBERS_SUFFIX> deduplicating them.
+LIST_PREFIX = "list:"
+LIST_MEMBERS_SUFFIX = ":members"
+
+# Array fields kept out of their document, per collection. Appending to them
+# does not rewrite the document, and they are only read by the endpoints
+# showing them, see load_list_fields.
+LIST_FIELDS = {
+    CITIZENS_PREFIX: [
+        "wallet_info.govt_wallet.transactions",
+        "wallet_info.personal_wallet.transactions",
+        "scheme_info",
+    ],
+    VENDORS_PREFIX: ["wallet_info.transactions"],
+    GOVERNMENTS_PREFIX: ["wallet_info.schemes", "wallet_info.transactions"],
+    SCHEMES_PREFIX: ["beneficiaries"],
+}
+
+# Array fields of LIST_FIELDS mirroring each other, as pairs of (collection
+# prefix, field): a document is in the field of every document in its own
+# field. Both sides are added together, see link_list_fields.
+LINKED_LIST_FIELDS = [
+    ((SCHEMES_PREFIX, "beneficiaries"), (CITIZENS_PREFIX, "scheme_info")),
+]
+
+# Collections whose index set is partitioned by the month of a timestamp field,
+# as (index set, field). Documents are listed in <index set>:<YYYY-MM> instead
+# of the index set, and the months in <index set><PARTITIONS_SUFFIX>.
+PARTITIONED_INDEXES = {
+    TRANSACTIONS_PREFIX: (TRANSACTIONS_SET, "timestamp"),
+}
+PARTITIONS_SUFFIX = ":partitions"
+
+# Cold tier: month partitions of these collections whose month ended over
+# REDIS_ARCHIVE_AFTER_DAYS days ago are moved out of Redis into compressed
+# segment files under REDIS_ARCHIVE_DIR/<collection>, which reads fall back to.
+# Archiving runs every REDIS_ARCHIVE_INTERVAL seconds on one worker, 0 days
+# disables it. Workers on other hosts need the directory on a shared volume.
+ARCHIVED_COLLECTIONS = [TRANSACTIONS_PREFIX]
+REDIS_ARCHIVE_DIR = os.environ.get("REDIS_ARCHIVE_DIR", "data/archive")
+REDIS_ARCHIVE_AFTER_DAYS = int(os.environ.get("REDIS_ARCHIVE_AFTER_DAYS", 0))
+REDIS_ARCHIVE_INTERVAL = float(os.environ.get("REDIS_ARCHIVE_INTERVAL", 3600))
+REDIS_ARCHIVE_COMPRESSION = os.environ.get("REDIS_ARCHIVE_COMPRESSION", "zlib")
+REDIS_ARCHIVE_LOCK = "archive:lock"
+
+# Number of keys fetched per MGET when reading documents in bulk
+REDIS_BATCH_SIZE = int(os.environ.get("REDIS_BATCH_SIZE", 500))
+
+# Number of documents written per pipeline by the bulk write operations
+REDIS_WRITE_BATCH_SIZE = int(os.environ.get("REDIS_WRITE_BATCH_SIZE", 100))
+
+# Document storage: "string" stores JSON strings and applies partial updates with
+# Lua, "json" stores native RedisJSON documents (requires the RedisJSON module)
+REDIS_STORAGE_MODE = os.environ.get("REDIS_STORAGE_MODE", "string")
+
+# Codec for documents in "string" storage mode: "json", "orjson" or "msgpack"
+# (the last two need the packages of the "codecs" extra, which the production
+# image installs). Every stored value starts with its codec header, so the
+# codec can change between deployments.
+REDIS_CODEC = os.environ.get("REDIS_CODEC", "json")
+
+# Compression of large documents in "string" storage mode: "none", "zlib", "lz4"
+# or "zstd" (lz4 and zstd need the packages of the "compression" extra, which the
+# production image installs). Encoded documents of at least
+# REDIS_COMPRESSION_THRESHOLD bytes are compressed. REDIS_COMPRESSION_DICTIONARY
+# is a zstd dictionary from scripts/train_compression_dictionary.py, keep it
+# available for as long as documents compressed with it are stored.
+REDIS_COMPRESSION = os.environ.get("REDIS_COMPRESSION", "none")
+REDIS_COMPRESSION_THRESHOLD = int(os.environ.get("REDIS_COMPRESSION_THRESHOLD", 1024))
+REDIS_COMPRESSION_DICTIONARY = os.environ.get("REDIS_COMPRESSION_DICTIONARY")
+
+# Package and extra each optional codec and compressor needs. Configuring one
+# whose package is missing fails here rather than at the first write.
+OPTIONAL_PACKAGES = {
+    "orjson": ("orjson", "codecs"),
+    "msgpack": ("msgpack", "codecs"),
+    "lz4": ("lz4", "compression"),
+    "zstd": ("zstandard", "compression"),
+}
+for setting, name in [
+    ("REDIS_CODEC", REDIS_CODEC),
+    ("REDIS_COMPRESSION", REDIS_COMPRESSION),
+    ("REDIS_ARCHIVE_COMPRESSION", REDIS_ARCHIVE_COMPRESSION),
+]:
+    if name in OPTIONAL_PACKAGES:
+        package, extra = OPTIONAL_PACKAGES[name]
+        if importlib.util.find_spec(package) is None:
+            raise RuntimeError(
+                f"{setting}={name} needs the {package} package, "
+                f"install the '{extra}' extra"
+            )
+
+# Every document has a version counter stored at <document key><VERSION_SUFFIX>,
+# incremented on each write and checked by optimistic updates
+VERSION_SUFFIX = ":version"
+REDIS_MAX_RETRIES = int(os.environ.get("REDIS_MAX_RETRIES", 5))
+
+# In-process cache of hot documents in front of get_document. Writes publish the
+# document key on REDIS_CACHE_CHANNEL so every worker evicts its copy, the TTL
+# bounds staleness if an invalidation is missed. A size of 0 disables it.
+CACHED_COLLECTIONS = [GOVERNMENTS_PREFIX, SCHEMES_PREFIX, VENDORS_PREFIX]
+REDIS_CACHE_SIZE = int(os.environ.get("REDIS_CACHE_SIZE", 10000))
+REDIS_CACHE_TTL = float(os.environ.get("REDIS_CACHE_TTL", 30))
+REDIS_CACHE_CHANNEL = "cache:invalidate"
+
+# Seconds a table of every citizen, loaded to check a scheme against all of
+# them (see utils.eligibility.CitizenTableCache), is reused before it is read
+# again. 0 reads it on every check.
+REDIS_CITIZEN_TABLE_TTL = float(os.environ.get("REDIS_CITIZEN_TABLE_TTL", 300))
@@ -1,14 +1,145 @@
+import json
 import time
+import zlib
+import inspect
 import functools
-from typing import Any, Dict, List, Optional
-from .redis_config import redis_client
-from utils.db_helpers import serialize_for_db, deserialize_from_db
-from monitoring.metrics import REDIS_QUERY_TIME
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+from redis.client import NEVER_DECODE
+from redis.exceptions import WatchError
+from .redis_config import (
+    redis_client,
+    INDEX_PREFIX,
+    SECONDARY_INDEXES,
+    REDIS_BATCH_SIZE,
+    REDIS_WRITE_BATCH_SIZE,
+    TRANSACTIONS_PREFIX,
+    TRANSACTIONS_SET,
+    REDIS_STORAGE_MODE,
+    VERSION_SUFFIX,
+    REDIS_MAX_RETRIES,
+    REDIS_CODEC,
+    REDIS_COMPRESSION,
+    REDIS_COMPRESSION_THRESHOLD,
+    REDIS_COMPRESSION_DICTIONARY,
+    CACHED_COLLECTIONS,
+    REDIS_CACHE_CHANNEL,
+    TIMELINE_PREFIX,
+    TIMELINE_FIELDS,
+    PARTITIONED_INDEXES,
+    PARTITIONS_SUFFIX,
+    REDIS_CLUSTER,
+    REDIS_INDEX_SHARDS,
+    PENDING_TRANSFER_PREFIX,
+    UNIQUE_PREFIX,
+    UNIQUE_FIELDS,
+    UNIQUE_CLAIM_TTL,
+    LIST_PREFIX,
+    LIST_MEMBERS_SUFFIX,
+    LIST_FIELDS,
+)
+from .archive import archives, Record
+from .cluster import ClusterPipeline
+from .document_cache import document_cache
+from .redis_scripts import (
+    TRANSFER_FUNDS_LUA,
+    UPDATE_FIELDS_LUA,
+    WALLET_ENTRY_LUA,
+    RELEASE_CLAIM_LUA,
+    APPEND_LIST_LUA,
+    LINK_LISTS_LUA,
+)
+from utils.db_helpers import (
+    get_codec,
+    get_compressor,
+    find_compressor,
+    register_compressor,
+    zstd_compressor,
+    serialize_for_db,
+    serialize_value_for_db,
+    deserialize_from_db,
+    deserialize_many_from_db,
+)
+from monitoring.metrics import (
+    REDIS_QUERY_TIME,
+    observe_document_size,
+    observe_compression,
+    observe_decompression,
+    increment_version_conflict,
+    increment_optimistic_retry,
+    increment_archived_documents,
+    increment_archive_read,
+)
+
+transfer_funds_script = redis_client.register_script(TRANSFER_FUNDS_LUA)
+update_fields_script = redis_client.register_script(UPDATE_FIELDS_LUA)
+wallet_entry_script = redis_client.register_script(WALLET_ENTRY_LUA)
+release_claim_script = redis_client.register_script(RELEASE_CLAIM_LUA)
+append_list_script = redis_client.register_script(APPEND_LIST_LUA)
+link_lists_script = redis_client.register_script(LINK_LISTS_LUA)
+document_codec = get_codec(REDIS_CODEC)
+
+# Register the trained zstd dictionary before selecting the compressor, it is
+# also needed to read documents when writing with another compressor
+if REDIS_COMPRESSION_DICTIONARY:
+    register_compressor(
+        zstd_compressor(Path(REDIS_COMPRESSION_DICTIONARY).read_bytes())
+    )
+document_compressor = (
+    None if REDIS_COMPRESSION == "none" else get_compressor(REDIS_COMPRESSION)
+)
+
+# Result of the update script for documents it cannot decode
+UNSUPPORTED_CODEC = -2
+
+# Timeline scores are microseconds since this instant
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class VersionConflictError(Exception):
+    """Raised when a document changed concurrently with a versioned write"""
+
+
+class UniqueConstraintError(Exception):
+    """Raised when a write would give a document a unique value another holds"""
+
+    def __init__(self, doc_id: str, field_path: str, value: Any):
+        super().__init__(f"{field_path} {value!r} of {doc_id} is already taken")
+        self.doc_id = doc_id
+        self.field_path = field_path
+        self.value = value
 
 
 def track_db_operation(func):
     """Decorator to track Redis operation execution time"""
 
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            collection = args[0] if args else kwargs.get("collection_prefix", "unknown")
+            start_time = time.time()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                REDIS_QUERY_TIME.labels(
+                    operation=func.__name__, collection=collection
+                ).observe(time.time() - start_time)
+
+        return async_wrapper
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         collection = args[0] if args else kwargs.get("collection_prefix", "unknown")
@@ -31,12 +162,1005 @@ def track_db_operation(func):
     return wrapper
 
 
+def _get_field(data: Dict[str, Any], field_path: str) -> Tuple[bool, Any]:
+    """Resolve a dot-notation field path, returning (found, value)"""
+    current = data
+    for part in field_path.split("."):
+        if isinstance(current, dict) and part in current:
+            current = current[part]
+        else:
+            return False, None
+    return True, current
+
+
+def _is_indexable(value: Any) -> bool:
+    """Only string values are stored in secondary indexes"""
+    return isinstance(value, str)
+
+
+def _index_key(collection_prefix: str, field_path: str, value: Any) -> str:
+    """Build the key of the index set holding IDs whose field equals value"""
+    return f"{INDEX_PREFIX}{collection_prefix}{field_path}:{value}"
+
+
+def _index_set_shard(index_set: str, doc_id: str) -> str:
+    """Get the shard of an index set listing a document"""
+    if REDIS_INDEX_SHARDS <= 1:
+        return index_set
+    shard = zlib.crc32(doc_id.encode()) % REDIS_INDEX_SHARDS
+    return f"{{{index_set}:{shard}}}"
+
+
+def _index_set_shards(index_set: str) -> List[str]:
+    """Get every shard of an index set"""
+    if REDIS_INDEX_SHARDS <= 1:
+        return [index_set]
+    return [f"{{{index_set}:{shard}}}" for shard in range(REDIS_INDEX_SHARDS)]
+
+
+def _index_entries(
+    collection_prefix: str, doc_id: str, data: Optional[Dict[str, Any]]
+) -> Set[str]:
+    """Get the index sets a document belongs to"""
+    entries = set()
+    if not data:
+        return entries
+    for field_path in SECONDARY_INDEXES.get(collection_prefix, []):
+        found, value = _get_field(data, field_path)
+        if found and _is_indexable(value):
+            entries.add(_index_key(collection_prefix, field_path, value))
+    # Month partitions are maintained like the secondary indexes
+    partition = _partition_of(collection_prefix, data)
+    if partition:
+        entries.add(_index_set_shard(f"{partition[0]}:{partition[1]}", doc_id))
+    return entries
+
+
+def _unique_key(collection_prefix: str, field_path: str, value: Any) -> str:
+    """Build the unique constraint key claimed by the document with a value"""
+    return f"{UNIQUE_PREFIX}{collection_prefix}{field_path}:{value}"
+
+
+def _unique_keys(
+    collection_prefix: str, data: Optional[Dict[str, Any]]
+) -> Dict[str, Tuple[str, Any]]:
+    """Get the unique constraint keys of a document, with their field and value"""
+    keys = {}
+    if not data:
+        return keys
+    for field_path in UNIQUE_FIELDS.get(collection_prefix, []):
+        found, value = _get_field(data, field_path)
+        if found and _is_indexable(value):
+            keys[_unique_key(collection_prefix, field_path, value)] = (
+                field_path,
+                value,
+            )
+    return keys
+
+
+def _queue_claims(
+    pipe: Any, collection_prefix: str, documents: Dict[str, Dict[str, Any]]
+) -> List[Tuple[str, str, str, Any]]:
+    """Queue SET NX claims of the unique values of documents, each followed by a
+    GET of its owner. Returns the (key, document ID, field, value) claimed."""
+    claims = []
+    for doc_id, data in documents.items():
+        for key, (field_path, value) in _unique_keys(collection_prefix, data).items():
+            pipe.set(key, doc_id, nx=True, ex=UNIQUE_CLAIM_TTL)
+            pipe.get(key)
+            claims.append((key, doc_id, field_path, value))
+    return claims
+
+
+def _check_claims(
+    claims: List[Tuple[str, str, str, Any]], results: List[Any]
+) -> Tuple[List[Tuple[str, str]], Optional[UniqueConstraintError]]:
+    """Get the (key, document ID) newly claimed and the first conflict, if any"""
+    claimed, conflict = [], None
+    for (key, doc_id, field_path, value), created, owner in zip(
+        claims, results[::2], results[1::2]
+    ):
+        if created:
+            claimed.append((key, doc_id))
+        if owner != doc_id and conflict is None:
+            conflict = UniqueConstraintError(doc_id, field_path, value)
+    return claimed, conflict
+
+
+def _claim_unique_values(
+    collection_prefix: str, documents: Dict[str, Dict[str, Any]]
+) -> List[Tuple[str, str]]:
+    """Claim the unique values of documents about to be written
+
+    Returns the (key, document ID) claimed by this call, to release should the
+    write fail. Raises UniqueConstraintError when another document holds one.
+    """
+    if collection_prefix not in UNIQUE_FIELDS:
+        return []
+    pipe = redis_client.pipeline(transaction=False)
+    claims = _queue_claims(pipe, collection_prefix, documents)
+    if not claims:
+        return []
+    claimed, conflict = _check_claims(claims, pipe.execute())
+    if conflict is not None:
+        _release_claims(claimed)
+        raise conflict
+    return claimed
+
+
+def _release_claims(claimed: List[Tuple[str, str]]) -> None:
+    """Release unique values claimed for a write that failed"""
+    for key, doc_id in claimed:
+        release_claim_script(keys=[key], args=[doc_id])
+
+
+def _candidates_set(
+    collection_prefix: str, index_set: str, field_path: str, value: Any
+) -> str:
+    """Pick the set to read query candidates from"""
+    # Use the secondary index when the field has one, otherwise scan
+    if field_path in SECONDARY_INDEXES.get(collection_prefix, []) and _is_indexable(
+        value
+    ):
+        return _index_key(collection_prefix, field_path, value)
+    return index_set
+
+
+def _parse_timestamp(timestamp: Union[datetime, str]) -> datetime:
+    """Parse a stored timestamp, naive timestamps are UTC"""
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+def _timeline_score(timestamp: Union[datetime, str]) -> int:
+    """Convert a timestamp to its timeline score, microseconds since the epoch"""
+    return (_parse_timestamp(timestamp) - EPOCH) // timedelta(microseconds=1)
+
+
+def _partition_of(
+    collection_prefix: str, data: Optional[Dict[str, Any]]
+) -> Optional[Tuple[str, str]]:
+    """Get the index set and month partition a document is listed in, if any"""
+    if collection_prefix not in PARTITIONED_INDEXES or not data:
+        return None
+    timestamp = _partition_timestamp(collection_prefix, data)
+    index_set = PARTITIONED_INDEXES[collection_prefix][0]
+    return index_set, f"{timestamp.year:04d}-{timestamp.month:02d}"
+
+
+def _partition_timestamp(collection_prefix: str, data: Dict[str, Any]) -> datetime:
+    """Get the timestamp a document is partitioned by"""
+    found, value = _get_field(data, PARTITIONED_INDEXES[collection_prefix][1])
+    # Documents without a timestamp are listed in the first partition
+    return _parse_timestamp(value) if found and value else EPOCH
+
+
+def _partition_score(timestamp: Union[datetime, str]) -> int:
+    """Order partitions by month, as months since the epoch"""
+    if isinstance(timestamp, str) and len(timestamp) == 7:
+        year, month = timestamp.split("-")
+        return (int(year) - 1970) * 12 + int(month) - 1
+    timestamp = _parse_timestamp(timestamp)
+    return (timestamp.year - 1970) * 12 + timestamp.month - 1
+
+
+def _partition_range(
+    since: Optional[datetime], until: Optional[datetime]
+) -> Tuple[Any, Any]:
+    """Get the score range of the partitions overlapping since to until"""
+    return (
+        _partition_score(since) if since else "-inf",
+        _partition_score(until) if until else "+inf",
+    )
+
+
+def _within(
+    collection_prefix: str,
+    data: Dict[str, Any],
+    since: Optional[datetime],
+    until: Optional[datetime],
+) -> bool:
+    """Check the partitioning timestamp of a document against since and until"""
+    if (since is None and until is None) or collection_prefix not in (
+        PARTITIONED_INDEXES
+    ):
+        return True
+    found, value = _get_field(data, PARTITIONED_INDEXES[collection_prefix][1])
+    if not found or not value:
+        return False
+    timestamp = _parse_timestamp(value)
+    return (since is None or timestamp >= _parse_timestamp(since)) and (
+        until is None or timestamp <= _parse_timestamp(until)
+    )
+
+
+def _timeline_key(collection_prefix: str, account_id: str) -> str:
+    """Build the key of the timeline of an account, on its slot on Redis Cluster"""
+    if REDIS_CLUSTER:
+        return f"{TIMELINE_PREFIX}{collection_prefix}{{{account_id}}}"
+    return f"{TIMELINE_PREFIX}{collection_prefix}{account_id}"
+
+
+def _timeline_entries(
+    collection_prefix: str, data: Optional[Dict[str, Any]]
+) -> Dict[str, int]:
+    """Get the timelines a document belongs to, with its score in them"""
+    entries = {}
+    if not data or not data.get("timestamp"):
+        return entries
+    score = _timeline_score(data["timestamp"])
+    for field_path in TIMELINE_FIELDS.get(collection_prefix, []):
+        found, value = _get_field(data, field_path)
+        if found and _is_indexable(value):
+            entries[_timeline_key(collection_prefix, value)] = score
+    return entries
+
+
+def _list_keys(collection_prefix: str, doc_id: str, field_path: str) -> List[str]:
+    """Get the keys of the list and member set of an array field kept out of its
+    document, on the slot of the document on Redis Cluster"""
+    if REDIS_CLUSTER:
+        key = f"{LIST_PREFIX}{collection_prefix}{{{doc_id}}}:{field_path}"
+    else:
+        key = f"{LIST_PREFIX}{collection_prefix}{doc_id}:{field_path}"
+    return [key, f"{key}{LIST_MEMBERS_SUFFIX}"]
+
+
+def _transaction_list_keys(
+    collection_prefix: str, doc_id: str, wallet_path: str
+) -> List[str]:
+    """Get the keys of the transaction list of a wallet"""
+    return _list_keys(collection_prefix, doc_id, f"{wallet_path}.transactions")
+
+
+def _queue_list_append(pipe: Any, list_keys: List[str], value: Any) -> None:
+    """Queue the append of a value not yet held to an array field kept out of
+    its document"""
+    pipe.sadd(list_keys[1], value)
+    pipe.rpush(list_keys[0], value)
+
+
+def _pop_list_fields(
+    collection_prefix: str, data: Dict[str, Any]
+) -> Dict[str, List[Any]]:
+    """Remove the array fields kept out of documents from a document still
+    holding them, returning their values"""
+    moved = {}
+    for field_path in LIST_FIELDS.get(collection_prefix, []):
+        parent_path, _, field = field_path.rpartition(".")
+        found, parent = _get_field(data, parent_path) if parent_path else (True, data)
+        if found and isinstance(parent, dict) and isinstance(parent.get(field), list):
+            moved[field_path] = parent.pop(field)
+    return moved
+
+
+def _merge_list_values(
+    data: Dict[str, Any], field_path: str, values: List[Any]
+) -> None:
+    """Set an array field kept out of a document, after the values it still holds"""
+    *parents, field = field_path.split(".")
+    target = data
+    for part in parents:
+        if not isinstance(target.get(part), dict):
+            target[part] = {}
+        target = target[part]
+    held = target[field] if isinstance(target.get(field), list) else []
+    seen = set(held)
+    target[field] = held + [value for value in values if value not in seen]
+
+
+def _list_append_keys(
+    collection_prefix: str, doc_id: str, field_path: str
+) -> List[str]:
+    """Get the keys of the append and link scripts for an array field kept out
+    of its document"""
+    return [
+        *_document_keys(collection_prefix, doc_id),
+        *_list_keys(collection_prefix, doc_id, field_path),
+    ]
+
+
+def _parse_list_cursor(cursor: Optional[str]) -> int:
+    """Get the list position a page cursor points to"""
+    if not cursor:
+        return 0
+    if not cursor.isdigit():
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    return int(cursor)
+
+
+def _list_page(
+    start: int, values: List[Any], count: int
+) -> Tuple[List[Any], int, Optional[str]]:
+    """Build a page of a list from its values and length"""
+    end = start + len(values)
+    return values, count, str(end) if end < count else None
+
+
+def _parse_timeline_cursor(cursor: str) -> Tuple[int, str]:
+    """Split a cursor into the score and ID of the entry it points to"""
+    score, separator, doc_id = cursor.partition(":")
+    if not separator or not doc_id:
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    return int(score), doc_id
+
+
+def _timeline_range(
+    before: Optional[str],
+    after: Optional[str],
+    since: Optional[datetime],
+    until: Optional[datetime],
+) -> Tuple[Optional[Tuple[int, str]], bool, Any, Any]:
+    """Get the cursor, direction and score range (min, max) of a timeline page"""
+    if before is not None and after is not None:
+        raise ValueError("Only one of before and after can be given")
+    newer = after is not None
+    cursor = (
+        _parse_timeline_cursor(after if newer else before)
+        if (after or before)
+        else None
+    )
+    low = _timeline_score(since) if since else None
+    high = _timeline_score(until) if until else None
+    # The range includes the cursor score, entries sharing it are filtered out
+    if cursor and newer:
+        low = cursor[0] if low is None else max(low, cursor[0])
+    elif cursor:
+        high = cursor[0] if high is None else min(high, cursor[0])
+    return (
+        cursor,
+        newer,
+        "-inf" if low is None else low,
+        "+inf" if high is None else high,
+    )
+
+
+def _past_cursor(
+    entries: List[Tuple[str, float]], cursor: Optional[Tuple[int, str]], newer: bool
+) -> List[Tuple[str, float]]:
+    """Drop the entries at or before the cursor in paging order"""
+    if cursor is None:
+        return entries
+    score, doc_id = cursor
+    # Entries with the same score are ordered by ID
+    return [
+        (member, member_score)
+        for member, member_score in entries
+        if member_score != score or (member > doc_id if newer else member < doc_id)
+    ]
+
+
+def _timeline_page(
+    entries: List[Tuple[str, float]], limit: int, newer: bool
+) -> Tuple[List[str], Optional[str]]:
+    """Get the IDs of a page, newest first, and the cursor of the next page"""
+    page = entries[:limit]
+    next_cursor = None
+    if len(entries) > limit:
+        doc_id, score = page[-1]
+        next_cursor = f"{int(score)}:{doc_id}"
+    if newer:
+        page.reverse()
+    return [doc_id for doc_id, _ in page], next_cursor
+
+
+def _named_cursors(collection_prefix: str) -> bool:
+    """Check whether the page cursors of a collection name their listing set"""
+    return collection_prefix in PARTITIONED_INDEXES or REDIS_INDEX_SHARDS > 1
+
+
+def _parse_scan_cursor(
+    cursor: Optional[str], listing_sets: List[str], named: bool
+) -> Tuple[int, int, int]:
+    """Get the listing set, SSCAN position and IDs to skip a page cursor points to
+
+    Cursors of collections listed in several sets (partitions or shards) are
+    "<listing set>:<position>", others are the position alone. A "+<skip>"
+    suffix skips the IDs at the start of the position already returned.
+    """
+    if not cursor:
+        return 0, 0, 0
+    key, _, position = cursor.rpartition(":")
+    if not named and not key:
+        key = listing_sets[0]
+    position, plus, skip = position.partition("+")
+    if (
+        key not in listing_sets
+        or not position.isdigit()
+        or (plus and not skip.isdigit())
+    ):
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    return listing_sets.index(key), int(position), int(skip or 0)
+
+
+def _scan_cursor(
+    listing_sets: List[str], current: int, position: int, skip: int, named: bool
+) -> Optional[str]:
+    """Build the cursor of the next page, None when every set was scanned"""
+    if current >= len(listing_sets):
+        return None
+    cursor = f"{position}+{skip}" if skip else str(position)
+    if named:
+        return f"{listing_sets[current]}:{cursor}"
+    return cursor
+
+
+def _partitions_key(index_set: str) -> str:
+    """Build the key of the sorted set listing the partitions of an index set"""
+    return f"{index_set}{PARTITIONS_SUFFIX}"
+
+
+def _version_key(key: str) -> str:
+    """Build the key of the version counter of a document"""
+    return f"{key}{VERSION_SUFFIX}"
+
+
+def _document_key(collection_prefix: str, doc_id: str) -> str:
+    """Build the key of a document, hash-tagged with its ID on Redis Cluster"""
+    if REDIS_CLUSTER:
+        return f"{collection_prefix}{{{doc_id}}}"
+    return f"{collection_prefix}{doc_id}"
+
+
+def _document_keys(collection_prefix: str, doc_id: str) -> List[str]:
+    """Get the key of a document and of its version counter"""
+    key = _document_key(collection_prefix, doc_id)
+    return [key, _version_key(key)]
+
+
+def _pending_transfer_key(payer_id: str, transaction_id: str) -> str:
+    """Build the key of a cluster transfer record, on the slot of the payer"""
+    return f"{PENDING_TRANSFER_PREFIX}{{{payer_id}}}:{transaction_id}"
+
+
+def _read_document(client: Any, key: str) -> Any:
+    """Issue the read command for a stored document"""
+    # Documents may be binary, so they are returned undecoded
+    if REDIS_STORAGE_MODE == "json":
+        return client.execute_command("JSON.GET", key, ".", **{NEVER_DECODE: []})
+    return client.execute_command("GET", key, **{NEVER_DECODE: []})
+
+
+def _read_documents(client: Any, keys: List[str]) -> Any:
+    """Issue the bulk read command for stored documents"""
+    if REDIS_CLUSTER and len(keys) > 1:
+        # Documents are on different slots, read them one by one in a pipeline
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            _read_document(pipe, key)
+        return pipe.execute()
+    if REDIS_STORAGE_MODE == "json":
+        return client.execute_command("JSON.MGET", *keys, ".", **{NEVER_DECODE: []})
+    return client.execute_command("MGET", *keys, **{NEVER_DECODE: []})
+
+
+def _encode_document(collection_prefix: str, data: Dict[str, Any]) -> Any:
+    """Serialize a document for the configured storage mode, codec and compression"""
+    if REDIS_STORAGE_MODE == "json":
+        return serialize_for_db(data)
+
+    value = serialize_for_db(data, document_codec)
+    observe_document_size(collection_prefix, len(value))
+    if document_compressor is None or len(value) < REDIS_COMPRESSION_THRESHOLD:
+        return value
+
+    start_time = time.thread_time()
+    compressed = document_compressor.header + document_compressor.compress(value)
+    observe_compression(
+        collection_prefix, len(compressed) / len(value), time.thread_time() - start_time
+    )
+    # Store documents that do not shrink uncompressed
+    return compressed if len(compressed) < len(value) else value
+
+
+def _decompress(collection_prefix: str, value: Any) -> Any:
+    """Undo the compression of a stored value, if it is compressed"""
+    compressor = find_compressor(value)
+    if compressor is None:
+        return value
+    start_time = time.thread_time()
+    value = compressor.decompress(value[1:])
+    observe_decompression(collection_prefix, time.thread_time() - start_time)
+    return value
+
+
+def _decode_document(collection_prefix: str, value: Any) -> Optional[Dict[str, Any]]:
+    """Deserialize a stored document"""
+    return deserialize_from_db(_decompress(collection_prefix, value))
+
+
+def _apply_operations(
+    data: Dict[str, Any], operations: List[Tuple[str, str, Any]]
+) -> None:
+    """Apply field update operations to a document, as the update script does"""
+    for operation, path, value in operations:
+        *parents, field = path.split(".")
+        target = data
+        for part in parents:
+            if not isinstance(target.get(part), dict):
+                target[part] = {}
+            target = target[part]
+
+        if operation == "set":
+            target[field] = value
+        elif operation == "incr":
+            target[field] = (target.get(field) or 0) + value
+        elif operation == "union":
+            if not isinstance(target.get(field), list):
+                target[field] = []
+            for item in value:
+                if item not in target[field]:
+                    target[field].append(item)
+
+
+def _apply_transfer(
+    payer: Optional[Dict[str, Any]],
+    payee: Optional[Dict[str, Any]],
+    payer_wallet: str,
+    payee_wallet: str,
+    amount: float,
+) -> str:
+    """Move funds between two loaded documents, as the transfer script does
+
+    The transaction is not added to the transaction lists of the wallets, which
+    are kept out of the documents.
+    """
+    if payer is None:
+        return "payer_not_found"
+    if payee is None:
+        return "payee_not_found"
+    found_payer, source = _get_field(payer, payer_wallet)
+    found_payee, target = _get_field(payee, payee_wallet)
+    if not (
+        found_payer
+        and found_payee
+        and isinstance(source, dict)
+        and isinstance(target, dict)
+    ):
+        return "wallet_not_found"
+    if (source.get("balance") or 0) < amount:
+        return "insufficient_balance"
+
+    source["balance"] -= amount
+    target["balance"] = (target.get("balance") or 0) + amount
+    return "ok"
+
+
+def _apply_wallet_entry(
+    data: Optional[Dict[str, Any]],
+    wallet_path: str,
+    amount: float,
+    transaction_id: str,
+    listed: bool,
+    revert: bool = False,
+) -> Tuple[str, bool]:
+    """Apply one side of a transfer to a loaded document, as the script does
+
+    listed tells whether the transaction list of the wallet holds the
+    transaction. Returns the status and whether the transaction is to be added
+    to that list, or removed from it when reverting.
+    """
+    if data is None:
+        return "account_not_found", False
+    found, wallet = _get_field(data, wallet_path)
+    if not found or not isinstance(wallet, dict):
+        return "wallet_not_found", False
+    # Entries applied before transaction lists were kept out of documents
+    transactions = wallet.get("transactions")
+    embedded = isinstance(transactions, list) and transaction_id in transactions
+    if not revert:
+        if listed or embedded:
+            return "ok", False
+        if (wallet.get("balance") or 0) + amount < 0:
+            return "insufficient_balance", False
+        wallet["balance"] = (wallet.get("balance") or 0) + amount
+        return "ok", True
+    if listed or embedded:
+        wallet["balance"] = (wallet.get("balance") or 0) - amount
+        if not listed:
+            transactions.remove(transaction_id)
+    return "ok", listed
+
+
+def _pending_transfer(
+    payer: Tuple[str, str, str],
+    payee: Tuple[str, str, str],
+    amount: float,
+    transaction_id: str,
+    transaction_data: Dict[str, Any],
+) -> str:
+    """Serialize the record of a cluster transfer kept until it completes"""
+    return serialize_for_db(
+        {
+            "payer": payer,
+            "payee": payee,
+            "amount": amount,
+            "transaction_id": transaction_id,
+            "transaction": transaction_data,
+        }
+    )
+
+
+def _cache_channel(*collection_prefixes: str) -> str:
+    """Get the channel to publish writes to, empty when nothing is cached"""
+    if any(prefix in CACHED_COLLECTIONS for prefix in collection_prefixes):
+        return REDIS_CACHE_CHANNEL
+    return ""
+
+
+def _update_fields_args(
+    collection_prefix: str,
+    doc_id: str,
+    operations: List[Tuple[str, str, Any]],
+    expected_version: Optional[int] = None,
+) -> List[str]:
+    """Build the ARGV of the field update script"""
+    args = [
+        doc_id,
+        json.dumps(_affected_indexes(collection_prefix, operations)),
+        "" if expected_version is None else str(expected_version),
+        _cache_channel(collection_prefix),
+    ]
+    for operation, path, value in operations:
+        args.extend([operation, path, serialize_value_for_db(value)])
+    return args
+
+
+def _affected_indexes(
+    collection_prefix: str, operations: List[Tuple[str, str, Any]]
+) -> Dict[str, str]:
+    """Get the indexed fields operations can change, with their index key prefix"""
+    return {
+        field_path: _index_key(collection_prefix, field_path, "")
+        for field_path in SECONDARY_INDEXES.get(collection_prefix, [])
+        if any(
+            field_path == path or field_path.startswith(f"{path}.")
+            for _, path, _ in operations
+        )
+    }
+
+
+def _moves_timelines(
+    collection_prefix: str, operations: List[Tuple[str, str, Any]]
+) -> bool:
+    """Check whether field operations change the timelines of a document"""
+    fields = TIMELINE_FIELDS.get(collection_prefix)
+    return bool(fields) and any(
+        path == "timestamp" or path in fields for _, path, _ in operations
+    )
+
+
+def _scriptable(collection_prefix: str, operations: List[Tuple[str, str, Any]]) -> bool:
+    """Check whether the update script can apply field operations
+
+    It does not maintain timelines or unique constraints, nor on Redis Cluster
+    secondary indexes, which are on other slots than the document.
+    """
+    if _moves_timelines(collection_prefix, operations):
+        return False
+    if any(
+        field_path == path or field_path.startswith(f"{path}.")
+        for field_path in UNIQUE_FIELDS.get(collection_prefix, [])
+        for _, path, _ in operations
+    ):
+        return False
+    return not (REDIS_CLUSTER and _affected_indexes(collection_prefix, operations))
+
+
+def _queue_cache_invalidation(pipe: Any, collection_prefix: str, key: str) -> None:
+    """Queue the publication of a document write to every worker's cache"""
+    if collection_prefix in CACHED_COLLECTIONS:
+        pipe.publish(REDIS_CACHE_CHANNEL, key)
+        document_cache.invalidate(key)
+
+
+def _queue_document_write(
+    pipe: Any,
+    collection_prefix: str,
+    doc_id: str,
+    data: Dict[str, Any],
+    index_set: Optional[str],
+    previous_entries: Set[str],
+    previous_timelines: Iterable[str] = (),
+    previous_claims: Iterable[str] = (),
+) -> None:
+    """Queue a document write and its index entries on a pipeline
+
+    Unique values of the document must have been claimed beforehand, see
+    _claim_unique_values.
+    """
+    key = _document_key(collection_prefix, doc_id)
+    entries = _index_entries(collection_prefix, doc_id, data)
+    timelines = _timeline_entries(collection_prefix, data)
+    claims = _unique_keys(collection_prefix, data)
+
+    if REDIS_STORAGE_MODE == "json":
+        pipe.execute_command(
+            "JSON.SET", key, ".", _encode_document(collection_prefix, data)
+        )
+    else:
+        pipe.set(key, _encode_document(collection_prefix, data))
+    pipe.incr(_version_key(key))
+    _queue_cache_invalidation(pipe, collection_prefix, key)
+    partition = _partition_of(collection_prefix, data)
+    if partition:
+        pipe.zadd(
+            _partitions_key(partition[0]),
+            {partition[1]: _partition_score(partition[1])},
+        )
+    elif index_set:
+        pipe.sadd(_index_set_shard(index_set, doc_id), doc_id)
+    for entry in previous_entries - entries:
+        pipe.srem(entry, doc_id)
+    for entry in entries:
+        pipe.sadd(entry, doc_id)
+    for timeline in set(previous_timelines) - timelines.keys():
+        pipe.zrem(timeline, doc_id)
+    for timeline, score in timelines.items():
+        pipe.zadd(timeline, {doc_id: score})
+    for claim in claims:
+        pipe.persist(claim)
+    for claim in set(previous_claims) - claims.keys():
+        pipe.delete(claim)
+
+
+def _queue_document_delete(
+    pipe: Any,
+    collection_prefix: str,
+    doc_id: str,
+    index_set: Optional[str],
+    entries: Set[str],
+    timelines: Iterable[str] = (),
+    claims: Iterable[str] = (),
+) -> None:
+    """Queue a document delete and the removal of its index entries"""
+    key = _document_key(collection_prefix, doc_id)
+    pipe.delete(key, _version_key(key))
+    _queue_cache_invalidation(pipe, collection_prefix, key)
+    # Remove from index set if provided
+    if index_set:
+        pipe.srem(_index_set_shard(index_set, doc_id), doc_id)
+    for entry in entries:
+        pipe.srem(entry, doc_id)
+    for timeline in timelines:
+        pipe.zrem(timeline, doc_id)
+    for claim in claims:
+        pipe.delete(claim)
+    for field_path in LIST_FIELDS.get(collection_prefix, []):
+        pipe.delete(*_list_keys(collection_prefix, doc_id, field_path))
+
+
+def _pipeline(transaction: bool = True) -> Any:
+    """Start a pipeline, a MULTI/EXEC block unless transaction is False
+
+    On Redis Cluster transactions are limited to one slot, see db.cluster.
+    """
+    if REDIS_CLUSTER and transaction:
+        return ClusterPipeline(redis_client)
+    return redis_client.pipeline(transaction=transaction)
+
+
+def _write_document(
+    collection_prefix: str,
+    doc_id: str,
+    data: Dict[str, Any],
+    index_set: Optional[str],
+    previous_entries: Set[str],
+) -> None:
+    """Write a document and its index entries in a single round trip"""
+    pipe = _pipeline()
+    _queue_document_write(
+        pipe, collection_prefix, doc_id, data, index_set, previous_entries
+    )
+    pipe.execute()
+
+
+def _run_optimistic(
+    operation: str,
+    collection_prefix: str,
+    keys: List[str],
+    transaction: Callable[[Any], Any],
+) -> Any:
+    """Run transaction(pipe) with the documents WATCHed, retrying on conflicts
+
+    The transaction reads through the pipeline, then calls pipe.multi() and
+    queues its writes. EXEC fails when a document or its version changed
+    since WATCH, and the whole transaction runs again up to REDIS_MAX_RETRIES.
+    On Redis Cluster the keys must share a slot, that is belong to one document.
+    """
+    watched = [*keys, *(_version_key(key) for key in keys)]
+    for attempt in range(REDIS_MAX_RETRIES):
+        with _pipeline() as pipe:
+            try:
+                pipe.watch(*watched)
+                return transaction(pipe)
+            except WatchError:
+                increment_version_conflict(operation, collection_prefix)
+                if attempt + 1 < REDIS_MAX_RETRIES:
+                    increment_optimistic_retry(operation, collection_prefix)
+    raise VersionConflictError(
+        f"{', '.join(keys)} modified concurrently {REDIS_MAX_RETRIES} times "
+        f"during {operation}"
+    )
+
+
+def _check_version(
+    version: int, expected_version: int, collection_prefix: str, key: str
+) -> None:
+    """Raise VersionConflictError when a document is not at the expected version"""
+    if version != expected_version:
+        increment_version_conflict("update_document", collection_prefix)
+        raise VersionConflictError(f"{key} is not at version {expected_version}")
+
+
+def _transfer_keys_and_args(
+    payer_prefix: str,
+    payer_id: str,
+    payer_wallet: str,
+    payee_prefix: str,
+    payee_id: str,
+    payee_wallet: str,
+    amount: float,
+    transaction_id: str,
+    transaction_data: Dict[str, Any],
+) -> Tuple[List[str], List[Any]]:
+    """Build the KEYS and ARGV of the transfer script"""
+    documents = [
+        _document_key(payer_prefix, payer_id),
+        _document_key(payee_prefix, payee_id),
+        _document_key(TRANSACTIONS_PREFIX, transaction_id),
+    ]
+    timelines = _timeline_entries(TRANSACTIONS_PREFIX, transaction_data)
+    partition = _partition_of(TRANSACTIONS_PREFIX, transaction_data)
+    keys = [
+        *documents,
+        *(_version_key(key) for key in documents),
+        *_transaction_list_keys(payer_prefix, payer_id, payer_wallet),
+        *_transaction_list_keys(payee_prefix, payee_id, payee_wallet),
+        (
+            _partitions_key(TRANSACTIONS_SET)
+            if partition
+            else _index_set_shard(TRANSACTIONS_SET, transaction_id)
+        ),
+        *timelines,
+        *sorted(_index_entries(TRANSACTIONS_PREFIX, transaction_id, transaction_data)),
+    ]
+    args = [
+        payer_wallet,
+        payee_wallet,
+        amount,
+        transaction_id,
+        _encode_document(TRANSACTIONS_PREFIX, transaction_data),
+        REDIS_STORAGE_MODE,
+        _cache_channel(payer_prefix, payee_prefix),
+        next(iter(timelines.values()), 0),
+        len(timelines),
+        partition[1] if partition else "",
+        _partition_score(partition[1]) if partition else 0,
+    ]
+    return keys, args
+
+
+def _read_archived(
+    collection_prefix: str, doc_ids: List[str], values: List[Any]
+) -> List[Any]:
+    """Fill in the stored values of documents missing from Redis from the archive"""
+    archive = archives.get(collection_prefix)
+    missing = [i for i, value in enumerate(values) if not value]
+    if archive is None or not missing:
+        return values
+    found = archive.get_many(doc_ids[i] for i in missing)
+    increment_archive_read(collection_prefix, "hit", len(found))
+    increment_archive_read(collection_prefix, "miss", len(missing) - len(found))
+    values = list(values)
+    for i in missing:
+        values[i] = found.get(doc_ids[i])
+    return values
+
+
+def _archived_records(
+    collection_prefix: str,
+    batch_size: int,
+    since: Optional[datetime],
+    until: Optional[datetime],
+) -> Iterator[List[Record]]:
+    """Yield the archived records from since to until in batches"""
+    archive = archives.get(collection_prefix)
+    if archive is None:
+        return
+    for partition in archive.partitions():
+        score = _partition_score(partition)
+        if (since and score < _partition_score(since)) or (
+            until and score > _partition_score(until)
+        ):
+            continue
+        batch = []
+        for record in archive.records(
+            partition,
+            _timeline_score(since) if since else None,
+            _timeline_score(until) if until else None,
+        ):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def _iter_documents(
+    collection_prefix: str, doc_ids: Iterable[str], batch_size: int
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield (id, document) pairs, fetching one MGET batch at a time"""
+    doc_ids = list(doc_ids)
+    for start in range(0, len(doc_ids), batch_size):
+        batch = doc_ids[start : start + batch_size]
+        values = _read_documents(
+            redis_client, [_document_key(collection_prefix, doc_id) for doc_id in batch]
+        )
+        values = _read_archived(collection_prefix, batch, values)
+
+        # Skip IDs whose document no longer exists
+        found = [(doc_id, value) for doc_id, value in zip(batch, values) if value]
+        documents = deserialize_many_from_db(
+            [_decompress(collection_prefix, value) for _, value in found]
+        )
+        yield from zip((doc_id for doc_id, _ in found), documents)
+
+
 @track_db_operation
 def get_document(collection_prefix: str, doc_id: str) -> Optional[Dict[str, Any]]:
-    """Get a document from Redis by ID"""
-    key = f"{collection_prefix}{doc_id}"
-    data = redis_client.get(key)
-    return deserialize_from_db(data)
+    """Get a document from Redis by ID, or from the archive once archived"""
+    key = _document_key(collection_prefix, doc_id)
+    data = _read_document(redis_client, key)
+    data = _read_archived(collection_prefix, [doc_id], [data])[0]
+    return _decode_document(collection_prefix, data)
+
+
+@track_db_operation
+def get_document_with_version(
+    collection_prefix: str, doc_id: str
+) -> Tuple[Optional[Dict[str, Any]], int]:
+    """Get a document and the version it was read at"""
+    key = _document_key(collection_prefix, doc_id)
+    # Not a MULTI block, whose reply would be decoded as a whole. Reading the
+    # version first means a concurrent write can only make it look stale.
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.get(_version_key(key))
+    _read_document(pipe, key)
+    version, data = pipe.execute()
+    return _decode_document(collection_prefix, data), int(version or 0)
+
+
+def get_unique_owners(
+    unique_fields: List[Tuple[str, str]], value: Any
+) -> List[Optional[str]]:
+    """Get the IDs of the documents holding a value of unique fields, given as
+    (collection prefix, field path), in one round trip"""
+    pipe = redis_client.pipeline(transaction=False)
+    for collection_prefix, field_path in unique_fields:
+        pipe.get(_unique_key(collection_prefix, field_path, value))
+    return pipe.execute()
+
+
+def find_document(
+    collection_prefixes: List[str], doc_id: str
+) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """Get a document from the first of several collections holding its ID
+
+    All collections are read in one round trip. Returns (None, None) when none
+    holds it.
+    """
+    if not collection_prefixes:
+        return None, None
+    keys = [_document_key(prefix, doc_id) for prefix in collection_prefixes]
+    for prefix, value in zip(collection_prefixes, _read_documents(redis_client, keys)):
+        if value:
+            return prefix, _decode_document(prefix, value)
+    return None, None
 
 
 @track_db_operation
@@ -47,12 +1171,87 @@ def set_document(
     index_set: Optional[str] = None,
 ) -> str:
     """Save a document to Redis"""
-    key = f"{collection_prefix}{doc_id}"
-    redis_client.set(key, serialize_for_db(data))
-    # Add to index set if provided
-    if index_set:
-        redis_client.sadd(index_set, doc_id)
-    return doc_id
+    # Without secondary indexes the write does not depend on the stored document
+    if collection_prefix not in SECONDARY_INDEXES:
+        _write_document(collection_prefix, doc_id, data, index_set, set())
+        return doc_id
+
+    key = _document_key(collection_prefix, doc_id)
+
+    def transaction(pipe):
+        # Drop index entries of the stored document that no longer apply
+        previous = _decode_document(collection_prefix, _read_document(pipe, key))
+        pipe.multi()
+        _queue_document_write(
+            pipe,
+            collection_prefix,
+            doc_id,
+            data,
+            index_set,
+            _index_entries(collection_prefix, doc_id, previous),
+            _timeline_entries(collection_prefix, previous),
+            _unique_keys(collection_prefix, previous),
+        )
+        pipe.execute()
+        return doc_id
+
+    claimed = _claim_unique_values(collection_prefix, {doc_id: data})
+    try:
+        return _run_optimistic("set_document", collection_prefix, [key], transaction)
+    except BaseException:
+        _release_claims(claimed)
+        raise
+
+
+@track_db_operation
+def modify_document(
+    collection_prefix: str,
+    doc_id: str,
+    modifier: Callable[[Dict[str, Any]], None],
+    index_set: Optional[str] = None,
+    expected_version: Optional[int] = None,
+) -> Optional[Dict[str, Any]]:
+    """Apply modifier to a document in place and save it, retrying on conflicts
+
+    Returns the saved document, or None when it does not exist.
+    """
+    key = _document_key(collection_prefix, doc_id)
+
+    def transaction(pipe):
+        data = _decode_document(collection_prefix, _read_document(pipe, key))
+        if data is None:
+            return None
+        if expected_version is not None:
+            _check_version(
+                int(pipe.get(_version_key(key)) or 0),
+                expected_version,
+                collection_prefix,
+                key,
+            )
+        previous_entries = _index_entries(collection_prefix, doc_id, data)
+        previous_timelines = _timeline_entries(collection_prefix, data)
+        previous_claims = _unique_keys(collection_prefix, data)
+        modifier(data)
+        claimed = _claim_unique_values(collection_prefix, {doc_id: data})
+        try:
+            pipe.multi()
+            _queue_document_write(
+                pipe,
+                collection_prefix,
+                doc_id,
+                data,
+                index_set,
+                previous_entries,
+                previous_timelines,
+                previous_claims,
+            )
+            pipe.execute()
+        except BaseException:
+            _release_claims(claimed)
+            raise
+        return data
+
+    return _run_optimistic("modify_document", collection_prefix, [key], transaction)
 
 
 @track_db_operation
@@ -60,24 +1259,161 @@ def delete_document(
     collection_prefix: str, doc_id: str, index_set: Optional[str] = None
 ) -> bool:
     """Delete a document from Redis"""
-    key = f"{collection_prefix}{doc_id}"
-    redis_client.delete(key)
-    # Remove from index set if provided
-    if index_set:
-        redis_client.srem(index_set, doc_id)
+    key = _document_key(collection_prefix, doc_id)
+
+    def transaction(pipe):
+        data = _decode_document(collection_prefix, _read_document(pipe, key))
+        pipe.multi()
+        _queue_document_delete(
+            pipe,
+            collection_prefix,
+            doc_id,
+            index_set,
+            _index_entries(collection_prefix, doc_id, data),
+            _timeline_entries(collection_prefix, data),
+            _unique_keys(collection_prefix, data),
+        )
+        pipe.execute()
+        return True
+
+    if collection_prefix in SECONDARY_INDEXES:
+        return _run_optimistic("delete_document", collection_prefix, [key], transaction)
+
+    pipe = _pipeline()
+    _queue_document_delete(pipe, collection_prefix, doc_id, index_set, set())
+    pipe.execute()
     return True
 
 
+@track_db_operation
+def get_many_documents(
+    collection_prefix: str,
+    doc_ids: Iterable[str],
+    batch_size: int = REDIS_BATCH_SIZE,
+) -> List[Dict[str, Any]]:
+    """Get multiple documents by ID using batched MGET calls"""
+    return [data for _, data in _iter_documents(collection_prefix, doc_ids, batch_size)]
+
+
+def _listing_sets(
+    collection_prefix: str,
+    index_set: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> List[str]:
+    """Get the sets listing the documents of a collection, oldest partition first
+
+    since and until select the partitions of partitioned collections. Every
+    shard of the index set or partitions is listed.
+    """
+    if collection_prefix not in PARTITIONED_INDEXES:
+        return _index_set_shards(index_set)
+    months = redis_client.zrangebyscore(
+        _partitions_key(index_set), *_partition_range(since, until)
+    )
+    return [
+        shard for month in months for shard in _index_set_shards(f"{index_set}:{month}")
+    ]
+
+
 @track_db_operation
 def get_all_documents(collection_prefix: str, index_set: str) -> List[Dict[str, Any]]:
     """Get all documents of a specific type"""
-    result = []
-    all_ids = redis_client.smembers(index_set)
-    for doc_id in all_ids:
-        data = get_document(collection_prefix, doc_id)
-        if data:
-            result.append(data)
-    return result
+    documents = []
+    for listing_set in _listing_sets(collection_prefix, index_set):
+        all_ids = redis_client.smembers(listing_set)
+        documents.extend(get_many_documents(collection_prefix, all_ids))
+    return documents
+
+
+def iter_document_batches(
+    collection_prefix: str,
+    index_set: str,
+    batch_size: int = REDIS_BATCH_SIZE,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Iterator[List[Dict[str, Any]]]:
+    """Yield every document of a collection in batches, SSCANning its index set
+
+    Only one batch is held in memory at a time. Documents added or removed
+    during the iteration may or may not be included. since and until limit
+    partitioned collections to documents from that period. Archived documents
+    follow the documents in Redis.
+    """
+    for listing_set in _listing_sets(collection_prefix, index_set, since, until):
+        doc_ids = []
+        for doc_id in redis_client.sscan_iter(listing_set, count=batch_size):
+            doc_ids.append(doc_id)
+            if len(doc_ids) >= batch_size:
+                yield _read_batch(collection_prefix, doc_ids, since, until)
+                doc_ids = []
+        if doc_ids:
+            yield _read_batch(collection_prefix, doc_ids, since, until)
+
+    for records in _archived_records(collection_prefix, batch_size, since, until):
+        # Skip documents written again since they were archived, listed above
+        pipe = redis_client.pipeline(transaction=False)
+        for doc_id, _, _ in records:
+            pipe.exists(_document_key(collection_prefix, doc_id))
+        hot = pipe.execute()
+        yield deserialize_many_from_db(
+            [value for (_, _, value), exists in zip(records, hot) if not exists]
+        )
+
+
+def _read_batch(
+    collection_prefix: str,
+    doc_ids: List[str],
+    since: Optional[datetime],
+    until: Optional[datetime],
+) -> List[Dict[str, Any]]:
+    """Read a batch of documents, keeping those from since to until"""
+    return [
+        data
+        for _, data in _iter_documents(collection_prefix, doc_ids, REDIS_BATCH_SIZE)
+        if _within(collection_prefix, data, since, until)
+    ]
+
+
+@track_db_operation
+def scan_documents(
+    collection_prefix: str,
+    index_set: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Get a page of a collection by iterating its index set with SSCAN
+
+    Pages hold at most limit documents, fewer when since and until filter
+    pages of partitioned collections. SSCAN returns a varying number of IDs
+    per call (small sets are returned whole), the IDs past the page are
+    returned by the next one, which scans from the same position again and
+    skips those already returned. Returns the documents and the cursor of the
+    next page, or None on the last page. Raises ValueError for an invalid
+    cursor.
+    """
+    listing_sets = _listing_sets(collection_prefix, index_set, since, until)
+    named = _named_cursors(collection_prefix)
+    current, position, skip = _parse_scan_cursor(cursor, listing_sets, named)
+    doc_ids = []
+    while current < len(listing_sets) and len(doc_ids) < limit:
+        wanted = limit - len(doc_ids)
+        next_position, batch = redis_client.sscan(
+            listing_sets[current], position, count=skip + wanted
+        )
+        batch = batch[skip:]
+        if len(batch) > wanted:
+            doc_ids.extend(batch[:wanted])
+            skip += wanted
+            break
+        doc_ids.extend(batch)
+        position, skip = next_position, 0
+        if position == 0:
+            current += 1
+    documents = _read_batch(collection_prefix, doc_ids, since, until)
+    return documents, _scan_cursor(listing_sets, current, position, skip, named)
 
 
 @track_db_operation
@@ -86,57 +1422,389 @@ def query_by_field(
 ) -> List[Dict[str, Any]]:
     """Query documents where a field equals a value"""
     result = []
-    all_ids = redis_client.smembers(index_set)
-
-    # Handle nested fields with dot notation
-    field_parts = field_path.split(".")
-
-    for doc_id in all_ids:
-        data = get_document(collection_prefix, doc_id)
-        if data:
-            # Navigate to the nested field
-            current = data
-            found = True
-            for part in field_parts:
-                if part in current:
-                    current = current[part]
-                else:
-                    found = False
-                    break
-
-            if found and current == value:
-                data["id"] = doc_id
-                result.append(data)
+
+    candidates = _candidates_set(collection_prefix, index_set, field_path, value)
+    if candidates == index_set:
+        candidate_ids = set()
+        for listing_set in _listing_sets(collection_prefix, index_set):
+            candidate_ids |= redis_client.smembers(listing_set)
+    else:
+        candidate_ids = redis_client.smembers(candidates)
+    for doc_id, data in _iter_documents(
+        collection_prefix, candidate_ids, REDIS_BATCH_SIZE
+    ):
+        # Re-check the value, index entries only narrow the candidates
+        found, current = _get_field(data, field_path)
+        if found and current == value:
+            data["id"] = doc_id
+            result.append(data)
 
     return result
 
 
+def _legacy_listing_sets(collection_prefix: str, index_set: str) -> List[str]:
+    """Get the sets that listed a collection before it was partitioned or sharded
+
+    That is the unpartitioned index set of partitioned collections, and the
+    unsharded index set or partitions when sets are sharded.
+    """
+    legacy = []
+    if collection_prefix in PARTITIONED_INDEXES:
+        legacy.append(index_set)
+        if REDIS_INDEX_SHARDS > 1:
+            months = redis_client.zrange(_partitions_key(index_set), 0, -1)
+            legacy.extend(f"{index_set}:{month}" for month in months)
+    elif REDIS_INDEX_SHARDS > 1:
+        legacy.append(index_set)
+    return legacy
+
+
+@track_db_operation
+def rebuild_indexes(collection_prefix: str, index_set: str) -> int:
+    """Rebuild the indexes, timelines, partitions and claims of a collection
+
+    Collections are also rebuilt from the sets that listed them before they
+    were partitioned or sharded, see _legacy_listing_sets.
+    """
+    listing_sets = _listing_sets(collection_prefix, index_set)
+    listing_sets += _legacy_listing_sets(collection_prefix, index_set)
+    doc_ids = {
+        doc_id
+        for listing_set in listing_sets
+        for doc_id in redis_client.sscan_iter(listing_set, count=REDIS_BATCH_SIZE)
+    }
+
+    count = 0
+    pipe = _pipeline()
+    for doc_id, data in _iter_documents(collection_prefix, doc_ids, REDIS_BATCH_SIZE):
+        if collection_prefix not in PARTITIONED_INDEXES:
+            pipe.sadd(_index_set_shard(index_set, doc_id), doc_id)
+        for entry in _index_entries(collection_prefix, doc_id, data):
+            pipe.sadd(entry, doc_id)
+        partition = _partition_of(collection_prefix, data)
+        if partition:
+            pipe.zadd(
+                _partitions_key(partition[0]),
+                {partition[1]: _partition_score(partition[1])},
+            )
+        for timeline, score in _timeline_entries(collection_prefix, data).items():
+            pipe.zadd(timeline, {doc_id: score})
+        # The first document listed keeps a value other documents share
+        for claim in _unique_keys(collection_prefix, data):
+            pipe.set(claim, doc_id, nx=True)
+        count += 1
+        if count % REDIS_BATCH_SIZE == 0:
+            pipe.execute()
+    pipe.execute()
+    return count
+
+
+@track_db_operation
+def move_list_fields(collection_prefix: str, index_set: str) -> int:
+    """Move the array fields of LIST_FIELDS out of the documents still holding them
+
+    Values already in the list of a field are not added again, so moving can
+    be repeated. Returns the number of documents moved.
+    """
+    doc_ids = {
+        doc_id
+        for listing_set in _listing_sets(collection_prefix, index_set)
+        for doc_id in redis_client.sscan_iter(listing_set, count=REDIS_BATCH_SIZE)
+    }
+
+    count = 0
+    for doc_id, data in _iter_documents(collection_prefix, doc_ids, REDIS_BATCH_SIZE):
+        if not _pop_list_fields(collection_prefix, data):
+            continue
+        key = _document_key(collection_prefix, doc_id)
+
+        def transaction(pipe, doc_id=doc_id, key=key):
+            data = _decode_document(collection_prefix, _read_document(pipe, key))
+            moved = _pop_list_fields(collection_prefix, data) if data else {}
+            if not moved:
+                return 0
+            held = {
+                field_path: pipe.smismember(
+                    _list_keys(collection_prefix, doc_id, field_path)[1], values
+                )
+                for field_path, values in moved.items()
+                if values
+            }
+            pipe.multi()
+            entries = _index_entries(collection_prefix, doc_id, data)
+            _queue_document_write(pipe, collection_prefix, doc_id, data, None, entries)
+            for field_path, members in held.items():
+                values = [
+                    value
+                    for value, member in zip(moved[field_path], members)
+                    if not member
+                ]
+                if not values:
+                    continue
+                list_key, members_key = _list_keys(
+                    collection_prefix, doc_id, field_path
+                )
+                # The document held its values before any was added to the list
+                pipe.lpush(list_key, *reversed(values))
+                pipe.sadd(members_key, *values)
+            pipe.execute()
+            return 1
+
+        count += _run_optimistic(
+            "move_list_fields", collection_prefix, [key], transaction
+        )
+    return count
+
+
+@track_db_operation
+def mirror_list_field(
+    collection_prefix: str,
+    index_set: str,
+    field_path: str,
+    linked_prefix: str,
+    linked_field: str,
+    batch_size: int = REDIS_WRITE_BATCH_SIZE,
+) -> int:
+    """Add every document of a collection to the linked array field of the
+    documents in its own one, see LINKED_LIST_FIELDS
+
+    For links added to one side only, before link_list_fields added both.
+    Values already in a list are not added again, so mirroring can be repeated.
+    Returns the number of links to existing documents. Cluster pipelines cannot
+    run scripts, so there the script runs once per link.
+    """
+    linked = 0
+    for listing_set in _listing_sets(collection_prefix, index_set):
+        for doc_id in redis_client.sscan_iter(listing_set, count=REDIS_BATCH_SIZE):
+            members_key = _list_keys(collection_prefix, doc_id, field_path)[1]
+            linked_ids = list(redis_client.sscan_iter(members_key, count=batch_size))
+            for start in range(0, len(linked_ids), batch_size):
+                pipe = (
+                    redis_client
+                    if REDIS_CLUSTER
+                    else redis_client.pipeline(transaction=False)
+                )
+                results = [
+                    append_list_script(
+                        keys=_list_append_keys(linked_prefix, linked_id, linked_field),
+                        args=[doc_id],
+                        client=pipe,
+                    )
+                    for linked_id in linked_ids[start : start + batch_size]
+                ]
+                if not REDIS_CLUSTER:
+                    results = pipe.execute()
+                linked += sum(results)
+    return linked
+
+
+@track_db_operation
+def archive_documents(collection_prefix: str, index_set: str, before: datetime) -> int:
+    """Move the month partitions that ended before a time to the archive
+
+    Each partition is written to a new segment, then its documents are deleted
+    from Redis with their index entries. Timelines are kept, so account
+    histories read archived documents through get_many_documents. Documents
+    written while their partition was being archived stay in Redis and are
+    archived again by a later run. Returns the number of documents archived.
+    """
+    archive = archives[collection_prefix]
+    registry = _partitions_key(index_set)
+    count = 0
+    for month in redis_client.zrangebyscore(
+        registry, "-inf", f"({_partition_score(before)}"
+    ):
+        shards = _index_set_shards(f"{index_set}:{month}")
+        doc_ids = sorted(
+            doc_id
+            for shard in shards
+            for doc_id in redis_client.sscan_iter(shard, count=REDIS_BATCH_SIZE)
+        )
+        versions = {}
+
+        def records() -> Iterator[Record]:
+            # Read in ID order, as segments are sorted by ID
+            for start in range(0, len(doc_ids), REDIS_BATCH_SIZE):
+                batch = doc_ids[start : start + REDIS_BATCH_SIZE]
+                keys = [_document_key(collection_prefix, doc_id) for doc_id in batch]
+                # Per document, as documents are on different slots on Redis Cluster
+                pipe = redis_client.pipeline(transaction=False)
+                for key in keys:
+                    pipe.get(_version_key(key))
+                    _read_document(pipe, key)
+                results = pipe.execute()
+                for doc_id, version, value in zip(batch, results[::2], results[1::2]):
+                    if not value:
+                        continue
+                    value = _decompress(collection_prefix, value)
+                    timestamp = _partition_timestamp(
+                        collection_prefix, deserialize_from_db(value)
+                    )
+                    versions[doc_id] = int(version or 0)
+                    yield doc_id, _timeline_score(timestamp), value
+
+        archive.write_segment(month, records())
+
+        archived = sorted(versions)
+        batch_size = 1 if REDIS_CLUSTER else REDIS_WRITE_BATCH_SIZE
+        for start in range(0, len(archived), batch_size):
+            batch = archived[start : start + batch_size]
+            keys = [_document_key(collection_prefix, doc_id) for doc_id in batch]
+
+            def transaction(pipe):
+                # Cluster pipelines block mget(), though not the MGET command
+                current = pipe.execute_command(
+                    "MGET", *(_version_key(key) for key in keys)
+                )
+                values = _read_documents(pipe, keys)
+                pipe.multi()
+                removed = 0
+                for doc_id, version, value in zip(batch, current, values):
+                    # Keep documents written since they were archived
+                    if not value or int(version or 0) != versions[doc_id]:
+                        continue
+                    _queue_document_delete(
+                        pipe,
+                        collection_prefix,
+                        doc_id,
+                        index_set,
+                        _index_entries(
+                            collection_prefix,
+                            doc_id,
+                            _decode_document(collection_prefix, value),
+                        ),
+                    )
+                    removed += 1
+                pipe.execute()
+                return removed
+
+            try:
+                removed = _run_optimistic(
+                    "archive_documents", collection_prefix, keys, transaction
+                )
+            except VersionConflictError:
+                continue
+            count += removed
+            increment_archived_documents(collection_prefix, removed)
+
+        # Unregister the partition unless a document was written to it meanwhile
+        if REDIS_CLUSTER:
+            # The shards are on other slots than the registry and cannot be
+            # WATCHed with it, check them again once it is removed instead
+            redis_client.zrem(registry, month)
+            if any(redis_client.scard(shard) for shard in shards):
+                redis_client.zadd(registry, {month: _partition_score(month)})
+            continue
+        with redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(*shards)
+                if not any(pipe.scard(shard) for shard in shards):
+                    pipe.multi()
+                    pipe.zrem(registry, month)
+                    pipe.execute()
+            except WatchError:
+                pass
+    return count
+
+
+@track_db_operation
+def get_timeline(
+    collection_prefix: str,
+    account_id: str,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Tuple[List[str], Optional[str]]:
+    """Get a page of document IDs from the timeline of an account, newest first
+
+    Pages continue from a cursor returned by a previous call, towards older
+    documents with before or newer documents with after, optionally limited to
+    documents from since to until. Returns the IDs and the cursor continuing in
+    the same direction, or None on the last page. Raises ValueError for an
+    invalid cursor.
+    """
+    key = _timeline_key(collection_prefix, account_id)
+    cursor, newer, low, high = _timeline_range(before, after, since, until)
+
+    # One entry more than the page tells whether another page follows, and one
+    # more covers the cursor's own entry that is filtered out
+    entries, offset = [], 0
+    while len(entries) <= limit:
+        if newer:
+            batch = redis_client.zrangebyscore(
+                key, low, high, start=offset, num=limit + 2, withscores=True
+            )
+        else:
+            batch = redis_client.zrevrangebyscore(
+                key, high, low, start=offset, num=limit + 2, withscores=True
+            )
+        entries.extend(_past_cursor(batch, cursor, newer))
+        offset += len(batch)
+        if len(batch) < limit + 2:
+            break
+    return _timeline_page(entries, limit, newer)
+
+
+def _update_fields(
+    collection_prefix: str,
+    doc_id: str,
+    operations: List[Tuple[str, str, Any]],
+    expected_version: Optional[int] = None,
+) -> bool:
+    """Apply field operations with the update script"""
+    keys = _document_keys(collection_prefix, doc_id)
+    result = UNSUPPORTED_CODEC
+    if _scriptable(collection_prefix, operations):
+        result = update_fields_script(
+            keys=keys,
+            args=_update_fields_args(
+                collection_prefix, doc_id, operations, expected_version
+            ),
+        )
+    if result == UNSUPPORTED_CODEC:
+        # Lua cannot edit the document exactly or maintain its timelines (or
+        # indexes on Redis Cluster), update it client-side instead
+        return (
+            modify_document(
+                collection_prefix,
+                doc_id,
+                lambda data: _apply_operations(data, operations),
+                expected_version=expected_version,
+            )
+            is not None
+        )
+    if result == -1:
+        increment_version_conflict("update_document", collection_prefix)
+        raise VersionConflictError(f"{keys[0]} is not at version {expected_version}")
+    document_cache.invalidate(keys[0])
+    return bool(result)
+
+
 @track_db_operation
 def update_document(
-    collection_prefix: str, doc_id: str, update_data: Dict[str, Any]
+    collection_prefix: str,
+    doc_id: str,
+    update_data: Dict[str, Any],
+    expected_version: Optional[int] = None,
 ) -> bool:
-    """Update a document in Redis"""
-    data = get_document(collection_prefix, doc_id)
-    if data:
-        # Handle nested field updates
-        for key, value in update_data.items():
-            # Handle nested fields with dot notation
-            parts = key.split(".")
-            target = data
-
-            # Navigate to the nested location
-            for i, part in enumerate(parts):
-                if i == len(parts) - 1:  # Last part is the field to update
-                    target[part] = value
-                else:  # Navigate deeper into the structure
-                    if part not in target:
-                        target[part] = {}
-                    target = target[part]
-
-        # Update the document
-        set_document(collection_prefix, doc_id, data)
-        return True
-    return False
+    """Update fields of a document in Redis, applied server-side
+
+    With expected_version the update only applies if the document is still at
+    that version, otherwise VersionConflictError is raised.
+    """
+    return _update_fields(
+        collection_prefix, doc_id, _update_operations(update_data), expected_version
+    )
+
+
+@track_db_operation
+def increment_field(
+    collection_prefix: str, doc_id: str, field_path: str, amount: float
+) -> bool:
+    """Increment a numeric field of a document, applied server-side"""
+    return _update_fields(collection_prefix, doc_id, [("incr", field_path, amount)])
 
 
 @track_db_operation
@@ -144,31 +1812,481 @@ def array_union(
     collection_prefix: str, doc_id: str, field_path: str, values: List[Any]
 ) -> bool:
     """Adds values to an array field, avoiding duplicates"""
-    data = get_document(collection_prefix, doc_id)
-    if data:
-        # Handle nested fields with dot notation
-        parts = field_path.split(".")
-        target = data
+    if field_path in LIST_FIELDS.get(collection_prefix, []):
+        return bool(
+            append_list_script(
+                keys=_list_append_keys(collection_prefix, doc_id, field_path),
+                args=values,
+            )
+        )
+    return _update_fields(collection_prefix, doc_id, [("union", field_path, values)])
 
-        # Navigate to the nested location
-        for i, part in enumerate(parts):
-            if i == len(parts) - 1:  # Last part is the field to update
-                if part not in target:
-                    target[part] = []
-
-                # Add values, ensuring no duplicates
-                current_array = target[part]
-                for value in values:
-                    if value not in current_array:
-                        current_array.append(value)
-
-                target[part] = current_array
-            else:  # Navigate deeper
-                if part not in target:
-                    target[part] = {}
-                target = target[part]
-
-        # Update the document
-        set_document(collection_prefix, doc_id, data)
-        return True
-    return False
+
+@track_db_operation
+def link_list_fields(
+    collection_prefix: str,
+    doc_id: str,
+    field_path: str,
+    linked_prefix: str,
+    linked_id: str,
+    linked_field: str,
+) -> bool:
+    """Add two documents to the linked array fields of each other, see
+    LINKED_LIST_FIELDS
+
+    Returns False when either document is missing. On Redis Cluster the
+    documents are on different slots and each side is added on its own, the
+    linked document first; linking again completes a link interrupted between
+    them.
+    """
+    keys = _list_append_keys(collection_prefix, doc_id, field_path)
+    linked_keys = _list_append_keys(linked_prefix, linked_id, linked_field)
+    if REDIS_CLUSTER:
+        if not redis_client.exists(keys[0]):
+            return False
+        return bool(
+            append_list_script(keys=linked_keys, args=[doc_id])
+            and append_list_script(keys=keys, args=[linked_id])
+        )
+    return bool(link_lists_script(keys=keys + linked_keys, args=[doc_id, linked_id]))
+
+
+@track_db_operation
+def load_list_fields(
+    collection_prefix: str,
+    doc_id: str,
+    data: Dict[str, Any],
+    field_paths: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Fill in the array fields a document keeps out of it, in one round trip
+
+    Loads field_paths, or every field of LIST_FIELDS. Values the document still
+    holds from before they were kept out of it come first. Returns the document.
+    """
+    fields = (
+        LIST_FIELDS.get(collection_prefix, []) if field_paths is None else field_paths
+    )
+    pipe = redis_client.pipeline(transaction=False)
+    for field_path in fields:
+        pipe.lrange(_list_keys(collection_prefix, doc_id, field_path)[0], 0, -1)
+    for field_path, values in zip(fields, pipe.execute()):
+        _merge_list_values(data, field_path, values)
+    return data
+
+
+@track_db_operation
+def scan_list_field(
+    collection_prefix: str,
+    doc_id: str,
+    field_path: str,
+    limit: int,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Any], int, Optional[str]]:
+    """Get a page of an array field kept out of its document
+
+    Returns the values, the number of values of the field and the cursor of the
+    next page, or None on the last page. Values the document still holds are
+    not read, see scripts/move_list_fields.py. Raises ValueError for an invalid
+    cursor.
+    """
+    start = _parse_list_cursor(cursor)
+    list_key = _list_keys(collection_prefix, doc_id, field_path)[0]
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.lrange(list_key, start, start + limit - 1)
+    pipe.llen(list_key)
+    values, count = pipe.execute()
+    return _list_page(start, values, count)
+
+
+def _update_operations(update_data: Dict[str, Any]) -> List[Tuple[str, str, Any]]:
+    """Turn dot-notation field updates into set operations"""
+    return [("set", path, value) for path, value in update_data.items()]
+
+
+@track_db_operation
+def set_many_documents(
+    collection_prefix: str,
+    documents: Dict[str, Dict[str, Any]],
+    index_set: Optional[str] = None,
+    batch_size: int = REDIS_WRITE_BATCH_SIZE,
+) -> int:
+    """Save documents keyed by ID, one pipelined round trip per batch
+
+    As with set_document, batches of collections with secondary indexes read
+    the stored documents under WATCH and are retried on concurrent writes.
+    A batch giving a document a unique value another holds is not written and
+    raises UniqueConstraintError. Returns the number of documents saved.
+    """
+    items = list(documents.items())
+    if REDIS_CLUSTER and collection_prefix in SECONDARY_INDEXES:
+        # Cluster transactions are limited to the slot of one document
+        batch_size = 1
+    for start in range(0, len(items), batch_size):
+        batch = items[start : start + batch_size]
+        if collection_prefix not in SECONDARY_INDEXES:
+            pipe = _pipeline()
+            for doc_id, data in batch:
+                _queue_document_write(
+                    pipe, collection_prefix, doc_id, data, index_set, set()
+                )
+            pipe.execute()
+            continue
+
+        keys = [_document_key(collection_prefix, doc_id) for doc_id, _ in batch]
+
+        def transaction(pipe, batch=batch, keys=keys):
+            values = _read_documents(pipe, keys)
+            pipe.multi()
+            for (doc_id, data), value in zip(batch, values):
+                previous = _decode_document(collection_prefix, value)
+                _queue_document_write(
+                    pipe,
+                    collection_prefix,
+                    doc_id,
+                    data,
+                    index_set,
+                    _index_entries(collection_prefix, doc_id, previous),
+                    _timeline_entries(collection_prefix, previous),
+                    _unique_keys(collection_prefix, previous),
+                )
+            pipe.execute()
+
+        claimed = _claim_unique_values(collection_prefix, dict(batch))
+        try:
+            _run_optimistic("set_many_documents", collection_prefix, keys, transaction)
+        except BaseException:
+            _release_claims(claimed)
+            raise
+    return len(items)
+
+
+@track_db_operation
+def update_many_documents(
+    collection_prefix: str,
+    updates: Dict[str, Dict[str, Any]],
+    batch_size: int = REDIS_WRITE_BATCH_SIZE,
+    missing: Optional[List[str]] = None,
+) -> int:
+    """Update fields of documents keyed by ID, pipelining the update script
+
+    Returns the number of documents updated, missing documents are skipped
+    and their IDs added to missing when given. Cluster pipelines cannot run scripts, so there the script runs once per
+    document.
+    """
+    updated = 0
+    items = list(updates.items())
+    for start in range(0, len(items), batch_size):
+        queued, client_side, results = [], [], []
+        pipe = (
+            redis_client if REDIS_CLUSTER else redis_client.pipeline(transaction=False)
+        )
+        for doc_id, update_data in items[start : start + batch_size]:
+            operations = _update_operations(update_data)
+            if not _scriptable(collection_prefix, operations):
+                client_side.append((doc_id, operations))
+                continue
+            results.append(
+                update_fields_script(
+                    keys=_document_keys(collection_prefix, doc_id),
+                    args=_update_fields_args(collection_prefix, doc_id, operations),
+                    client=pipe,
+                )
+            )
+            queued.append((doc_id, operations))
+        if not REDIS_CLUSTER:
+            results = pipe.execute()
+
+        for (doc_id, operations), result in zip(queued, results):
+            if result == UNSUPPORTED_CODEC:
+                client_side.append((doc_id, operations))
+            elif result:
+                document_cache.invalidate(_document_key(collection_prefix, doc_id))
+                updated += 1
+            elif missing is not None:
+                missing.append(doc_id)
+
+        # Documents the script cannot handle are updated one at a time
+        for doc_id, operations in client_side:
+            data = modify_document(
+                collection_prefix,
+                doc_id,
+                lambda data, operations=operations: _apply_operations(data, operations),
+            )
+            updated += data is not None
+            if data is None and missing is not None:
+                missing.append(doc_id)
+    return updated
+
+
+@track_db_operation
+def delete_many_documents(
+    collection_prefix: str,
+    doc_ids: Iterable[str],
+    index_set: Optional[str] = None,
+    batch_size: int = REDIS_WRITE_BATCH_SIZE,
+) -> int:
+    """Delete documents and their index entries, one transaction per batch
+
+    Returns the number of documents that existed.
+    """
+    deleted = 0
+    doc_ids = list(doc_ids)
+    if REDIS_CLUSTER:
+        # Cluster transactions are limited to the slot of one document
+        batch_size = 1
+    for start in range(0, len(doc_ids), batch_size):
+        batch = doc_ids[start : start + batch_size]
+        keys = [_document_key(collection_prefix, doc_id) for doc_id in batch]
+
+        def transaction(pipe, batch=batch, keys=keys):
+            values = _read_documents(pipe, keys)
+            pipe.multi()
+            for doc_id, value in zip(batch, values):
+                data = _decode_document(collection_prefix, value)
+                _queue_document_delete(
+                    pipe,
+                    collection_prefix,
+                    doc_id,
+                    index_set,
+                    _index_entries(collection_prefix, doc_id, data),
+                    _timeline_entries(collection_prefix, data),
+                    _unique_keys(collection_prefix, data),
+                )
+            pipe.execute()
+            return sum(1 for value in values if value)
+
+        deleted += _run_optimistic(
+            "delete_many_documents", collection_prefix, keys, transaction
+        )
+    return deleted
+
+
+@track_db_operation
+def existing_field_values(
+    collection_prefix: str, field_path: str, values: Iterable[str]
+) -> Set[str]:
+    """Get the values of an indexed field that some document already has"""
+    values = list(values)
+    pipe = redis_client.pipeline(transaction=False)
+    for value in values:
+        pipe.exists(_index_key(collection_prefix, field_path, value))
+    return {value for value, exists in zip(values, pipe.execute()) if exists}
+
+
+def _record_wallet_entry(
+    account: Tuple[str, str, str],
+    amount: float,
+    transaction_id: str,
+    revert: bool = False,
+    pending_key: Optional[str] = None,
+    pending: str = "",
+) -> str:
+    """Apply one side of a cluster transfer with the wallet entry script
+
+    The account is (prefix, ID, wallet). A pending transfer record on the slot
+    of the account is stored along with the entry, or deleted along with its
+    revert.
+    """
+    account_prefix, account_id, wallet = account
+    keys = _document_keys(account_prefix, account_id)
+    list_keys = _transaction_list_keys(account_prefix, account_id, wallet)
+    status = wallet_entry_script(
+        keys=[*keys, *list_keys, pending_key] if pending_key else [*keys, *list_keys],
+        args=[
+            wallet,
+            amount,
+            transaction_id,
+            "revert" if revert else "apply",
+            _cache_channel(account_prefix),
+            pending,
+        ],
+    )
+    if status != "unsupported_codec":
+        document_cache.invalidate(keys[0])
+        return status
+
+    # Lua cannot decode the document, apply the entry client-side instead
+    def transaction(pipe):
+        data = _decode_document(account_prefix, _read_document(pipe, keys[0]))
+        entries = _index_entries(account_prefix, account_id, data)
+        # The list only changes along with the document, whose version is WATCHed
+        listed = bool(pipe.sismember(list_keys[1], transaction_id))
+        result, changes_list = _apply_wallet_entry(
+            data, wallet, amount, transaction_id, listed, revert
+        )
+        if result != "ok":
+            return result
+        pipe.multi()
+        _queue_document_write(pipe, account_prefix, account_id, data, None, entries)
+        if changes_list and revert:
+            pipe.srem(list_keys[1], transaction_id)
+            pipe.lrem(list_keys[0], 0, transaction_id)
+        elif changes_list:
+            _queue_list_append(pipe, list_keys, transaction_id)
+        if pending_key and revert:
+            pipe.delete(pending_key)
+        elif pending_key:
+            pipe.set(pending_key, pending)
+        pipe.execute()
+        return result
+
+    return _run_optimistic("transfer_funds", account_prefix, keys[:1], transaction)
+
+
+def _complete_transfer(pending_key: str, transfer: Dict[str, Any]) -> str:
+    """Credit the payee of a debited cluster transfer and save the transaction
+
+    The payer is refunded when the payee or their wallet no longer exists.
+    Every step can be repeated, so interrupted transfers complete by running
+    this again.
+    """
+    amount, transaction_id = transfer["amount"], transfer["transaction_id"]
+    status = _record_wallet_entry(transfer["payee"], amount, transaction_id)
+    if status != "ok":
+        _record_wallet_entry(
+            transfer["payer"],
+            -amount,
+            transaction_id,
+            revert=True,
+            pending_key=pending_key,
+        )
+        return "payee_not_found" if status == "account_not_found" else status
+    _write_document(
+        TRANSACTIONS_PREFIX,
+        transaction_id,
+        transfer["transaction"],
+        TRANSACTIONS_SET,
+        set(),
+    )
+    redis_client.delete(pending_key)
+    return "ok"
+
+
+def _transfer_across_slots(
+    payer: Tuple[str, str, str],
+    payee: Tuple[str, str, str],
+    amount: float,
+    transaction_id: str,
+    transaction_data: Dict[str, Any],
+) -> str:
+    """Transfer funds between accounts on different cluster slots
+
+    The accounts are (prefix, ID, wallet). The payer is debited first, along
+    with a pending transfer record on their slot, then _complete_transfer
+    credits the payee. Transfers interrupted in between are completed by
+    resume_transfers.
+    """
+    keys = [_document_key(payer[0], payer[1]), _document_key(payee[0], payee[1])]
+    documents = _read_documents(redis_client, keys)
+    # Report missing accounts the way the transfer script does, before debiting
+    status = _apply_transfer(
+        _decode_document(payer[0], documents[0]),
+        _decode_document(payee[0], documents[1]),
+        payer[2],
+        payee[2],
+        amount,
+    )
+    if status != "ok":
+        return status
+
+    pending_key = _pending_transfer_key(payer[1], transaction_id)
+    pending = _pending_transfer(payer, payee, amount, transaction_id, transaction_data)
+    status = _record_wallet_entry(
+        payer, -amount, transaction_id, pending_key=pending_key, pending=pending
+    )
+    if status != "ok":
+        return "payer_not_found" if status == "account_not_found" else status
+    return _complete_transfer(pending_key, deserialize_from_db(pending))
+
+
+@track_db_operation
+def transfer_funds(
+    payer_prefix: str,
+    payer_id: str,
+    payer_wallet: str,
+    payee_prefix: str,
+    payee_id: str,
+    payee_wallet: str,
+    amount: float,
+    transaction_id: str,
+    transaction_data: Dict[str, Any],
+) -> str:
+    """Atomically move funds between wallets and save the transaction
+
+    Wallets are dot-notation paths to objects holding a balance, whose
+    transaction IDs are kept out of the document (see LIST_FIELDS). Returns
+    "ok", "payer_not_found", "payee_not_found", "wallet_not_found" or
+    "insufficient_balance". On Redis Cluster the transfer is applied in steps,
+    see _transfer_across_slots.
+    """
+    if REDIS_CLUSTER:
+        return _transfer_across_slots(
+            (payer_prefix, payer_id, payer_wallet),
+            (payee_prefix, payee_id, payee_wallet),
+            amount,
+            transaction_id,
+            transaction_data,
+        )
+
+    keys, args = _transfer_keys_and_args(
+        payer_prefix,
+        payer_id,
+        payer_wallet,
+        payee_prefix,
+        payee_id,
+        payee_wallet,
+        amount,
+        transaction_id,
+        transaction_data,
+    )
+    status = transfer_funds_script(keys=keys, args=args)
+    if status != "unsupported_codec":
+        document_cache.invalidate(keys[0])
+        document_cache.invalidate(keys[1])
+        return status
+
+    # Lua cannot decode the documents, transfer client-side under WATCH instead
+    def transaction(pipe):
+        payer = _decode_document(payer_prefix, _read_document(pipe, keys[0]))
+        payee = _decode_document(payee_prefix, _read_document(pipe, keys[1]))
+        result = _apply_transfer(payer, payee, payer_wallet, payee_wallet, amount)
+        if result != "ok":
+            return result
+        pipe.multi()
+        for prefix, doc_id, data, wallet in (
+            (payer_prefix, payer_id, payer, payer_wallet),
+            (payee_prefix, payee_id, payee, payee_wallet),
+        ):
+            entries = _index_entries(prefix, doc_id, data)
+            _queue_document_write(pipe, prefix, doc_id, data, None, entries)
+            _queue_list_append(
+                pipe, _transaction_list_keys(prefix, doc_id, wallet), transaction_id
+            )
+        _queue_document_write(
+            pipe,
+            TRANSACTIONS_PREFIX,
+            transaction_id,
+            transaction_data,
+            TRANSACTIONS_SET,
+            set(),
+        )
+        pipe.execute()
+        return result
+
+    return _run_optimistic("transfer_funds", payer_prefix, keys[:2], transaction)
+
+
+def resume_transfers() -> int:
+    """Complete the cluster transfers interrupted after debiting the payer
+
+    Returns the number of transfers completed or refunded.
+    """
+    count = 0
+    for key in redis_client.scan_iter(
+        match=f"{PENDING_TRANSFER_PREFIX}*", count=REDIS_BATCH_SIZE
+    ):
+        pending = redis_client.get(key)
+        if pending:
+            _complete_transfer(key, deserialize_from_db(pending))
+            count += 1
+    return count
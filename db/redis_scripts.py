@@ -0,0 +1,645 @@
+# Lua scripts executed server-side with EVALSHA (redis-py falls back to EVAL
+# and caches the script on NOSCRIPT)
+
+# Helpers shared by scripts that edit JSON documents
+LUA_JSON_HELPERS = r"""
+-- Documents are edited as JSON text: the values an update touches are located
+-- in the text and replaced, keeping the rest byte for byte. Decoding documents
+-- with cjson would write every number back as a double with 14 digits (1.0
+-- becomes 1) and reorder the keys.
+local INTEGER_LIMIT = 2 ^ 53
+
+local function split_path(path)
+    local parts = {}
+    for part in string.gmatch(path, '[^%.]+') do
+        table.insert(parts, part)
+    end
+    return parts
+end
+
+local function skip_whitespace(text, pos)
+    return string.find(text, '[^ \t\r\n]', pos) or #text + 1
+end
+
+local function skip_string(text, pos)
+    pos = pos + 1
+    while true do
+        local found = string.find(text, '["\\]', pos)
+        if string.sub(text, found, found) == '"' then
+            return found + 1
+        end
+        pos = found + 2
+    end
+end
+
+-- Position after the JSON value starting at pos
+local function skip_value(text, pos)
+    local first = string.sub(text, pos, pos)
+    if first == '"' then
+        return skip_string(text, pos)
+    elseif first ~= '{' and first ~= '[' then
+        return string.find(text, '[,}%]%s]', pos) or #text + 1
+    end
+    local depth = 0
+    while true do
+        pos = string.find(text, '["{}%[%]]', pos)
+        local char = string.sub(text, pos, pos)
+        if char == '"' then
+            pos = skip_string(text, pos)
+        else
+            depth = depth + ((char == '{' or char == '[') and 1 or -1)
+            pos = pos + 1
+            if depth == 0 then
+                return pos
+            end
+        end
+    end
+end
+
+-- Spans ({start, end}, end excluded) of the values of the array or object
+-- starting at pos, the keys of an object and the position of the closing
+-- bracket
+local function members(text, pos)
+    local is_object = string.sub(text, pos, pos) == '{'
+    local close = is_object and '}' or ']'
+    local spans, keys = {}, {}
+    pos = skip_whitespace(text, pos + 1)
+    while string.sub(text, pos, pos) ~= close do
+        if is_object then
+            local key_end = skip_string(text, pos)
+            table.insert(keys, cjson.decode(string.sub(text, pos, key_end - 1)))
+            pos = skip_whitespace(text, skip_whitespace(text, key_end) + 1)
+        end
+        local finish = skip_value(text, pos)
+        table.insert(spans, {pos, finish})
+        pos = skip_whitespace(text, finish)
+        if string.sub(text, pos, pos) == ',' then
+            pos = skip_whitespace(text, pos + 1)
+        end
+    end
+    return spans, keys, pos
+end
+
+-- Find the value of a dot-notation path. Returns its span, or nil, the closing
+-- brace of the last object found and the number of parts found when it is
+-- missing, or nothing when a value on the path is not an object.
+local function find_path(text, parts)
+    local pos = skip_whitespace(text, 1)
+    for i, part in ipairs(parts) do
+        if string.sub(text, pos, pos) ~= '{' then
+            return nil
+        end
+        local spans, keys, close = members(text, pos)
+        local span = nil
+        for j, key in ipairs(keys) do
+            if key == part then
+                span = spans[j]
+            end
+        end
+        if not span then
+            return nil, close, i - 1
+        end
+        if i == #parts then
+            return span
+        end
+        pos = span[1]
+    end
+end
+
+local function span_text(text, span)
+    return string.sub(text, span[1], span[2] - 1)
+end
+
+-- Decoded value of a path, nil when missing
+local function path_value(text, path)
+    local span = find_path(text, split_path(path))
+    if span then
+        return cjson.decode(span_text(text, span))
+    end
+end
+
+-- Insert a value before the closing bracket at close, after a comma unless
+-- the array or object is empty
+local function insert_before(text, close, value)
+    local previous = string.match(string.sub(text, 1, close - 1), '(%S)%s*$')
+    if previous ~= '{' and previous ~= '[' then
+        value = ', ' .. value
+    end
+    return string.sub(text, 1, close - 1) .. value .. string.sub(text, close)
+end
+
+-- Set a path to JSON text, creating the objects missing on it. Returns nil
+-- when a value on the path is not an object.
+local function set_path(text, path, value)
+    local parts = split_path(path)
+    local span, close, found = find_path(text, parts)
+    if span then
+        return string.sub(text, 1, span[1] - 1) .. value .. string.sub(text, span[2])
+    elseif not close then
+        return nil
+    end
+    for i = #parts, found + 2, -1 do
+        value = '{' .. cjson.encode(parts[i]) .. ': ' .. value .. '}'
+    end
+    return insert_before(text, close, cjson.encode(parts[found + 1]) .. ': ' .. value)
+end
+
+-- Whether a path holds an object
+local function is_object_path(text, path)
+    local span = find_path(text, split_path(path))
+    return span ~= nil and string.sub(text, span[1], span[1]) == '{'
+end
+
+local function is_float_text(text)
+    return string.find(text, '[.eE]') ~= nil
+end
+
+-- Number of a path and whether it is written as a float, 0 when missing or
+-- not a number
+local function path_number(text, path)
+    local span = find_path(text, split_path(path))
+    local number = span and tonumber(span_text(text, span))
+    if not number then
+        return 0, false
+    end
+    return number, is_float_text(span_text(text, span))
+end
+
+-- JSON text of a number as Python writes it, nil when it cannot be written
+-- exactly
+local function format_number(number, is_float)
+    if number ~= number or number == math.huge or number == -math.huge then
+        return nil
+    elseif not is_float then
+        if math.abs(number) >= INTEGER_LIMIT then
+            return nil
+        end
+        return string.format('%d', number)
+    end
+    local text
+    for precision = 15, 17 do
+        text = string.format('%.' .. precision .. 'g', number)
+        if tonumber(text) == number then
+            break
+        end
+    end
+    if not is_float_text(text) then
+        text = text .. '.0'
+    end
+    return text
+end
+
+-- Add to the number of a path, a missing value counting as 0. The result is a
+-- float when either number is, as in Python. Returns nil when it cannot be
+-- written exactly.
+local function add_to_path(text, path, amount, amount_is_float)
+    local number, is_float = path_number(text, path)
+    is_float = is_float or amount_is_float
+    if not is_float and math.abs(number) >= INTEGER_LIMIT then
+        return nil
+    end
+    local result = format_number(number + amount, is_float)
+    return result and set_path(text, path, result)
+end
+
+-- Append the items of a JSON array to the array of a path, skipping those it
+-- holds and creating it when missing. Returns nil when the path holds
+-- something else.
+local function union_path(text, path, items)
+    local span = find_path(text, split_path(path))
+    local existing, spans, keys, close = {}, {}, nil, nil
+    if span then
+        if string.sub(text, span[1], span[1]) ~= '[' then
+            return nil
+        end
+        spans, keys, close = members(text, span[1])
+        for _, element in ipairs(spans) do
+            table.insert(existing, cjson.decode(span_text(text, element)))
+        end
+    end
+    local added = {}
+    for _, element in ipairs((members(items, skip_whitespace(items, 1)))) do
+        local raw = span_text(items, element)
+        local item = cjson.decode(raw)
+        local present = false
+        for _, value in ipairs(existing) do
+            present = present or value == item
+        end
+        if not present then
+            table.insert(existing, item)
+            table.insert(added, raw)
+        end
+    end
+    if #added == 0 then
+        return text
+    elseif not span then
+        return set_path(text, path, '[' .. table.concat(added, ', ') .. ']')
+    end
+    return insert_before(text, close, table.concat(added, ', '))
+end
+
+-- Remove a value from the array of a path, with the comma separating it.
+-- Returns nil when the array does not hold it.
+local function remove_from_path(text, path, value)
+    local span = find_path(text, split_path(path))
+    if not span or string.sub(text, span[1], span[1]) ~= '[' then
+        return nil
+    end
+    local spans = members(text, span[1])
+    for i, element in ipairs(spans) do
+        if cjson.decode(span_text(text, element)) == value then
+            local first, last = element[1], element[2]
+            if spans[i + 1] then
+                last = spans[i + 1][1]
+            elseif spans[i - 1] then
+                first = spans[i - 1][2]
+            end
+            return string.sub(text, 1, first - 1) .. string.sub(text, last)
+        end
+    end
+    return nil
+end
+
+-- Documents are native RedisJSON values in "json" storage mode, otherwise
+-- strings starting with a codec header byte. Documents written before codec
+-- headers are plain JSON. Only JSON can be edited here, callers fall back to
+-- client-side updates for other codecs.
+local JSON_HEADER = '\1'
+
+local function is_json_document(key)
+    return redis.call('TYPE', key)['ok'] == 'ReJSON-RL'
+end
+
+-- Get the JSON text of a document and its format
+local function read_document(key)
+    if is_json_document(key) then
+        return redis.call('JSON.GET', key, '.'), 'rejson'
+    end
+    local raw = redis.call('GET', key)
+    if not raw then
+        return nil, nil
+    end
+    local header = string.sub(raw, 1, 1)
+    if header == JSON_HEADER then
+        return string.sub(raw, 2), 'json'
+    elseif header == '{' then
+        return raw, 'plain'
+    end
+    return nil, 'unsupported'
+end
+
+local function write_document(key, text, format)
+    if format == 'rejson' then
+        redis.call('JSON.SET', key, '.', text)
+    elseif format == 'json' then
+        redis.call('SET', key, JSON_HEADER .. text)
+    else
+        redis.call('SET', key, text)
+    end
+end
+"""
+
+# Append a value to an array field kept out of its document, stored as a list
+# and the set deduplicating it. Returns 1 when added, 0 when already present.
+LUA_LIST_HELPERS = """
+local function append_to_list(list_key, members_key, value)
+    if redis.call('SADD', members_key, value) == 0 then
+        return 0
+    end
+    redis.call('RPUSH', list_key, value)
+    return 1
+end
+"""
+
+# Move funds between two wallets and record the transaction atomically
+# KEYS: payer, payee, transaction, their three version counters, transaction
+#       list and member set of the payer wallet, then of the payee wallet,
+#       transactions set (or its partitions when ARGV[10] is set), transaction
+#       timelines (ARGV[9] of them), transaction index sets...
+# ARGV: payer wallet path, payee wallet path, amount, transaction ID,
+#       serialized transaction, storage mode, cache invalidation channel ("" for
+#       none), timeline score, number of timelines, partition ("" for none),
+#       partition score
+# Returns "unsupported_codec" without changes when a document codec cannot be
+# edited in Lua or a balance cannot be written exactly
+TRANSFER_FUNDS_LUA = (
+    LUA_JSON_HELPERS
+    + LUA_LIST_HELPERS
+    + """
+local payer, payer_format = read_document(KEYS[1])
+local payee, payee_format = read_document(KEYS[2])
+if payer_format == 'unsupported' or payee_format == 'unsupported' then
+    return 'unsupported_codec'
+end
+if not payer then
+    return 'payer_not_found'
+end
+if not payee then
+    return 'payee_not_found'
+end
+if not is_object_path(payer, ARGV[1]) or not is_object_path(payee, ARGV[2]) then
+    return 'wallet_not_found'
+end
+
+local amount = tonumber(ARGV[3])
+local amount_is_float = is_float_text(ARGV[3])
+if path_number(payer, ARGV[1] .. '.balance') < amount then
+    return 'insufficient_balance'
+end
+
+payer = add_to_path(payer, ARGV[1] .. '.balance', -amount, amount_is_float)
+payee = add_to_path(payee, ARGV[2] .. '.balance', amount, amount_is_float)
+if not payer or not payee then
+    -- A balance cannot be written exactly, nothing was written
+    return 'unsupported_codec'
+end
+append_to_list(KEYS[7], KEYS[8], ARGV[4])
+append_to_list(KEYS[9], KEYS[10], ARGV[4])
+
+write_document(KEYS[1], payer, payer_format)
+write_document(KEYS[2], payee, payee_format)
+if ARGV[6] == 'json' then
+    redis.call('JSON.SET', KEYS[3], '.', ARGV[5])
+else
+    redis.call('SET', KEYS[3], ARGV[5])
+end
+for i = 4, 6 do
+    redis.call('INCR', KEYS[i])
+end
+if ARGV[10] ~= '' then
+    redis.call('ZADD', KEYS[11], ARGV[11], ARGV[10])
+else
+    redis.call('SADD', KEYS[11], ARGV[4])
+end
+local timelines = tonumber(ARGV[9])
+for i = 12, 11 + timelines do
+    redis.call('ZADD', KEYS[i], ARGV[8], ARGV[4])
+end
+for i = 12 + timelines, #KEYS do
+    redis.call('SADD', KEYS[i], ARGV[4])
+end
+if ARGV[7] ~= '' then
+    redis.call('PUBLISH', ARGV[7], KEYS[1])
+    redis.call('PUBLISH', ARGV[7], KEYS[2])
+end
+return 'ok'
+"""
+)
+
+# Apply one side of a transfer to a wallet, on Redis Cluster where the payer,
+# payee and transaction have different hash tags and cannot be updated by one
+# script. Entries are identified by the transaction ID in the transaction list of
+# the wallet, or in the wallet itself for entries applied before these lists
+# were kept out of documents, so applying an entry twice or reverting one that
+# is not applied changes nothing.
+# KEYS: account, its version counter, transaction list and member set of the
+#       wallet, pending transfer record (debits only)
+# ARGV: wallet path, balance change (negative for debits), transaction ID,
+#       "apply" or "revert", cache invalidation channel ("" for none), pending
+#       transfer record stored with the debit
+# Returns "ok", "account_not_found", "wallet_not_found", "insufficient_balance"
+# or "unsupported_codec" without changes when the codec cannot be edited in Lua
+# or the balance cannot be written exactly
+WALLET_ENTRY_LUA = (
+    LUA_JSON_HELPERS
+    + LUA_LIST_HELPERS
+    + """
+local text, format = read_document(KEYS[1])
+if format == 'unsupported' then
+    return 'unsupported_codec'
+end
+if not text then
+    return 'account_not_found'
+end
+if not is_object_path(text, ARGV[1]) then
+    return 'wallet_not_found'
+end
+
+local balance_path = ARGV[1] .. '.balance'
+local amount = tonumber(ARGV[2])
+local amount_is_float = is_float_text(ARGV[2])
+local listed = redis.call('SISMEMBER', KEYS[4], ARGV[3]) == 1
+local without_entry = remove_from_path(text, ARGV[1] .. '.transactions', ARGV[3])
+
+if ARGV[4] == 'apply' then
+    if listed or without_entry then
+        return 'ok'
+    end
+    if path_number(text, balance_path) + amount < 0 then
+        return 'insufficient_balance'
+    end
+    text = add_to_path(text, balance_path, amount, amount_is_float)
+    if not text then
+        return 'unsupported_codec'
+    end
+    append_to_list(KEYS[3], KEYS[4], ARGV[3])
+    if KEYS[5] then
+        redis.call('SET', KEYS[5], ARGV[6])
+    end
+else
+    if not listed and not without_entry then
+        if KEYS[5] then
+            redis.call('DEL', KEYS[5])
+        end
+        return 'ok'
+    end
+    text = add_to_path(listed and text or without_entry, balance_path, -amount, amount_is_float)
+    if not text then
+        return 'unsupported_codec'
+    end
+    if KEYS[5] then
+        redis.call('DEL', KEYS[5])
+    end
+    if listed then
+        redis.call('SREM', KEYS[4], ARGV[3])
+        redis.call('LREM', KEYS[3], 0, ARGV[3])
+    end
+end
+
+write_document(KEYS[1], text, format)
+redis.call('INCR', KEYS[2])
+if ARGV[5] ~= '' then
+    redis.call('PUBLISH', ARGV[5], KEYS[1])
+end
+return 'ok'
+"""
+)
+
+# Apply dot-notation field operations to a document without sending it over the
+# network, keeping the affected secondary indexes in sync
+# KEYS: document, document version counter
+# ARGV: document ID, JSON object of affected indexed paths -> index key prefix,
+#       expected version ("" to skip the check), cache invalidation channel
+#       ("" for none), then (operation, path,
+#       JSON-encoded value) triplets where operation is "set", "incr" or
+#       "union" (append values that are not present yet)
+# Returns 1 when applied, 0 when the document is missing, -1 when the version
+# does not match and -2 without changes when the document codec cannot be
+# decoded in Lua or the operations cannot be applied exactly (a number too
+# large to add to exactly, a field of a value that is not an object)
+UPDATE_FIELDS_LUA = (
+    LUA_JSON_HELPERS
+    + """
+local key = KEYS[1]
+local doc_id = ARGV[1]
+local indexed = cjson.decode(ARGV[2])
+
+if ARGV[3] ~= '' and tonumber(redis.call('GET', KEYS[2]) or '0') ~= tonumber(ARGV[3]) then
+    return -1
+end
+
+local function apply_to_text(text, op, path, value)
+    if op == 'set' then
+        return set_path(text, path, value)
+    elseif op == 'incr' then
+        return add_to_path(text, path, tonumber(value), is_float_text(value))
+    elseif op == 'union' then
+        return union_path(text, path, value)
+    end
+end
+
+local function json_value(path)
+    local raw = redis.call('JSON.GET', key, '$.' .. path)
+    if not raw then
+        return nil
+    end
+    return cjson.decode(raw)[1]
+end
+
+local function ensure_json_path(parts, count, default)
+    local path = '$'
+    for i = 1, count do
+        path = path .. '.' .. parts[i]
+        if #redis.call('JSON.TYPE', key, path) == 0 then
+            redis.call('JSON.SET', key, path, i == #parts and default or '{}')
+        end
+    end
+    return path
+end
+
+local function apply_to_json(op, path, raw)
+    local parts = split_path(path)
+    ensure_json_path(parts, #parts - 1)
+    local json_path = '$.' .. path
+    if op == 'set' then
+        redis.call('JSON.SET', key, json_path, raw)
+    elseif op == 'incr' then
+        ensure_json_path(parts, #parts, '0')
+        redis.call('JSON.NUMINCRBY', key, json_path, raw)
+    elseif op == 'union' then
+        ensure_json_path(parts, #parts, '[]')
+        for _, item in ipairs((members(raw, skip_whitespace(raw, 1)))) do
+            local encoded = span_text(raw, item)
+            if redis.call('JSON.ARRINDEX', key, json_path, encoded)[1] == -1 then
+                redis.call('JSON.ARRAPPEND', key, json_path, encoded)
+            end
+        end
+    end
+end
+
+local before, after = {}, {}
+
+if is_json_document(key) then
+    for path, _ in pairs(indexed) do
+        before[path] = json_value(path)
+    end
+    for i = 5, #ARGV, 3 do
+        apply_to_json(ARGV[i], ARGV[i + 1], ARGV[i + 2])
+    end
+    for path, _ in pairs(indexed) do
+        after[path] = json_value(path)
+    end
+else
+    local text, format = read_document(key)
+    if format == 'unsupported' then
+        return -2
+    end
+    if not text then
+        return 0
+    end
+    for path, _ in pairs(indexed) do
+        before[path] = path_value(text, path)
+    end
+    for i = 5, #ARGV, 3 do
+        text = apply_to_text(text, ARGV[i], ARGV[i + 1], ARGV[i + 2])
+        if not text then
+            -- The operations cannot be applied exactly, nothing was written
+            return -2
+        end
+    end
+    for path, _ in pairs(indexed) do
+        after[path] = path_value(text, path)
+    end
+    write_document(key, text, format)
+end
+
+-- Only string values are indexed
+for path, prefix in pairs(indexed) do
+    if before[path] ~= after[path] then
+        if type(before[path]) == 'string' then
+            redis.call('SREM', prefix .. before[path], doc_id)
+        end
+        if type(after[path]) == 'string' then
+            redis.call('SADD', prefix .. after[path], doc_id)
+        end
+    end
+end
+redis.call('INCR', KEYS[2])
+if ARGV[4] ~= '' then
+    redis.call('PUBLISH', ARGV[4], key)
+end
+return 1
+"""
+)
+
+# Delete a unique constraint key (KEYS[1]) if it is still claimed by the document
+# ARGV[1]. Returns 1 when released.
+RELEASE_CLAIM_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Append values to an array field kept out of its document, skipping values it
+# holds. The document version is incremented as for any write of the document.
+# KEYS: document, its version counter, list, member set
+# ARGV: values
+# Returns 1 when applied, 0 when the document is missing
+APPEND_LIST_LUA = (
+    LUA_LIST_HELPERS
+    + """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local added = 0
+for i = 1, #ARGV do
+    added = added + append_to_list(KEYS[3], KEYS[4], ARGV[i])
+end
+if added > 0 then
+    redis.call('INCR', KEYS[2])
+end
+return 1
+"""
+)
+
+# Add two documents to the linked array field of each other, kept out of them
+# KEYS: first document, its version counter, list and member set of its field,
+#       then the same for the second document
+# ARGV: first document ID, second document ID
+# Returns 1 when applied, 0 when either document is missing
+LINK_LISTS_LUA = (
+    LUA_LIST_HELPERS
+    + """
+if redis.call('EXISTS', KEYS[1]) == 0 or redis.call('EXISTS', KEYS[5]) == 0 then
+    return 0
+end
+if append_to_list(KEYS[3], KEYS[4], ARGV[2]) == 1 then
+    redis.call('INCR', KEYS[2])
+end
+if append_to_list(KEYS[7], KEYS[8], ARGV[1]) == 1 then
+    redis.call('INCR', KEYS[6])
+end
+return 1
+"""
+)
@@ -0,0 +1,223 @@
+import time
+import random
+import asyncio
+import inspect
+import logging
+import functools
+from contextvars import ContextVar
+from typing import Any, List, Optional
+from redis.exceptions import ConnectionError, TimeoutError, MasterDownError
+from .redis_config import (
+    async_redis_client,
+    async_replica_clients,
+    REDIS_REPLICA_MAX_LAG,
+    REDIS_REPLICA_CHECK_INTERVAL,
+    REDIS_REPLICA_HEARTBEAT,
+)
+from monitoring.metrics import increment_replica_read, observe_replica_lag
+
+logger = logging.getLogger(__name__)
+
+# Errors of a replica that is down, loading or disconnected from the primary
+REPLICA_ERRORS = (ConnectionError, TimeoutError, MasterDownError)
+
+# Seconds for which reads go to the primary after a write, after which every
+# replica still picked has the write
+READ_YOUR_WRITES_WINDOW = REDIS_REPLICA_MAX_LAG + REDIS_REPLICA_CHECK_INTERVAL
+
+
+class ReadSession:
+    """Reads of one request, sent to the primary until primary_until
+
+    Starts from the time carried over from earlier requests of the session, see
+    middleware.ReadSessionMiddleware. Shared by reference, so writes made in the
+    endpoint are seen by the middleware.
+    """
+
+    def __init__(self, primary_until: float = 0.0):
+        self.primary_until = primary_until
+        self.wrote = False
+
+    def reads_primary(self) -> bool:
+        """Check whether reads must see a recent write of the session"""
+        return time.time() < self.primary_until
+
+
+_session: ContextVar[Optional[ReadSession]] = ContextVar(
+    "redis_read_session", default=None
+)
+
+# Replica client the current read operation runs on, None for the primary
+_UNROUTED = object()
+_replica: ContextVar[Any] = ContextVar("redis_replica", default=_UNROUTED)
+
+
+def start_read_session(primary_until: float = 0.0) -> ReadSession:
+    """Start the read session of the current request"""
+    session = ReadSession(primary_until)
+    _session.set(session)
+    return session
+
+
+def note_write() -> None:
+    """Send the following reads of the current session to the primary"""
+    session = _session.get()
+    if session is not None:
+        session.primary_until = time.time() + READ_YOUR_WRITES_WINDOW
+        session.wrote = True
+
+
+def current_replica() -> Optional[Any]:
+    """Get the replica client of the current read operation, None for the primary"""
+    replica = _replica.get()
+    return None if replica is _UNROUTED else replica
+
+
+class ReplicaRouter:
+    """Picks the replica serving a read operation from the measured replica lags
+
+    A replica is picked once a health check measured its lag, and only while
+    that lag is at most max_lag. Replicas that fail a read are not picked again
+    until the next check.
+    """
+
+    def __init__(self, clients: List[Any], max_lag: float):
+        self.clients = clients
+        self.max_lag = max_lag
+        self._lags: List[Optional[float]] = [None] * len(clients)
+
+    def pick(self) -> Optional[int]:
+        """Get the index of the replica for a read, or None for the primary"""
+        session = _session.get()
+        if session is not None and session.reads_primary():
+            return None
+        healthy = [
+            index
+            for index, lag in enumerate(self._lags)
+            if lag is not None and lag <= self.max_lag
+        ]
+        return random.choice(healthy) if healthy else None
+
+    def update(self, index: int, lag: Optional[float]) -> None:
+        """Record the lag of a replica, None when it is unavailable"""
+        self._lags[index] = lag
+        observe_replica_lag(str(index), -1 if lag is None else lag)
+
+    def route(self, func):
+        """Decorator running a read operation on a picked replica
+
+        The operation reads through current_replica(). It runs again on the
+        primary when the replica fails, which for streams is only retried
+        before their first item. Operations called by a routed operation run on
+        its replica.
+        """
+
+        if inspect.isasyncgenfunction(func):
+
+            @functools.wraps(func)
+            async def generator_wrapper(*args, **kwargs):
+                if _replica.get() is not _UNROUTED:
+                    async for item in func(*args, **kwargs):
+                        yield item
+                    return
+
+                index = self.pick()
+                target = self._target(index)
+                items = func(*args, **kwargs)
+                started = False
+                try:
+                    while True:
+                        token = _replica.set(self._client(index))
+                        try:
+                            item = await items.__anext__()
+                        except StopAsyncIteration:
+                            break
+                        except REPLICA_ERRORS as e:
+                            if index is None or started:
+                                raise
+                            self._failed(index, e)
+                            await items.aclose()
+                            index, target = None, "fallback"
+                            items = func(*args, **kwargs)
+                            continue
+                        finally:
+                            _replica.reset(token)
+                        if not started:
+                            started = True
+                            increment_replica_read(target)
+                        yield item
+                    if not started:
+                        increment_replica_read(target)
+                finally:
+                    await items.aclose()
+
+            return generator_wrapper
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _replica.get() is not _UNROUTED:
+                return await func(*args, **kwargs)
+
+            index = self.pick()
+            token = _replica.set(self._client(index))
+            try:
+                result = await func(*args, **kwargs)
+                increment_replica_read(self._target(index))
+                return result
+            except REPLICA_ERRORS as e:
+                if index is None:
+                    raise
+                self._failed(index, e)
+            finally:
+                _replica.reset(token)
+
+            token = _replica.set(None)
+            try:
+                result = await func(*args, **kwargs)
+                increment_replica_read("fallback")
+                return result
+            finally:
+                _replica.reset(token)
+
+        return wrapper
+
+    def _client(self, index: Optional[int]) -> Optional[Any]:
+        return None if index is None else self.clients[index]
+
+    def _target(self, index: Optional[int]) -> str:
+        return "primary" if index is None else "replica"
+
+    def _failed(self, index: int, error: Exception) -> None:
+        logger.warning(f"Read from replica {index} failed, using the primary: {error}")
+        self.update(index, None)
+
+
+replica_router = ReplicaRouter(async_replica_clients, REDIS_REPLICA_MAX_LAG)
+
+
+async def _replica_lag(client: Any) -> Optional[float]:
+    """Get the seconds since the last heartbeat a replica received"""
+    heartbeat = await client.get(REDIS_REPLICA_HEARTBEAT)
+    return None if heartbeat is None else max(time.time() - float(heartbeat), 0.0)
+
+
+async def monitor_replicas() -> None:
+    """Measure the lag of every replica, for as long as the app runs"""
+    while True:
+        # Replicas are read before the next heartbeat is written, so their lag
+        # is overestimated by at most one interval rather than underestimated
+        for index, client in enumerate(replica_router.clients):
+            try:
+                replica_router.update(index, await _replica_lag(client))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Replica {index} health check failed: {e}")
+                replica_router.update(index, None)
+        try:
+            await async_redis_client.set(REDIS_REPLICA_HEARTBEAT, repr(time.time()))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Replica heartbeat failed: {e}")
+        await asyncio.sleep(REDIS_REPLICA_CHECK_INTERVAL)
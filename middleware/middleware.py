@@ -1,3 +1,4 @@
+import math
 import time
 import logging
 import threading
@@ -7,6 +8,7 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from starlette.responses import Response, HTMLResponse, JSONResponse
 from starlette.exceptions import HTTPException
+from db.replicas import start_read_session, READ_YOUR_WRITES_WINDOW
 from monitoring.metrics import (
     HTTP_REQUEST_COUNT,
     HTTP_REQUEST_LATENCY,
@@ -145,6 +147,33 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         return client_host
 
 
+class ReadSessionMiddleware(BaseHTTPMiddleware):
+    """Middleware keeping reads of a client on the primary after its writes."""
+
+    cookie_name = "payzee_read_primary_until"
+
+    async def dispatch(
+        self, request: Request, call_next: Callable[[Request], Awaitable[Response]]
+    ) -> Response:
+        # Time until which earlier writes of the session may be missing on replicas
+        try:
+            primary_until = float(request.cookies.get(self.cookie_name, 0))
+        except ValueError:
+            primary_until = 0.0
+        session = start_read_session(primary_until)
+
+        response = await call_next(request)
+
+        if session.wrote:
+            response.set_cookie(
+                self.cookie_name,
+                repr(session.primary_until),
+                max_age=math.ceil(READ_YOUR_WRITES_WINDOW),
+                httponly=True,
+            )
+        return response
+
+
 class AuthenticationMiddleware(BaseHTTPMiddleware):
     """Middleware to handle authentication."""
 
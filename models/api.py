@@ -89,6 +89,16 @@ class SchemeCreate(BaseModel):
     }
 
 
+# Bulk import models, one per NDJSON line
+class BulkUpdate(BaseModel):
+    id: str
+    fields: Dict[str, Any]  # Dot-notation field paths to new values
+
+
+class BulkDelete(BaseModel):
+    id: str
+
+
 # Response models
 class MessageResponse(BaseModel):
     message: str
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime, timezone
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Optional
 
 
 class Citizen:
@@ -43,19 +43,19 @@ class Citizen:
             "annual_income": annual_income,
         }
 
+        # Transaction IDs of the wallets and IDs of the schemes the citizen is a
+        # beneficiary of (scheme_info) are stored apart, see
+        # db.redis_config.LIST_FIELDS
         self.wallet_info: Dict[str, Any] = {
-            "govt_wallet": {"balance": 0, "transactions": []},
-            "personal_wallet": {"balance": 0, "transactions": []},
+            "govt_wallet": {"balance": 0},
+            "personal_wallet": {"balance": 0},
         }
 
-        self.scheme_info: List[str] = []
-
     def to_dict(self) -> Dict[str, Any]:
         return {
             "account_info": self.account_info,
             "personal_info": self.personal_info,
             "wallet_info": self.wallet_info,
-            "scheme_info": self.scheme_info,
         }
 
     @classmethod
@@ -78,6 +78,5 @@ class Citizen:
         citizen.account_info = data["account_info"]
         citizen.personal_info = data["personal_info"]
         citizen.wallet_info = data["wallet_info"]
-        citizen.scheme_info = data["scheme_info"]
 
         return citizen
@@ -26,10 +26,10 @@ class Government:
             "image_url": image_url,
         }
 
+        # IDs of the schemes managed by this government account and of its
+        # transactions are stored apart, see db.redis_config.LIST_FIELDS
         self.wallet_info: Dict[str, Any] = {
             "balance": 0,
-            "schemes": [],  # References to scheme IDs managed by this government account
-            "transactions": [],
         }
 
     def to_dict(self) -> Dict[str, Any]:
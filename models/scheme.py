@@ -24,7 +24,8 @@ class Scheme:
         self.status: str = status  # active, inactive, completed
         self.eligibility_criteria: Dict[str, Any] = eligibility_criteria or {}
         self.tags: List[str] = tags or []
-        self.beneficiaries: List[str] = []  # List of citizen IDs who are beneficiaries
+        # Citizen IDs of the beneficiaries are stored apart, see
+        # db.redis_config.LIST_FIELDS
         self.created_at: datetime = datetime.now(timezone.utc)
         self.updated_at: datetime = datetime.now(timezone.utc)
 
@@ -38,7 +39,6 @@ class Scheme:
             "status": self.status,
             "eligibility_criteria": self.eligibility_criteria,
             "tags": self.tags,
-            "beneficiaries": self.beneficiaries,
             "created_at": self.created_at,
             "updated_at": self.updated_at,
         }
@@ -55,7 +55,6 @@ class Scheme:
             status=data.get("status", "active"),
         )
         scheme.id = data["id"]
-        scheme.beneficiaries = data["beneficiaries"]
         scheme.created_at = data["created_at"]
         scheme.updated_at = data["updated_at"]
 
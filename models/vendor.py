@@ -39,9 +39,10 @@ class Vendor:
             "occupation": occupation,
         }
 
+        # Transaction IDs of the wallet are stored apart, see
+        # db.redis_config.LIST_FIELDS
         self.wallet_info: Dict[str, Any] = {
             "balance": 0,
-            "transactions": [],
         }
 
     def to_dict(self) -> Dict[str, Any]:
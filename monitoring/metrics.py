@@ -1,4 +1,4 @@
-from prometheus_client import Counter, Histogram, Summary
+from prometheus_client import Counter, Gauge, Histogram, Summary
 
 # API request metrics
 API_REQUESTS = Counter(
@@ -35,6 +35,79 @@ REDIS_QUERY_TIME = Summary(
     ["operation", "collection"],
 )
 
+# Optimistic concurrency metrics
+REDIS_VERSION_CONFLICTS = Counter(
+    "redis_version_conflicts_total",
+    "Total number of document writes that hit a concurrent modification",
+    ["operation", "collection"],
+)
+
+REDIS_OPTIMISTIC_RETRIES = Counter(
+    "redis_optimistic_retries_total",
+    "Total number of optimistic transactions retried after a conflict",
+    ["operation", "collection"],
+)
+
+# Document compression metrics
+REDIS_DOCUMENT_SIZE = Histogram(
+    "redis_document_size_bytes",
+    "Encoded size of documents written to Redis, before compression",
+    ["collection"],
+    buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072),
+)
+
+REDIS_COMPRESSION_RATIO = Histogram(
+    "redis_compression_ratio",
+    "Compressed size divided by encoded size of compressed documents",
+    ["collection"],
+    buckets=(0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.75, 1.0),
+)
+
+REDIS_COMPRESSION_CPU_SECONDS = Histogram(
+    "redis_compression_cpu_seconds",
+    "CPU time spent compressing and decompressing documents",
+    ["collection", "direction"],
+    buckets=(1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2),
+)
+
+# Document cache metrics
+REDIS_CACHE_REQUESTS = Counter(
+    "redis_cache_requests_total",
+    "Total number of document cache lookups",
+    ["collection", "result"],
+)
+
+REDIS_CACHE_EVICTIONS = Counter(
+    "redis_cache_evictions_total",
+    "Total number of documents evicted from the document cache",
+    ["collection", "reason"],
+)
+
+# Cold tier metrics
+REDIS_ARCHIVED_DOCUMENTS = Counter(
+    "redis_archived_documents_total",
+    "Total number of documents moved from Redis to archive segments",
+    ["collection"],
+)
+
+REDIS_ARCHIVE_READS = Counter(
+    "redis_archive_reads_total",
+    "Total number of documents missing from Redis looked up in the archive",
+    ["collection", "result"],
+)
+
+REDIS_REPLICA_READS = Counter(
+    "redis_replica_reads_total",
+    "Total number of read operations by the node serving them",
+    ["target"],
+)
+
+REDIS_REPLICA_LAG = Gauge(
+    "redis_replica_lag_seconds",
+    "Replication lag of each read replica, -1 while unavailable",
+    ["replica"],
+)
+
 # Rate limiting metrics
 RATE_LIMIT_EXCEEDED = Counter(
     "rate_limit_exceeded_total",
@@ -70,3 +143,63 @@ def observe_redis_query_time(operation, collection, duration):
     REDIS_QUERY_TIME.labels(operation=operation, collection=collection).observe(
         duration
     )
+
+
+def increment_version_conflict(operation, collection):
+    """Record a write that hit a concurrent modification."""
+    REDIS_VERSION_CONFLICTS.labels(operation=operation, collection=collection).inc()
+
+
+def increment_optimistic_retry(operation, collection):
+    """Record a retried optimistic transaction."""
+    REDIS_OPTIMISTIC_RETRIES.labels(operation=operation, collection=collection).inc()
+
+
+def observe_document_size(collection, size):
+    """Record the encoded size of a written document."""
+    REDIS_DOCUMENT_SIZE.labels(collection=collection).observe(size)
+
+
+def observe_compression(collection, ratio, cpu_seconds):
+    """Record the ratio and CPU time of a document compression."""
+    REDIS_COMPRESSION_RATIO.labels(collection=collection).observe(ratio)
+    REDIS_COMPRESSION_CPU_SECONDS.labels(
+        collection=collection, direction="compress"
+    ).observe(cpu_seconds)
+
+
+def observe_decompression(collection, cpu_seconds):
+    """Record the CPU time of a document decompression."""
+    REDIS_COMPRESSION_CPU_SECONDS.labels(
+        collection=collection, direction="decompress"
+    ).observe(cpu_seconds)
+
+
+def increment_cache_request(collection, result):
+    """Record a document cache hit or miss."""
+    REDIS_CACHE_REQUESTS.labels(collection=collection, result=result).inc()
+
+
+def increment_cache_eviction(collection, reason):
+    """Record a document evicted from the document cache."""
+    REDIS_CACHE_EVICTIONS.labels(collection=collection, reason=reason).inc()
+
+
+def increment_archived_documents(collection, count):
+    """Record documents moved to the archive."""
+    REDIS_ARCHIVED_DOCUMENTS.labels(collection=collection).inc(count)
+
+
+def increment_archive_read(collection, result, count=1):
+    """Record archive lookups that found or missed a document."""
+    REDIS_ARCHIVE_READS.labels(collection=collection, result=result).inc(count)
+
+
+def increment_replica_read(target):
+    """Record a read operation served by a replica, the primary or a fallback."""
+    REDIS_REPLICA_READS.labels(target=target).inc()
+
+
+def observe_replica_lag(replica, lag):
+    """Record the measured lag of a read replica."""
+    REDIS_REPLICA_LAG.labels(replica=replica).set(lag)
@@ -11,12 +11,23 @@ from models.citizen import Citizen
 from models.vendor import Vendor
 from models.government import Government
 from db import (
+    UniqueConstraintError,
     save_citizen,
     save_government,
     save_vendor,
-    query_citizens_by_field,
-    query_vendors_by_field,
-    query_governments_by_field,
+)
+from db.async_redis_operations import update_document
+from utils.common import (
+    USER_PREFIXES,
+    already_registered,
+    get_user_by_id,
+    resolve_login,
+)
+from utils.passwords import (
+    UNKNOWN_ACCOUNT_HASH,
+    hash_password,
+    verify_password,
+    is_hashed,
 )
 
 router = APIRouter()
@@ -24,15 +35,10 @@ router = APIRouter()
 
 @router.post("/signup/citizen", response_model=MessageResponse)
 async def citizen_signup(data: CitizenSignup) -> JSONResponse:
-    # Check if email already registered
-    existing_users = query_citizens_by_field("account_info.email", data.email)
-    if existing_users:
-        raise HTTPException(status_code=409, detail="Email already registered")
-
     # Create citizen object
     citizen = Citizen(
         name=data.name,
-        password=data.password,
+        password=await hash_password(data.password),
         email=data.email,
         phone=data.phone,
         id_type=data.id_type,
@@ -50,8 +56,11 @@ async def citizen_signup(data: CitizenSignup) -> JSONResponse:
     citizen_dict = citizen.to_dict()
     citizen_id = citizen_dict["account_info"]["id"]
 
-    # Save to database
-    save_citizen(citizen_id, citizen_dict)
+    # Save to database, claiming the email and ID number in the same step
+    try:
+        await save_citizen(citizen_id, citizen_dict)
+    except UniqueConstraintError as e:
+        raise HTTPException(status_code=409, detail=already_registered(e))
     return JSONResponse(
         content={
             "message": "Citizen account created successfully",
@@ -63,13 +72,9 @@ async def citizen_signup(data: CitizenSignup) -> JSONResponse:
 
 @router.post("/signup/vendor", response_model=MessageResponse)
 async def vendor_signup(data: VendorSignup) -> JSONResponse:
-    existing_users = query_vendors_by_field("account_info.email", data.email)
-    if existing_users:
-        raise HTTPException(status_code=409, detail="Email already registered")
-
     vendor = Vendor(
         name=data.name,
-        password=data.password,
+        password=await hash_password(data.password),
         email=data.email,
         gender=data.gender,
         business_name=data.business_name,
@@ -84,7 +89,10 @@ async def vendor_signup(data: VendorSignup) -> JSONResponse:
     vendor_dict = vendor.to_dict()
     vendor_id = vendor_dict["account_info"]["id"]
 
-    save_vendor(vendor_id, vendor_dict)
+    try:
+        await save_vendor(vendor_id, vendor_dict)
+    except UniqueConstraintError as e:
+        raise HTTPException(status_code=409, detail=already_registered(e))
     return JSONResponse(
         content={
             "message": "Vendor account created successfully",
@@ -96,13 +104,9 @@ async def vendor_signup(data: VendorSignup) -> JSONResponse:
 
 @router.post("/signup/government", response_model=MessageResponse)
 async def government_signup(data: GovernmentSignup) -> JSONResponse:
-    existing_users = query_governments_by_field("account_info.email", data.email)
-    if existing_users:
-        raise HTTPException(status_code=409, detail="Email already registered")
-
     government = Government(
         name=data.name,
-        password=data.password,
+        password=await hash_password(data.password),
         email=data.email,
         jurisdiction=data.jurisdiction,
         govt_id=data.govt_id,
@@ -112,7 +116,10 @@ async def government_signup(data: GovernmentSignup) -> JSONResponse:
     government_dict = government.to_dict()
     govt_id = government_dict["account_info"]["id"]
 
-    save_government(govt_id, government_dict)
+    try:
+        await save_government(govt_id, government_dict)
+    except UniqueConstraintError as e:
+        raise HTTPException(status_code=409, detail=already_registered(e))
     return JSONResponse(
         content={
             "message": "Government account created successfully",
@@ -124,45 +131,34 @@ async def government_signup(data: GovernmentSignup) -> JSONResponse:
 
 @router.post("/login", response_model=MessageResponse)
 async def login(data: LoginRequest) -> JSONResponse:
-    # Check in citizens collection
-    citizen_results = query_citizens_by_field("personal_info.id_number", data.id_number)
-    if citizen_results:
-        citizen = citizen_results[0]
-        if citizen["account_info"]["password"] == data.password:
-            return JSONResponse(
-                content={
-                    "message": "Login successful",
-                    "user_id": citizen["account_info"]["id"],
-                    "user_type": "citizen",
-                }
-            )
-
-    # Check in vendors collection
-    vendor_results = query_vendors_by_field("business_info.business_id", data.id_number)
-    if vendor_results:
-        vendor = vendor_results[0]
-        if vendor["account_info"]["password"] == data.password:
-            return JSONResponse(
-                content={
-                    "message": "Login successful",
-                    "user_id": vendor["account_info"]["id"],
-                    "user_type": "vendor",
-                }
-            )
-
-    # Check in governments collection
-    govt_results = query_governments_by_field("account_info.govt_id", data.id_number)
-    if govt_results:
-        govt = govt_results[0]
-        if govt["account_info"]["password"] == data.password:
+    # Find the accounts of the identifier in one lookup, citizens first
+    accounts = await resolve_login(data.id_number)
+    for user_type, user_id in accounts:
+        try:
+            _, user = await get_user_by_id(user_id, user_type)
+        except HTTPException:
+            # Claimed by an account still being created
+            continue
+        stored_password = user["account_info"]["password"]
+        if await verify_password(data.password, stored_password):
+            if not is_hashed(stored_password):
+                # Hash passwords stored in plain text on their next login
+                await update_document(
+                    USER_PREFIXES[user_type],
+                    user_id,
+                    {"account_info.password": await hash_password(data.password)},
+                )
             return JSONResponse(
                 content={
                     "message": "Login successful",
-                    "user_id": govt["account_info"]["id"],
-                    "user_type": "government",
+                    "user_id": user_id,
+                    "user_type": user_type,
                 }
             )
 
+    if not accounts:
+        # Take as long as with a wrong password, not revealing unknown IDs
+        await verify_password(data.password, UNKNOWN_ACCOUNT_HASH)
     raise HTTPException(status_code=401, detail="Invalid ID number or password")
 
 
@@ -1,7 +1,18 @@
-from fastapi import APIRouter, HTTPException, Body
-from fastapi.responses import JSONResponse
-from typing import Dict, Any
-from models.api import SchemeCreate, MessageResponse
+import asyncio
+import datetime
+from fastapi import APIRouter, HTTPException, Body, Query, Request
+from fastapi.responses import JSONResponse, Response
+from typing import Dict, Any, List, Literal, Optional, Tuple
+from models.api import (
+    SchemeCreate,
+    MessageResponse,
+    CitizenSignup,
+    VendorSignup,
+    BulkUpdate,
+    BulkDelete,
+)
+from models.citizen import Citizen
+from models.vendor import Vendor
 from models.scheme import Scheme
 from db import (
     get_government,
@@ -10,32 +21,93 @@ from db import (
     get_citizen,
     get_scheme,
     save_scheme,
+    modify_scheme,
     query_schemes_by_field,
-    get_all_citizens,
-    get_all_vendors,
-    get_all_transactions,
+    scan_scheme_beneficiaries,
+    scan_citizens,
+    scan_vendors,
+    scan_transactions,
+    iter_transaction_batches,
     array_union,
+    load_list_fields,
+    get_many_documents,
     get_vendor,
     get_transaction,
+    VersionConflictError,
+    UniqueConstraintError,
+    save_many,
+    update_many,
+    delete_many,
+)
+from db.redis_config import (
+    CITIZENS_PREFIX,
+    VENDORS_PREFIX,
+    GOVERNMENTS_PREFIX,
+    REDIS_WRITE_BATCH_SIZE,
+    UNIQUE_FIELDS,
+    LIST_FIELDS,
+    LINKED_LIST_FIELDS,
 )
-from db.redis_config import GOVERNMENTS_PREFIX
+from utils.streaming import (
+    stream_documents,
+    iter_ndjson_lines,
+    NDJSON_MAX_LINE_BYTES,
+)
+from utils.common import remove_sensitive_info, already_registered
+from utils.passwords import hash_password
+from utils.eligibility import CompiledScheme, citizen_tables
 
 router = APIRouter()
 
+# Signup model, account model and collection prefix of bulk importable accounts
+BULK_ACCOUNTS = {
+    "citizens": (CitizenSignup, Citizen, CITIZENS_PREFIX),
+    "vendors": (VendorSignup, Vendor, VENDORS_PREFIX),
+}
+
+# Profile fields bulk updates may set, as dot-notation paths. Wallets and array
+# fields are only changed by the routes maintaining them.
+BULK_UPDATE_FIELDS = {
+    "citizens": [
+        "account_info.name",
+        "account_info.email",
+        "account_info.password",
+        "account_info.image_url",
+        "personal_info.phone",
+        "personal_info.id_type",
+        "personal_info.id_number",
+        "personal_info.address",
+        "personal_info.dob",
+        "personal_info.gender",
+        "personal_info.occupation",
+        "personal_info.caste",
+        "personal_info.annual_income",
+    ],
+    "vendors": [
+        "account_info.name",
+        "account_info.email",
+        "account_info.password",
+        "account_info.gender",
+        "account_info.image_url",
+        "business_info.business_name",
+        "business_info.business_id",
+        "business_info.license_type",
+        "business_info.phone",
+        "business_info.address",
+        "business_info.occupation",
+    ],
+}
+
 
 # Get government profile
 @router.get("/{government_id}")
 async def get_government_profile(government_id: str) -> JSONResponse:
     # Check if government exists
-    govt = get_government(government_id)
+    govt = await get_government(government_id)
     if not govt:
         raise HTTPException(status_code=404, detail="Government not found")
 
-    # Remove sensitive information
-    if "password" in govt["account_info"]:
-        govt["account_info"].pop("password")
-
-    return JSONResponse(content=govt)
+    return JSONResponse(content=remove_sensitive_info(govt))
 
 
 # Update government profile
@@ -43,10 +115,14 @@ async def get_government_profile(government_id: str) -> JSONResponse:
 async def update_government_profile(
     government_id: str, data: Dict[str, Any] = Body(...)
 ) -> JSONResponse:
-    govt = get_government(government_id)
+    govt = await get_government(government_id)
     if not govt:
         raise HTTPException(status_code=404, detail="Government not found")
 
+    # Store a new password hashed
+    if isinstance(data.get("password"), str):
+        data["password"] = await hash_password(data["password"])
+
     # Only update fields that are present
     update_data = {}
     for field, value in data.items():
@@ -55,109 +131,135 @@ async def update_government_profile(
     if not update_data:
         raise HTTPException(status_code=400, detail="No valid fields to update")
 
-    update_government(government_id, update_data)
+    try:
+        await update_government(government_id, update_data)
+    except UniqueConstraintError as e:
+        raise HTTPException(status_code=409, detail=already_registered(e))
     return JSONResponse(content={"message": "Profile updated successfully"})
 
 
 # Delete government profile
 @router.delete("/{government_id}", response_model=MessageResponse)
 async def delete_government_profile(government_id: str) -> JSONResponse:
-    government = get_government(government_id)
+    government = await get_government(government_id)
     if not government:
         raise HTTPException(status_code=404, detail="Government not found")
 
     # Delete the government
-    delete_government(government_id)
+    await delete_government(government_id)
     return JSONResponse(content={"message": "Government profile deleted successfully"})
 
 
 # Get wallet information
 @router.get("/{government_id}/wallet")
 async def get_wallet(government_id: str) -> JSONResponse:
-    govt = get_government(government_id)
+    govt = await get_government(government_id)
     if not govt:
         raise HTTPException(status_code=404, detail="Government not found")
 
+    # Scheme and transaction IDs are stored apart from the profile
+    await load_list_fields(GOVERNMENTS_PREFIX, government_id, govt)
     return JSONResponse(content=govt["wallet_info"])
 
 
-# Get all citizens
+# Get all citizens, one page at a time
 @router.get("/{government_id}/citizens")
-async def get_all_citizen_profiles(government_id: str) -> JSONResponse:
-    govt = get_government(government_id)
+async def get_all_citizen_profiles(
+    government_id: str,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+) -> JSONResponse:
+    govt = await get_government(government_id)
     if not govt:
         raise HTTPException(status_code=404, detail="Government not found")
 
-    citizens = get_all_citizens()
+    try:
+        citizens, next_cursor = await scan_citizens(limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     for citizen in citizens:
-        if "account_info" in citizen and "password" in citizen["account_info"]:
-            citizen["account_info"].pop("password")
+        remove_sensitive_info(citizen)
 
-    return JSONResponse(content=citizens)
+    return JSONResponse(content={"citizens": citizens, "next_cursor": next_cursor})
 
 
 # Get specific citizen by ID
 @router.get("/{government_id}/citizens/{citizen_id}")
 async def get_specific_citizen(government_id: str, citizen_id: str) -> JSONResponse:
-    govt = get_government(government_id)
+    govt = await get_government(government_id)
     if not govt:
         raise HTTPException(status_code=404, detail="Government not found")
 
-    citizen = get_citizen(citizen_id)
+    citizen = await get_citizen(citizen_id)
     if not citizen:
         raise HTTPException(status_code=404, detail="Citizen not found")
 
-    if "account_info" in citizen and "password" in citizen["account_info"]:
-        citizen["account_info"].pop("password")
+    return JSONResponse(content=remove_sensitive_info(citizen))
 
-    return JSONResponse(content=citizen)
 
-
-# Get all vendors
+# Get all vendors, one page at a time
 @router.get("/{government_id}/vendors")
-async def get_all_vendor_profiles(government_id: str) -> JSONResponse:
-    govt = get_government(government_id)
+async def get_all_vendor_profiles(
+    government_id: str,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+) -> JSONResponse:
+    govt = await get_government(government_id)
     if not govt:
         raise HTTPException(status_code=404, detail="Government not found")
 
-    vendors = get_all_vendors()
+    try:
+        vendors, next_cursor = await scan_vendors(limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     for vendor in vendors:
-        if "account_info" in vendor and "password" in vendor["account_info"]:
-            vendor["account_info"].pop("password")
+        remove_sensitive_info(vendor)
 
-    return JSONResponse(content=vendors)
+    return JSONResponse(content={"vendors": vendors, "next_cursor": next_cursor})
 
 
 # Get specific vendor by ID
 @router.get("/{government_id}/vendors/{vendor_id}")
 async def get_specific_vendor(government_id: str, vendor_id: str) -> JSONResponse:
-    govt = get_government(government_id)
+    govt = await get_government(government_id)
     if not govt:
         raise HTTPException(status_code=404, detail="Government not found")
 
-    vendor = get_vendor(vendor_id)
+    vendor = await get_vendor(vendor_id)
     if not vendor:
         raise HTTPException(status_code=404, detail="Vendor not found")
 
-    if "account_info" in vendor and "password" in vendor["account_info"]:
-        vendor["account_info"].pop("password")
-
-    return JSONResponse(content=vendor)
+    return JSONResponse(content=remove_sensitive_info(vendor))
 
 
-# Get all transactions
+# Get all transactions, optionally from since to until, one page at a time in
+# no particular order, or all of them streamed as NDJSON or a JSON array
 @router.get("/{government_id}/transactions")
-async def get_all_system_transactions(government_id: str) -> JSONResponse:
-    govt = get_government(government_id)
+async def get_all_system_transactions(
+    government_id: str,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    stream: Optional[Literal["ndjson", "json"]] = None,
+) -> Response:
+    govt = await get_government(government_id)
     if not govt:
         raise HTTPException(status_code=404, detail="Government not found")
 
-    transactions = get_all_transactions()
-    # Sort by timestamp, newest first
-    transactions.sort(
-        key=lambda x: x["timestamp"] if "timestamp" in x else "", reverse=True
+    if stream:
+        return stream_documents(iter_transaction_batches(since, until), stream)
+
+    try:
+        transactions, next_cursor = await scan_transactions(limit, cursor, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return JSONResponse(
+        content={"transactions": transactions, "next_cursor": next_cursor}
     )
-    return JSONResponse(content=transactions)
 
 
 # Get specific transaction by ID
@@ -165,11 +267,11 @@ async def get_all_system_transactions(government_id: str) -> JSONResponse:
 async def get_specific_transaction(
     government_id: str, transaction_id: str
 ) -> JSONResponse:
-    govt = get_government(government_id)
+    govt = await get_government(government_id)
     if not govt:
         raise HTTPException(status_code=404, detail="Government not found")
 
-    transaction = get_transaction(transaction_id)
+    transaction = await get_transaction(transaction_id)
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
 
@@ -179,7 +281,7 @@ async def get_specific_transaction(
 # Create a new scheme
 @router.post("/{government_id}/schemes", response_model=MessageResponse)
 async def create_scheme(government_id: str, scheme_data: SchemeCreate) -> JSONResponse:
-    govt = get_government(government_id)
+    govt = await get_government(government_id)
     if not govt:
         raise HTTPException(status_code=404, detail="Government not found")
 
@@ -196,10 +298,12 @@ async def create_scheme(government_id: str, scheme_data: SchemeCreate) -> JSONRe
 
     scheme_dict = scheme.to_dict()
     # Save scheme to database
-    save_scheme(scheme.id, scheme_dict)
+    await save_scheme(scheme.id, scheme_dict)
 
     # Add scheme to government's schemes list
-    array_union(GOVERNMENTS_PREFIX, government_id, "wallet_info.schemes", [scheme.id])
+    await array_union(
+        GOVERNMENTS_PREFIX, government_id, "wallet_info.schemes", [scheme.id]
+    )
     return JSONResponse(
         content={"message": "Scheme created successfully", "scheme_id": scheme.id}
     )
@@ -208,23 +312,23 @@ async def create_scheme(government_id: str, scheme_data: SchemeCreate) -> JSONRe
 # Get all schemes created by this government
 @router.get("/{government_id}/schemes")
 async def get_schemes(government_id: str) -> JSONResponse:
-    govt = get_government(government_id)
+    govt = await get_government(government_id)
     if not govt:
         raise HTTPException(status_code=404, detail="Government not found")
 
     # Get schemes created by this government
-    schemes = query_schemes_by_field("govt_id", government_id)
+    schemes = await query_schemes_by_field("govt_id", government_id)
     return JSONResponse(content=schemes)
 
 
 # Get a specific scheme by ID
 @router.get("/{government_id}/schemes/{scheme_id}")
 async def get_specific_scheme(government_id: str, scheme_id: str) -> JSONResponse:
-    govt = get_government(government_id)
+    govt = await get_government(government_id)
     if not govt:
         raise HTTPException(status_code=404, detail="Government not found")
 
-    scheme = get_scheme(scheme_id)
+    scheme = await get_scheme(scheme_id)
     if not scheme:
         raise HTTPException(status_code=404, detail="Scheme not found")
 
@@ -241,11 +345,11 @@ async def get_specific_scheme(government_id: str, scheme_id: str) -> JSONRespons
 async def update_scheme(
     government_id: str, scheme_id: str, scheme_data: SchemeCreate
 ) -> JSONResponse:
-    govt = get_government(government_id)
+    govt = await get_government(government_id)
     if not govt:
         raise HTTPException(status_code=404, detail="Government not found")
 
-    existing_scheme = get_scheme(scheme_id)
+    existing_scheme = await get_scheme(scheme_id)
     if not existing_scheme:
         raise HTTPException(status_code=404, detail="Scheme not found")
 
@@ -264,14 +368,22 @@ async def update_scheme(
         status=scheme_data.status,
     )
 
-    # Preserve the original ID and beneficiaries
-    updated_scheme.id = scheme_id
-    updated_scheme.beneficiaries = existing_scheme["beneficiaries"]
-    updated_scheme.created_at = existing_scheme["created_at"]
-
-    # Update and save
     scheme_dict = updated_scheme.to_dict()
-    save_scheme(scheme_id, scheme_dict)
+
+    def apply_update(scheme: Dict[str, Any]) -> None:
+        # Preserve the original ID, beneficiaries and creation time
+        for field, value in scheme_dict.items():
+            if field not in ("id", "beneficiaries", "created_at"):
+                scheme[field] = value
+
+    # Update against the latest stored version, retried on concurrent writes
+    try:
+        if not await modify_scheme(scheme_id, apply_update):
+            raise HTTPException(status_code=404, detail="Scheme not found")
+    except VersionConflictError:
+        raise HTTPException(
+            status_code=409, detail="Scheme was modified concurrently, try again"
+        )
 
     return JSONResponse(
         content={"message": "Scheme updated successfully", "scheme_id": scheme_id}
@@ -281,11 +393,11 @@ async def update_scheme(
 # Soft delete (mark as inactive) a specific scheme
 @router.delete("/{government_id}/schemes/{scheme_id}", response_model=MessageResponse)
 async def soft_delete_scheme(government_id: str, scheme_id: str) -> JSONResponse:
-    govt = get_government(government_id)
+    govt = await get_government(government_id)
     if not govt:
         raise HTTPException(status_code=404, detail="Government not found")
 
-    existing_scheme = get_scheme(scheme_id)
+    existing_scheme = await get_scheme(scheme_id)
     if not existing_scheme:
         raise HTTPException(status_code=404, detail="Scheme not found")
 
@@ -294,9 +406,17 @@ async def soft_delete_scheme(government_id: str, scheme_id: str) -> JSONResponse
             status_code=403, detail="Not authorized to delete this scheme"
         )
 
+    def deactivate(scheme: Dict[str, Any]) -> None:
+        scheme["status"] = "inactive"
+
     # Update only the status field to inactive
-    existing_scheme["status"] = "inactive"
-    save_scheme(scheme_id, existing_scheme)
+    try:
+        if not await modify_scheme(scheme_id, deactivate):
+            raise HTTPException(status_code=404, detail="Scheme not found")
+    except VersionConflictError:
+        raise HTTPException(
+            status_code=409, detail="Scheme was modified concurrently, try again"
+        )
 
     return JSONResponse(
         content={"message": "Scheme marked as inactive", "scheme_id": scheme_id}
@@ -305,14 +425,19 @@ async def soft_delete_scheme(government_id: str, scheme_id: str) -> JSONResponse
 
 # Get beneficiaries of a specific scheme
 @router.get("/{government_id}/schemes/{scheme_id}/beneficiaries")
-async def get_scheme_beneficiaries(government_id: str, scheme_id: str) -> JSONResponse:
+async def get_scheme_beneficiaries(
+    government_id: str,
+    scheme_id: str,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+) -> JSONResponse:
     # Check if the government exists
-    govt = get_government(government_id)
+    govt = await get_government(government_id)
     if not govt:
         raise HTTPException(status_code=404, detail="Government not found")
 
     # Get the scheme
-    scheme = get_scheme(scheme_id)
+    scheme = await get_scheme(scheme_id)
     if not scheme:
         raise HTTPException(status_code=404, detail="Scheme not found")
 
@@ -322,15 +447,221 @@ async def get_scheme_beneficiaries(government_id: str, scheme_id: str) -> JSONRe
             status_code=403, detail="Not authorized to access this scheme"
         )
 
-    # Get the beneficiaries
-    beneficiaries = []
-    if "beneficiaries" in scheme:
-        for citizen_id in scheme["beneficiaries"]:
-            citizen = get_citizen(citizen_id)
-            if citizen:
-                # Remove sensitive info
-                if "password" in citizen["account_info"]:
-                    citizen["account_info"].pop("password")
-                beneficiaries.append(citizen)
-
-    return JSONResponse(content=beneficiaries)
+    # Get a page of the beneficiaries, pass next_cursor back for the next one
+    try:
+        citizen_ids, count, next_cursor = await scan_scheme_beneficiaries(
+            scheme_id, limit, cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    beneficiaries = await get_many_documents(CITIZENS_PREFIX, citizen_ids)
+    for citizen in beneficiaries:
+        remove_sensitive_info(citizen)
+
+    return JSONResponse(
+        content={
+            "beneficiaries": beneficiaries,
+            "count": count,
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+# Get the citizens eligible for a specific scheme, checked all at once
+@router.get("/{government_id}/schemes/{scheme_id}/eligible-citizens")
+async def get_scheme_eligible_citizens(
+    government_id: str,
+    scheme_id: str,
+    limit: int = Query(1000, ge=1, le=100000),
+    cursor: Optional[str] = None,
+) -> JSONResponse:
+    # Check if the government exists
+    govt = await get_government(government_id)
+    if not govt:
+        raise HTTPException(status_code=404, detail="Government not found")
+
+    # Get the scheme
+    scheme = await get_scheme(scheme_id)
+    if not scheme:
+        raise HTTPException(status_code=404, detail="Scheme not found")
+
+    # Check if this government owns the scheme
+    if scheme["govt_id"] != government_id:
+        raise HTTPException(
+            status_code=403, detail="Not authorized to access this scheme"
+        )
+
+    # Evaluate the criteria of the scheme over the columns of every citizen,
+    # pass next_cursor back for the next page of the eligible ones
+    citizens = await citizen_tables.table()
+    mask = CompiledScheme(scheme).eligible_mask(citizens)
+    citizen_ids, count, next_cursor = citizens.page(mask, limit, cursor)
+
+    return JSONResponse(
+        content={
+            "eligible_citizens": citizen_ids,
+            "count": count,
+            "checked": len(citizens),
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+def _parse_bulk_line(collection: str, mode: str, line: bytes) -> Tuple[str, Any]:
+    """Parse an NDJSON line of a bulk import into (document ID, payload)"""
+    if mode == "create":
+        signup_model, account_model, _ = BULK_ACCOUNTS[collection]
+        data = signup_model.model_validate_json(line)
+        document = account_model(**data.model_dump()).to_dict()
+        return document["account_info"]["id"], document
+    if mode == "update":
+        update = BulkUpdate.model_validate_json(line)
+        _check_bulk_update_fields(collection, update.fields)
+        return update.id, update.fields
+    return BulkDelete.model_validate_json(line).id, None
+
+
+def _check_bulk_update_fields(collection: str, fields: Dict[str, Any]) -> None:
+    """Reject bulk update paths outside the profile fields of a collection"""
+    _, _, prefix = BULK_ACCOUNTS[collection]
+    list_fields = [
+        *LIST_FIELDS.get(prefix, []),
+        *(
+            field
+            for pair in LINKED_LIST_FIELDS
+            for side, field in pair
+            if side == prefix
+        ),
+    ]
+    for path in fields:
+        if any(
+            path == field
+            or path.startswith(f"{field}.")
+            or field.startswith(f"{path}.")
+            for field in list_fields
+        ):
+            raise ValueError(f"List field '{path}' cannot be updated in bulk")
+        if path == "wallet_info" or path.startswith("wallet_info."):
+            raise ValueError(f"Wallet field '{path}' cannot be updated in bulk")
+        if path not in BULK_UPDATE_FIELDS[collection]:
+            raise ValueError(f"Field '{path}' cannot be updated in bulk")
+
+
+async def _write_bulk_batch(
+    collection: str,
+    mode: str,
+    batch: List[Tuple[int, str, Any]],
+    errors: List[Dict[str, Any]],
+) -> int:
+    """Write a batch of parsed lines, returning the number of documents written"""
+    if mode == "update":
+        # Store new passwords hashed, as the profile routes do
+        passwords = [
+            data
+            for _, _, data in batch
+            if isinstance(data.get("account_info.password"), str)
+        ]
+        hashes = await asyncio.gather(
+            *(hash_password(data["account_info.password"]) for data in passwords)
+        )
+        for data, password_hash in zip(passwords, hashes):
+            data["account_info.password"] = password_hash
+
+        # Updates of unique fields are written one at a time, as update_many
+        # does anyway, so a value already registered only fails its own line
+        _, account_model, prefix = BULK_ACCOUNTS[collection]
+        updates, written, missing = {}, 0, []
+        for line_number, doc_id, data in batch:
+            if not any(
+                field_path == path or field_path.startswith(f"{path}.")
+                for field_path in UNIQUE_FIELDS.get(prefix, [])
+                for path in data
+            ):
+                updates[doc_id] = data
+                continue
+            try:
+                written += await update_many(
+                    collection, {doc_id: data}, missing=missing
+                )
+            except UniqueConstraintError as e:
+                errors.append({"line": line_number, "detail": already_registered(e)})
+        written += await update_many(collection, updates, missing=missing)
+
+        # Report the lines of accounts that do not exist
+        lines = {doc_id: line_number for line_number, doc_id, _ in batch}
+        for doc_id in missing:
+            errors.append(
+                {"line": lines[doc_id], "detail": f"{account_model.__name__} not found"}
+            )
+        return written
+    if mode == "delete":
+        return await delete_many(collection, [doc_id for _, doc_id, _ in batch])
+
+    documents = {doc_id: data for _, doc_id, data in batch}
+
+    # Hash the passwords of the batch in the bounded hashing pool
+    hashes = await asyncio.gather(
+        *(
+            hash_password(data["account_info"]["password"])
+            for data in documents.values()
+        )
+    )
+    for data, password_hash in zip(documents.values(), hashes):
+        data["account_info"]["password"] = password_hash
+
+    # Drop accounts whose unique values are already registered, as signup
+    # does, one at a time
+    lines = {doc_id: line_number for line_number, doc_id, _ in batch}
+    while documents:
+        try:
+            return await save_many(collection, documents)
+        except UniqueConstraintError as e:
+            errors.append({"line": lines[e.doc_id], "detail": already_registered(e)})
+            del documents[e.doc_id]
+    return 0
+
+
+# Bulk create, update or delete citizens or vendors from an NDJSON upload, one
+# account per line (signup fields, {"id", "fields"} or {"id"} depending on mode)
+@router.post("/{government_id}/bulk/{collection}")
+async def bulk_import(
+    government_id: str,
+    collection: Literal["citizens", "vendors"],
+    request: Request,
+    mode: Literal["create", "update", "delete"] = "create",
+) -> JSONResponse:
+    govt = await get_government(government_id)
+    if not govt:
+        raise HTTPException(status_code=404, detail="Government not found")
+
+    # Write while the upload is received, one pipelined batch at a time
+    processed, errors, batch = 0, [], []
+    async for line_number, line in iter_ndjson_lines(request.stream()):
+        if line is None:
+            errors.append(
+                {
+                    "line": line_number,
+                    "detail": f"Line longer than {NDJSON_MAX_LINE_BYTES} bytes",
+                }
+            )
+            continue
+        try:
+            doc_id, data = _parse_bulk_line(collection, mode, line)
+        except ValueError as e:
+            errors.append({"line": line_number, "detail": str(e)})
+            continue
+        batch.append((line_number, doc_id, data))
+        if len(batch) >= REDIS_WRITE_BATCH_SIZE:
+            processed += await _write_bulk_batch(collection, mode, batch, errors)
+            batch = []
+    if batch:
+        processed += await _write_bulk_batch(collection, mode, batch, errors)
+
+    return JSONResponse(
+        content={
+            "message": f"Bulk {mode} of {collection} completed",
+            "processed": processed,
+            "errors": errors,
+        }
+    )
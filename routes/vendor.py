@@ -1,17 +1,23 @@
 import io
 import qrcode
 import base64
-from fastapi import APIRouter, HTTPException, Body
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Body, Query
 from fastapi.responses import JSONResponse
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from models.api import MessageResponse
 from db import (
     get_vendor,
     update_vendor,
     delete_vendor,
     get_transaction,
-    query_transactions_by_field,
+    get_account_transactions,
+    load_list_fields,
+    UniqueConstraintError,
 )
+from db.redis_config import VENDORS_PREFIX
+from utils.common import remove_sensitive_info, already_registered
+from utils.passwords import hash_password
 
 router = APIRouter()
 
@@ -20,15 +26,11 @@ router = APIRouter()
 @router.get("/{vendor_id}")
 async def get_vendor_profile(vendor_id: str) -> JSONResponse:
     # Check if vendor existss
-    vendor = get_vendor(vendor_id)
+    vendor = await get_vendor(vendor_id)
     if not vendor:
         raise HTTPException(status_code=404, detail="Vendor not found")
 
-    # Remove sensitive information
-    if "password" in vendor["account_info"]:
-        vendor["account_info"].pop("password")
-
-    return JSONResponse(content=vendor)
+    return JSONResponse(content=remove_sensitive_info(vendor))
 
 
 # Update vendor profile
@@ -36,10 +38,14 @@ async def get_vendor_profile(vendor_id: str) -> JSONResponse:
 async def update_vendor_profile(
     vendor_id: str, data: Dict[str, Any] = Body(...)
 ) -> JSONResponse:
-    vendor = get_vendor(vendor_id)
+    vendor = await get_vendor(vendor_id)
     if not vendor:
         raise HTTPException(status_code=404, detail="Vendor not found")
 
+    # Store a new password hashed
+    if isinstance(data.get("password"), str):
+        data["password"] = await hash_password(data["password"])
+
     # Only update fields that are present
     update_data = {}
     for field, value in data.items():
@@ -48,7 +54,10 @@ async def update_vendor_profile(
     if not update_data:
         raise HTTPException(status_code=400, detail="No valid fields to update")
 
-    update_vendor(vendor_id, update_data)
+    try:
+        await update_vendor(vendor_id, update_data)
+    except UniqueConstraintError as e:
+        raise HTTPException(status_code=409, detail=already_registered(e))
     return JSONResponse(content={"message": "Profile updated successfully"})
 
 
@@ -56,29 +65,31 @@ async def update_vendor_profile(
 @router.delete("/{vendor_id}", response_model=MessageResponse)
 async def delete_vendor_profile(vendor_id: str) -> JSONResponse:
     # Check if vendor exists
-    vendor = get_vendor(vendor_id)
+    vendor = await get_vendor(vendor_id)
     if not vendor:
         raise HTTPException(status_code=404, detail="Vendor not found")
 
     # Delete the vendor
-    delete_vendor(vendor_id)
+    await delete_vendor(vendor_id)
     return JSONResponse(content={"message": "Vendor profile deleted successfully"})
 
 
 # Get wallet information
 @router.get("/{vendor_id}/wallet")
 async def get_wallet(vendor_id: str) -> JSONResponse:
-    vendor = get_vendor(vendor_id)
+    vendor = await get_vendor(vendor_id)
     if not vendor:
         raise HTTPException(status_code=404, detail="Vendor not found")
 
+    # Transaction IDs are stored apart from the profile
+    await load_list_fields(VENDORS_PREFIX, vendor_id, vendor)
     return JSONResponse(content=vendor["wallet_info"])
 
 
 # Generate QR code for payment
 @router.get("/{vendor_id}/generate-qr")
 async def generate_qr(vendor_id: str) -> JSONResponse:
-    vendor = get_vendor(vendor_id)
+    vendor = await get_vendor(vendor_id)
     if not vendor:
         raise HTTPException(status_code=404, detail="Vendor not found")
 
@@ -103,39 +114,40 @@ async def generate_qr(vendor_id: str) -> JSONResponse:
     return JSONResponse(content={"qr_code": img_str, "user_id": vendor_id})
 
 
-# Get transaction history
+# Get transaction history, newest first
 @router.get("/{vendor_id}/transactions")
-async def get_transactions(vendor_id: str) -> JSONResponse:
-    # Find transactions where vendor is either sender or receiver
-    from_transactions = query_transactions_by_field("from_id", vendor_id)
-    to_transactions = query_transactions_by_field("to_id", vendor_id)
-
-    transactions = []
-
-    # Add from transactions
-    for transaction in from_transactions:
-        transactions.append(transaction)
-
-    # Add to transactions (avoiding duplicates)
-    for transaction in to_transactions:
-        if not any(t["id"] == transaction["id"] for t in transactions):
-            transactions.append(transaction)
+async def get_transactions(
+    vendor_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> JSONResponse:
+    # Page through the vendor's timeline, pass next_cursor back as before (or as
+    # after when paging towards newer transactions)
+    try:
+        transactions, next_cursor = await get_account_transactions(
+            vendor_id, limit, before, after, since, until
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # Sort by timestamp, newest first
-    transactions.sort(key=lambda x: x["timestamp"], reverse=True)
-    return JSONResponse(content=transactions)
+    return JSONResponse(
+        content={"transactions": transactions, "next_cursor": next_cursor}
+    )
 
 
 # Get transaction by ID
 @router.get("/{vendor_id}/transactions/{transaction_id}")
 async def get_specific_transaction(vendor_id: str, transaction_id: str) -> JSONResponse:
     # Check if vendor exists
-    vendor = get_vendor(vendor_id)
+    vendor = await get_vendor(vendor_id)
     if not vendor:
         raise HTTPException(status_code=404, detail="Vendor not found")
 
     # Get the transaction
-    transaction = get_transaction(transaction_id)
+    transaction = await get_transaction(transaction_id)
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
 
@@ -0,0 +1,39 @@
+"""Move old transactions out of Redis into archive segment files.
+
+Archives the monthly transaction partitions that ended more than DAYS days ago
+(default REDIS_ARCHIVE_AFTER_DAYS), as the app does periodically when
+REDIS_ARCHIVE_AFTER_DAYS is set. Archived transactions stay readable by ID and
+from account histories.
+
+Usage: python scripts/archive_transactions.py [--days DAYS]
+"""
+
+import sys
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db.redis_config import (  # noqa: E402
+    TRANSACTIONS_PREFIX,
+    TRANSACTIONS_SET,
+    REDIS_ARCHIVE_AFTER_DAYS,
+)
+from db.redis_operations import archive_documents  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=REDIS_ARCHIVE_AFTER_DAYS)
+    args = parser.parse_args()
+    if args.days <= 0:
+        parser.error("--days must be positive")
+
+    before = datetime.now(timezone.utc) - timedelta(days=args.days)
+    count = archive_documents(TRANSACTIONS_PREFIX, TRANSACTIONS_SET, before)
+    print(f"archived {count} transactions from before {before:%Y-%m}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Benchmark the document codecs on citizen and transaction documents.
+
+Measures encode and decode time per document and the stored size for every
+codec available in this environment (orjson and msgpack are only listed when
+installed). No Redis connection is needed.
+
+Usage: python scripts/benchmark_codecs.py [--iterations N] [--transactions N]
+"""
+
+import sys
+import timeit
+import uuid
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from models.citizen import Citizen  # noqa: E402
+from models.transaction import Transaction  # noqa: E402
+from utils.db_helpers import CODECS, serialize_for_db  # noqa: E402
+
+
+def citizen_document(transactions: int):
+    """Citizen with a realistic profile and wallet history"""
+    citizen = Citizen(
+        name="Benchmark Citizen",
+        password="$2b$12$" + "x" * 53,
+        email="citizen@example.com",
+        phone="+91 98765 43210",
+        id_number="123456789012",
+        address="221B, MG Road, Bengaluru, Karnataka 560001",
+        dob="1990-01-01",
+        gender="female",
+        occupation="farmer",
+        caste="general",
+        annual_income=85000.0,
+    )
+    data = citizen.to_dict()
+    for wallet in ("govt_wallet", "personal_wallet"):
+        data["wallet_info"][wallet] = {
+            "balance": 12500.75,
+            "transactions": [str(uuid.uuid4()) for _ in range(transactions)],
+        }
+    data["scheme_info"] = [str(uuid.uuid4()) for _ in range(5)]
+    return data
+
+
+def transaction_document():
+    """Citizen-to-vendor payment"""
+    return Transaction(
+        str(uuid.uuid4()),
+        str(uuid.uuid4()),
+        249.5,
+        "citizen_to_vendor",
+        description="Payment for groceries",
+    ).to_dict()
+
+
+def run(name, document, iterations: int) -> None:
+    print(f"\n{name}")
+    print(f"{'codec':<10} {'encode us':>10} {'decode us':>10} {'bytes':>8}")
+    for codec in CODECS.values():
+        stored = serialize_for_db(document, codec)
+        encode = timeit.timeit(
+            lambda: serialize_for_db(document, codec), number=iterations
+        )
+        # Decode with the codec itself, reads of a shared header use the
+        # fastest registered implementation
+        decode = timeit.timeit(lambda: codec.loads(stored[1:]), number=iterations)
+        print(
+            f"{codec.name:<10} {encode * 1e6 / iterations:>10.2f} "
+            f"{decode * 1e6 / iterations:>10.2f} {len(stored):>8}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument(
+        "--transactions", type=int, default=50, help="transaction IDs per wallet"
+    )
+    args = parser.parse_args()
+
+    run(
+        f"citizen ({args.transactions} transactions per wallet)",
+        citizen_document(args.transactions),
+        args.iterations,
+    )
+    run("transaction", transaction_document(), args.iterations)
+
+
+if __name__ == "__main__":
+    main()
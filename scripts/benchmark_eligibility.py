@@ -0,0 +1,185 @@
+"""Benchmark eligibility checks against large numbers of active schemes.
+
+Measures compiling and indexing the criteria of every scheme, which the
+scheme registry does once per scheme version (and every call when the document
+cache is disabled), then checking one citizen against every compiled scheme
+and against the candidates left by the index, which every eligible-schemes
+request does. With --citizens, also measures building a table of that many
+citizens and checking one scheme against all of them, which the
+eligible-citizens endpoint does. No Redis connection is needed.
+
+Usage: python scripts/benchmark_eligibility.py [--schemes N ...] [--iterations N]
+                                               [--citizens N ...]
+"""
+
+import sys
+import time
+import uuid
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from models.scheme import Scheme  # noqa: E402
+from utils.eligibility import (  # noqa: E402
+    CitizenProfile,
+    CitizenTable,
+    CompiledScheme,
+    SchemeIndex,
+    compile_active_schemes,
+)
+
+OCCUPATIONS = ["farmer", "teacher", "weaver", "driver", "any"]
+GENDERS = ["female", "male", "any"]
+CASTES = ["general", "obc", "sc", "st", "all"]
+STATES = [
+    "Karnataka",
+    "Kerala",
+    "Maharashtra",
+    "Tamil Nadu",
+    "Gujarat",
+    "Punjab",
+    "Odisha",
+    "all",
+]
+
+
+def scheme_documents(count: int, rng: random.Random):
+    """Active schemes with a varied mix of criteria"""
+    schemes = []
+    for _ in range(count):
+        criteria = {
+            "occupation": rng.choice(OCCUPATIONS),
+            "gender": rng.choice(GENDERS),
+            "annual_income": rng.choice([100000.0, 250000.0, 500000.0]),
+            "min_age": rng.choice([0, 18, 21]),
+            "max_age": rng.choice([35, 60, 100]),
+            "state": rng.choice(STATES),
+        }
+        if rng.random() < 0.5:
+            criteria["caste"] = rng.choice(CASTES)
+        scheme = Scheme(
+            name="Benchmark Scheme",
+            description="Scheme with generated criteria",
+            govt_id=str(uuid.uuid4()),
+            amount=5000.0,
+            eligibility_criteria=criteria,
+        )
+        schemes.append(scheme.to_dict())
+    return schemes
+
+
+def citizen_profile():
+    """Personal information of a citizen eligible for part of the schemes"""
+    return {
+        "address": "221B, MG Road, Bengaluru, Karnataka 560001",
+        "dob": "1990-01-01",
+        "gender": "female",
+        "occupation": "farmer",
+        "caste": "general",
+        "annual_income": 85000.0,
+    }
+
+
+def citizen_columns(count: int, rng: random.Random):
+    """IDs and fields of citizens with a varied mix of attributes, as loaded
+    into a citizen table"""
+    ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(count)]
+    fields = {
+        "occupation": [rng.choice(OCCUPATIONS[:-1]) for _ in range(count)],
+        "gender": [rng.choice(GENDERS[:-1]) for _ in range(count)],
+        "caste": [rng.choice(CASTES[:-1]) for _ in range(count)],
+        "address": [
+            f"{rng.randint(1, 999)}, Road {rng.randint(1, 99)}, "
+            f"{rng.choice(STATES[:-1])} {rng.randint(100000, 999999)}"
+            for _ in range(count)
+        ],
+        "dob": [
+            f"{rng.randint(1940, 2010)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            for _ in range(count)
+        ],
+        "annual_income": [float(rng.randint(0, 1000000)) for _ in range(count)],
+    }
+    return ids, fields
+
+
+def check(schemes, profile: CitizenProfile):
+    """Check a citizen like the eligible-schemes endpoint"""
+    eligible = [scheme for scheme in schemes if scheme.eligible(profile)]
+    for scheme in eligible:
+        scheme.check(profile)
+    return eligible
+
+
+def run(count: int, iterations: int) -> None:
+    schemes = scheme_documents(count, random.Random(count))
+
+    start = time.perf_counter()
+    compiled = compile_active_schemes(schemes)
+    index = SchemeIndex(compiled)
+    compile_ms = (time.perf_counter() - start) * 1e3
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        eligible = check(compiled, CitizenProfile(citizen_profile()))
+    scan_ms = (time.perf_counter() - start) * 1e3 / iterations
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        profile = CitizenProfile(citizen_profile())
+        candidates = index.candidates(profile)
+        indexed = check(candidates, profile)
+    indexed_ms = (time.perf_counter() - start) * 1e3 / iterations
+    assert len(indexed) == len(eligible)
+
+    print(
+        f"{count:>8} {compile_ms:>12.1f} {scan_ms:>10.2f} {indexed_ms:>12.3f} "
+        f"{len(candidates):>11} {len(eligible):>9}"
+    )
+
+
+def run_table(count: int, iterations: int) -> None:
+    ids, fields = citizen_columns(count, random.Random(count))
+    scheme = CompiledScheme(scheme_documents(1, random.Random(count))[0])
+
+    start = time.perf_counter()
+    table = CitizenTable(ids, fields)
+    build_ms = (time.perf_counter() - start) * 1e3
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        eligible = int(scheme.eligible_mask(table).sum())
+    check_ms = (time.perf_counter() - start) * 1e3 / iterations
+
+    print(f"{count:>9} {build_ms:>10.1f} {check_ms:>10.2f} {eligible:>9}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--schemes", type=int, nargs="+", default=[10000, 50000, 100000]
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=20, help="citizen checks per size"
+    )
+    parser.add_argument(
+        "--citizens", type=int, nargs="+", default=[], help="citizen table sizes"
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'schemes':>8} {'compile ms':>12} {'check ms':>10} {'indexed ms':>12} "
+        f"{'candidates':>11} {'eligible':>9}"
+    )
+    for count in args.schemes:
+        run(count, args.iterations)
+
+    if args.citizens:
+        print(f"\n{'citizens':>9} {'build ms':>10} {'check ms':>10} {'eligible':>9}")
+    for count in args.citizens:
+        run_table(count, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Benchmark citizen-to-vendor payments against a running Redis.
+
+Compares the previous client-side flow (reads, read-modify-write updates and a
+separate transaction save) with the atomic transfer script, and checks that no
+balance updates are lost when several workers pay from the same wallets.
+
+Usage: python scripts/benchmark_payments.py [--payments N] [--workers N]
+Writes benchmark accounts into the configured Redis database and removes them
+afterwards.
+"""
+
+import sys
+import time
+import uuid
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db.redis_config import (  # noqa: E402
+    redis_client,
+    CITIZENS_PREFIX,
+    VENDORS_PREFIX,
+    TRANSACTIONS_PREFIX,
+    TRANSACTIONS_SET,
+)
+from db.redis_operations import array_union, delete_document  # noqa: E402
+from models.transaction import Transaction  # noqa: E402
+from utils.db_ops import (  # noqa: E402
+    get_citizen,
+    save_citizen,
+    update_citizen,
+    delete_citizen,
+    get_vendor,
+    save_vendor,
+    update_vendor,
+    delete_vendor,
+    save_transaction,
+    query_transactions_by_field,
+    pay_vendor_from_wallet,
+)
+
+AMOUNT = 1.0
+WALLET = "personal_wallet"
+
+
+def legacy_payment(citizen_id: str, vendor_id: str) -> None:
+    """Payment flow used before the transfer script"""
+    citizen = get_citizen(citizen_id)
+    if citizen["wallet_info"][WALLET]["balance"] < AMOUNT:
+        return
+    vendor = get_vendor(vendor_id)
+    transaction = Transaction(citizen_id, vendor_id, AMOUNT, "citizen-to-vendor")
+
+    update_citizen(
+        citizen_id,
+        {
+            f"wallet_info.{WALLET}.balance": citizen["wallet_info"][WALLET]["balance"]
+            - AMOUNT
+        },
+    )
+    array_union(
+        CITIZENS_PREFIX,
+        citizen_id,
+        f"wallet_info.{WALLET}.transactions",
+        [transaction.id],
+    )
+    update_vendor(
+        vendor_id, {"wallet_info.balance": vendor["wallet_info"]["balance"] + AMOUNT}
+    )
+    array_union(VENDORS_PREFIX, vendor_id, "wallet_info.transactions", [transaction.id])
+    save_transaction(transaction.id, transaction.to_dict())
+
+
+def script_payment(citizen_id: str, vendor_id: str) -> None:
+    """Payment flow using the atomic transfer script"""
+    transaction = Transaction(citizen_id, vendor_id, AMOUNT, "citizen-to-vendor")
+    pay_vendor_from_wallet(
+        citizen_id, vendor_id, WALLET, AMOUNT, transaction.id, transaction.to_dict()
+    )
+
+
+def create_accounts(count: int, balance: float):
+    citizen_ids, vendor_ids = [], []
+    for _ in range(count):
+        citizen_id, vendor_id = f"bench-{uuid.uuid4()}", f"bench-{uuid.uuid4()}"
+        save_citizen(
+            citizen_id,
+            {
+                "account_info": {"id": citizen_id, "name": "Benchmark Citizen"},
+                "wallet_info": {
+                    "govt_wallet": {"balance": 0},
+                    "personal_wallet": {"balance": balance},
+                },
+            },
+        )
+        save_vendor(
+            vendor_id,
+            {
+                "account_info": {"id": vendor_id, "name": "Benchmark Vendor"},
+                "wallet_info": {"balance": 0},
+            },
+        )
+        citizen_ids.append(citizen_id)
+        vendor_ids.append(vendor_id)
+    return citizen_ids, vendor_ids
+
+
+def remove_accounts(citizen_ids, vendor_ids) -> None:
+    for citizen_id in citizen_ids:
+        for transaction in query_transactions_by_field("from_id", citizen_id):
+            delete_document(TRANSACTIONS_PREFIX, transaction["id"], TRANSACTIONS_SET)
+        delete_citizen(citizen_id)
+    for vendor_id in vendor_ids:
+        delete_vendor(vendor_id)
+
+
+def run(name, payment, payments: int, workers: int, accounts: int) -> None:
+    citizen_ids, vendor_ids = create_accounts(accounts, balance=payments * AMOUNT)
+    pairs = [
+        (citizen_ids[i % accounts], vendor_ids[i % accounts]) for i in range(payments)
+    ]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda pair: payment(*pair), pairs))
+    elapsed = time.perf_counter() - start
+
+    # Every payment must be reflected in the vendor balances
+    credited = sum(get_vendor(v)["wallet_info"]["balance"] for v in vendor_ids)
+    lost = payments * AMOUNT - credited
+    print(
+        f"{name:<8} {payments / elapsed:>10.0f} payments/s "
+        f"{elapsed * 1000 / payments:>8.3f} ms/payment  lost updates: {lost:.0f}"
+    )
+    remove_accounts(citizen_ids, vendor_ids)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--payments", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--accounts", type=int, default=4)
+    args = parser.parse_args()
+
+    redis_client.ping()
+    print(
+        f"{args.payments} payments, {args.workers} workers, "
+        f"{args.accounts} citizen/vendor pairs"
+    )
+    run("legacy", legacy_payment, args.payments, args.workers, args.accounts)
+    run("script", script_payment, args.payments, args.workers, args.accounts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Copy the documents of a standalone Redis instance into a Redis Cluster.
+
+Run with REDIS_CLUSTER_NODES set to the cluster. Documents are read from the
+index sets and partitions of the source instance and saved with
+set_many_documents, which writes them under hash-tagged keys along with their
+sharded index sets, secondary indexes and timelines. Array fields kept apart
+from documents are copied along with them. Safe to run again.
+
+Usage: python scripts/migrate_to_cluster.py --source host:port [--db N]
+"""
+
+import sys
+import argparse
+from pathlib import Path
+from typing import Any, Dict, Set
+
+import redis
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db.redis_config import (  # noqa: E402
+    REDIS_CLUSTER,
+    REDIS_BATCH_SIZE,
+    PARTITIONED_INDEXES,
+    LIST_PREFIX,
+    LIST_FIELDS,
+)
+from db.redis_operations import (  # noqa: E402
+    set_many_documents,
+    move_list_fields,
+    _partitions_key,
+    _read_documents,
+    _decode_document,
+    _merge_list_values,
+)
+from utils.db_ops import COLLECTIONS  # noqa: E402
+
+
+def source_ids(source: redis.Redis, collection_prefix: str, index_set: str) -> Set[str]:
+    """Get the IDs listed in the unsharded index set and partitions of the source"""
+    listing_sets = [index_set]
+    if collection_prefix in PARTITIONED_INDEXES:
+        months = source.zrange(_partitions_key(index_set), 0, -1)
+        listing_sets.extend(f"{index_set}:{month}" for month in months)
+    return {
+        doc_id
+        for listing_set in listing_sets
+        for doc_id in source.sscan_iter(listing_set, count=REDIS_BATCH_SIZE)
+    }
+
+
+def load_source_lists(
+    source: redis.Redis, collection_prefix: str, documents: Dict[str, Dict[str, Any]]
+) -> None:
+    """Put the array fields the source keeps apart back into its documents"""
+    fields = LIST_FIELDS.get(collection_prefix, [])
+    pipe = source.pipeline(transaction=False)
+    for doc_id in documents:
+        for field_path in fields:
+            pipe.lrange(f"{LIST_PREFIX}{collection_prefix}{doc_id}:{field_path}", 0, -1)
+    values = iter(pipe.execute())
+    for data in documents.values():
+        for field_path in fields:
+            _merge_list_values(data, field_path, next(values))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", required=True, help="host:port of the source")
+    parser.add_argument("--db", type=int, default=0, help="database of the source")
+    args = parser.parse_args()
+    if not REDIS_CLUSTER:
+        parser.error("REDIS_CLUSTER_NODES must be set to the target cluster")
+
+    host, port = args.source.rsplit(":", 1)
+    source = redis.Redis(host=host, port=int(port), db=args.db, decode_responses=True)
+    for name, (prefix, index_set) in COLLECTIONS.items():
+        doc_ids = sorted(source_ids(source, prefix, index_set))
+        copied = 0
+        for start in range(0, len(doc_ids), REDIS_BATCH_SIZE):
+            batch = doc_ids[start : start + REDIS_BATCH_SIZE]
+            # Keys of the source follow the standalone layout, without hash tags
+            values = _read_documents(source, [f"{prefix}{doc_id}" for doc_id in batch])
+            documents = {
+                doc_id: _decode_document(prefix, value)
+                for doc_id, value in zip(batch, values)
+                if value
+            }
+            load_source_lists(source, prefix, documents)
+            copied += set_many_documents(prefix, documents, index_set)
+        # Documents were saved holding their array fields, move them apart
+        move_list_fields(prefix, index_set)
+        print(f"copied {copied} {name}")
+
+
+if __name__ == "__main__":
+    main()
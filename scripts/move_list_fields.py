@@ -0,0 +1,55 @@
+"""Move wallet transaction, scheme and beneficiary IDs out of documents.
+
+Documents written before these array fields were kept apart (see LIST_FIELDS in
+db/redis_config.py) still hold them, which the app reads until they are moved.
+Moves them into their lists in one transaction per document, then adds the
+moved links of LINKED_LIST_FIELDS to their other side (scheme beneficiaries to
+the scheme_info of the citizens). Safe to run again and while the app is
+running.
+
+Usage: python scripts/move_list_fields.py [collection ...]
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db.redis_config import LIST_FIELDS, LINKED_LIST_FIELDS  # noqa: E402
+from db.redis_operations import move_list_fields, mirror_list_field  # noqa: E402
+from utils.db_ops import COLLECTIONS  # noqa: E402
+
+# Collections with array fields kept apart
+LIST_COLLECTIONS = {
+    name: (prefix, index_set)
+    for name, (prefix, index_set) in COLLECTIONS.items()
+    if prefix in LIST_FIELDS
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "collections",
+        nargs="*",
+        help=f"collections to migrate, of {', '.join(LIST_COLLECTIONS)} (default: all)",
+    )
+    args = parser.parse_args()
+    unknown = set(args.collections) - set(LIST_COLLECTIONS)
+    if unknown:
+        parser.error(f"unknown collections: {', '.join(sorted(unknown))}")
+
+    for name in args.collections or LIST_COLLECTIONS:
+        prefix, index_set = LIST_COLLECTIONS[name]
+        count = move_list_fields(prefix, index_set)
+        print(f"moved the lists of {count} {name}")
+
+        for (field_prefix, field_path), linked_field in LINKED_LIST_FIELDS:
+            if field_prefix == prefix:
+                count = mirror_list_field(prefix, index_set, field_path, *linked_field)
+                print(f"linked {count} {name} {field_path}")
+
+
+if __name__ == "__main__":
+    main()
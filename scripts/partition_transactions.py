@@ -0,0 +1,40 @@
+"""Move transactions written before index partitioning into monthly partitions.
+
+Lists every transaction of the unpartitioned transactions set in its
+transactions:<YYYY-MM> partition, along with the other indexes, then deletes
+the unpartitioned set. Safe to run again and while the app is running, as new
+transactions are only written to partitions.
+
+Usage: python scripts/partition_transactions.py [--keep]
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db.redis_config import (  # noqa: E402
+    redis_client,
+    TRANSACTIONS_PREFIX,
+    TRANSACTIONS_SET,
+)
+from db.redis_operations import rebuild_indexes  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--keep", action="store_true", help="keep the unpartitioned set"
+    )
+    args = parser.parse_args()
+
+    count = rebuild_indexes(TRANSACTIONS_PREFIX, TRANSACTIONS_SET)
+    print(f"indexed {count} transactions")
+    if not args.keep:
+        redis_client.unlink(TRANSACTIONS_SET)
+        print(f"deleted {TRANSACTIONS_SET}")
+
+
+if __name__ == "__main__":
+    main()
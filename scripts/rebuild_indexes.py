@@ -0,0 +1,40 @@
+"""Rebuild the indexes of collections from their documents.
+
+Recreates the secondary indexes, timelines, partitions and unique constraint
+keys of each document. Run it once for the account collections after upgrading
+to unique constraint keys, as accounts saved before only log in once claimed.
+Safe to run again and while the app is running.
+
+Usage: python scripts/rebuild_indexes.py [collection ...]
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db.redis_operations import rebuild_indexes  # noqa: E402
+from utils.db_ops import COLLECTIONS  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "collections",
+        nargs="*",
+        help=f"collections to rebuild, of {', '.join(COLLECTIONS)} (default: all)",
+    )
+    args = parser.parse_args()
+    unknown = set(args.collections) - set(COLLECTIONS)
+    if unknown:
+        parser.error(f"unknown collections: {', '.join(sorted(unknown))}")
+
+    for name in args.collections or COLLECTIONS:
+        prefix, index_set = COLLECTIONS[name]
+        count = rebuild_indexes(prefix, index_set)
+        print(f"indexed {count} {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,43 +4,35 @@ echo "Seeding test data into Redis..."
 echo "==============================="
 
 PYTHON_SCRIPT=$(cat << 'EOF'
-import os
-import json
 import uuid
 import random
-import redis
 from datetime import datetime, timedelta
-
-CITIZENS_PREFIX = "citizen:"
-CITIZENS_SET = "citizens"
-VENDORS_PREFIX = "vendor:"
-VENDORS_SET = "vendors"
-GOVERNMENTS_PREFIX = "govt:"
-GOVERNMENTS_SET = "governments"
-SCHEMES_PREFIX = "scheme:"
-SCHEMES_SET = "schemes"
-TRANSACTIONS_PREFIX = "txn:"
-TRANSACTIONS_SET = "transactions"
-
-redis_host = os.environ.get("REDIS_HOST", "localhost")
-redis_port = int(os.environ.get("REDIS_PORT", 6379))
-redis_db = int(os.environ.get("REDIS_DB", 0))
-
-redis_client = redis.Redis(
-    host=redis_host, port=redis_port, db=redis_db, decode_responses=True
+from db.redis_config import (
+    redis_client,
+    redis_host,
+    redis_port,
+    CITIZENS_PREFIX,
+    VENDORS_PREFIX,
+    GOVERNMENTS_PREFIX,
+)
+from db.redis_operations import array_union
+from utils.db_ops import (
+    get_citizen,
+    save_citizen,
+    get_vendor,
+    save_vendor,
+    get_government,
+    save_government,
+    get_scheme,
+    save_scheme,
+    add_beneficiary_to_scheme,
+    save_transaction,
 )
+
 redis_client.ping()
 print(f"Connected to Redis at {redis_host}:{redis_port}")
 
 
-def serialize_for_db(data):
-    return json.dumps(data)
-
-
-def deserialize_from_db(data):
-    return json.loads(data)
-
-
 print("Clearing Redis database...")
 redis_client.flushall()
 redis_client.ping()
@@ -122,18 +114,15 @@ for citizen_data in citizens:
             "caste": citizen_data["caste"],
             "annual_income": citizen_data["annual_income"],
         },
+        # Transaction and scheme IDs are added to their lists below, see
+        # LIST_FIELDS in db/redis_config.py
         "wallet_info": {
-            "govt_wallet": {"balance": random.randint(500, 5000), "transactions": []},
-            "personal_wallet": {
-                "balance": random.randint(5000, 10000),
-                "transactions": [],
-            },
+            "govt_wallet": {"balance": random.randint(500, 5000)},
+            "personal_wallet": {"balance": random.randint(5000, 10000)},
         },
-        "scheme_info": [],
     }
 
-    redis_client.set(f"{CITIZENS_PREFIX}{citizen_id}", serialize_for_db(citizen))
-    redis_client.sadd(CITIZENS_SET, citizen_id)
+    save_citizen(citizen_id, citizen)
 
     print(f"Added citizen: {citizen_data['name']}")
 
@@ -205,11 +194,10 @@ for vendor_data in vendors:
             "address": vendor_data["address"],
             "occupation": vendor_data["occupation"],
         },
-        "wallet_info": {"balance": random.randint(5000, 20000), "transactions": []},
+        "wallet_info": {"balance": random.randint(5000, 20000)},
     }
 
-    redis_client.set(f"{VENDORS_PREFIX}{vendor_id}", serialize_for_db(vendor))
-    redis_client.sadd(VENDORS_SET, vendor_id)
+    save_vendor(vendor_id, vendor)
 
     print(f"Added vendor: {vendor_data['business_name']}")
 
@@ -259,15 +247,10 @@ for govt_data in governments:
             "govt_id": govt_data["govt_id"],
             "image_url": govt_data["image_url"],
         },
-        "wallet_info": {
-            "balance": random.randint(1000000, 10000000),
-            "schemes": [],
-            "transactions": [],
-        },
+        "wallet_info": {"balance": random.randint(1000000, 10000000)},
     }
 
-    redis_client.set(f"{GOVERNMENTS_PREFIX}{govt_id}", serialize_for_db(govt))
-    redis_client.sadd(GOVERNMENTS_SET, govt_id)
+    save_government(govt_id, govt)
 
     print(f"Added government entity: {govt_data['name']}")
 
@@ -371,6 +354,7 @@ schemes = [
 ]
 
 scheme_ids = []
+scheme_beneficiaries = {}
 for scheme_data in schemes:
     scheme_id = str(uuid.uuid4())
     scheme_ids.append(scheme_id)
@@ -378,7 +362,7 @@ for scheme_data in schemes:
     eligible_beneficiaries = []
 
     for cid in citizen_ids:
-        citizen = deserialize_from_db(redis_client.get(f"{CITIZENS_PREFIX}{cid}"))
+        citizen = get_citizen(cid)
         personal_info = citizen["personal_info"]
 
         eligible = True
@@ -430,11 +414,6 @@ for scheme_data in schemes:
         if eligible:
             eligible_beneficiaries.append(cid)
 
-            if "scheme_info" not in citizen:
-                citizen["scheme_info"] = []
-            citizen["scheme_info"].append(scheme_id)
-            redis_client.set(f"{CITIZENS_PREFIX}{cid}", serialize_for_db(citizen))
-
     scheme = {
         "id": scheme_id,
         "name": scheme_data["name"],
@@ -444,20 +423,20 @@ for scheme_data in schemes:
         "status": scheme_data["status"],
         "eligibility_criteria": scheme_data["eligibility_criteria"],
         "tags": scheme_data["tags"],
-        "beneficiaries": eligible_beneficiaries,
         "created_at": datetime.now().isoformat(),
         "updated_at": datetime.now().isoformat(),
     }
 
-    redis_client.set(f"{SCHEMES_PREFIX}{scheme_id}", serialize_for_db(scheme))
-    redis_client.sadd(SCHEMES_SET, scheme_id)
+    save_scheme(scheme_id, scheme)
 
-    govt_key = f"{GOVERNMENTS_PREFIX}{scheme_data['govt_id']}"
-    govt_data = redis_client.get(govt_key)
-    if govt_data:
-        govt_dict = deserialize_from_db(govt_data)
-        govt_dict["wallet_info"]["schemes"].append(scheme_id)
-        redis_client.set(govt_key, serialize_for_db(govt_dict))
+    # Add the beneficiaries to the scheme and the scheme to their scheme_info
+    for cid in eligible_beneficiaries:
+        add_beneficiary_to_scheme(scheme_id, cid)
+    scheme_beneficiaries[scheme_id] = eligible_beneficiaries
+
+    array_union(
+        GOVERNMENTS_PREFIX, scheme_data["govt_id"], "wallet_info.schemes", [scheme_id]
+    )
 
     print(
         f"Added scheme: {scheme_data['name']} with {len(eligible_beneficiaries)} beneficiaries"
@@ -468,20 +447,16 @@ transactions = []
 transaction_count = 0
 
 for scheme_id in scheme_ids:
-    scheme_data = redis_client.get(f"{SCHEMES_PREFIX}{scheme_id}")
-    scheme = deserialize_from_db(scheme_data)
-
-    govt_data = redis_client.get(f"{GOVERNMENTS_PREFIX}{scheme['govt_id']}")
-    govt = deserialize_from_db(govt_data)
+    scheme = get_scheme(scheme_id)
+    govt = get_government(scheme["govt_id"])
 
-    beneficiaries = scheme["beneficiaries"]
+    beneficiaries = scheme_beneficiaries[scheme_id]
     if not beneficiaries:
         beneficiaries = random.sample(citizen_ids, min(1, len(citizen_ids)))
 
     for citizen_id in beneficiaries:
         txn_id = str(uuid.uuid4())
-        citizen_data = redis_client.get(f"{CITIZENS_PREFIX}{citizen_id}")
-        citizen = deserialize_from_db(citizen_data)
+        citizen = get_citizen(citizen_id)
 
         transaction = {
             "id": txn_id,
@@ -497,25 +472,18 @@ for scheme_id in scheme_ids:
             "status": "completed",
         }
 
-        redis_client.set(
-            f"{TRANSACTIONS_PREFIX}{txn_id}", serialize_for_db(transaction)
-        )
-        redis_client.sadd(TRANSACTIONS_SET, txn_id)
+        save_transaction(txn_id, transaction)
 
         citizen["wallet_info"]["govt_wallet"]["balance"] += scheme["amount"]
-        if "transactions" not in citizen["wallet_info"]["govt_wallet"]:
-            citizen["wallet_info"]["govt_wallet"]["transactions"] = []
-
-        citizen["wallet_info"]["govt_wallet"]["transactions"].append(txn_id)
-        redis_client.set(f"{CITIZENS_PREFIX}{citizen_id}", serialize_for_db(citizen))
+        save_citizen(citizen_id, citizen)
+        array_union(
+            CITIZENS_PREFIX, citizen_id, "wallet_info.govt_wallet.transactions", [txn_id]
+        )
 
         govt["wallet_info"]["balance"] -= scheme["amount"]
-        if "transactions" not in govt["wallet_info"]:
-            govt["wallet_info"]["transactions"] = []
-
-        govt["wallet_info"]["transactions"].append(txn_id)
-        redis_client.set(
-            f"{GOVERNMENTS_PREFIX}{scheme['govt_id']}", serialize_for_db(govt)
+        save_government(scheme["govt_id"], govt)
+        array_union(
+            GOVERNMENTS_PREFIX, scheme["govt_id"], "wallet_info.transactions", [txn_id]
         )
 
         print(
@@ -528,11 +496,8 @@ for i in range(len(citizen_ids)):
         txn_id = str(uuid.uuid4())
         vendor_id = random.choice(vendor_ids)
 
-        citizen_data = redis_client.get(f"{CITIZENS_PREFIX}{citizen_ids[i]}")
-        citizen = deserialize_from_db(citizen_data)
-
-        vendor_data = redis_client.get(f"{VENDORS_PREFIX}{vendor_id}")
-        vendor = deserialize_from_db(vendor_data)
+        citizen = get_citizen(citizen_ids[i])
+        vendor = get_vendor(vendor_id)
 
         amount = min(
             random.randint(100, 1000),
@@ -556,26 +521,20 @@ for i in range(len(citizen_ids)):
             "status": "completed",
         }
 
-        redis_client.set(
-            f"{TRANSACTIONS_PREFIX}{txn_id}", serialize_for_db(transaction)
-        )
-        redis_client.sadd(TRANSACTIONS_SET, txn_id)
+        save_transaction(txn_id, transaction)
 
         citizen["wallet_info"]["personal_wallet"]["balance"] -= amount
-        if "transactions" not in citizen["wallet_info"]["personal_wallet"]:
-            citizen["wallet_info"]["personal_wallet"]["transactions"] = []
-
-        citizen["wallet_info"]["personal_wallet"]["transactions"].append(txn_id)
-        redis_client.set(
-            f"{CITIZENS_PREFIX}{citizen_ids[i]}", serialize_for_db(citizen)
+        save_citizen(citizen_ids[i], citizen)
+        array_union(
+            CITIZENS_PREFIX,
+            citizen_ids[i],
+            "wallet_info.personal_wallet.transactions",
+            [txn_id],
         )
 
         vendor["wallet_info"]["balance"] += amount
-        if "transactions" not in vendor["wallet_info"]:
-            vendor["wallet_info"]["transactions"] = []
-
-        vendor["wallet_info"]["transactions"].append(txn_id)
-        redis_client.set(f"{VENDORS_PREFIX}{vendor_id}", serialize_for_db(vendor))
+        save_vendor(vendor_id, vendor)
+        array_union(VENDORS_PREFIX, vendor_id, "wallet_info.transactions", [txn_id])
 
         print(
             f"Created purchase: {citizen['account_info']['name']} to {vendor['business_info']['business_name']} (₹{amount})"
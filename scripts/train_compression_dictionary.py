@@ -0,0 +1,77 @@
+"""Train a zstd compression dictionary from the documents stored in Redis.
+
+Samples documents of every collection, encodes them with the configured codec
+and writes a dictionary to use with REDIS_COMPRESSION=zstd and
+REDIS_COMPRESSION_DICTIONARY=<output>. Requires the zstandard package.
+
+Usage: python scripts/train_compression_dictionary.py OUTPUT [--samples N]
+       [--size BYTES]
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+import zstandard
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db.redis_config import (  # noqa: E402
+    CITIZENS_PREFIX,
+    CITIZENS_SET,
+    VENDORS_PREFIX,
+    VENDORS_SET,
+    GOVERNMENTS_PREFIX,
+    GOVERNMENTS_SET,
+    SCHEMES_PREFIX,
+    SCHEMES_SET,
+    TRANSACTIONS_PREFIX,
+    TRANSACTIONS_SET,
+)
+from db.redis_operations import document_codec, scan_documents  # noqa: E402
+from utils.db_helpers import serialize_for_db  # noqa: E402
+
+COLLECTIONS = [
+    (CITIZENS_PREFIX, CITIZENS_SET),
+    (VENDORS_PREFIX, VENDORS_SET),
+    (GOVERNMENTS_PREFIX, GOVERNMENTS_SET),
+    (SCHEMES_PREFIX, SCHEMES_SET),
+    (TRANSACTIONS_PREFIX, TRANSACTIONS_SET),
+]
+
+
+def compressed_size(samples, dict_data=None) -> int:
+    compressor = zstandard.ZstdCompressor(level=3, dict_data=dict_data)
+    return sum(len(compressor.compress(sample)) for sample in samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", type=Path)
+    parser.add_argument(
+        "--samples", type=int, default=2000, help="documents per collection"
+    )
+    parser.add_argument("--size", type=int, default=16384, help="dictionary size")
+    args = parser.parse_args()
+
+    samples = []
+    for prefix, index_set in COLLECTIONS:
+        # A page of a partitioned collection starts at its oldest partition
+        documents, _ = scan_documents(prefix, index_set, args.samples)
+        documents = documents[: args.samples]
+        samples.extend(serialize_for_db(data, document_codec) for data in documents)
+        print(f"{prefix:<12} {len(documents)} documents")
+
+    dictionary = zstandard.train_dictionary(args.size, samples)
+    args.output.write_bytes(dictionary.as_bytes())
+
+    original = sum(len(sample) for sample in samples)
+    print(f"\nwrote {len(dictionary.as_bytes())} byte dictionary to {args.output}")
+    print(f"ratio without dictionary: {compressed_size(samples) / original:.3f}")
+    print(
+        f"ratio with dictionary:    {compressed_size(samples, dictionary) / original:.3f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
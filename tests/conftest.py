@@ -5,8 +5,9 @@ from app import app
 
 
 @pytest.fixture
-def client():
-    return TestClient(app)
+def client(request):
+    # Each test gets its own client address, so the rate limit applies per test
+    return TestClient(app, client=(request.node.nodeid, 50000))
 
 
 @pytest.fixture
@@ -40,10 +41,9 @@ def mock_citizen_data():
             "annual_income": 800000.0,
         },
         "wallet_info": {
-            "govt_wallet": {"balance": 5000.0, "transactions": []},
-            "personal_wallet": {"balance": 10000.0, "transactions": []},
+            "govt_wallet": {"balance": 5000.0},
+            "personal_wallet": {"balance": 10000.0},
         },
-        "scheme_info": [],
     }
 
 
@@ -71,7 +71,6 @@ def mock_vendor_data():
         },
         "wallet_info": {
             "balance": 50000.0,
-            "transactions": [],
         },
     }
 
@@ -93,8 +92,6 @@ def mock_government_data():
         },
         "wallet_info": {
             "balance": 10000000.0,
-            "schemes": [],
-            "transactions": [],
         },
     }
 
@@ -116,7 +113,6 @@ def mock_scheme_data():
             "annual_income": 100000.0,
         },
         "tags": ["test", "scheme"],
-        "beneficiaries": [],
         "created_at": "2025-05-10T10:00:00Z",
         "updated_at": "2025-05-10T10:00:00Z",
     }
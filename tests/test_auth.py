@@ -1,13 +1,13 @@
+import asyncio
 from unittest.mock import patch
+from db import UniqueConstraintError
+from utils.passwords import hash_password
 
 
 class TestAuthRoutes:
     def test_citizen_signup_success(self, client):
-        # Mock the query and save functions
-        with (
-            patch("routes.auth.query_citizens_by_field", return_value=[]) as mock_query,
-            patch("routes.auth.save_citizen", return_value="test-id") as mock_save,
-        ):
+        # Mock the save function
+        with patch("routes.auth.save_citizen", return_value="test-id") as mock_save:
             # Send signup request
             response = client.post(
                 "/api/v1/auth/signup/citizen",
@@ -34,13 +34,15 @@ class TestAuthRoutes:
             assert response.json()["user_type"] == "citizen"
 
             # Verify mocks were called
-            mock_query.assert_called_once()
             mock_save.assert_called_once()
 
     def test_citizen_signup_email_exists(self, client):
-        # Mock query to return existing user
+        # Mock save to find the email claimed by an existing user
         with patch(
-            "routes.auth.query_citizens_by_field", return_value=[{"id": "existing-id"}]
+            "routes.auth.save_citizen",
+            side_effect=UniqueConstraintError(
+                "test-id", "account_info.email", "existing@example.com"
+            ),
         ):
             # Send signup request with existing email
             response = client.post(
@@ -58,13 +60,10 @@ class TestAuthRoutes:
             assert "Email already registered" in response.json()["detail"]
 
     def test_vendor_signup_success(self, client):
-        # Mock the query and save functions
-        with (
-            patch("routes.auth.query_vendors_by_field", return_value=[]) as mock_query,
-            patch(
-                "routes.auth.save_vendor", return_value="test-vendor-id"
-            ) as mock_save,
-        ):
+        # Mock the save function
+        with patch(
+            "routes.auth.save_vendor", return_value="test-vendor-id"
+        ) as mock_save:
             # Send signup request
             response = client.post(
                 "/api/v1/auth/signup/vendor",
@@ -87,19 +86,13 @@ class TestAuthRoutes:
             assert response.json()["user_type"] == "vendor"
 
             # Verify mocks were called
-            mock_query.assert_called_once()
             mock_save.assert_called_once()
 
     def test_government_signup_success(self, client):
-        # Mock the query and save functions
-        with (
-            patch(
-                "routes.auth.query_governments_by_field", return_value=[]
-            ) as mock_query,
-            patch(
-                "routes.auth.save_government", return_value="test-govt-id"
-            ) as mock_save,
-        ):
+        # Mock the save function
+        with patch(
+            "routes.auth.save_government", return_value="test-govt-id"
+        ) as mock_save:
             # Send signup request
             response = client.post(
                 "/api/v1/auth/signup/government",
@@ -119,14 +112,21 @@ class TestAuthRoutes:
             assert response.json()["user_type"] == "government"
 
             # Verify mocks were called
-            mock_query.assert_called_once()
             mock_save.assert_called_once()
 
     def test_login_citizen_success(self, client, mock_citizen_data):
-        # Mock query to return citizen
-        with patch(
-            "routes.auth.query_citizens_by_field", return_value=[mock_citizen_data]
-        ) as mock_query:
+        # Mock the directory to resolve the ID number to a citizen
+        with (
+            patch(
+                "routes.auth.resolve_login",
+                return_value=[("citizen", "test-citizen-id")],
+            ) as mock_resolve,
+            patch(
+                "routes.auth.get_user_by_id",
+                return_value=("citizen", mock_citizen_data),
+            ),
+            patch("routes.auth.update_document") as mock_update,
+        ):
             # Send login request
             response = client.post(
                 "/api/v1/auth/login",
@@ -138,18 +138,26 @@ class TestAuthRoutes:
             assert response.json()["message"] == "Login successful"
             assert response.json()["user_type"] == "citizen"
 
-            # Verify mock was called
-            mock_query.assert_called_once()
+            # Verify mocks were called, the plain text password gets hashed
+            mock_resolve.assert_called_once_with("123456789012")
+            stored = mock_update.call_args.args[2]["account_info.password"]
+            assert stored.startswith("scrypt$")
 
     def test_login_vendor_success(self, client, mock_vendor_data):
-        # Mock query to return no citizens but a vendor
+        mock_vendor_data["account_info"]["password"] = asyncio.run(
+            hash_password("password123")
+        )
+        # Mock the directory to resolve the business ID to a vendor
         with (
             patch(
-                "routes.auth.query_citizens_by_field", return_value=[]
-            ) as mock_citizen_query,
+                "routes.auth.resolve_login",
+                return_value=[("vendor", "test-vendor-id")],
+            ),
             patch(
-                "routes.auth.query_vendors_by_field", return_value=[mock_vendor_data]
-            ) as mock_vendor_query,
+                "routes.auth.get_user_by_id",
+                return_value=("vendor", mock_vendor_data),
+            ),
+            patch("routes.auth.update_document") as mock_update,
         ):
             # Send login request
             response = client.post(
@@ -162,23 +170,29 @@ class TestAuthRoutes:
             assert response.json()["message"] == "Login successful"
             assert response.json()["user_type"] == "vendor"
 
-            # Verify mocks were called
-            mock_citizen_query.assert_called_once()
-            mock_vendor_query.assert_called_once()
+            # Verify the hashed password is kept
+            mock_update.assert_not_called()
 
-    def test_login_government_success(self, client, mock_government_data):
-        # Mock query to return no citizens or vendors but a government
+    def test_login_tries_each_account_of_the_identifier(
+        self, client, mock_citizen_data, mock_government_data
+    ):
+        # The ID number is a citizen's and a government's, with another password
         with (
             patch(
-                "routes.auth.query_citizens_by_field", return_value=[]
-            ) as mock_citizen_query,
+                "routes.auth.resolve_login",
+                return_value=[
+                    ("citizen", "test-citizen-id"),
+                    ("government", "test-govt-id"),
+                ],
+            ),
             patch(
-                "routes.auth.query_vendors_by_field", return_value=[]
-            ) as mock_vendor_query,
-            patch(
-                "routes.auth.query_governments_by_field",
-                return_value=[mock_government_data],
-            ) as mock_govt_query,
+                "routes.auth.get_user_by_id",
+                side_effect=[
+                    ("citizen", {"account_info": {"password": "other"}}),
+                    ("government", mock_government_data),
+                ],
+            ),
+            patch("routes.auth.update_document"),
         ):
             # Send login request
             response = client.post(
@@ -191,18 +205,9 @@ class TestAuthRoutes:
             assert response.json()["message"] == "Login successful"
             assert response.json()["user_type"] == "government"
 
-            # Verify mocks were called
-            mock_citizen_query.assert_called_once()
-            mock_vendor_query.assert_called_once()
-            mock_govt_query.assert_called_once()
-
     def test_login_invalid_credentials(self, client):
-        # Mock query to return no users
-        with (
-            patch("routes.auth.query_citizens_by_field", return_value=[]),
-            patch("routes.auth.query_vendors_by_field", return_value=[]),
-            patch("routes.auth.query_governments_by_field", return_value=[]),
-        ):
+        # Mock the directory to know no account of the ID number
+        with patch("routes.auth.resolve_login", return_value=[]):
             # Send login request with invalid credentials
             response = client.post(
                 "/api/v1/auth/login",
@@ -1,11 +1,35 @@
+import asyncio
+import fakeredis
 from unittest.mock import patch, MagicMock
+from db import UniqueConstraintError
+from db.redis_config import CITIZENS_PREFIX, VENDORS_PREFIX
+from db.redis_operations import get_document, set_document
+from db.redis_scripts import TRANSFER_FUNDS_LUA
+from utils.eligibility import (
+    CitizenProfile,
+    CitizenTable,
+    CompiledScheme,
+    SchemeIndex,
+    SchemeRegistry,
+    compile_active_schemes,
+)
+from utils.async_db_ops import pay_vendor_from_wallet
 
 
 class TestCitizenRoutes:
     def test_get_citizen_profile_success(self, client, mock_citizen_data):
-        with patch(
-            "routes.citizen.get_citizen", return_value=mock_citizen_data
-        ) as mock_get:
+        def load_list_fields(collection_prefix, citizen_id, data, field_paths):
+            data["scheme_info"] = ["test-scheme-id"]
+            return data
+
+        with (
+            patch(
+                "routes.citizen.get_citizen", return_value=mock_citizen_data
+            ) as mock_get,
+            patch(
+                "routes.citizen.load_list_fields", side_effect=load_list_fields
+            ) as mock_load,
+        ):
             # Send request
             response = client.get("/api/v1/citizens/test-citizen-id")
 
@@ -13,9 +37,11 @@ class TestCitizenRoutes:
             assert response.status_code == 200
             assert "account_info" in response.json()
             assert "password" not in response.json()["account_info"]
+            assert response.json()["scheme_info"] == ["test-scheme-id"]
 
-            # Verify mock was called
+            # Verify mocks were called
             mock_get.assert_called_once_with("test-citizen-id")
+            assert mock_load.call_args[0][3] == ["scheme_info"]
 
     def test_get_citizen_profile_not_found(self, client):
         with patch("routes.citizen.get_citizen", return_value=None) as mock_get:
@@ -48,6 +74,25 @@ class TestCitizenRoutes:
             mock_get.assert_called_once_with("test-citizen-id")
             mock_update.assert_called_once()
 
+    def test_update_citizen_profile_taken_value(self, client, mock_citizen_data):
+        with (
+            patch("routes.citizen.get_citizen", return_value=mock_citizen_data),
+            patch(
+                "routes.citizen.update_citizen",
+                side_effect=UniqueConstraintError(
+                    "test-citizen-id", "account_info.email", "taken@example.com"
+                ),
+            ),
+        ):
+            # Send update request with a value another account holds
+            response = client.put(
+                "/api/v1/citizens/test-citizen-id", json={"email": "taken@example.com"}
+            )
+
+            # Verify response is a conflict
+            assert response.status_code == 409
+            assert response.json()["detail"] == "Email already registered"
+
     def test_update_citizen_profile_not_found(self, client):
         with patch("routes.citizen.get_citizen", return_value=None) as mock_get:
             # Send update request
@@ -80,9 +125,14 @@ class TestCitizenRoutes:
             mock_delete.assert_called_once_with("test-citizen-id")
 
     def test_get_wallet_success(self, client, mock_citizen_data):
-        with patch(
-            "routes.citizen.get_citizen", return_value=mock_citizen_data
-        ) as mock_get:
+        with (
+            patch(
+                "routes.citizen.get_citizen", return_value=mock_citizen_data
+            ) as mock_get,
+            patch(
+                "routes.citizen.load_list_fields", return_value=mock_citizen_data
+            ) as mock_load,
+        ):
             # Send request
             response = client.get("/api/v1/citizens/test-citizen-id/wallet")
 
@@ -91,8 +141,11 @@ class TestCitizenRoutes:
             assert "govt_wallet" in response.json()
             assert "personal_wallet" in response.json()
 
-            # Verify mock was called
+            # Verify mocks were called
             mock_get.assert_called_once_with("test-citizen-id")
+            mock_load.assert_called_once_with(
+                "citizen:", "test-citizen-id", mock_citizen_data
+            )
 
     def test_generate_qr_success(self, client, mock_citizen_data):
         with patch(
@@ -111,59 +164,57 @@ class TestCitizenRoutes:
             mock_get.assert_called_once_with("test-citizen-id")
 
     def test_get_transactions(self, client, mock_transaction_data):
-        transaction_list = [mock_transaction_data]
-
-        # Mock query functions to return transactions
-        with patch("routes.citizen.query_transactions_by_field") as mock_query:
-            # Configure mock to return different values based on arguments
-            mock_query.side_effect = (
-                lambda field, value: transaction_list
-                if value == "test-citizen-id"
-                else []
-            )
+        # Mock the timeline page
+        with patch("routes.citizen.get_account_transactions") as mock_page:
+            mock_page.return_value = ([mock_transaction_data], "1746871200000000:next")
 
             # Send request
-            response = client.get("/api/v1/citizens/test-citizen-id/transactions")
+            response = client.get(
+                "/api/v1/citizens/test-citizen-id/transactions?limit=1"
+            )
 
             # Verify response
             assert response.status_code == 200
-            assert isinstance(response.json(), list)
-            assert len(response.json()) > 0
+            assert response.json()["transactions"] == [mock_transaction_data]
+            assert response.json()["next_cursor"] == "1746871200000000:next"
+
+            # Verify mock was called
+            mock_page.assert_called_once_with(
+                "test-citizen-id", 1, None, None, None, None
+            )
+
+    def test_get_transactions_invalid_cursor(self, client):
+        with patch("routes.citizen.get_account_transactions") as mock_page:
+            mock_page.side_effect = ValueError("Invalid cursor 'x'")
 
-            # Verify mock was called twice (for from_id and to_id)
-            assert mock_query.call_count == 2
+            response = client.get(
+                "/api/v1/citizens/test-citizen-id/transactions?before=x"
+            )
+
+            assert response.status_code == 400
 
     def test_pay_vendor_success(
         self, client, mock_citizen_data, mock_vendor_data, mock_transaction_data
     ):
-        # Deep copy wallet balances to avoid test side effects
-        mock_citizen_data_with_balance = mock_citizen_data.copy()
-        mock_citizen_data_with_balance["wallet_info"] = {
-            "govt_wallet": {"balance": 5000.0, "transactions": []},
-            "personal_wallet": {"balance": 10000.0, "transactions": []},
-        }
-
-        # Mock functions
+        # Run the transfer script on a fake Redis server shared by both clients
+        server = fakeredis.FakeServer()
+        sync_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+        async_client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
         with (
+            patch("db.redis_operations.redis_client", sync_client),
+            patch("db.async_redis_operations.async_redis_client", async_client),
             patch(
-                "routes.citizen.get_citizen",
-                return_value=mock_citizen_data_with_balance,
-            ) as mock_get_citizen,
-            patch(
-                "routes.citizen.get_vendor", return_value=mock_vendor_data
-            ) as mock_get_vendor,
+                "db.async_redis_operations.transfer_funds_script",
+                async_client.register_script(TRANSFER_FUNDS_LUA),
+            ),
             patch("routes.citizen.Transaction") as mock_transaction_cls,
             patch(
-                "routes.citizen.update_citizen", return_value=True
-            ) as mock_update_citizen,
-            patch(
-                "routes.citizen.update_vendor", return_value=True
-            ) as mock_update_vendor,
-            patch("routes.citizen.array_union", return_value=True) as mock_array_union,
-            patch(
-                "routes.citizen.save_transaction", return_value=True
-            ) as mock_save_transaction,
+                "routes.citizen.pay_vendor_from_wallet", wraps=pay_vendor_from_wallet
+            ) as mock_pay,
         ):
+            set_document(CITIZENS_PREFIX, "test-citizen-id", mock_citizen_data)
+            set_document(VENDORS_PREFIX, "test-vendor-id", mock_vendor_data)
+
             # Configure transaction mock
             transaction_instance = MagicMock()
             transaction_instance.id = "test-transaction-id"
@@ -186,28 +237,32 @@ class TestCitizenRoutes:
             assert response.json()["message"] == "Payment successful"
             assert response.json()["transaction_id"] == "test-transaction-id"
 
-            # Verify mocks were called
-            mock_get_citizen.assert_called_once_with("test-citizen-id")
-            mock_get_vendor.assert_called_once_with("test-vendor-id")
-            mock_update_citizen.assert_called_once()
-            mock_update_vendor.assert_called_once()
-            assert mock_array_union.call_count == 2
-            mock_save_transaction.assert_called_once_with(
-                "test-transaction-id", mock_transaction_data
+            # Verify the payment was made in a single atomic call
+            mock_pay.assert_called_once_with(
+                "test-citizen-id",
+                "test-vendor-id",
+                "personal_wallet",
+                1000.0,
+                "test-transaction-id",
+                mock_transaction_data,
             )
 
-    def test_pay_vendor_insufficient_balance(self, client, mock_citizen_data):
-        # Set a low balance
-        mock_citizen_data_with_low_balance = mock_citizen_data.copy()
-        mock_citizen_data_with_low_balance["wallet_info"] = {
-            "personal_wallet": {"balance": 500.0, "transactions": []},
-            "govt_wallet": {"balance": 0.0, "transactions": []},
-        }
-
+            # Verify the balances moved and are still floats
+            citizen = get_document(CITIZENS_PREFIX, "test-citizen-id")
+            vendor = get_document(VENDORS_PREFIX, "test-vendor-id")
+            payer_balance = citizen["wallet_info"]["personal_wallet"]["balance"]
+            assert payer_balance == 9000.0
+            assert isinstance(payer_balance, float)
+            assert vendor["wallet_info"]["balance"] == 51000.0
+            assert isinstance(vendor["wallet_info"]["balance"], float)
+            assert citizen["wallet_info"]["govt_wallet"]["balance"] == 5000.0
+            assert isinstance(citizen["wallet_info"]["govt_wallet"]["balance"], float)
+
+    def test_pay_vendor_insufficient_balance(self, client):
         with patch(
-            "routes.citizen.get_citizen",
-            return_value=mock_citizen_data_with_low_balance,
-        ) as mock_get_citizen:
+            "routes.citizen.pay_vendor_from_wallet",
+            return_value="insufficient_balance",
+        ) as mock_pay:
             # Send payment request with amount higher than balance
             payment_data = {
                 "vendor_id": "test-vendor-id",
@@ -224,16 +279,38 @@ class TestCitizenRoutes:
             assert "Insufficient balance" in response.json()["detail"]
 
             # Verify mock was called
-            mock_get_citizen.assert_called_once_with("test-citizen-id")
+            mock_pay.assert_called_once()
+
+    def test_pay_vendor_vendor_not_found(self, client):
+        with patch(
+            "routes.citizen.pay_vendor_from_wallet", return_value="payee_not_found"
+        ):
+            payment_data = {
+                "vendor_id": "missing-vendor-id",
+                "amount": 1000.0,
+                "wallet_type": "personal_wallet",
+            }
+            response = client.post(
+                "/api/v1/citizens/test-citizen-id/pay", json=payment_data
+            )
+
+            assert response.status_code == 404
+            assert "Vendor not found" in response.json()["detail"]
 
     def test_get_eligible_schemes(self, client, mock_citizen_data, mock_scheme_data):
+        def load_list_fields(collection_prefix, citizen_id, data, field_paths):
+            data["scheme_info"] = ["test-scheme-id"]
+            return data
+
         with (
             patch(
                 "routes.citizen.get_citizen", return_value=mock_citizen_data
             ) as mock_get_citizen,
             patch(
-                "routes.citizen.get_all_schemes", return_value=[mock_scheme_data]
+                "routes.citizen.scheme_registry.active_schemes",
+                return_value=SchemeIndex(compile_active_schemes([mock_scheme_data])),
             ) as mock_get_schemes,
+            patch("routes.citizen.load_list_fields", side_effect=load_list_fields),
         ):
             # Send request
             response = client.get("/api/v1/citizens/test-citizen-id/eligible-schemes")
@@ -242,13 +319,178 @@ class TestCitizenRoutes:
             assert response.status_code == 200
             assert isinstance(response.json(), list)
 
-            # If scheme is eligible, there should be at least one item
-            if len(response.json()) > 0:
-                scheme = response.json()[0]
-                assert "id" in scheme
-                assert "eligible" in scheme
-                assert "eligibility_check" in scheme
+            # Schemes the citizen is a beneficiary of are listed as enrolled
+            scheme = response.json()[0]
+            assert "id" in scheme
+            assert "eligible" in scheme
+            assert "eligibility_check" in scheme
+            assert scheme["already_enrolled"] is True
 
             # Verify mocks were called
             mock_get_citizen.assert_called_once_with("test-citizen-id")
             mock_get_schemes.assert_called_once()
+
+
+class TestEligibility:
+    def test_compiled_criteria(self, mock_citizen_data, mock_scheme_data):
+        mock_scheme_data["eligibility_criteria"] = {
+            "city": "Test City",
+            "occupation": "any",
+            "annual_income": 1000000.0,
+            "max_age": 30,
+        }
+        (scheme,) = compile_active_schemes([mock_scheme_data])
+
+        eligible, results = scheme.check(
+            CitizenProfile(mock_citizen_data["personal_info"])
+        )
+
+        # Results are reported in the order of the criteria checks
+        assert eligible is False
+        assert list(results) == ["occupation", "annual_income", "age", "city"]
+        assert results["occupation"]["passed"] is True
+        assert results["annual_income"]["required"] == "<= 1000000.0"
+        assert results["age"]["required"] == "0-30 years"
+        assert results["age"]["passed"] is False
+        assert results["city"]["passed"] is True
+
+    def test_unknown_dob_fails_age_criteria(self, mock_citizen_data, mock_scheme_data):
+        mock_citizen_data["personal_info"]["dob"] = "not a date"
+        (scheme,) = compile_active_schemes([mock_scheme_data])
+
+        eligible, results = scheme.check(
+            CitizenProfile(mock_citizen_data["personal_info"])
+        )
+
+        assert eligible is False
+        assert results["age"]["passed"] is False
+        assert "Could not determine age" in results["age"]["error"]
+
+    def test_registry_recompiles_invalidated_schemes(self, mock_scheme_data):
+        other = {**mock_scheme_data, "id": "other-scheme-id"}
+        inactive = {**mock_scheme_data, "status": "inactive"}
+        registry = SchemeRegistry()
+
+        with (
+            patch("utils.eligibility.document_cache") as mock_cache,
+            patch(
+                "utils.eligibility.get_all_schemes",
+                return_value=[mock_scheme_data, other],
+            ) as mock_get_all,
+            patch(
+                "utils.eligibility.get_many_documents", return_value=[inactive]
+            ) as mock_get_many,
+        ):
+            mock_cache.caches.return_value = True
+
+            first = asyncio.run(registry.active_schemes())
+            other_compiled = first.schemes["other-scheme-id"]
+            assert asyncio.run(registry.active_schemes()) is first
+            registry.invalidate("scheme:test-scheme-id")
+            registry.invalidate("citizen:test-citizen-id")
+            schemes = asyncio.run(registry.active_schemes())
+
+            # Only the soft-deleted scheme was read again
+            assert list(schemes.schemes) == ["other-scheme-id"]
+            assert schemes.schemes["other-scheme-id"] is other_compiled
+            mock_get_all.assert_called_once()
+            mock_get_many.assert_called_once_with("scheme:", {"test-scheme-id"})
+
+    def test_index_prunes_schemes_by_attribute(
+        self, mock_citizen_data, mock_scheme_data
+    ):
+        def scheme(scheme_id, **criteria):
+            return {
+                **mock_scheme_data,
+                "id": scheme_id,
+                "eligibility_criteria": criteria,
+            }
+
+        index = SchemeIndex(
+            compile_active_schemes(
+                [
+                    scheme("open"),
+                    scheme("any-gender", gender="any", state="all"),
+                    scheme("male-in-city", gender="male", city="Test City"),
+                    scheme("female", gender="female"),
+                    scheme("other-city", city="Other City"),
+                    scheme("developers", occupation="Software Developer", caste="SC"),
+                ]
+            )
+        )
+        profile = CitizenProfile(mock_citizen_data["personal_info"])
+
+        candidates = {scheme.id for scheme in index.candidates(profile)}
+        assert candidates == {"open", "any-gender", "male-in-city"}
+        enrolled = index.candidates(profile, ["female", "unknown"])
+        assert {scheme.id for scheme in enrolled} == candidates | {"female"}
+
+        # Candidates are the schemes every rule would be checked for
+        eligible = {
+            scheme.id
+            for scheme in index.schemes.values()
+            if all(
+                rule.passes(profile) is not False
+                for rule in scheme.rules
+                if rule.name in ("gender", "occupation", "caste", "city", "state")
+            )
+        }
+        assert eligible == candidates
+
+        index.remove("male-in-city")
+        index.add(compile_active_schemes([scheme("female", gender="male")])[0])
+        candidates = {scheme.id for scheme in index.candidates(profile)}
+        assert candidates == {"open", "any-gender", "female"}
+
+    def test_table_masks_match_citizen_checks(
+        self, mock_citizen_data, mock_scheme_data
+    ):
+        def citizen(citizen_id, **personal_info):
+            return {
+                "account_info": {"id": citizen_id},
+                "personal_info": {
+                    **mock_citizen_data["personal_info"],
+                    **personal_info,
+                },
+            }
+
+        citizens = [
+            citizen("c-4"),
+            citizen("c-3", gender="female"),
+            citizen("c-2", dob="not a date", address=""),
+            citizen("c-1", dob="2015-06-01", occupation="any"),
+            {"account_info": {"id": "c-0"}, "personal_info": {}},
+        ]
+        table = CitizenTable.from_citizens(citizens)
+        assert table.ids.tolist() == ["c-0", "c-1", "c-2", "c-3", "c-4"]
+
+        for criteria in [
+            {},
+            {"gender": "male", "state": "all"},
+            {"occupation": "Software Developer", "caste": "all"},
+            {"city": "Test City", "annual_income": 1000000.0},
+            {"min_age": 18, "max_age": 60},
+            {"max_age": "sixty"},
+        ]:
+            mock_scheme_data["eligibility_criteria"] = criteria
+            scheme = CompiledScheme(mock_scheme_data)
+            mask = scheme.eligible_mask(table)
+
+            expected = [
+                scheme.eligible(CitizenProfile(item["personal_info"]))
+                for item in sorted(citizens, key=lambda c: c["account_info"]["id"])
+            ]
+            assert mask.tolist() == expected, criteria
+
+        # Unknown incomes are excluded by a maximum like missing ones
+        citizens[0]["personal_info"]["annual_income"] = None
+        table = CitizenTable.from_citizens(citizens)
+        mock_scheme_data["eligibility_criteria"] = {"annual_income": 1000000.0}
+        mask = CompiledScheme(mock_scheme_data).eligible_mask(table)
+        assert mask.tolist() == [False, True, True, True, False]
+
+        # Pages continue after the last ID of the previous one
+        mock_scheme_data["eligibility_criteria"] = {"gender": "male"}
+        mask = CompiledScheme(mock_scheme_data).eligible_mask(table)
+        assert table.page(mask, 2) == (["c-1", "c-2"], 3, "c-2")
+        assert table.page(mask, 2, "c-2") == (["c-4"], 3, None)
@@ -0,0 +1,935 @@
+import asyncio
+import json
+import fakeredis
+from datetime import datetime, timezone
+import pytest
+from unittest.mock import patch, AsyncMock, MagicMock
+from redis.crc import key_slot
+from redis.exceptions import ConnectionError as RedisConnectionError, WatchError
+from db import async_redis_operations
+from db.redis_config import (
+    CITIZENS_PREFIX,
+    CITIZENS_SET,
+    GOVERNMENTS_PREFIX,
+    SCHEMES_PREFIX,
+    SCHEMES_SET,
+    TRANSACTIONS_PREFIX,
+    TRANSACTIONS_SET,
+)
+from db.redis_operations import (
+    UniqueConstraintError,
+    VersionConflictError,
+    _apply_wallet_entry,
+    _pop_list_fields,
+    _parse_list_cursor,
+    _list_page,
+    _decode_document,
+    _document_keys,
+    _encode_document,
+    _index_entries,
+    _index_set_shard,
+    _list_keys,
+    _pending_transfer_key,
+    _record_wallet_entry,
+    _timeline_entries,
+    _timeline_key,
+    array_union,
+    get_document,
+    get_many_documents,
+    get_timeline,
+    increment_field,
+    load_list_fields,
+    link_list_fields,
+    modify_document,
+    query_by_field,
+    scan_documents,
+    set_document,
+    update_document,
+    update_many_documents,
+)
+from db.archive import SegmentArchive
+from db.redis_scripts import UPDATE_FIELDS_LUA, WALLET_ENTRY_LUA
+from db.cluster import ClusterPipeline
+from db.document_cache import DocumentCache
+from db.replicas import ReplicaRouter, replica_router, start_read_session
+from utils.common import get_user_by_id, remove_sensitive_info
+from utils.db_helpers import (
+    CODECS,
+    COMPRESSORS,
+    find_compressor,
+    deserialize_from_db,
+    deserialize_many_from_db,
+    serialize_for_db,
+)
+
+
+class TestSecondaryIndexes:
+    def test_index_entries_for_citizen(self, mock_citizen_data):
+        entries = _index_entries(CITIZENS_PREFIX, "test-citizen-id", mock_citizen_data)
+
+        # Only declared scalar fields are indexed
+        assert entries == {
+            "idx:citizen:account_info.email:test@citizen.com",
+            "idx:citizen:personal_info.id_number:123456789012",
+        }
+
+    def test_index_entries_skip_missing_values(self):
+        entries = _index_entries(
+            CITIZENS_PREFIX, "test-citizen-id", {"account_info": {"email": None}}
+        )
+        assert entries == set()
+
+    def test_query_by_field_uses_index(self, mock_citizen_data):
+        with patch("db.redis_operations.redis_client") as mock_client:
+            mock_client.smembers.return_value = {"test-citizen-id"}
+            mock_client.execute_command.return_value = [
+                serialize_for_db(mock_citizen_data)
+            ]
+
+            result = query_by_field(
+                CITIZENS_PREFIX, CITIZENS_SET, "account_info.email", "test@citizen.com"
+            )
+
+            # Only the index set is read, not the whole collection
+            mock_client.smembers.assert_called_once_with(
+                "idx:citizen:account_info.email:test@citizen.com"
+            )
+            assert len(result) == 1
+            assert result[0]["id"] == "test-citizen-id"
+
+    def test_query_by_field_falls_back_to_scan(self, mock_scheme_data):
+        with patch("db.redis_operations.redis_client") as mock_client:
+            mock_client.smembers.return_value = {"test-scheme-id"}
+            mock_client.execute_command.return_value = [
+                serialize_for_db(mock_scheme_data)
+            ]
+
+            result = query_by_field(SCHEMES_PREFIX, SCHEMES_SET, "status", "active")
+
+            # Unindexed fields are matched by scanning the collection
+            mock_client.smembers.assert_called_once_with(SCHEMES_SET)
+            assert len(result) == 1
+
+    def test_update_document_runs_server_side(self):
+        with patch("db.redis_operations.update_fields_script") as mock_script:
+            mock_script.return_value = 1
+
+            result = update_document(
+                SCHEMES_PREFIX,
+                "test-scheme-id",
+                {"govt_id": "new-govt-id", "name": "New"},
+            )
+
+            # Only the changed fields and the affected index are sent
+            assert result is True
+            mock_script.assert_called_once_with(
+                keys=["scheme:test-scheme-id", "scheme:test-scheme-id:version"],
+                args=[
+                    "test-scheme-id",
+                    '{"govt_id": "idx:scheme:govt_id:"}',
+                    "",
+                    "cache:invalidate",
+                    "set",
+                    "govt_id",
+                    '"new-govt-id"',
+                    "set",
+                    "name",
+                    '"New"',
+                ],
+            )
+
+    def test_update_document_missing(self):
+        with patch("db.redis_operations.update_fields_script") as mock_script:
+            mock_script.return_value = 0
+            assert update_document(CITIZENS_PREFIX, "missing", {"a": 1}) is False
+
+    def test_taken_unique_value_is_released_and_not_written(self, mock_citizen_data):
+        with (
+            patch("db.redis_operations.redis_client") as mock_client,
+            patch("db.redis_operations.release_claim_script") as mock_release,
+            patch("db.redis_operations._run_optimistic") as mock_write,
+        ):
+            # The email is free, the ID number belongs to another citizen
+            mock_client.pipeline.return_value.execute.return_value = [
+                True,
+                "test-citizen-id",
+                None,
+                "other-citizen-id",
+            ]
+
+            with pytest.raises(UniqueConstraintError) as error:
+                set_document(CITIZENS_PREFIX, "test-citizen-id", mock_citizen_data)
+
+            assert error.value.field_path == "personal_info.id_number"
+            mock_release.assert_called_once_with(
+                keys=["uniq:citizen:account_info.email:test@citizen.com"],
+                args=["test-citizen-id"],
+            )
+            mock_write.assert_not_called()
+
+
+class TestExactUpdates:
+    @pytest.fixture
+    def fake_client(self):
+        client = fakeredis.FakeRedis(decode_responses=True)
+        with (
+            patch("db.redis_operations.redis_client", client),
+            patch(
+                "db.redis_operations.update_fields_script",
+                client.register_script(UPDATE_FIELDS_LUA),
+            ),
+            patch(
+                "db.redis_operations.wallet_entry_script",
+                client.register_script(WALLET_ENTRY_LUA),
+            ),
+        ):
+            yield client
+
+    def test_update_script_keeps_untouched_values(self, fake_client):
+        set_document(
+            CITIZENS_PREFIX,
+            "c1",
+            {
+                "account_info": {"name": "Citizen"},
+                "personal_info": {"score": 1.0, "big": 12345678901234567},
+                "wallet_info": {"balance": 50000.0},
+                "tags": [0.5],
+            },
+        )
+
+        with patch("db.redis_operations.modify_document") as mock_modify:
+            update_document(CITIZENS_PREFIX, "c1", {"account_info.name": "New"})
+            increment_field(CITIZENS_PREFIX, "c1", "wallet_info.balance", 5)
+            array_union(CITIZENS_PREFIX, "c1", "tags", [0.5, 1.0, 12345678901234567])
+            mock_modify.assert_not_called()
+
+        # Floats stay floats and large integers keep every digit, in key order
+        assert fake_client.get("citizen:c1")[1:] == json.dumps(
+            {
+                "account_info": {"name": "New"},
+                "personal_info": {"score": 1.0, "big": 12345678901234567},
+                "wallet_info": {"balance": 50005.0},
+                "tags": [0.5, 1.0, 12345678901234567],
+            }
+        )
+
+    def test_update_script_keeps_empty_objects(self, fake_client):
+        set_document(
+            SCHEMES_PREFIX,
+            "s1",
+            {"name": "Scheme", "eligibility_criteria": {"gender": "male"}, "tags": []},
+        )
+
+        with patch("db.redis_operations.modify_document") as mock_modify:
+            update_document(SCHEMES_PREFIX, "s1", {"eligibility_criteria": {}})
+            mock_modify.assert_not_called()
+
+        # cjson cannot tell [] from {}, the script leaves both as written
+        assert fake_client.get("scheme:s1")[1:] == json.dumps(
+            {"name": "Scheme", "eligibility_criteria": {}, "tags": []}
+        )
+
+    def test_inexact_increment_is_applied_client_side(self, fake_client):
+        set_document(CITIZENS_PREFIX, "c1", {"personal_info": {"big": 2**60}})
+
+        increment_field(CITIZENS_PREFIX, "c1", "personal_info.big", 1)
+
+        # Lua numbers are doubles, the script leaves the sum to Python
+        document = get_document(CITIZENS_PREFIX, "c1")
+        assert document["personal_info"]["big"] == 2**60 + 1
+
+    def test_wallet_entry_script_keeps_float_balance(self, fake_client):
+        set_document(
+            CITIZENS_PREFIX,
+            "c1",
+            {
+                "personal_info": {"annual_income": 800000.0},
+                "wallet_info": {
+                    "govt_wallet": {"balance": 5000.0, "transactions": ["t0", "t1"]}
+                },
+            },
+        )
+        account = (CITIZENS_PREFIX, "c1", "wallet_info.govt_wallet")
+
+        # Applying an entry twice changes nothing
+        assert _record_wallet_entry(account, -1000.0, "t2") == "ok"
+        assert _record_wallet_entry(account, -1000.0, "t2") == "ok"
+        # Entries held by the wallet itself are reverted there
+        assert _record_wallet_entry(account, 500.0, "t1", revert=True) == "ok"
+
+        assert fake_client.get("citizen:c1")[1:] == json.dumps(
+            {
+                "personal_info": {"annual_income": 800000.0},
+                "wallet_info": {
+                    "govt_wallet": {"balance": 3500.0, "transactions": ["t0"]}
+                },
+            }
+        )
+        assert _record_wallet_entry(account, -4000.0, "t3") == "insufficient_balance"
+
+
+class TestOptimisticConcurrency:
+    def test_update_document_version_mismatch(self):
+        with patch("db.redis_operations.update_fields_script") as mock_script:
+            mock_script.return_value = -1
+
+            with pytest.raises(VersionConflictError):
+                update_document(
+                    CITIZENS_PREFIX, "test-citizen-id", {"a": 1}, expected_version=3
+                )
+
+            # The expected version is checked by the script
+            assert mock_script.call_args.kwargs["args"][2] == "3"
+
+    def test_modify_document_retries_on_conflict(self, mock_scheme_data):
+        with patch("db.redis_operations.redis_client") as mock_client:
+            pipe = MagicMock()
+            mock_client.pipeline.return_value.__enter__.return_value = pipe
+            pipe.execute_command.return_value = serialize_for_db(mock_scheme_data)
+            # The first EXEC fails because another client wrote in between
+            pipe.execute.side_effect = [WatchError(), [True]]
+
+            result = modify_document(
+                SCHEMES_PREFIX,
+                "test-scheme-id",
+                lambda scheme: scheme.update(status="inactive"),
+                SCHEMES_SET,
+            )
+
+            assert pipe.watch.call_count == 2
+            pipe.watch.assert_called_with(
+                "scheme:test-scheme-id", "scheme:test-scheme-id:version"
+            )
+            pipe.incr.assert_called_with("scheme:test-scheme-id:version")
+            assert result["status"] == "inactive"
+
+    def test_modify_document_gives_up_after_max_retries(self, mock_scheme_data):
+        with patch("db.redis_operations.redis_client") as mock_client:
+            pipe = MagicMock()
+            mock_client.pipeline.return_value.__enter__.return_value = pipe
+            pipe.execute_command.return_value = serialize_for_db(mock_scheme_data)
+            pipe.execute.side_effect = WatchError()
+
+            with pytest.raises(VersionConflictError):
+                modify_document(SCHEMES_PREFIX, "test-scheme-id", lambda scheme: None)
+
+
+class TestCodecs:
+    @pytest.mark.parametrize("name", sorted(CODECS))
+    def test_codec_round_trip(self, name, mock_citizen_data):
+        stored = serialize_for_db(mock_citizen_data, CODECS[name])
+
+        # Values start with the codec header
+        assert stored[:1] == CODECS[name].header
+        assert deserialize_from_db(stored) == mock_citizen_data
+
+    def test_headerless_json_still_decodes(self, mock_citizen_data):
+        legacy = serialize_for_db(mock_citizen_data)
+
+        assert deserialize_from_db(legacy) == mock_citizen_data
+        assert deserialize_from_db(legacy.encode()) == mock_citizen_data
+
+    def test_deserialize_many_mixed_codecs(self, mock_citizen_data):
+        values = [serialize_for_db(mock_citizen_data), None]
+        values += [
+            serialize_for_db(mock_citizen_data, codec) for codec in CODECS.values()
+        ]
+
+        result = deserialize_many_from_db(values)
+
+        assert result == [mock_citizen_data] * (len(CODECS) + 1)
+
+
+class TestCompression:
+    def test_large_documents_are_compressed(self, mock_citizen_data):
+        mock_citizen_data["wallet_info"]["personal_wallet"]["transactions"] = [
+            f"transaction-{i}" for i in range(200)
+        ]
+        with (
+            patch("db.redis_operations.document_compressor", COMPRESSORS["zlib"]),
+            patch("db.redis_operations.observe_compression") as mock_observe,
+        ):
+            stored = _encode_document(CITIZENS_PREFIX, mock_citizen_data)
+
+            assert stored[:1] == COMPRESSORS["zlib"].header
+            assert mock_observe.call_args[0][1] < 0.5
+            assert _decode_document(CITIZENS_PREFIX, stored) == mock_citizen_data
+
+    def test_small_documents_are_not_compressed(self):
+        with patch("db.redis_operations.document_compressor", COMPRESSORS["zlib"]):
+            stored = _encode_document(SCHEMES_PREFIX, {"status": "active"})
+
+            assert find_compressor(stored) is None
+
+
+class TestBulkReads:
+    def test_get_many_documents_batches_mget(self, mock_citizen_data):
+        with patch("db.redis_operations.redis_client") as mock_client:
+            mock_client.execute_command.side_effect = lambda command, *keys, **_: [
+                None if key.endswith("missing") else serialize_for_db(mock_citizen_data)
+                for key in keys
+            ]
+
+            result = get_many_documents(
+                CITIZENS_PREFIX, ["c1", "c2", "missing", "c3"], batch_size=2
+            )
+
+            # Two round trips for four IDs, missing documents are skipped
+            assert mock_client.execute_command.call_count == 2
+            mock_client.execute_command.assert_any_call(
+                "MGET", "citizen:c1", "citizen:c2", NEVER_DECODE=[]
+            )
+            assert len(result) == 3
+            assert result[0]["account_info"]["id"] == "test-citizen-id"
+
+    def test_scan_documents_pages_with_sscan(self, mock_citizen_data):
+        with patch("db.redis_operations.redis_client") as mock_client:
+            mock_client.sscan.side_effect = [(5, ["c1"]), (9, ["c2", "c3"])]
+            mock_client.execute_command.side_effect = lambda command, *keys, **_: [
+                serialize_for_db(mock_citizen_data) for _ in keys
+            ]
+
+            documents, next_cursor = scan_documents(
+                CITIZENS_PREFIX, CITIZENS_SET, 2, cursor="3"
+            )
+
+            # SSCAN continues until the page is full, keeping the position of
+            # the IDs past it
+            mock_client.sscan.assert_any_call(CITIZENS_SET, 3, count=2)
+            mock_client.sscan.assert_any_call(CITIZENS_SET, 5, count=1)
+            assert len(documents) == 2
+            assert next_cursor == "5+1"
+
+    def test_scan_documents_skips_ids_already_returned(self, mock_citizen_data):
+        with patch("db.redis_operations.redis_client") as mock_client:
+            mock_client.sscan.side_effect = [(9, ["c2", "c3"]), (0, ["c4"])]
+            mock_client.execute_command.side_effect = lambda command, *keys, **_: [
+                serialize_for_db(mock_citizen_data) for _ in keys
+            ]
+
+            documents, next_cursor = scan_documents(
+                CITIZENS_PREFIX, CITIZENS_SET, 2, cursor="5+1"
+            )
+
+            mock_client.sscan.assert_any_call(CITIZENS_SET, 5, count=3)
+            mock_client.sscan.assert_any_call(CITIZENS_SET, 9, count=1)
+            mock_client.execute_command.assert_called_once_with(
+                "MGET", "citizen:c3", "citizen:c4", NEVER_DECODE=[]
+            )
+            assert len(documents) == 2
+            assert next_cursor is None
+
+
+class TestBulkWrites:
+    def test_update_many_documents_pipelines_script(self):
+        with (
+            patch("db.redis_operations.redis_client") as mock_client,
+            patch("db.redis_operations.update_fields_script") as mock_script,
+        ):
+            mock_pipe = mock_client.pipeline.return_value
+            mock_pipe.execute.return_value = [1, 0]
+
+            result = update_many_documents(
+                CITIZENS_PREFIX,
+                {"c1": {"personal_info.occupation": "farmer"}, "missing": {"a": 1}},
+            )
+
+            # One round trip for both documents, missing documents are skipped
+            assert result == 1
+            assert mock_script.call_count == 2
+            assert mock_script.call_args.kwargs["client"] is mock_pipe
+            mock_pipe.execute.assert_called_once()
+
+
+class TestTimelines:
+    def test_transactions_are_added_to_both_timelines(self, mock_transaction_data):
+        entries = _timeline_entries(TRANSACTIONS_PREFIX, mock_transaction_data)
+
+        assert entries == {
+            "timeline:txn:test-citizen-id": 1746871200000000,
+            "timeline:txn:test-vendor-id": 1746871200000000,
+        }
+
+    def test_get_timeline_continues_past_cursor(self):
+        with patch("db.redis_operations.redis_client") as mock_client:
+            # Entries sharing the cursor score are ordered by ID
+            mock_client.zrevrangebyscore.return_value = [
+                ("t3", 100.0),
+                ("t2", 100.0),
+                ("t1", 99.0),
+            ]
+
+            ids, next_cursor = get_timeline(
+                TRANSACTIONS_PREFIX, "test-citizen-id", 1, before="100:t3"
+            )
+
+            mock_client.zrevrangebyscore.assert_called_once_with(
+                "timeline:txn:test-citizen-id",
+                100,
+                "-inf",
+                start=0,
+                num=3,
+                withscores=True,
+            )
+            assert ids == ["t2"]
+            assert next_cursor == "100:t2"
+
+    def test_get_timeline_rejects_invalid_cursor(self):
+        with pytest.raises(ValueError):
+            get_timeline(TRANSACTIONS_PREFIX, "test-citizen-id", 10, before="x")
+
+
+class TestListFields:
+    def test_array_union_appends_to_list(self):
+        with patch("db.redis_operations.append_list_script") as mock_script:
+            mock_script.return_value = 1
+
+            result = array_union(
+                GOVERNMENTS_PREFIX, "test-govt-id", "wallet_info.schemes", ["s1"]
+            )
+
+            # The document is not rewritten
+            assert result is True
+            mock_script.assert_called_once_with(
+                keys=[
+                    "govt:test-govt-id",
+                    "govt:test-govt-id:version",
+                    "list:govt:test-govt-id:wallet_info.schemes",
+                    "list:govt:test-govt-id:wallet_info.schemes:members",
+                ],
+                args=["s1"],
+            )
+
+    def test_values_held_by_the_document_come_first(self, mock_government_data):
+        mock_government_data["wallet_info"]["schemes"] = ["s1", "s2"]
+        with patch("db.redis_operations.redis_client") as mock_client:
+            mock_client.pipeline.return_value.execute.return_value = [
+                ["s2", "s3"],
+                [],
+            ]
+
+            data = load_list_fields(
+                GOVERNMENTS_PREFIX, "test-govt-id", mock_government_data
+            )
+
+        assert data["wallet_info"]["schemes"] == ["s1", "s2", "s3"]
+        assert data["wallet_info"]["transactions"] == []
+        assert _pop_list_fields(GOVERNMENTS_PREFIX, data) == {
+            "wallet_info.schemes": ["s1", "s2", "s3"],
+            "wallet_info.transactions": [],
+        }
+        assert data["wallet_info"] == {"balance": 10000000.0}
+
+    def test_link_adds_both_documents(self):
+        with patch("db.redis_operations.link_lists_script") as mock_script:
+            mock_script.return_value = 1
+
+            result = link_list_fields(
+                SCHEMES_PREFIX,
+                "s1",
+                "beneficiaries",
+                CITIZENS_PREFIX,
+                "c1",
+                "scheme_info",
+            )
+
+            assert result is True
+            mock_script.assert_called_once_with(
+                keys=[
+                    "scheme:s1",
+                    "scheme:s1:version",
+                    "list:scheme:s1:beneficiaries",
+                    "list:scheme:s1:beneficiaries:members",
+                    "citizen:c1",
+                    "citizen:c1:version",
+                    "list:citizen:c1:scheme_info",
+                    "list:citizen:c1:scheme_info:members",
+                ],
+                args=["s1", "c1"],
+            )
+
+    def test_list_pages(self):
+        assert _parse_list_cursor(None) == 0
+        assert _parse_list_cursor("100") == 100
+        with pytest.raises(ValueError):
+            _parse_list_cursor("scheme:1")
+
+        assert _list_page(0, ["c1", "c2"], 3) == (["c1", "c2"], 3, "2")
+        assert _list_page(2, ["c3"], 3) == (["c3"], 3, None)
+
+
+class TestPartitions:
+    def test_transactions_are_indexed_in_their_month(self, mock_transaction_data):
+        entries = _index_entries(
+            TRANSACTIONS_PREFIX, "test-transaction-id", mock_transaction_data
+        )
+
+        assert "transactions:2025-05" in entries
+
+    def test_scan_documents_moves_to_next_partition(self, mock_transaction_data):
+        with patch("db.redis_operations.redis_client") as mock_client:
+            mock_client.zrangebyscore.return_value = ["2025-04", "2025-05"]
+            mock_client.sscan.side_effect = [(0, ["t1"]), (4, ["t2"])]
+            mock_client.execute_command.side_effect = lambda command, *keys, **_: [
+                serialize_for_db(mock_transaction_data) for _ in keys
+            ]
+
+            documents, next_cursor = scan_documents(
+                TRANSACTIONS_PREFIX, TRANSACTIONS_SET, 2
+            )
+
+            mock_client.sscan.assert_any_call("transactions:2025-04", 0, count=2)
+            mock_client.sscan.assert_any_call("transactions:2025-05", 0, count=1)
+            assert len(documents) == 2
+            assert next_cursor == "transactions:2025-05:4"
+
+    def test_scan_documents_across_partitions_stays_within_limit(
+        self, mock_transaction_data
+    ):
+        with patch("db.redis_operations.redis_client") as mock_client:
+            mock_client.zrangebyscore.return_value = ["2025-04", "2025-05"]
+            # Small sets are returned whole whatever the count
+            mock_client.sscan.side_effect = [
+                (0, ["t1", "t2", "t3"]),
+                (0, ["t4", "t5", "t6"]),
+            ]
+            mock_client.execute_command.side_effect = lambda command, *keys, **_: [
+                serialize_for_db(mock_transaction_data) for _ in keys
+            ]
+
+            documents, next_cursor = scan_documents(
+                TRANSACTIONS_PREFIX, TRANSACTIONS_SET, 5
+            )
+
+            assert len(documents) <= 5
+            assert next_cursor == "transactions:2025-05:0+2"
+
+    def test_date_bounded_scan_only_reads_overlapping_partitions(
+        self, mock_transaction_data
+    ):
+        with patch("db.redis_operations.redis_client") as mock_client:
+            mock_client.zrangebyscore.return_value = ["2025-05"]
+            mock_client.sscan.return_value = (0, ["t1"])
+            mock_client.execute_command.side_effect = lambda command, *keys, **_: [
+                serialize_for_db(mock_transaction_data) for _ in keys
+            ]
+
+            documents, next_cursor = scan_documents(
+                TRANSACTIONS_PREFIX,
+                TRANSACTIONS_SET,
+                10,
+                since=datetime(2025, 5, 1, tzinfo=timezone.utc),
+                until=datetime(2025, 5, 10, 9, tzinfo=timezone.utc),
+            )
+
+            # May 2025 is month 664 since the epoch
+            mock_client.zrangebyscore.assert_called_once_with(
+                "transactions:partitions", 664, 664
+            )
+            # The transaction at 10:00 is past until
+            assert documents == []
+            assert next_cursor is None
+
+    def test_scan_documents_rejects_cursor_of_unknown_partition(self):
+        with patch("db.redis_operations.redis_client") as mock_client:
+            mock_client.zrangebyscore.return_value = ["2025-05"]
+
+            with pytest.raises(ValueError):
+                scan_documents(
+                    TRANSACTIONS_PREFIX,
+                    TRANSACTIONS_SET,
+                    10,
+                    cursor="transactions:2024-01:3",
+                )
+
+
+class TestArchive:
+    def test_segments_are_read_by_id_and_timestamp(self, tmp_path):
+        archive = SegmentArchive(tmp_path)
+        records = [(f"t{i:04d}", i, f"value {i}".encode()) for i in range(300)]
+        archive.write_segment("2025-05", records)
+
+        found = archive.get_many(["t0000", "t0150", "t0299", "missing"])
+
+        assert found == {
+            "t0000": b"value 0",
+            "t0150": b"value 150",
+            "t0299": b"value 299",
+        }
+        assert [doc_id for doc_id, _, _ in archive.records("2025-05", 10, 12)] == [
+            "t0010",
+            "t0011",
+            "t0012",
+        ]
+
+    def test_newest_segment_wins(self, tmp_path):
+        archive = SegmentArchive(tmp_path)
+        with patch("db.archive.time.time_ns", side_effect=[1_000_000, 2_000_000]):
+            archive.write_segment("2025-05", [("t1", 0, b"old"), ("t2", 0, b"kept")])
+            archive.write_segment("2025-05", [("t1", 0, b"new")])
+
+        assert archive.get_many(["t1", "t2"]) == {"t1": b"new", "t2": b"kept"}
+        assert sorted(archive.records("2025-05")) == [
+            ("t1", 0, b"new"),
+            ("t2", 0, b"kept"),
+        ]
+
+    def test_get_document_reads_through_to_archive(
+        self, tmp_path, mock_transaction_data
+    ):
+        archive = SegmentArchive(tmp_path)
+        archive.write_segment(
+            "2025-05",
+            [
+                (
+                    "test-transaction-id",
+                    0,
+                    serialize_for_db(mock_transaction_data).encode(),
+                )
+            ],
+        )
+
+        with (
+            patch("db.redis_operations.redis_client") as mock_client,
+            patch.dict("db.redis_operations.archives", {TRANSACTIONS_PREFIX: archive}),
+        ):
+            mock_client.execute_command.return_value = None
+
+            result = get_document(TRANSACTIONS_PREFIX, "test-transaction-id")
+
+            assert result == mock_transaction_data
+
+
+class TestCluster:
+    def test_account_keys_share_a_slot(self):
+        with patch("db.redis_operations.REDIS_CLUSTER", True):
+            keys = [
+                *_document_keys(CITIZENS_PREFIX, "c1"),
+                _timeline_key(TRANSACTIONS_PREFIX, "c1"),
+                *_list_keys(CITIZENS_PREFIX, "c1", "wallet_info.transactions"),
+                _pending_transfer_key("c1", "t1"),
+            ]
+
+        assert keys[0] == "citizen:{c1}"
+        assert len({key_slot(key.encode()) for key in keys}) == 1
+
+    def test_index_sets_are_sharded_by_id(self, mock_transaction_data):
+        with patch("db.redis_operations.REDIS_INDEX_SHARDS", 16):
+            shards = {_index_set_shard(CITIZENS_SET, f"c{i}") for i in range(100)}
+            partition = _index_set_shard("transactions:2025-05", "t1")
+            entries = _index_entries(TRANSACTIONS_PREFIX, "t1", mock_transaction_data)
+
+        # Shards are spread over the slots, and a document keeps its shard
+        assert len(shards) == 16
+        assert len({key_slot(shard.encode()) for shard in shards}) > 1
+        assert partition in entries
+        assert "transactions:2025-05" not in entries
+
+    def test_pipeline_runs_other_slots_after_the_transaction(self):
+        client = MagicMock()
+        client.keyslot.side_effect = lambda key: key_slot(key.encode())
+        multi, pipeline = MagicMock(), MagicMock()
+        client.pipeline.side_effect = lambda transaction=True: (
+            multi if transaction else pipeline
+        )
+        multi.execute.return_value = [True, 1]
+        pipeline.execute.return_value = [1]
+
+        pipe = ClusterPipeline(client)
+        pipe.watch("citizen:{c1}", "citizen:{c1}:version")
+        pipe.multi()
+        pipe.set("citizen:{c1}", "{}")
+        pipe.incr("citizen:{c1}:version")
+        pipe.sadd("{citizens:3}", "c1")
+        pipe.publish("cache:invalidate", "citizen:{c1}")
+        client.publish.assert_not_called()
+        pipe.execute()
+
+        multi.set.assert_called_once_with("citizen:{c1}", "{}")
+        multi.incr.assert_called_once_with("citizen:{c1}:version")
+        pipeline.sadd.assert_called_once_with("{citizens:3}", "c1")
+        client.publish.assert_called_once_with("cache:invalidate", "citizen:{c1}")
+
+    def test_wallet_entries_apply_and_revert_once(self):
+        account = {"wallet": {"balance": 10}}
+
+        # The transaction list is updated by the caller
+        assert _apply_wallet_entry(account, "wallet", -4, "t1", False) == ("ok", True)
+        assert _apply_wallet_entry(account, "wallet", -4, "t1", True) == ("ok", False)
+        assert account["wallet"] == {"balance": 6}
+        assert _apply_wallet_entry(account, "wallet", -7, "t2", False) == (
+            "insufficient_balance",
+            False,
+        )
+
+        result = _apply_wallet_entry(account, "wallet", -4, "t1", True, revert=True)
+        assert result == ("ok", True)
+        result = _apply_wallet_entry(account, "wallet", -4, "t1", False, revert=True)
+        assert result == ("ok", False)
+        assert account["wallet"] == {"balance": 10}
+
+    def test_wallet_entries_applied_in_the_document_are_kept(self):
+        account = {"wallet": {"balance": 6, "transactions": ["t1"]}}
+
+        assert _apply_wallet_entry(account, "wallet", -4, "t1", False) == ("ok", False)
+        _apply_wallet_entry(account, "wallet", -4, "t1", False, revert=True)
+        assert account["wallet"] == {"balance": 10, "transactions": []}
+
+
+class TestDocumentCache:
+    def test_least_recently_used_documents_are_evicted(self):
+        cache = DocumentCache(max_size=2, ttl=60)
+        cache.put("scheme:s1", "{}1", cache.token())
+        cache.put("scheme:s2", "{}2", cache.token())
+        cache.get("scheme:s1")
+        cache.put("scheme:s3", "{}3", cache.token())
+
+        assert cache.get("scheme:s1") == "{}1"
+        assert cache.get("scheme:s2") is None
+        assert cache.get("scheme:s3") == "{}3"
+
+    def test_expired_documents_are_not_served(self):
+        cache = DocumentCache(max_size=2, ttl=0)
+        cache.put("scheme:s1", "{}", cache.token())
+
+        assert cache.get("scheme:s1") is None
+
+    def test_invalidation_drops_documents(self):
+        cache = DocumentCache(max_size=2, ttl=60)
+        cache.put("scheme:s1", "{}", cache.token())
+        cache.invalidate("scheme:s1")
+
+        assert cache.get("scheme:s1") is None
+
+    def test_reads_racing_an_invalidation_are_not_cached(self):
+        cache = DocumentCache(max_size=2, ttl=60)
+        token = cache.token()
+        # A write lands between reading the document and caching it
+        cache.invalidate("scheme:s1")
+        cache.put("scheme:s1", "{}", token)
+
+        assert cache.get("scheme:s1") is None
+
+    def test_async_get_document_reads_through_cache(self, mock_citizen_data):
+        cache = DocumentCache(max_size=2, ttl=60)
+        cache.active = True
+        with (
+            patch("db.async_redis_operations.document_cache", cache),
+            patch("db.async_redis_operations.async_redis_client") as mock_client,
+        ):
+            mock_client.execute_command = AsyncMock(
+                return_value=serialize_for_db(mock_citizen_data)
+            )
+
+            first = asyncio.run(
+                async_redis_operations.get_document(SCHEMES_PREFIX, "s1")
+            )
+            second = asyncio.run(
+                async_redis_operations.get_document(SCHEMES_PREFIX, "s1")
+            )
+
+            # Served from Redis once, and every hit gets its own copy
+            assert mock_client.execute_command.await_count == 1
+            assert first == second == mock_citizen_data
+            assert first is not second
+
+
+class TestReplicas:
+    def test_only_caught_up_replicas_are_picked(self):
+        router = ReplicaRouter([MagicMock(), MagicMock()], max_lag=1)
+        assert router.pick() is None
+
+        router.update(0, 0.5)
+        router.update(1, 3)
+        assert router.pick() == 0
+
+        router.update(0, None)
+        assert router.pick() is None
+
+    def test_reads_fall_back_to_primary_when_replica_fails(self, mock_citizen_data):
+        replica = MagicMock()
+        replica.execute_command = AsyncMock(side_effect=RedisConnectionError())
+        with (
+            patch.object(replica_router, "clients", [replica]),
+            patch.object(replica_router, "_lags", [0.0]),
+            patch("db.async_redis_operations.async_redis_client") as mock_client,
+        ):
+            mock_client.execute_command = AsyncMock(
+                return_value=serialize_for_db(mock_citizen_data)
+            )
+
+            result = asyncio.run(
+                async_redis_operations.get_document(CITIZENS_PREFIX, "c1")
+            )
+
+            replica.execute_command.assert_awaited_once()
+            assert result == mock_citizen_data
+            # Not picked again until the next health check
+            assert replica_router.pick() is None
+
+    def test_reads_after_a_write_go_to_primary(self, mock_citizen_data):
+        replica = MagicMock()
+
+        async def write_then_read():
+            start_read_session()
+            with patch(
+                "db.async_redis_operations.update_fields_script",
+                AsyncMock(return_value=1),
+            ):
+                await async_redis_operations.update_document(
+                    CITIZENS_PREFIX, "c1", {"name": "new"}
+                )
+            return await async_redis_operations.get_document(CITIZENS_PREFIX, "c1")
+
+        with (
+            patch.object(replica_router, "clients", [replica]),
+            patch.object(replica_router, "_lags", [0.0]),
+            patch("db.async_redis_operations.async_redis_client") as mock_client,
+        ):
+            mock_client.execute_command = AsyncMock(
+                return_value=serialize_for_db(mock_citizen_data)
+            )
+
+            assert asyncio.run(write_then_read()) == mock_citizen_data
+            replica.execute_command.assert_not_called()
+
+
+class TestAsyncOperations:
+    def test_async_query_by_field_uses_index(self, mock_citizen_data):
+        with patch("db.async_redis_operations.async_redis_client") as mock_client:
+            mock_client.smembers = AsyncMock(return_value={"test-citizen-id"})
+            mock_client.execute_command = AsyncMock(
+                return_value=[serialize_for_db(mock_citizen_data)]
+            )
+
+            result = asyncio.run(
+                async_redis_operations.query_by_field(
+                    CITIZENS_PREFIX,
+                    CITIZENS_SET,
+                    "personal_info.id_number",
+                    "123456789012",
+                )
+            )
+
+            mock_client.smembers.assert_awaited_once_with(
+                "idx:citizen:personal_info.id_number:123456789012"
+            )
+            assert result[0]["id"] == "test-citizen-id"
+
+    def test_get_user_by_id_reads_every_collection_at_once(self, mock_vendor_data):
+        with patch("db.async_redis_operations.async_redis_client") as mock_client:
+            mock_client.execute_command = AsyncMock(
+                return_value=[None, serialize_for_db(mock_vendor_data), None]
+            )
+
+            user_type, user = asyncio.run(get_user_by_id("test-vendor-id"))
+
+            mock_client.execute_command.assert_awaited_once()
+            assert mock_client.execute_command.await_args.args == (
+                "MGET",
+                "citizen:test-vendor-id",
+                "vendor:test-vendor-id",
+                "govt:test-vendor-id",
+            )
+            assert user_type == "vendor"
+            assert "password" not in remove_sensitive_info(user)["account_info"]
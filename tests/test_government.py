@@ -1,4 +1,10 @@
+import json
+import asyncio
+import pytest
 from unittest.mock import patch, MagicMock
+from db import VersionConflictError, UniqueConstraintError
+from utils.eligibility import CitizenTable
+from utils.streaming import iter_ndjson_lines
 
 
 class TestGovernmentRoutes:
@@ -50,6 +56,27 @@ class TestGovernmentRoutes:
             mock_get.assert_called_once_with("test-govt-id")
             mock_update.assert_called_once()
 
+    def test_update_government_profile_taken_value(self, client, mock_government_data):
+        with (
+            patch(
+                "routes.government.get_government", return_value=mock_government_data
+            ),
+            patch(
+                "routes.government.update_government",
+                side_effect=UniqueConstraintError(
+                    "test-govt-id", "account_info.govt_id", "TAKEN-GOVT-ID"
+                ),
+            ),
+        ):
+            # Send update request with a value another account holds
+            response = client.put(
+                "/api/v1/governments/test-govt-id", json={"govt_id": "TAKEN-GOVT-ID"}
+            )
+
+            # Verify response is a conflict
+            assert response.status_code == 409
+            assert response.json()["detail"] == "Government ID already registered"
+
     def test_delete_government_profile_success(self, client, mock_government_data):
         with (
             patch(
@@ -73,9 +100,16 @@ class TestGovernmentRoutes:
             mock_delete.assert_called_once_with("test-govt-id")
 
     def test_get_wallet_success(self, client, mock_government_data):
-        with patch(
-            "routes.government.get_government", return_value=mock_government_data
-        ) as mock_get:
+        def load_list_fields(collection_prefix, government_id, data):
+            data["wallet_info"].update(schemes=["test-scheme-id"], transactions=[])
+            return data
+
+        with (
+            patch(
+                "routes.government.get_government", return_value=mock_government_data
+            ) as mock_get,
+            patch("routes.government.load_list_fields", side_effect=load_list_fields),
+        ):
             # Send request
             response = client.get("/api/v1/governments/test-govt-id/wallet")
 
@@ -96,21 +130,24 @@ class TestGovernmentRoutes:
                 "routes.government.get_government", return_value=mock_government_data
             ) as mock_get_govt,
             patch(
-                "routes.government.get_all_citizens", return_value=citizens_list
-            ) as mock_get_citizens,
+                "routes.government.scan_citizens",
+                return_value=(citizens_list, "42"),
+            ) as mock_scan_citizens,
         ):
             # Send request
-            response = client.get("/api/v1/governments/test-govt-id/citizens")
+            response = client.get(
+                "/api/v1/governments/test-govt-id/citizens?limit=10&cursor=7"
+            )
 
             # Verify response
             assert response.status_code == 200
-            assert isinstance(response.json(), list)
-            assert len(response.json()) > 0
-            assert "password" not in response.json()[0]["account_info"]
+            assert len(response.json()["citizens"]) > 0
+            assert response.json()["next_cursor"] == "42"
+            assert "password" not in response.json()["citizens"][0]["account_info"]
 
             # Verify mocks were called
             mock_get_govt.assert_called_once_with("test-govt-id")
-            mock_get_citizens.assert_called_once()
+            mock_scan_citizens.assert_called_once_with(10, "7")
 
     def test_get_specific_citizen(
         self, client, mock_government_data, mock_citizen_data
@@ -145,21 +182,24 @@ class TestGovernmentRoutes:
                 "routes.government.get_government", return_value=mock_government_data
             ) as mock_get_govt,
             patch(
-                "routes.government.get_all_vendors", return_value=vendors_list
-            ) as mock_get_vendors,
+                "routes.government.scan_vendors",
+                return_value=(vendors_list, "42"),
+            ) as mock_scan_vendors,
         ):
             # Send request
-            response = client.get("/api/v1/governments/test-govt-id/vendors")
+            response = client.get(
+                "/api/v1/governments/test-govt-id/vendors?limit=10&cursor=7"
+            )
 
             # Verify response
             assert response.status_code == 200
-            assert isinstance(response.json(), list)
-            assert len(response.json()) > 0
-            assert "password" not in response.json()[0]["account_info"]
+            assert len(response.json()["vendors"]) > 0
+            assert response.json()["next_cursor"] == "42"
+            assert "password" not in response.json()["vendors"][0]["account_info"]
 
             # Verify mocks were called
             mock_get_govt.assert_called_once_with("test-govt-id")
-            mock_get_vendors.assert_called_once()
+            mock_scan_vendors.assert_called_once_with(10, "7")
 
     def test_get_specific_vendor(self, client, mock_government_data, mock_vendor_data):
         with (
@@ -194,20 +234,52 @@ class TestGovernmentRoutes:
                 "routes.government.get_government", return_value=mock_government_data
             ) as mock_get_govt,
             patch(
-                "routes.government.get_all_transactions", return_value=transactions_list
-            ) as mock_get_transactions,
+                "routes.government.scan_transactions",
+                return_value=(transactions_list, "42"),
+            ) as mock_scan_transactions,
         ):
             # Send request
-            response = client.get("/api/v1/governments/test-govt-id/transactions")
+            response = client.get(
+                "/api/v1/governments/test-govt-id/transactions?limit=10&cursor=7"
+            )
 
             # Verify response
             assert response.status_code == 200
-            assert isinstance(response.json(), list)
-            assert len(response.json()) > 0
+            assert len(response.json()["transactions"]) > 0
+            assert response.json()["next_cursor"] == "42"
 
             # Verify mocks were called
             mock_get_govt.assert_called_once_with("test-govt-id")
-            mock_get_transactions.assert_called_once()
+            mock_scan_transactions.assert_called_once_with(10, "7", None, None)
+
+    @pytest.mark.parametrize("stream", ["ndjson", "json"])
+    def test_stream_all_transactions(
+        self, client, mock_government_data, mock_transaction_data, stream
+    ):
+        async def batches():
+            yield [mock_transaction_data, mock_transaction_data]
+            yield [mock_transaction_data]
+
+        with (
+            patch(
+                "routes.government.get_government", return_value=mock_government_data
+            ),
+            patch("routes.government.iter_transaction_batches", return_value=batches()),
+        ):
+            # Send request
+            response = client.get(
+                f"/api/v1/governments/test-govt-id/transactions?stream={stream}"
+            )
+
+            # Verify every batch was written
+            assert response.status_code == 200
+            if stream == "ndjson":
+                lines = response.text.splitlines()
+                assert [json.loads(line) for line in lines] == [
+                    mock_transaction_data
+                ] * 3
+            else:
+                assert response.json() == [mock_transaction_data] * 3
 
     def test_get_specific_transaction(
         self, client, mock_government_data, mock_transaction_data
@@ -351,8 +423,8 @@ class TestGovernmentRoutes:
             ) as mock_get_scheme,
             patch("routes.government.Scheme") as mock_scheme_cls,
             patch(
-                "routes.government.save_scheme", return_value=True
-            ) as mock_save_scheme,
+                "routes.government.modify_scheme", return_value=scheme_data
+            ) as mock_modify_scheme,
         ):
             # Configure scheme mock
             scheme_instance = MagicMock()
@@ -389,7 +461,13 @@ class TestGovernmentRoutes:
             mock_get_govt.assert_called_once_with("test-govt-id")
             mock_get_scheme.assert_called_once_with("test-scheme-id")
             mock_scheme_cls.assert_called_once()
-            mock_save_scheme.assert_called_once()
+            mock_modify_scheme.assert_called_once()
+
+            # Beneficiaries of the stored scheme are kept
+            stored = {"id": "test-scheme-id", "beneficiaries": ["c1"]}
+            mock_modify_scheme.call_args[0][1](stored)
+            assert stored["beneficiaries"] == ["c1"]
+            assert stored["name"] == scheme_data["name"]
 
     def test_soft_delete_scheme_success(
         self, client, mock_government_data, mock_scheme_data
@@ -407,8 +485,8 @@ class TestGovernmentRoutes:
                 "routes.government.get_scheme", return_value=scheme_data
             ) as mock_get_scheme,
             patch(
-                "routes.government.save_scheme", return_value=True
-            ) as mock_save_scheme,
+                "routes.government.modify_scheme", return_value=scheme_data
+            ) as mock_modify_scheme,
         ):
             # Send delete request
             response = client.delete(
@@ -423,17 +501,39 @@ class TestGovernmentRoutes:
             mock_get_govt.assert_called_once_with("test-govt-id")
             mock_get_scheme.assert_called_once_with("test-scheme-id")
             # Verify that the saved data has status as inactive
-            mock_save_scheme.assert_called_once()
-            saved_data = mock_save_scheme.call_args[0][1]
+            mock_modify_scheme.assert_called_once()
+            saved_data = dict(scheme_data)
+            mock_modify_scheme.call_args[0][1](saved_data)
             assert saved_data["status"] == "inactive"
 
+    def test_soft_delete_scheme_conflict(
+        self, client, mock_government_data, mock_scheme_data
+    ):
+        scheme_data = mock_scheme_data.copy()
+        scheme_data["govt_id"] = "test-govt-id"
+
+        with (
+            patch(
+                "routes.government.get_government", return_value=mock_government_data
+            ),
+            patch("routes.government.get_scheme", return_value=scheme_data),
+            patch(
+                "routes.government.modify_scheme",
+                side_effect=VersionConflictError("conflict"),
+            ),
+        ):
+            response = client.delete(
+                "/api/v1/governments/test-govt-id/schemes/test-scheme-id"
+            )
+
+            assert response.status_code == 409
+
     def test_get_scheme_beneficiaries(
         self, client, mock_government_data, mock_scheme_data, mock_citizen_data
     ):
-        # Ensure the scheme belongs to this government and has beneficiaries
+        # Ensure the scheme belongs to this government
         scheme_data = mock_scheme_data.copy()
         scheme_data["govt_id"] = "test-govt-id"
-        scheme_data["beneficiaries"] = ["test-citizen-id"]
 
         with (
             patch(
@@ -443,22 +543,293 @@ class TestGovernmentRoutes:
                 "routes.government.get_scheme", return_value=scheme_data
             ) as mock_get_scheme,
             patch(
-                "routes.government.get_citizen", return_value=mock_citizen_data
-            ) as mock_get_citizen,
+                "routes.government.scan_scheme_beneficiaries",
+                return_value=(["test-citizen-id"], 2, "1"),
+            ) as mock_scan,
+            patch(
+                "routes.government.get_many_documents",
+                return_value=[mock_citizen_data],
+            ) as mock_get_citizens,
         ):
             # Send request
             response = client.get(
-                "/api/v1/governments/test-govt-id/schemes/test-scheme-id/beneficiaries"
+                "/api/v1/governments/test-govt-id/schemes/test-scheme-id/beneficiaries",
+                params={"limit": 1},
             )
 
             # Verify response
             assert response.status_code == 200
-            assert isinstance(response.json(), list)
-            assert len(response.json()) > 0
-            assert response.json()[0]["account_info"]["id"] == "test-citizen-id"
-            assert "password" not in response.json()[0]["account_info"]
+            body = response.json()
+            assert body["count"] == 2
+            assert body["next_cursor"] == "1"
+            assert body["beneficiaries"][0]["account_info"]["id"] == "test-citizen-id"
+            assert "password" not in body["beneficiaries"][0]["account_info"]
 
             # Verify mocks were called
             mock_get_govt.assert_called_once_with("test-govt-id")
             mock_get_scheme.assert_called_once_with("test-scheme-id")
-            mock_get_citizen.assert_called_once_with("test-citizen-id")
+            mock_scan.assert_called_once_with("test-scheme-id", 1, None)
+            mock_get_citizens.assert_called_once_with("citizen:", ["test-citizen-id"])
+
+    def test_get_scheme_eligible_citizens(
+        self, client, mock_government_data, mock_scheme_data, mock_citizen_data
+    ):
+        scheme_data = mock_scheme_data.copy()
+        scheme_data["govt_id"] = "test-govt-id"
+        scheme_data["eligibility_criteria"] = {"gender": "male", "max_age": 60}
+        other = {
+            "account_info": {"id": "other-citizen-id"},
+            "personal_info": {"gender": "female"},
+        }
+        table = CitizenTable.from_citizens([mock_citizen_data, other])
+
+        with (
+            patch(
+                "routes.government.get_government", return_value=mock_government_data
+            ),
+            patch("routes.government.get_scheme", return_value=scheme_data),
+            patch(
+                "routes.government.citizen_tables.table", return_value=table
+            ) as mock_table,
+        ):
+            # Send request
+            response = client.get(
+                "/api/v1/governments/test-govt-id/schemes/test-scheme-id/eligible-citizens",
+                params={"limit": 1},
+            )
+
+            # Verify response
+            assert response.status_code == 200
+            assert response.json() == {
+                "eligible_citizens": ["test-citizen-id"],
+                "count": 1,
+                "checked": 2,
+                "next_cursor": None,
+            }
+            mock_table.assert_called_once()
+
+    def test_bulk_import_citizens(self, client, mock_government_data):
+        lines = [
+            json.dumps(
+                {
+                    "name": "Citizen",
+                    "password": "password123",
+                    "email": f"citizen{i}@test.com",
+                    "id_number": str(i),
+                }
+            )
+            for i in range(3)
+        ]
+        lines.insert(1, "not json")
+
+        def save_many(collection, documents):
+            # The email of the last account is already registered
+            for doc_id, document in documents.items():
+                email = document["account_info"]["email"]
+                if email == "citizen2@test.com":
+                    raise UniqueConstraintError(doc_id, "account_info.email", email)
+            return len(documents)
+
+        with (
+            patch(
+                "routes.government.get_government", return_value=mock_government_data
+            ),
+            patch(
+                "routes.government.save_many", side_effect=save_many
+            ) as mock_save_many,
+        ):
+            # Send request
+            response = client.post(
+                "/api/v1/governments/test-govt-id/bulk/citizens",
+                content="\n".join(lines),
+            )
+
+            # Verify response, invalid lines and taken emails are reported
+            assert response.status_code == 200
+            assert response.json()["processed"] == 2
+            assert [error["line"] for error in response.json()["errors"]] == [2, 4]
+
+            # Verify the valid accounts were saved in one batch
+            assert mock_save_many.call_count == 2
+            collection, documents = mock_save_many.call_args.args
+            assert collection == "citizens"
+            assert [
+                document["account_info"]["email"] for document in documents.values()
+            ] == ["citizen0@test.com", "citizen1@test.com"]
+
+    def test_bulk_update_taken_email(self, client, mock_government_data):
+        lines = [
+            json.dumps({"id": "citizen-0", "fields": {"account_info.name": "A"}}),
+            json.dumps(
+                {"id": "citizen-1", "fields": {"account_info.email": "taken@test.com"}}
+            ),
+            json.dumps(
+                {"id": "citizen-2", "fields": {"account_info.email": "free@test.com"}}
+            ),
+        ]
+
+        def update_many(collection, updates, missing=None):
+            if "citizen-1" in updates:
+                raise UniqueConstraintError(
+                    "citizen-1", "account_info.email", "taken@test.com"
+                )
+            return len(updates)
+
+        with (
+            patch(
+                "routes.government.get_government", return_value=mock_government_data
+            ),
+            patch(
+                "routes.government.update_many", side_effect=update_many
+            ) as mock_update_many,
+        ):
+            # Send request
+            response = client.post(
+                "/api/v1/governments/test-govt-id/bulk/citizens",
+                params={"mode": "update"},
+                content="\n".join(lines),
+            )
+
+            # Verify response, only the conflicting line failed
+            assert response.status_code == 200
+            assert response.json()["processed"] == 2
+            assert response.json()["errors"] == [
+                {"line": 2, "detail": "Email already registered"}
+            ]
+
+            # Verify the update of other fields was batched
+            assert mock_update_many.call_args.args == (
+                "citizens",
+                {"citizen-0": {"account_info.name": "A"}},
+            )
+
+    def test_bulk_import_rejects_long_lines(self, client, mock_government_data):
+        lines = [
+            json.dumps({"id": "citizen-0"}),
+            json.dumps({"id": "citizen-1" + "x" * 100}),
+            json.dumps({"id": "citizen-2"}),
+        ]
+
+        with (
+            patch("utils.streaming.NDJSON_MAX_LINE_BYTES", 64),
+            patch("routes.government.NDJSON_MAX_LINE_BYTES", 64),
+            patch(
+                "routes.government.get_government", return_value=mock_government_data
+            ),
+            patch("routes.government.delete_many", return_value=2) as mock_delete,
+        ):
+            # Send request
+            response = client.post(
+                "/api/v1/governments/test-govt-id/bulk/citizens",
+                params={"mode": "delete"},
+                content="\n".join(lines),
+            )
+
+            # Verify response, only the long line is rejected
+            assert response.status_code == 200
+            assert response.json()["errors"] == [
+                {"line": 2, "detail": "Line longer than 64 bytes"}
+            ]
+            mock_delete.assert_called_once_with("citizens", ["citizen-0", "citizen-2"])
+
+    def test_ndjson_lines_across_chunks(self):
+        async def chunks():
+            for chunk in [b'{"a":', b' 1}\n\n{"b"', b": 2}\n" + b"x" * 40, b"x" * 40]:
+                yield chunk
+
+        async def read():
+            return [pair async for pair in iter_ndjson_lines(chunks())]
+
+        with patch("utils.streaming.NDJSON_MAX_LINE_BYTES", 64):
+            # Lines are joined across chunks, the long last line is dropped
+            assert asyncio.run(read()) == [
+                (1, b'{"a": 1}'),
+                (3, b'{"b": 2}'),
+                (4, None),
+            ]
+
+    @pytest.mark.parametrize(
+        "field, detail",
+        [
+            (
+                "wallet_info.govt_wallet.balance",
+                "Wallet field 'wallet_info.govt_wallet.balance' cannot be updated",
+            ),
+            (
+                "wallet_info.govt_wallet.transactions",
+                "List field 'wallet_info.govt_wallet.transactions' cannot be updated",
+            ),
+            ("scheme_info", "List field 'scheme_info' cannot be updated"),
+            ("account_info.user_type", "Field 'account_info.user_type' cannot be"),
+        ],
+    )
+    def test_bulk_update_rejects_field(
+        self, client, mock_government_data, field, detail
+    ):
+        lines = [
+            json.dumps({"id": "citizen-0", "fields": {"account_info.name": "A"}}),
+            json.dumps({"id": "citizen-1", "fields": {field: 1}}),
+        ]
+
+        with (
+            patch(
+                "routes.government.get_government", return_value=mock_government_data
+            ),
+            patch("routes.government.update_many", return_value=1) as mock_update_many,
+        ):
+            # Send request
+            response = client.post(
+                "/api/v1/governments/test-govt-id/bulk/citizens",
+                params={"mode": "update"},
+                content="\n".join(lines),
+            )
+
+            # Verify response, the line is rejected without being written
+            assert response.status_code == 200
+            assert response.json()["processed"] == 1
+            [error] = response.json()["errors"]
+            assert error["line"] == 2
+            assert error["detail"].startswith(detail)
+            assert mock_update_many.call_args.args[1] == {
+                "citizen-0": {"account_info.name": "A"}
+            }
+
+    def test_bulk_update_hashes_password_and_reports_unknown_ids(
+        self, client, mock_government_data
+    ):
+        lines = [
+            json.dumps(
+                {"id": "citizen-0", "fields": {"account_info.password": "plain"}}
+            ),
+            json.dumps({"id": "unknown", "fields": {"account_info.name": "A"}}),
+        ]
+
+        def update_many(collection, updates, missing=None):
+            missing.extend(doc_id for doc_id in updates if doc_id == "unknown")
+            return len(updates) - len(missing)
+
+        with (
+            patch(
+                "routes.government.get_government", return_value=mock_government_data
+            ),
+            patch(
+                "routes.government.update_many", side_effect=update_many
+            ) as mock_update_many,
+        ):
+            # Send request
+            response = client.post(
+                "/api/v1/governments/test-govt-id/bulk/citizens",
+                params={"mode": "update"},
+                content="\n".join(lines),
+            )
+
+            # Verify response, the unknown account is reported
+            assert response.status_code == 200
+            assert response.json()["processed"] == 1
+            assert response.json()["errors"] == [
+                {"line": 2, "detail": "Citizen not found"}
+            ]
+
+            # Verify the password was stored hashed
+            updates = mock_update_many.call_args.args[1]
+            assert updates["citizen-0"]["account_info.password"].startswith("scrypt$")
@@ -1,4 +1,5 @@
 from unittest.mock import patch
+from db import UniqueConstraintError
 
 
 class TestVendorRoutes:
@@ -48,6 +49,25 @@ class TestVendorRoutes:
             mock_get.assert_called_once_with("test-vendor-id")
             mock_update.assert_called_once()
 
+    def test_update_vendor_profile_taken_value(self, client, mock_vendor_data):
+        with (
+            patch("routes.vendor.get_vendor", return_value=mock_vendor_data),
+            patch(
+                "routes.vendor.update_vendor",
+                side_effect=UniqueConstraintError(
+                    "test-vendor-id", "account_info.email", "taken@vendor.com"
+                ),
+            ),
+        ):
+            # Send update request with a value another account holds
+            response = client.put(
+                "/api/v1/vendors/test-vendor-id", json={"email": "taken@vendor.com"}
+            )
+
+            # Verify response is a conflict
+            assert response.status_code == 409
+            assert response.json()["detail"] == "Email already registered"
+
     def test_update_vendor_profile_not_found(self, client):
         with patch("routes.vendor.get_vendor", return_value=None) as mock_get:
             # Send update request
@@ -80,16 +100,23 @@ class TestVendorRoutes:
             mock_delete.assert_called_once_with("test-vendor-id")
 
     def test_get_wallet_success(self, client, mock_vendor_data):
-        with patch(
-            "routes.vendor.get_vendor", return_value=mock_vendor_data
-        ) as mock_get:
+        def load_list_fields(collection_prefix, vendor_id, data):
+            data["wallet_info"]["transactions"] = ["test-transaction-id"]
+            return data
+
+        with (
+            patch(
+                "routes.vendor.get_vendor", return_value=mock_vendor_data
+            ) as mock_get,
+            patch("routes.vendor.load_list_fields", side_effect=load_list_fields),
+        ):
             # Send request
             response = client.get("/api/v1/vendors/test-vendor-id/wallet")
 
             # Verify response
             assert response.status_code == 200
             assert "balance" in response.json()
-            assert "transactions" in response.json()
+            assert response.json()["transactions"] == ["test-transaction-id"]
 
             # Verify mock was called
             mock_get.assert_called_once_with("test-vendor-id")
@@ -111,27 +138,32 @@ class TestVendorRoutes:
             mock_get.assert_called_once_with("test-vendor-id")
 
     def test_get_transactions(self, client, mock_transaction_data):
-        transaction_list = [mock_transaction_data]
-
-        # Mock query functions to return transactions
-        with patch("routes.vendor.query_transactions_by_field") as mock_query:
-            # Configure mock to return different values based on arguments
-            mock_query.side_effect = (
-                lambda field, value: transaction_list
-                if value == "test-vendor-id"
-                else []
-            )
+        # Mock the timeline page
+        with patch("routes.vendor.get_account_transactions") as mock_page:
+            mock_page.return_value = ([mock_transaction_data], "1746871200000000:next")
 
             # Send request
-            response = client.get("/api/v1/vendors/test-vendor-id/transactions")
+            response = client.get("/api/v1/vendors/test-vendor-id/transactions?limit=1")
 
             # Verify response
             assert response.status_code == 200
-            assert isinstance(response.json(), list)
-            assert len(response.json()) > 0
+            assert response.json()["transactions"] == [mock_transaction_data]
+            assert response.json()["next_cursor"] == "1746871200000000:next"
+
+            # Verify mock was called
+            mock_page.assert_called_once_with(
+                "test-vendor-id", 1, None, None, None, None
+            )
+
+    def test_get_transactions_invalid_cursor(self, client):
+        with patch("routes.vendor.get_account_transactions") as mock_page:
+            mock_page.side_effect = ValueError("Invalid cursor 'x'")
+
+            response = client.get(
+                "/api/v1/vendors/test-vendor-id/transactions?before=x"
+            )
 
-            # Verify mock was called twice (for from_id and to_id)
-            assert mock_query.call_count == 2
+            assert response.status_code == 400
 
     def test_get_specific_transaction_success(
         self, client, mock_vendor_data, mock_transaction_data
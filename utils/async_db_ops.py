@@ -0,0 +1,337 @@
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from db.async_redis_operations import (
+    get_document,
+    set_document,
+    update_document,
+    modify_document,
+    delete_document,
+    query_by_field,
+    get_all_documents,
+    get_many_documents,
+    scan_documents,
+    iter_document_batches,
+    set_many_documents,
+    update_many_documents,
+    delete_many_documents,
+    get_timeline,
+    link_list_fields,
+    scan_list_field,
+    transfer_funds,
+)
+from db.redis_config import (
+    CITIZENS_PREFIX,
+    CITIZENS_SET,
+    VENDORS_PREFIX,
+    VENDORS_SET,
+    GOVERNMENTS_PREFIX,
+    GOVERNMENTS_SET,
+    SCHEMES_PREFIX,
+    SCHEMES_SET,
+    TRANSACTIONS_PREFIX,
+    TRANSACTIONS_SET,
+    REDIS_WRITE_BATCH_SIZE,
+)
+
+# Collection prefix and index set of each collection, by name
+COLLECTIONS = {
+    "citizens": (CITIZENS_PREFIX, CITIZENS_SET),
+    "vendors": (VENDORS_PREFIX, VENDORS_SET),
+    "governments": (GOVERNMENTS_PREFIX, GOVERNMENTS_SET),
+    "schemes": (SCHEMES_PREFIX, SCHEMES_SET),
+    "transactions": (TRANSACTIONS_PREFIX, TRANSACTIONS_SET),
+}
+
+
+# Citizen operations
+async def get_citizen(citizen_id: str) -> Optional[Dict[str, Any]]:
+    """Get a citizen by ID"""
+    return await get_document(CITIZENS_PREFIX, citizen_id)
+
+
+async def save_citizen(citizen_id: str, data: Dict[str, Any]) -> str:
+    """Save a citizen document"""
+    return await set_document(CITIZENS_PREFIX, citizen_id, data, CITIZENS_SET)
+
+
+async def update_citizen(citizen_id: str, update_data: Dict[str, Any]) -> bool:
+    """Update a citizen document"""
+    return await update_document(CITIZENS_PREFIX, citizen_id, update_data)
+
+
+async def delete_citizen(citizen_id: str) -> bool:
+    """Delete a citizen document"""
+    return await delete_document(CITIZENS_PREFIX, citizen_id, CITIZENS_SET)
+
+
+async def query_citizens_by_field(field: str, value: Any) -> List[Dict[str, Any]]:
+    """Query citizens by a field value"""
+    return await query_by_field(CITIZENS_PREFIX, CITIZENS_SET, field, value)
+
+
+async def get_all_citizens() -> List[Dict[str, Any]]:
+    """Get all citizens"""
+    return await get_all_documents(CITIZENS_PREFIX, CITIZENS_SET)
+
+
+async def scan_citizens(
+    limit: int, cursor: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Get a page of citizens and the cursor of the next page"""
+    return await scan_documents(CITIZENS_PREFIX, CITIZENS_SET, limit, cursor)
+
+
+def iter_citizen_batches() -> AsyncIterator[List[Dict[str, Any]]]:
+    """Iterate over all citizens in batches"""
+    return iter_document_batches(CITIZENS_PREFIX, CITIZENS_SET)
+
+
+# Vendor operations
+async def get_vendor(vendor_id: str) -> Optional[Dict[str, Any]]:
+    """Get a vendor by ID"""
+    return await get_document(VENDORS_PREFIX, vendor_id)
+
+
+async def save_vendor(vendor_id: str, data: Dict[str, Any]) -> str:
+    """Save a vendor document"""
+    return await set_document(VENDORS_PREFIX, vendor_id, data, VENDORS_SET)
+
+
+async def update_vendor(vendor_id: str, update_data: Dict[str, Any]) -> bool:
+    """Update a vendor document"""
+    return await update_document(VENDORS_PREFIX, vendor_id, update_data)
+
+
+async def delete_vendor(vendor_id: str) -> bool:
+    """Delete a vendor document"""
+    return await delete_document(VENDORS_PREFIX, vendor_id, VENDORS_SET)
+
+
+async def query_vendors_by_field(field: str, value: Any) -> List[Dict[str, Any]]:
+    """Query vendors by a field value"""
+    return await query_by_field(VENDORS_PREFIX, VENDORS_SET, field, value)
+
+
+async def get_all_vendors() -> List[Dict[str, Any]]:
+    """Get all vendors"""
+    return await get_all_documents(VENDORS_PREFIX, VENDORS_SET)
+
+
+async def scan_vendors(
+    limit: int, cursor: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Get a page of vendors and the cursor of the next page"""
+    return await scan_documents(VENDORS_PREFIX, VENDORS_SET, limit, cursor)
+
+
+# Government operations
+async def get_government(govt_id: str) -> Optional[Dict[str, Any]]:
+    """Get a government by ID"""
+    return await get_document(GOVERNMENTS_PREFIX, govt_id)
+
+
+async def save_government(govt_id: str, data: Dict[str, Any]) -> str:
+    """Save a government document"""
+    return await set_document(GOVERNMENTS_PREFIX, govt_id, data, GOVERNMENTS_SET)
+
+
+async def update_government(govt_id: str, update_data: Dict[str, Any]) -> bool:
+    """Update a government document"""
+    return await update_document(GOVERNMENTS_PREFIX, govt_id, update_data)
+
+
+async def delete_government(govt_id: str) -> bool:
+    """Delete a government document"""
+    return await delete_document(GOVERNMENTS_PREFIX, govt_id, GOVERNMENTS_SET)
+
+
+async def query_governments_by_field(field: str, value: Any) -> List[Dict[str, Any]]:
+    """Query governments by a field value"""
+    return await query_by_field(GOVERNMENTS_PREFIX, GOVERNMENTS_SET, field, value)
+
+
+async def get_all_governments() -> List[Dict[str, Any]]:
+    """Get all governments"""
+    return await get_all_documents(GOVERNMENTS_PREFIX, GOVERNMENTS_SET)
+
+
+# Scheme operations
+async def get_scheme(scheme_id: str) -> Optional[Dict[str, Any]]:
+    """Get a scheme by ID"""
+    return await get_document(SCHEMES_PREFIX, scheme_id)
+
+
+async def save_scheme(scheme_id: str, data: Dict[str, Any]) -> str:
+    """Save a scheme document"""
+    return await set_document(SCHEMES_PREFIX, scheme_id, data, SCHEMES_SET)
+
+
+async def update_scheme(scheme_id: str, update_data: Dict[str, Any]) -> bool:
+    """Update a scheme document"""
+    return await update_document(SCHEMES_PREFIX, scheme_id, update_data)
+
+
+async def modify_scheme(
+    scheme_id: str, modifier: Callable[[Dict[str, Any]], None]
+) -> Optional[Dict[str, Any]]:
+    """Modify a scheme document in place, retrying on concurrent writes"""
+    return await modify_document(SCHEMES_PREFIX, scheme_id, modifier, SCHEMES_SET)
+
+
+async def query_schemes_by_field(field: str, value: Any) -> List[Dict[str, Any]]:
+    """Query schemes by a field value"""
+    return await query_by_field(SCHEMES_PREFIX, SCHEMES_SET, field, value)
+
+
+async def get_all_schemes() -> List[Dict[str, Any]]:
+    """Get all schemes"""
+    return await get_all_documents(SCHEMES_PREFIX, SCHEMES_SET)
+
+
+async def add_beneficiary_to_scheme(scheme_id: str, citizen_id: str) -> bool:
+    """Add a citizen beneficiary to a scheme, and the scheme to the citizen"""
+    return await link_list_fields(
+        SCHEMES_PREFIX,
+        scheme_id,
+        "beneficiaries",
+        CITIZENS_PREFIX,
+        citizen_id,
+        "scheme_info",
+    )
+
+
+async def scan_scheme_beneficiaries(
+    scheme_id: str, limit: int, cursor: Optional[str] = None
+) -> Tuple[List[str], int, Optional[str]]:
+    """Get a page of the citizen IDs of a scheme's beneficiaries, their number
+    and the cursor of the next page"""
+    return await scan_list_field(
+        SCHEMES_PREFIX, scheme_id, "beneficiaries", limit, cursor
+    )
+
+
+# Transaction operations
+async def get_transaction(transaction_id: str) -> Optional[Dict[str, Any]]:
+    """Get a transaction by ID"""
+    return await get_document(TRANSACTIONS_PREFIX, transaction_id)
+
+
+async def save_transaction(transaction_id: str, data: Dict[str, Any]) -> str:
+    """Save a transaction document"""
+    return await set_document(
+        TRANSACTIONS_PREFIX, transaction_id, data, TRANSACTIONS_SET
+    )
+
+
+async def update_transaction(transaction_id: str, update_data: Dict[str, Any]) -> bool:
+    """Update a transaction document"""
+    return await update_document(TRANSACTIONS_PREFIX, transaction_id, update_data)
+
+
+async def query_transactions_by_field(field: str, value: Any) -> List[Dict[str, Any]]:
+    """Query transactions by a field value"""
+    return await query_by_field(TRANSACTIONS_PREFIX, TRANSACTIONS_SET, field, value)
+
+
+async def get_all_transactions() -> List[Dict[str, Any]]:
+    """Get all transactions"""
+    return await get_all_documents(TRANSACTIONS_PREFIX, TRANSACTIONS_SET)
+
+
+async def scan_transactions(
+    limit: int,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Get a page of transactions from since to until and the next page cursor"""
+    return await scan_documents(
+        TRANSACTIONS_PREFIX, TRANSACTIONS_SET, limit, cursor, since, until
+    )
+
+
+def iter_transaction_batches(
+    since: Optional[datetime] = None, until: Optional[datetime] = None
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Iterate over all transactions from since to until in batches"""
+    return iter_document_batches(
+        TRANSACTIONS_PREFIX, TRANSACTIONS_SET, since=since, until=until
+    )
+
+
+async def get_account_transactions(
+    account_id: str,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Get a page of the transactions sent or received by an account"""
+    transaction_ids, next_cursor = await get_timeline(
+        TRANSACTIONS_PREFIX, account_id, limit, before, after, since, until
+    )
+    return await get_many_documents(TRANSACTIONS_PREFIX, transaction_ids), next_cursor
+
+
+async def pay_vendor_from_wallet(
+    citizen_id: str,
+    vendor_id: str,
+    wallet_type: str,
+    amount: float,
+    transaction_id: str,
+    transaction_data: Dict[str, Any],
+) -> str:
+    """Debit a citizen wallet, credit a vendor and save the transaction atomically"""
+    return await transfer_funds(
+        CITIZENS_PREFIX,
+        citizen_id,
+        f"wallet_info.{wallet_type}",
+        VENDORS_PREFIX,
+        vendor_id,
+        "wallet_info",
+        amount,
+        transaction_id,
+        transaction_data,
+    )
+
+
+# Bulk operations
+def _collection(collection: str) -> Tuple[str, str]:
+    """Get the collection prefix and index set of a collection name"""
+    if collection not in COLLECTIONS:
+        raise ValueError(
+            f"Unknown collection '{collection}', "
+            f"available collections: {', '.join(COLLECTIONS)}"
+        )
+    return COLLECTIONS[collection]
+
+
+async def save_many(
+    collection: str,
+    documents: Dict[str, Dict[str, Any]],
+    batch_size: int = REDIS_WRITE_BATCH_SIZE,
+) -> int:
+    """Save documents keyed by ID in pipelined batches"""
+    prefix, index_set = _collection(collection)
+    return await set_many_documents(prefix, documents, index_set, batch_size)
+
+
+async def update_many(
+    collection: str,
+    updates: Dict[str, Dict[str, Any]],
+    batch_size: int = REDIS_WRITE_BATCH_SIZE,
+    missing: Optional[List[str]] = None,
+) -> int:
+    """Update documents keyed by ID in pipelined batches, adding the IDs of
+    missing documents to missing when given"""
+    prefix, _ = _collection(collection)
+    return await update_many_documents(prefix, updates, batch_size, missing)
+
+
+async def delete_many(
+    collection: str, doc_ids: List[str], batch_size: int = REDIS_WRITE_BATCH_SIZE
+) -> int:
+    """Delete documents in pipelined batches"""
+    prefix, index_set = _collection(collection)
+    return await delete_many_documents(prefix, doc_ids, index_set, batch_size)
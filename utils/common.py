@@ -1,40 +1,76 @@
 from fastapi import HTTPException
-from typing import Dict, Any, Tuple, Optional
-from db import citizens_collection, vendors_collection, governments_collection
+from typing import Dict, Any, List, Tuple, Optional
+from db.async_redis_operations import find_document, get_unique_owners
+from db.redis_operations import UniqueConstraintError
+from db.redis_config import CITIZENS_PREFIX, VENDORS_PREFIX, GOVERNMENTS_PREFIX
 
+# Collection prefix of each user type
+USER_PREFIXES = {
+    "citizen": CITIZENS_PREFIX,
+    "vendor": VENDORS_PREFIX,
+    "government": GOVERNMENTS_PREFIX,
+}
+USER_TYPES = {prefix: user_type for user_type, prefix in USER_PREFIXES.items()}
 
-# TODO: Migrate from Firestore to Redis
-def get_user_by_id(
+# Unique field each user type logs in with. Its unique constraint keys act as
+# the directory of login identifiers, see db.redis_config.UNIQUE_FIELDS.
+LOGIN_FIELDS = {
+    "citizen": "personal_info.id_number",
+    "vendor": "business_info.business_id",
+    "government": "account_info.govt_id",
+}
+
+# Names of the unique account fields in error messages
+UNIQUE_FIELD_NAMES = {
+    "account_info.email": "Email",
+    "personal_info.id_number": "ID number",
+    "business_info.business_id": "Business ID",
+    "account_info.govt_id": "Government ID",
+}
+
+
+async def get_user_by_id(
     user_id: str, user_type: Optional[str] = None
-) -> Tuple[Any, Dict[str, Any]]:
-    """Get user by ID from Firestore"""
-    if user_type == "citizen" or user_type is None:
-        doc_ref = citizens_collection.document(user_id)
-        doc = doc_ref.get()
-        if doc.exists:
-            return doc_ref, doc.to_dict()
+) -> Tuple[str, Dict[str, Any]]:
+    """Get a user and their type by ID, from all user collections in one round
+    trip when the type is not given"""
+    if user_type is None:
+        prefixes = list(USER_PREFIXES.values())
+    else:
+        prefixes = [USER_PREFIXES[user_type]] if user_type in USER_PREFIXES else []
+
+    prefix, user_data = await find_document(prefixes, user_id)
+    if user_data is None:
+        raise HTTPException(status_code=404, detail="User not found")
 
-    if user_type == "vendor" or user_type is None:
-        doc_ref = vendors_collection.document(user_id)
-        doc = doc_ref.get()
-        if doc.exists:
-            return doc_ref, doc.to_dict()
+    return USER_TYPES[prefix], user_data
 
-    if user_type == "government" or user_type is None:
-        doc_ref = governments_collection.document(user_id)
-        doc = doc_ref.get()
-        if doc.exists:
-            return doc_ref, doc.to_dict()
 
-    raise HTTPException(status_code=404, detail="User not found")
+async def resolve_login(identifier: str) -> List[Tuple[str, str]]:
+    """Get the (user type, ID) of the users logging in with an identifier"""
+    owners = await get_unique_owners(
+        [
+            (USER_PREFIXES[user_type], field)
+            for user_type, field in LOGIN_FIELDS.items()
+        ],
+        identifier,
+    )
+    return [
+        (user_type, user_id)
+        for user_type, user_id in zip(LOGIN_FIELDS, owners)
+        if user_id is not None
+    ]
 
 
 def remove_sensitive_info(user_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Remove sensitive information from user data"""
-    clean_data = {**user_data}
+    """Remove sensitive information from user data, in place"""
+    account_info = user_data.get("account_info")
+    if isinstance(account_info, dict):
+        account_info.pop("password", None)
+    return user_data
 
-    if "account_info" in clean_data and "password" in clean_data["account_info"]:
-        clean_data["account_info"] = {**clean_data["account_info"]}
-        clean_data["account_info"].pop("password")
 
-    return clean_data
+def already_registered(error: UniqueConstraintError) -> str:
+    """Describe a unique value another account already holds"""
+    name = UNIQUE_FIELD_NAMES.get(error.field_path, error.field_path)
+    return f"{name} already registered"
@@ -1,6 +1,28 @@
 import json
+import zlib
+import threading
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 
 class DateTimeEncoder(json.JSONEncoder):
@@ -12,15 +34,217 @@ class DateTimeEncoder(json.JSONEncoder):
         return super(DateTimeEncoder, self).default(obj)
 
 
-def serialize_for_db(data: Dict[str, Any]) -> str:
-    """Serialize data to JSON string with datetime handling"""
+def _encode_datetime(obj: Any) -> Any:
+    """Fallback for types the binary codecs cannot serialize"""
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+class Codec:
+    """Document serialization format, identified by a one byte header
+
+    Stored values start with the header of the codec that wrote them, so codecs
+    can be switched without rewriting existing documents. Codecs sharing a
+    header must produce the same format.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        header: bytes,
+        dumps: Callable[[Any], bytes],
+        loads: Callable[[bytes], Any],
+    ):
+        self.name = name
+        self.header = header
+        self.dumps = dumps
+        self.loads = loads
+
+
+JSON_HEADER = b"\x01"
+MSGPACK_HEADER = b"\x02"
+
+CODECS: Dict[str, Codec] = {}
+_DECODERS: Dict[int, Callable[[bytes], Any]] = {}
+
+
+def register_codec(codec: Codec) -> None:
+    """Make a codec available for writing and its header readable"""
+    CODECS[codec.name] = codec
+    # The latest registered codec decodes its header, so faster
+    # implementations of a format take over reads
+    _DECODERS[codec.header[0]] = codec.loads
+
+
+def get_codec(name: str) -> Codec:
+    """Get a registered codec by name"""
+    if name not in CODECS:
+        raise ValueError(
+            f"Unknown codec '{name}', available codecs: {', '.join(CODECS)}"
+        )
+    return CODECS[name]
+
+
+register_codec(
+    Codec(
+        "json",
+        JSON_HEADER,
+        lambda data: json.dumps(data, cls=DateTimeEncoder).encode(),
+        json.loads,
+    )
+)
+
+if orjson is not None:
+    register_codec(
+        Codec(
+            "orjson",
+            JSON_HEADER,
+            lambda data: orjson.dumps(data, default=_encode_datetime),
+            orjson.loads,
+        )
+    )
+
+if msgpack is not None:
+    register_codec(
+        Codec(
+            "msgpack",
+            MSGPACK_HEADER,
+            lambda data: msgpack.packb(data, default=_encode_datetime),
+            lambda payload: msgpack.unpackb(payload, strict_map_key=False),
+        )
+    )
+
+
+class Compressor:
+    """Compression applied to encoded values, identified by a one byte header
+
+    Compressed values are the header followed by the compressed codec-encoded
+    value, so they can be told apart from uncompressed values when read.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        header: bytes,
+        compress: Callable[[bytes], bytes],
+        decompress: Callable[[bytes], bytes],
+    ):
+        self.name = name
+        self.header = header
+        self.compress = compress
+        self.decompress = decompress
+
+
+ZLIB_HEADER = b"\x10"
+LZ4_HEADER = b"\x11"
+ZSTD_HEADER = b"\x12"
+
+COMPRESSORS: Dict[str, Compressor] = {}
+_COMPRESSION_HEADERS: Dict[int, Compressor] = {}
+
+
+def register_compressor(compressor: Compressor) -> None:
+    """Make a compressor available for writing and its header readable"""
+    COMPRESSORS[compressor.name] = compressor
+    _COMPRESSION_HEADERS[compressor.header[0]] = compressor
+
+
+def get_compressor(name: str) -> Compressor:
+    """Get a registered compressor by name"""
+    if name not in COMPRESSORS:
+        raise ValueError(
+            f"Unknown compressor '{name}', "
+            f"available compressors: {', '.join(COMPRESSORS)}"
+        )
+    return COMPRESSORS[name]
+
+
+def find_compressor(value: Union[str, bytes]) -> Optional[Compressor]:
+    """Get the compressor a stored value was compressed with, if any"""
+    if isinstance(value, bytes) and value:
+        return _COMPRESSION_HEADERS.get(value[0])
+    return None
+
+
+def zstd_compressor(dictionary: Optional[bytes] = None, level: int = 3) -> Compressor:
+    """Build a zstd compressor, optionally using a trained dictionary"""
+    dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+    # zstandard contexts must not be shared between threads
+    local = threading.local()
+
+    def compress(data: bytes) -> bytes:
+        if not hasattr(local, "compressor"):
+            local.compressor = zstandard.ZstdCompressor(
+                level=level, dict_data=dict_data
+            )
+        return local.compressor.compress(data)
+
+    def decompress(data: bytes) -> bytes:
+        if not hasattr(local, "decompressor"):
+            local.decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+        return local.decompressor.decompress(data)
+
+    return Compressor("zstd", ZSTD_HEADER, compress, decompress)
+
+
+register_compressor(Compressor("zlib", ZLIB_HEADER, zlib.compress, zlib.decompress))
+
+if lz4 is not None:
+    register_compressor(
+        Compressor("lz4", LZ4_HEADER, lz4.frame.compress, lz4.frame.decompress)
+    )
+
+if zstandard is not None:
+    register_compressor(zstd_compressor())
+
+
+def serialize_for_db(
+    data: Dict[str, Any], codec: Optional[Codec] = None
+) -> Union[str, bytes]:
+    """Serialize data to JSON string with datetime handling
+
+    With a codec the data is encoded by it and prefixed with its header.
+    """
+    if codec is not None:
+        return codec.header + codec.dumps(data if data is not None else {})
     if data is None:
         return "{}"
     return json.dumps(data, cls=DateTimeEncoder)
 
 
-def deserialize_from_db(json_str: Optional[bytes]) -> Optional[Dict[str, Any]]:
-    """Deserialize JSON string back to Python object"""
-    if json_str:
-        return json.loads(json_str)
-    return None
+def serialize_value_for_db(value: Any) -> str:
+    """Serialize a single field value to JSON with datetime handling"""
+    return json.dumps(value, cls=DateTimeEncoder)
+
+
+def deserialize_from_db(
+    value: Optional[Union[str, bytes]],
+) -> Optional[Dict[str, Any]]:
+    """Deserialize a stored value back to Python object"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.encode()
+    # Values without a codec header are plain JSON
+    decoder = _DECODERS.get(value[0])
+    if decoder is None:
+        return _DECODERS[JSON_HEADER[0]](value)
+    return decoder(value[1:])
+
+
+def deserialize_many_from_db(
+    values: List[Optional[Union[str, bytes]]],
+) -> List[Dict[str, Any]]:
+    """Deserialize a batch of stored values, skipping missing values"""
+    present = [
+        value.encode() if isinstance(value, str) else value for value in values if value
+    ]
+    if not present:
+        return []
+
+    # Parse JSON values as a single array instead of one document at a time
+    payloads = [value[1:] if value[:1] == JSON_HEADER else value for value in present]
+    if all(payload[:1] in (b"{", b"[") for payload in payloads):
+        return _DECODERS[JSON_HEADER[0]](b"[" + b",".join(payloads) + b"]")
+    return [deserialize_from_db(value) for value in present]
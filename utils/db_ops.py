@@ -1,12 +1,23 @@
-from typing import Any, Dict, List, Optional
+from datetime import datetime
+from typing import Any, Iterator, Callable, Dict, List, Optional, Tuple
 from db.redis_operations import (
     get_document,
     set_document,
     update_document,
+    modify_document,
     delete_document,
     query_by_field,
     get_all_documents,
-    array_union,
+    get_many_documents,
+    scan_documents,
+    iter_document_batches,
+    set_many_documents,
+    update_many_documents,
+    delete_many_documents,
+    get_timeline,
+    link_list_fields,
+    scan_list_field,
+    transfer_funds,
 )
 from db.redis_config import (
     CITIZENS_PREFIX,
@@ -19,8 +30,18 @@ from db.redis_config import (
     SCHEMES_SET,
     TRANSACTIONS_PREFIX,
     TRANSACTIONS_SET,
+    REDIS_WRITE_BATCH_SIZE,
 )
 
+# Collection prefix and index set of each collection, by name
+COLLECTIONS = {
+    "citizens": (CITIZENS_PREFIX, CITIZENS_SET),
+    "vendors": (VENDORS_PREFIX, VENDORS_SET),
+    "governments": (GOVERNMENTS_PREFIX, GOVERNMENTS_SET),
+    "schemes": (SCHEMES_PREFIX, SCHEMES_SET),
+    "transactions": (TRANSACTIONS_PREFIX, TRANSACTIONS_SET),
+}
+
 
 # Citizen operations
 def get_citizen(citizen_id: str) -> Optional[Dict[str, Any]]:
@@ -53,6 +74,18 @@ def get_all_citizens() -> List[Dict[str, Any]]:
     return get_all_documents(CITIZENS_PREFIX, CITIZENS_SET)
 
 
+def scan_citizens(
+    limit: int, cursor: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Get a page of citizens and the cursor of the next page"""
+    return scan_documents(CITIZENS_PREFIX, CITIZENS_SET, limit, cursor)
+
+
+def iter_citizen_batches() -> Iterator[List[Dict[str, Any]]]:
+    """Iterate over all citizens in batches"""
+    return iter_document_batches(CITIZENS_PREFIX, CITIZENS_SET)
+
+
 # Vendor operations
 def get_vendor(vendor_id: str) -> Optional[Dict[str, Any]]:
     """Get a vendor by ID"""
@@ -84,6 +117,13 @@ def get_all_vendors() -> List[Dict[str, Any]]:
     return get_all_documents(VENDORS_PREFIX, VENDORS_SET)
 
 
+def scan_vendors(
+    limit: int, cursor: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Get a page of vendors and the cursor of the next page"""
+    return scan_documents(VENDORS_PREFIX, VENDORS_SET, limit, cursor)
+
+
 # Government operations
 def get_government(govt_id: str) -> Optional[Dict[str, Any]]:
     """Get a government by ID"""
@@ -131,6 +171,13 @@ def update_scheme(scheme_id: str, update_data: Dict[str, Any]) -> bool:
     return update_document(SCHEMES_PREFIX, scheme_id, update_data)
 
 
+def modify_scheme(
+    scheme_id: str, modifier: Callable[[Dict[str, Any]], None]
+) -> Optional[Dict[str, Any]]:
+    """Modify a scheme document in place, retrying on concurrent writes"""
+    return modify_document(SCHEMES_PREFIX, scheme_id, modifier, SCHEMES_SET)
+
+
 def query_schemes_by_field(field: str, value: Any) -> List[Dict[str, Any]]:
     """Query schemes by a field value"""
     return query_by_field(SCHEMES_PREFIX, SCHEMES_SET, field, value)
@@ -142,8 +189,23 @@ def get_all_schemes() -> List[Dict[str, Any]]:
 
 
 def add_beneficiary_to_scheme(scheme_id: str, citizen_id: str) -> bool:
-    """Add a citizen beneficiary to a scheme"""
-    return array_union(SCHEMES_PREFIX, scheme_id, "beneficiaries", [citizen_id])
+    """Add a citizen beneficiary to a scheme, and the scheme to the citizen"""
+    return link_list_fields(
+        SCHEMES_PREFIX,
+        scheme_id,
+        "beneficiaries",
+        CITIZENS_PREFIX,
+        citizen_id,
+        "scheme_info",
+    )
+
+
+def scan_scheme_beneficiaries(
+    scheme_id: str, limit: int, cursor: Optional[str] = None
+) -> Tuple[List[str], int, Optional[str]]:
+    """Get a page of the citizen IDs of a scheme's beneficiaries, their number
+    and the cursor of the next page"""
+    return scan_list_field(SCHEMES_PREFIX, scheme_id, "beneficiaries", limit, cursor)
 
 
 # Transaction operations
@@ -170,3 +232,102 @@ def query_transactions_by_field(field: str, value: Any) -> List[Dict[str, Any]]:
 def get_all_transactions() -> List[Dict[str, Any]]:
     """Get all transactions"""
     return get_all_documents(TRANSACTIONS_PREFIX, TRANSACTIONS_SET)
+
+
+def scan_transactions(
+    limit: int,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Get a page of transactions from since to until and the next page cursor"""
+    return scan_documents(
+        TRANSACTIONS_PREFIX, TRANSACTIONS_SET, limit, cursor, since, until
+    )
+
+
+def iter_transaction_batches(
+    since: Optional[datetime] = None, until: Optional[datetime] = None
+) -> Iterator[List[Dict[str, Any]]]:
+    """Iterate over all transactions from since to until in batches"""
+    return iter_document_batches(
+        TRANSACTIONS_PREFIX, TRANSACTIONS_SET, since=since, until=until
+    )
+
+
+def get_account_transactions(
+    account_id: str,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Get a page of the transactions sent or received by an account"""
+    transaction_ids, next_cursor = get_timeline(
+        TRANSACTIONS_PREFIX, account_id, limit, before, after, since, until
+    )
+    return get_many_documents(TRANSACTIONS_PREFIX, transaction_ids), next_cursor
+
+
+def pay_vendor_from_wallet(
+    citizen_id: str,
+    vendor_id: str,
+    wallet_type: str,
+    amount: float,
+    transaction_id: str,
+    transaction_data: Dict[str, Any],
+) -> str:
+    """Debit a citizen wallet, credit a vendor and save the transaction atomically"""
+    return transfer_funds(
+        CITIZENS_PREFIX,
+        citizen_id,
+        f"wallet_info.{wallet_type}",
+        VENDORS_PREFIX,
+        vendor_id,
+        "wallet_info",
+        amount,
+        transaction_id,
+        transaction_data,
+    )
+
+
+# Bulk operations
+def _collection(collection: str) -> Tuple[str, str]:
+    """Get the collection prefix and index set of a collection name"""
+    if collection not in COLLECTIONS:
+        raise ValueError(
+            f"Unknown collection '{collection}', "
+            f"available collections: {', '.join(COLLECTIONS)}"
+        )
+    return COLLECTIONS[collection]
+
+
+def save_many(
+    collection: str,
+    documents: Dict[str, Dict[str, Any]],
+    batch_size: int = REDIS_WRITE_BATCH_SIZE,
+) -> int:
+    """Save documents keyed by ID in pipelined batches"""
+    prefix, index_set = _collection(collection)
+    return set_many_documents(prefix, documents, index_set, batch_size)
+
+
+def update_many(
+    collection: str,
+    updates: Dict[str, Dict[str, Any]],
+    batch_size: int = REDIS_WRITE_BATCH_SIZE,
+    missing: Optional[List[str]] = None,
+) -> int:
+    """Update documents keyed by ID in pipelined batches, adding the IDs of
+    missing documents to missing when given"""
+    prefix, _ = _collection(collection)
+    return update_many_documents(prefix, updates, batch_size, missing)
+
+
+def delete_many(
+    collection: str, doc_ids: List[str], batch_size: int = REDIS_WRITE_BATCH_SIZE
+) -> int:
+    """Delete documents in pipelined batches"""
+    prefix, index_set = _collection(collection)
+    return delete_many_documents(prefix, doc_ids, index_set, batch_size)
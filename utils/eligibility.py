@@ -0,0 +1,556 @@
+import abc
+import time
+import asyncio
+import datetime
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from db.async_redis_operations import get_many_documents
+from db.document_cache import document_cache
+from db.redis_config import SCHEMES_PREFIX, REDIS_CITIZEN_TABLE_TTL
+from utils.async_db_ops import get_all_schemes, iter_citizen_batches
+
+# Criteria requiring a personal_info field to equal their value, with the value
+# accepting every citizen
+MATCH_CRITERIA = {"occupation": "any", "gender": "any", "caste": "all"}
+
+# Criteria requiring the citizen's address to contain their value, "all"
+# accepts every citizen
+ADDRESS_CRITERIA = ["state", "district", "city"]
+
+# Criteria on citizen attributes the scheme index files schemes by, see
+# SchemeIndex
+INDEXED_CRITERIA = [*MATCH_CRITERIA, *ADDRESS_CRITERIA]
+
+
+def citizen_age(dob_str: Any) -> Tuple[Optional[int], Optional[str]]:
+    """Get the age in years of a date of birth and the error determining it,
+    both None without a date of birth"""
+    if not dob_str:
+        return None, None
+    try:
+        dob = datetime.datetime.fromisoformat(dob_str)
+        today = datetime.datetime.now()
+        age = today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
+        return age, None
+    except Exception as e:
+        return None, f"Could not determine age: {str(e)}"
+
+
+class CitizenProfile:
+    """Fields of a citizen that rules check, derived once for every scheme"""
+
+    def __init__(self, personal_info: Dict[str, Any]):
+        self.personal_info = personal_info
+        self.address = personal_info.get("address", "")
+        self.annual_income = personal_info.get("annual_income", float("inf"))
+        # Age in years, None without a date of birth or when age_error is set
+        self.age, self.age_error = citizen_age(personal_info.get("dob", ""))
+
+
+# Text fields of personal_info held by citizen tables, with their default
+CATEGORICAL_FIELDS = {
+    **{name: "" for name in MATCH_CRITERIA},
+    "address": "",
+    "dob": "",
+}
+
+
+class CitizenTable:
+    """Fields of many citizens that rules check, held in columns sorted by
+    citizen ID for checking them all at once
+
+    Text fields are factorized into codes of their distinct values, so a
+    criterion on them is evaluated once per distinct value and spread to the
+    citizens by code.
+    """
+
+    def __init__(self, ids: List[str], fields: Dict[str, List[Any]]):
+        order = np.argsort(np.array(ids, dtype=str), kind="stable")
+        self.ids = np.array(ids, dtype=object)[order]
+        # Code of each citizen's value among the distinct values of a text
+        # field, -1 when missing (None)
+        self.codes: Dict[str, np.ndarray] = {}
+        self.values: Dict[str, np.ndarray] = {}
+        for name in CATEGORICAL_FIELDS:
+            codes, values = pd.factorize(np.array(fields[name], dtype=object))
+            self.codes[name] = codes[order]
+            self.values[name] = values
+
+        # Incomes that are missing or not numbers are unknown, like the default
+        self.annual_income = np.nan_to_num(
+            pd.to_numeric(
+                np.array(fields["annual_income"], dtype=object)[order],
+                errors="coerce",
+            ).astype(float),
+            nan=np.inf,
+        )
+
+        # Ages of the distinct dates of birth, NaN without one
+        ages, errors = zip(*map(citizen_age, [*self.values["dob"], None]))
+        self.age = self._spread(
+            "dob", np.array([np.nan if age is None else age for age in ages])
+        )
+        self.age_error = self._spread(
+            "dob", np.array([error is not None for error in errors])
+        )
+
+    @classmethod
+    def from_citizens(cls, citizens: Iterable[Dict[str, Any]]) -> "CitizenTable":
+        """Build a table from citizen documents"""
+        ids: List[str] = []
+        fields: Dict[str, List[Any]] = {}
+        add_citizens(ids, fields, citizens)
+        return cls(ids, fields)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def page(
+        self, mask: np.ndarray, limit: int, cursor: Optional[str] = None
+    ) -> Tuple[List[str], int, Optional[str]]:
+        """Get a page of the IDs of the citizens a mask selects, after the
+        cursor (the last ID of the previous page), their count and the cursor
+        of the next page"""
+        ids = self.ids[mask]
+        start = 0 if cursor is None else int(np.searchsorted(ids, cursor, "right"))
+        page = ids[start : start + limit].tolist()
+        next_cursor = page[-1] if start + limit < len(ids) else None
+        return page, len(ids), next_cursor
+
+    def everyone(self) -> np.ndarray:
+        """Get a mask selecting every citizen"""
+        return np.ones(len(self), dtype=bool)
+
+    def _spread(self, name: str, results: np.ndarray) -> np.ndarray:
+        """Spread results for the distinct values of a text field, followed by
+        the result for missing values (code -1), to the citizens"""
+        return results[self.codes[name]]
+
+    def equal_mask(self, name: str, value: Any) -> np.ndarray:
+        """Get a mask of the citizens whose text field equals a value"""
+        values = self.values[name]
+        if isinstance(value, str):
+            equal = values == value
+        else:
+            equal = np.fromiter((v == value for v in values), bool, len(values))
+        return self._spread(name, np.append(equal, value is None))
+
+    def contains_mask(self, name: str, text: Any) -> np.ndarray:
+        """Get a mask of the citizens whose text field contains a text"""
+        if not isinstance(text, str):
+            return ~self.everyone()
+        values = self.values[name]
+        contains = np.fromiter(
+            (isinstance(v, str) and text in v for v in values), bool, len(values)
+        )
+        return self._spread(name, np.append(contains, False))
+
+
+def add_citizens(
+    ids: List[str], fields: Dict[str, List[Any]], citizens: Iterable[Dict[str, Any]]
+) -> None:
+    """Append the IDs and checked fields of citizen documents to the columns of
+    a CitizenTable being built"""
+    for name in [*CATEGORICAL_FIELDS, "annual_income"]:
+        fields.setdefault(name, [])
+    for citizen in citizens:
+        personal_info = citizen.get("personal_info", {})
+        ids.append(citizen["account_info"]["id"])
+        for name, default in CATEGORICAL_FIELDS.items():
+            fields[name].append(personal_info.get(name, default))
+        fields["annual_income"].append(personal_info.get("annual_income", float("inf")))
+
+
+class Rule(abc.ABC):
+    """An eligibility criterion of a scheme, compiled by compile_criteria"""
+
+    name = ""
+    # Whether every citizen passes, for criteria set to their wildcard
+    accepts_all = False
+
+    @abc.abstractmethod
+    def passes(self, citizen: CitizenProfile) -> Optional[bool]:
+        """Check a citizen, None when the criterion does not apply to them"""
+
+    @abc.abstractmethod
+    def report(self, citizen: CitizenProfile, passed: bool) -> Dict[str, Any]:
+        """Describe the check of a citizen the criterion applies to"""
+
+    @abc.abstractmethod
+    def mask(self, table: CitizenTable) -> np.ndarray:
+        """Check every citizen of a table, False where passes() would be"""
+
+
+class MatchRule(Rule):
+    """A personal_info field equal to the required value"""
+
+    def __init__(self, name: str, required: Any, wildcard: str):
+        self.name = name
+        self.required = required
+        self.accepts_all = required == wildcard
+
+    def passes(self, citizen: CitizenProfile) -> Optional[bool]:
+        return (
+            self.accepts_all
+            or citizen.personal_info.get(self.name, "") == self.required
+        )
+
+    def report(self, citizen: CitizenProfile, passed: bool) -> Dict[str, Any]:
+        return {
+            "required": self.required,
+            "actual": citizen.personal_info.get(self.name, ""),
+            "passed": passed,
+        }
+
+    def mask(self, table: CitizenTable) -> np.ndarray:
+        if self.accepts_all:
+            return table.everyone()
+        return table.equal_mask(self.name, self.required)
+
+
+class AddressRule(Rule):
+    """An address containing the required state, district or city"""
+
+    def __init__(self, name: str, required: Any):
+        self.name = name
+        self.required = required
+        self.accepts_all = required == "all"
+
+    def passes(self, citizen: CitizenProfile) -> Optional[bool]:
+        return self.accepts_all or self.required in citizen.address
+
+    def report(self, citizen: CitizenProfile, passed: bool) -> Dict[str, Any]:
+        return {"required": self.required, "actual": citizen.address, "passed": passed}
+
+    def mask(self, table: CitizenTable) -> np.ndarray:
+        if self.accepts_all:
+            return table.everyone()
+        return table.contains_mask("address", self.required)
+
+
+class IncomeRule(Rule):
+    """An annual income of at most the required maximum"""
+
+    name = "annual_income"
+
+    def __init__(self, maximum: Any):
+        self.maximum = maximum
+        self.required = f"<= {maximum}"
+
+    def passes(self, citizen: CitizenProfile) -> Optional[bool]:
+        return not citizen.annual_income > self.maximum
+
+    def report(self, citizen: CitizenProfile, passed: bool) -> Dict[str, Any]:
+        return {
+            "required": self.required,
+            "actual": citizen.annual_income,
+            "passed": passed,
+        }
+
+    def mask(self, table: CitizenTable) -> np.ndarray:
+        return ~(table.annual_income > self.maximum)
+
+
+class AgeRule(Rule):
+    """An age within the required range, checked for citizens with a date of birth"""
+
+    name = "age"
+
+    def __init__(self, min_age: Any, max_age: Any):
+        self.min_age = min_age
+        self.max_age = max_age
+        self.required = f"{min_age}-{max_age} years"
+
+    def _outside(self, age: int) -> bool:
+        return age < self.min_age or age > self.max_age
+
+    def passes(self, citizen: CitizenProfile) -> Optional[bool]:
+        if citizen.age is None:
+            return None if citizen.age_error is None else False
+        try:
+            return not self._outside(citizen.age)
+        except TypeError:
+            return False
+
+    def report(self, citizen: CitizenProfile, passed: bool) -> Dict[str, Any]:
+        error = citizen.age_error
+        if citizen.age is not None:
+            try:
+                self._outside(citizen.age)
+                return {
+                    "required": self.required,
+                    "actual": citizen.age,
+                    "passed": passed,
+                }
+            except TypeError as e:
+                error = f"Could not determine age: {str(e)}"
+        return {"error": error, "passed": False}
+
+    def mask(self, table: CitizenTable) -> np.ndarray:
+        # Comparisons with NaN are False, so citizens without an age pass
+        try:
+            outside = (table.age < self.min_age) | (table.age > self.max_age)
+        except TypeError:
+            outside = ~np.isnan(table.age)
+        return ~outside & ~table.age_error
+
+
+def compile_criteria(criteria: Dict[str, Any]) -> List[Rule]:
+    """Compile the eligibility criteria of a scheme into rules, in the order
+    their results are reported"""
+    rules: List[Rule] = [
+        MatchRule(name, criteria[name], wildcard)
+        for name, wildcard in MATCH_CRITERIA.items()
+        if name in criteria
+    ]
+    if "annual_income" in criteria:
+        rules.append(IncomeRule(criteria["annual_income"]))
+    if "min_age" in criteria or "max_age" in criteria:
+        rules.append(
+            AgeRule(criteria.get("min_age", 0), criteria.get("max_age", float("inf")))
+        )
+    rules.extend(
+        AddressRule(name, criteria[name])
+        for name in ADDRESS_CRITERIA
+        if name in criteria
+    )
+    return rules
+
+
+class CompiledScheme:
+    """A scheme with its eligibility criteria compiled into rules"""
+
+    def __init__(self, scheme: Dict[str, Any]):
+        self.id: str = scheme["id"]
+        # Fields of the scheme reported with the result of a check
+        self.summary = {
+            "id": scheme["id"],
+            "name": scheme["name"],
+            "description": scheme["description"],
+            "amount": scheme["amount"],
+            "govt_id": scheme["govt_id"],
+            "eligibility_criteria": scheme.get("eligibility_criteria", {}),
+        }
+        self.rules = compile_criteria(scheme.get("eligibility_criteria", {}))
+
+    def eligible(self, citizen: CitizenProfile) -> bool:
+        """Check whether a citizen is eligible, stopping at the first failed rule"""
+        for rule in self.rules:
+            if rule.passes(citizen) is False:
+                return False
+        return True
+
+    def check(self, citizen: CitizenProfile) -> Tuple[bool, Dict[str, Any]]:
+        """Check whether a citizen is eligible, with the result of every rule"""
+        eligible = True
+        results = {}
+        for rule in self.rules:
+            passed = rule.passes(citizen)
+            if passed is not None:
+                results[rule.name] = rule.report(citizen, passed)
+                eligible = eligible and passed
+        return eligible, results
+
+    def eligible_mask(self, table: CitizenTable) -> np.ndarray:
+        """Check every citizen of a table, True where eligible() would be"""
+        mask = table.everyone()
+        for rule in self.rules:
+            mask &= rule.mask(table)
+        return mask
+
+
+def compile_active_schemes(schemes: List[Dict[str, Any]]) -> List[CompiledScheme]:
+    """Compile the active schemes of a list of schemes"""
+    return [
+        CompiledScheme(scheme) for scheme in schemes if scheme.get("status") == "active"
+    ]
+
+
+class SchemeIndex:
+    """Compiled schemes with an inverted index of their criteria on citizen
+    attributes (INDEXED_CRITERIA)
+
+    Each indexed criterion files a scheme under its required value, or in the
+    open bucket when it accepts every citizen: without the criterion, with its
+    wildcard, or with a value the index cannot look up. Candidates for a
+    citizen are the schemes in the open bucket or a matching one of every
+    criterion, so only they need their rules checked.
+    """
+
+    def __init__(self, schemes: Iterable[CompiledScheme] = ()):
+        self.schemes: Dict[str, CompiledScheme] = {}
+        self._buckets: Dict[str, Dict[Any, Set[str]]] = {
+            name: {} for name in INDEXED_CRITERIA
+        }
+        self._open: Dict[str, Set[str]] = {name: set() for name in INDEXED_CRITERIA}
+        for scheme in schemes:
+            self.add(scheme)
+
+    def _bucket(self, name: str, rule: Optional[Rule]) -> Set[str]:
+        """Get the bucket a criterion of a scheme is filed in"""
+        if rule is None or rule.accepts_all:
+            return self._open[name]
+        # Address criteria are matched as substrings of the address
+        if name in ADDRESS_CRITERIA and not isinstance(rule.required, str):
+            return self._open[name]
+        try:
+            return self._buckets[name].setdefault(rule.required, set())
+        except TypeError:
+            return self._open[name]
+
+    def add(self, scheme: CompiledScheme) -> None:
+        """Index a scheme, replacing the indexed version of it if any"""
+        self.remove(scheme.id)
+        self.schemes[scheme.id] = scheme
+        rules = {rule.name: rule for rule in scheme.rules}
+        for name in INDEXED_CRITERIA:
+            self._bucket(name, rules.get(name)).add(scheme.id)
+
+    def remove(self, scheme_id: str) -> None:
+        """Drop a scheme from the index"""
+        scheme = self.schemes.pop(scheme_id, None)
+        if scheme is None:
+            return
+        rules = {rule.name: rule for rule in scheme.rules}
+        for name in INDEXED_CRITERIA:
+            bucket = self._bucket(name, rules.get(name))
+            bucket.discard(scheme_id)
+            if not bucket and bucket is not self._open[name]:
+                del self._buckets[name][rules[name].required]
+
+    def _matching(self, name: str, citizen: CitizenProfile) -> Optional[List[Set[str]]]:
+        """Get the buckets of a criterion matching a citizen, None when the
+        citizen's value cannot be looked up"""
+        buckets = self._buckets[name]
+        if name in ADDRESS_CRITERIA:
+            if not isinstance(citizen.address, str):
+                return None
+            return [ids for value, ids in buckets.items() if value in citizen.address]
+        try:
+            matched = buckets.get(citizen.personal_info.get(name, ""))
+        except TypeError:
+            return None
+        return [matched] if matched else []
+
+    def candidates(
+        self, citizen: CitizenProfile, include: Iterable[str] = ()
+    ) -> List[CompiledScheme]:
+        """Get the schemes a citizen can be eligible for, and the schemes of
+        include (such as those they are enrolled in)"""
+        criteria = []
+        for name in INDEXED_CRITERIA:
+            # Criteria no scheme restricts leave every scheme
+            if not self._buckets[name]:
+                continue
+            matching = self._matching(name, citizen)
+            if matching is not None:
+                criteria.append([self._open[name], *matching])
+        if not criteria:
+            return list(self.schemes.values())
+
+        # Intersect the smallest candidate set with the buckets of the other
+        # criteria, set operations keep the loops out of Python
+        criteria.sort(key=lambda buckets: sum(map(len, buckets)))
+        candidate_ids = set().union(*criteria[0])
+        for buckets in criteria[1:]:
+            candidate_ids = set().union(*(candidate_ids & bucket for bucket in buckets))
+        candidate_ids.update(
+            scheme_id for scheme_id in include if scheme_id in self.schemes
+        )
+        return [self.schemes[scheme_id] for scheme_id in candidate_ids]
+
+
+class SchemeRegistry:
+    """Index of the active schemes compiled for eligibility checks, kept in
+    memory
+
+    Loaded whole on first use. Afterwards only the schemes whose documents were
+    invalidated by the document cache since the last call, on their creation,
+    update or soft delete by any worker, are read, compiled and indexed again,
+    so criteria are compiled once per scheme version. Used while the document
+    cache receives the invalidations of other workers, every call loads and
+    indexes all schemes otherwise.
+    """
+
+    def __init__(self):
+        self._index: Optional[SchemeIndex] = None
+        # IDs of the schemes invalidated since they were indexed
+        self._stale: Set[str] = set()
+        # Incremented when every scheme is invalidated, see active_schemes()
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self, key: Optional[str]) -> None:
+        """Drop a scheme by document key, or every scheme for None"""
+        if key is None:
+            self._index = None
+            self._stale.clear()
+            self._generation += 1
+        elif key.startswith(SCHEMES_PREFIX):
+            self._stale.add(key[len(SCHEMES_PREFIX) :])
+
+    async def active_schemes(self) -> SchemeIndex:
+        """Get the index of the compiled active schemes"""
+        if not document_cache.caches(SCHEMES_PREFIX):
+            return SchemeIndex(compile_active_schemes(await get_all_schemes()))
+
+        async with self._lock:
+            if self._index is None:
+                # Schemes invalidated while loading are read again next time
+                self._stale.clear()
+                generation = self._generation
+                index = SchemeIndex(compile_active_schemes(await get_all_schemes()))
+                if generation == self._generation:
+                    self._index = index
+                return index
+
+            # An index dropped while reading is updated for this call only
+            index = self._index
+            if self._stale:
+                stale, self._stale = self._stale, set()
+                try:
+                    documents = await get_many_documents(SCHEMES_PREFIX, stale)
+                except Exception:
+                    self._stale |= stale
+                    raise
+                for scheme_id in stale:
+                    index.remove(scheme_id)
+                for scheme in compile_active_schemes(documents):
+                    index.add(scheme)
+            return index
+
+
+class CitizenTableCache:
+    """Table of every citizen for checking a scheme against all of them, kept
+    in memory for up to ttl seconds
+
+    Citizen documents are not invalidated like cached ones, so a table shows
+    the citizens as they were when it was loaded. A ttl of 0 loads it on every
+    call. The table is built off the event loop, sorting and factorizing the
+    columns takes seconds for millions of citizens.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._table: Optional[CitizenTable] = None
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def table(self) -> CitizenTable:
+        """Get the table of every citizen, loading it when expired"""
+        async with self._lock:
+            if self._table is None or time.monotonic() - self._loaded_at >= self.ttl:
+                loaded_at = time.monotonic()
+                ids: List[str] = []
+                fields: Dict[str, List[Any]] = {}
+                async for batch in iter_citizen_batches():
+                    add_citizens(ids, fields, batch)
+                self._table = await asyncio.to_thread(CitizenTable, ids, fields)
+                self._loaded_at = loaded_at
+            return self._table
+
+
+scheme_registry = SchemeRegistry()
+document_cache.add_listener(scheme_registry.invalidate)
+citizen_tables = CitizenTableCache(REDIS_CITIZEN_TABLE_TTL)
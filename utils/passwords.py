@@ -0,0 +1,65 @@
+import os
+import hmac
+import base64
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+# scrypt cost parameters of new hashes (16 MiB of memory per hash). Stored hashes
+# carry their own, so raising them only applies to passwords hashed afterwards.
+SCRYPT_N = int(os.environ.get("PASSWORD_SCRYPT_N", 2**14))
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+# Threads hashing passwords. Hashing runs outside the event loop, and a flood
+# of logins queues up here instead of taking every CPU from the other requests.
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+
+_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32
+    )
+
+
+def _hash(password: str) -> str:
+    """Hash a password as scrypt$<n>$<r>$<p>$<salt>$<hash>"""
+    salt = os.urandom(16)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    encoded = [base64.b64encode(value).decode() for value in (salt, digest)]
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${encoded[0]}${encoded[1]}"
+
+
+def _verify(password: str, stored: str) -> bool:
+    """Check a password against a stored hash, or plain text stored before hashing"""
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode(), stored.encode())
+    _, n, r, p, salt, digest = stored.split("$")
+    computed = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+    return hmac.compare_digest(computed, base64.b64decode(digest))
+
+
+def is_hashed(stored: str) -> bool:
+    """Check whether a stored password is a hash, rather than legacy plain text"""
+    return stored.startswith("scrypt$")
+
+
+async def hash_password(password: str) -> str:
+    """Hash a password for storage"""
+    return await asyncio.get_running_loop().run_in_executor(_executor, _hash, password)
+
+
+async def verify_password(password: str, stored: str) -> bool:
+    """Check a password against its stored hash"""
+    return await asyncio.get_running_loop().run_in_executor(
+        _executor, _verify, password, stored
+    )
+
+
+# Verified when no account matches a login, so that failing takes as long
+# whether or not the identifier exists
+UNKNOWN_ACCOUNT_HASH = _hash(base64.b64encode(os.urandom(16)).decode())
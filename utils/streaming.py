@@ -0,0 +1,82 @@
+import os
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from fastapi.responses import StreamingResponse
+
+# Media type of each streaming format
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+# Longest NDJSON line read from an upload. Longer lines are discarded while
+# they are received instead of being held in memory.
+NDJSON_MAX_LINE_BYTES = int(os.environ.get("NDJSON_MAX_LINE_BYTES", 64 * 1024))
+
+
+async def _ndjson_chunks(
+    batches: AsyncIterator[List[Dict[str, Any]]],
+) -> AsyncIterator[str]:
+    """Encode batches of documents as newline-delimited JSON, one chunk per batch"""
+    async for batch in batches:
+        if batch:
+            yield "".join(f"{json.dumps(document)}\n" for document in batch)
+
+
+async def _json_array_chunks(
+    batches: AsyncIterator[List[Dict[str, Any]]],
+) -> AsyncIterator[str]:
+    """Encode batches of documents as a single JSON array, one chunk per batch"""
+    separator = "["
+    async for batch in batches:
+        if batch:
+            yield separator + ",".join(json.dumps(document) for document in batch)
+            separator = ","
+    yield "[]" if separator == "[" else "]"
+
+
+def stream_documents(
+    batches: AsyncIterator[List[Dict[str, Any]]], stream_format: str
+) -> StreamingResponse:
+    """Stream batches of documents as NDJSON or a JSON array while they are read"""
+    chunks = _ndjson_chunks if stream_format == "ndjson" else _json_array_chunks
+    return StreamingResponse(
+        chunks(batches), media_type=STREAM_MEDIA_TYPES[stream_format]
+    )
+
+
+async def iter_ndjson_lines(
+    chunks: AsyncIterator[bytes],
+) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """Yield (line number, line) pairs of an NDJSON body as it is received
+
+    Blank lines are skipped but counted, so numbers match the uploaded file.
+    Lines over NDJSON_MAX_LINE_BYTES are yielded as None.
+    """
+    # Pieces of the current line received so far, and their size
+    pieces: List[bytes] = []
+    size = 0
+    number = 0
+    async for chunk in chunks:
+        *lines, rest = chunk.split(b"\n")
+        for line in lines:
+            number += 1
+            if size + len(line) > NDJSON_MAX_LINE_BYTES:
+                yield number, None
+            else:
+                line = b"".join([*pieces, line])
+                if line.strip():
+                    yield number, line
+            pieces, size = [], 0
+        size += len(rest)
+        if size > NDJSON_MAX_LINE_BYTES:
+            # Keep counting the rest of the line without holding it
+            pieces = []
+        else:
+            pieces.append(rest)
+    if size > NDJSON_MAX_LINE_BYTES:
+        yield number + 1, None
+    else:
+        line = b"".join(pieces)
+        if line.strip():
+            yield number + 1, line